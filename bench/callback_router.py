@@ -0,0 +1,129 @@
+"""Сравнение стоимости выбора обработчика кнопки: цепочка startswith-фильтров против CallbackRouter.
+
+Запуск: python bench/callback_router.py [число повторов]
+Цепочка повторяет фильтры и порядок callback_query_handler из bot.py до
+перехода на router.py; telebot проверяет их по очереди до первого совпадения.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import CallbackRouter
+
+# (префикс или точное значение, точное ли совпадение, шаблон маршрута)
+HANDLERS = [
+    ('role_', False, 'role_{role}'),
+    ('master_full', True, 'master_full'),
+    ('master_simple', True, 'master_simple'),
+    ('entity_', False, 'entity_{entity_type}'),
+    ('age_', False, 'age_{key:rest}'),
+    ('prof_', False, 'prof_{data}'),
+    ('exp_', False, 'exp_{code}'),
+    ('dist_', False, 'dist_{data}'),
+    ('pay_', False, 'pay_{data}'),
+    ('skip_bio', True, 'skip_bio'),
+    ('contact_', False, 'contact_{data}'),
+    ('doc_', False, 'doc_{choice}'),
+    ('doc_done', True, 'doc_done'),
+    ('doc_skip', True, 'doc_skip'),
+    ('help_portfolio', True, 'help_portfolio'),
+    ('skip_portfolio', True, 'skip_portfolio'),
+    ('portfolio_send_to_admin', True, 'portfolio_send_to_admin'),
+    ('save_app_', False, 'save_app_{user_id:int}'),
+    ('save_app_', False, 'save_app_{user_id:int}_{mode}'),
+    ('send_docs_', False, 'send_docs_{app_id:int}'),
+    ('send_photo_', False, 'send_photo_{app_id:int}'),
+    ('finish_docs', True, 'finish_docs'),
+    ('request_', False, 'request_{req_type}'),
+    ('cl_serv_', False, 'cl_serv_{code}'),
+    ('cl_dist_', False, 'cl_dist_{code}'),
+    ('edit_req', True, 'edit_req'),
+    ('confirm_req_', False, 'confirm_req_{user_id:int}'),
+    ('cancel_req', True, 'cancel_req'),
+    ('respond_', False, 'respond_{req_id:int}'),
+    ('channel_respond_', False, 'channel_respond_{request_id:int}'),
+    ('view_master_', False, 'view_master_{master_id:int}'),
+    ('accept_response_', False, 'accept_response_{req_id:int}_{master_id:int}'),
+    ('reject_response_', False, 'reject_response_{req_id:int}_{master_id:int}'),
+    ('view_responses_', False, 'view_responses_{req_id:int}'),
+    ('republish_request_', False, 'republish_request_{req_id:int}'),
+    ('confirm_republish_', False, 'confirm_republish_{req_id:int}'),
+    ('cancel_republish', True, 'cancel_republish'),
+    ('leave_review_', False, 'leave_review_{req_id:int}_{master_id:int}'),
+    ('search_serv_', False, 'search_serv_{code}'),
+    ('search_dist_', False, 'search_dist_{code}'),
+    ('master_', False, 'master_{master_id:int}'),
+    ('contact_', False, 'contact_{master_id:int}'),
+    ('reviews_', False, 'reviews_{master_id:int}'),
+    ('review_rate_', False, 'review_rate_{rating:int}_{master_id:int}'),
+    ('confirm_change_role', True, 'confirm_change_role'),
+    ('cancel_change_role', True, 'cancel_change_role'),
+    ('channel_master_', False, 'channel_master_{master_id:int}'),
+    ('admin_', False, 'admin_{cmd:rest}'),
+    ('admin_entity_', False, 'admin_entity_{entity_type}'),
+    ('admin_age_', False, 'admin_age_{key:rest}'),
+    ('admin_prof_', False, 'admin_prof_{data}'),
+    ('admin_exp_', False, 'admin_exp_{code}'),
+    ('admin_dist_', False, 'admin_dist_{data}'),
+    ('admin_pay_', False, 'admin_pay_{data}'),
+    ('admin_skip_bio', True, 'admin_skip_bio'),
+    ('admin_skip_portfolio', True, 'admin_skip_portfolio'),
+    ('admin_doc_', False, 'admin_doc_{choice}'),
+    ('admin_doc_type_', False, 'admin_doc_type_{data}'),
+    ('admin_contact_', False, 'admin_contact_{data}'),
+    ('admin_save_', False, 'admin_save_{user_id:int}'),
+    ('admin_cancel_add', True, 'admin_cancel_add'),
+]
+
+# Типичная смесь нажатий: анкета мастера, отклики, каталог, админка
+SAMPLES = [
+    'role_client', 'prof_plumber', 'dist_center', 'exp_3-5', 'contact_telegram', 'doc_done',
+    'save_app_8111497942_moderate', 'accept_response_1532_418', 'view_responses_1532',
+    'channel_respond_1532', 'master_418', 'contact_418', 'reviews_418', 'review_rate_5_418',
+    'search_serv_electrician', 'admin_stats', 'admin_dist_frunze', 'admin_cancel_add',
+]
+
+
+def build_chain():
+    chain = []
+    for value, exact, _ in HANDLERS:
+        if exact:
+            chain.append(lambda data, v=value: data == v)
+        else:
+            chain.append(lambda data, v=value: data.startswith(v))
+    return chain
+
+
+def build_router():
+    router = CallbackRouter()
+    for _, _, pattern in HANDLERS:
+        router.add(pattern, lambda call, **kwargs: None)
+    return router
+
+
+def dispatch_chain(chain, data):
+    for i, func in enumerate(chain):
+        if func(data):
+            # Обработчику ещё нужно разобрать аргументы сам – как в старом коде
+            data.split('_')
+            return i
+    return None
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    chain = build_chain()
+    router = build_router()
+    chain_time = timeit.timeit(lambda: [dispatch_chain(chain, d) for d in SAMPLES], number=number)
+    router_time = timeit.timeit(lambda: [router.resolve(d) for d in SAMPLES], number=number)
+    calls = number * len(SAMPLES)
+    print(f"Обработчиков: {len(HANDLERS)}, нажатий: {calls}")
+    print(f"Цепочка startswith: {chain_time / calls * 1e6:.2f} мкс на нажатие")
+    print(f"CallbackRouter:     {router_time / calls * 1e6:.2f} мкс на нажатие")
+    print(f"Ускорение: x{chain_time / router_time:.1f}")
+
+
+if __name__ == '__main__':
+    main()
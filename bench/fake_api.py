@@ -0,0 +1,297 @@
+"""Локальная замена api.telegram.org для нагрузочных тестов.
+
+Бот запускается с TELEGRAM_API_URL=http://127.0.0.1:PORT и ходит сюда
+вместо Telegram. Поддерживаются getUpdates (long polling), sendMessage,
+sendPhoto, editMessageText, editMessageReplyMarkup, answerCallbackQuery
+и служебные вызовы при запуске (getMe, deleteWebhook,
+getChatAdministrators); остальные методы отвечают ok/True и считаются
+в unsupported.
+
+Виртуальные пользователи кладут обновления через push_message /
+push_callback и ждут ответа бота через wait(): сервер ведёт по каждому
+чату журнал событий (новые и изменённые сообщения, ответы на кнопки).
+Запуск отдельно: python bench/fake_api.py [порт]
+"""
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {'id': 999, 'is_bot': True, 'first_name': 'Бот', 'username': 'loadtest_bot'}
+
+
+def buttons(markup):
+    """callback_data всех кнопок inline-клавиатуры."""
+    if isinstance(markup, str):
+        markup = json.loads(markup) if markup else None
+    if not markup:
+        return []
+    return [b['callback_data'] for row in markup.get('inline_keyboard', []) for b in row if 'callback_data' in b]
+
+
+class Event:
+    __slots__ = ('seq', 'kind', 'chat_id', 'message_id', 'text', 'buttons', 'at')
+
+    def __init__(self, seq, kind, chat_id, message_id, text, buttons):
+        self.seq = seq
+        self.kind = kind                # 'message', 'edit', 'answer' (ответ на кнопку)
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.buttons = buttons
+        self.at = time.perf_counter()
+
+
+class FakeTelegram:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.cond = threading.Condition()
+        self.updates = []                       # ещё не забранные ботом
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.seq = itertools.count(1)
+        self.events = defaultdict(list)         # chat_id -> [Event]
+        self.messages = {}                      # (chat_id, message_id) -> Event последней версии
+        self.callbacks = {}                     # id кнопки -> chat_id нажавшего
+        self.calls = []                         # (seq, метод, chat_id)
+        self.methods = Counter()
+        self.polls = 0
+        self.httpd = _Server((host, port), _make_handler(self))
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-api", daemon=True)
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ----- сторона пользователей -----
+    def push_message(self, user_id, text):
+        message_id = next(self.message_ids)
+        message = {'message_id': message_id, 'date': int(time.time()), 'text': text,
+                   'chat': {'id': user_id, 'type': 'private'}, 'from': _user(user_id)}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self._push({'message': message})
+
+    def push_callback(self, user_id, data, chat_id, message_id):
+        callback_id = f'cb{next(self.message_ids)}'
+        chat_type = 'private' if str(chat_id) == str(user_id) else 'channel'
+        with self.cond:
+            self.callbacks[callback_id] = str(user_id)
+            shown = self.messages.get((str(chat_id), message_id))
+        text = shown.text if shown else ''
+        self._push({'callback_query': {
+            'id': callback_id, 'chat_instance': str(chat_id), 'data': data, 'from': _user(user_id),
+            'message': {'message_id': message_id, 'date': int(time.time()), 'text': text,
+                        'chat': {'id': int(chat_id), 'type': chat_type}, 'from': BOT_USER}}})
+        return callback_id
+
+    def _push(self, update):
+        with self.cond:
+            update['update_id'] = next(self.update_ids)
+            self.updates.append(update)
+            self.cond.notify_all()
+
+    def position(self):
+        """Номер последнего события: wait(since=...) смотрит только то, что было после."""
+        with self.cond:
+            return next(self.seq)
+
+    def wait(self, chat_id, since, match, timeout=10):
+        """Первое событие чата после since, для которого match(event) истинно, или None."""
+        chat_id = str(chat_id)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            checked = 0
+            while True:
+                events = self.events[chat_id]
+                for event in events[checked:]:
+                    if event.seq > since and match(event):
+                        return event
+                checked = len(events)
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                self.cond.wait(left)
+
+    def find_button(self, chat_id, data, prefix=False, containing=None):
+        """(message_id, callback_data) последнего сообщения чата с такой кнопкой.
+
+        prefix – data это начало callback_data; containing – текст сообщения
+        должен содержать эту строку (например, метку заявки в канале).
+        """
+        with self.cond:
+            for event in reversed(self.events[str(chat_id)]):
+                current = self.messages.get((event.chat_id, event.message_id))
+                if current is None or (containing and containing not in current.text):
+                    continue
+                for button in current.buttons:
+                    if button == data or (prefix and button.startswith(data)):
+                        return event.message_id, button
+        return None, None
+
+    def calls_since(self, since, chat_ids):
+        return sum(self.methods_since(since, chat_ids).values())
+
+    def methods_since(self, since, chat_ids):
+        """Вызовы по методам после since в чатах chat_ids."""
+        with self.cond:
+            return Counter(method for seq, method, chat_id in self.calls if seq > since and chat_id in chat_ids)
+
+    # ----- сторона бота -----
+    def call(self, method, params):
+        chat_id = str(params.get('chat_id', ''))
+        if method == 'answerCallbackQuery':
+            chat_id = self.callbacks.get(params.get('callback_query_id'), '')
+        with self.cond:
+            self.methods[method] += 1
+            if method != 'getUpdates':
+                self.calls.append((next(self.seq), method, chat_id))
+        handler = getattr(self, '_' + method, None)
+        if handler is None:
+            with self.cond:
+                self.methods['unsupported'] += 1
+            return True
+        return handler(params, chat_id)
+
+    def _getUpdates(self, params, chat_id):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            if offset >= 0 and timeout:
+                self.polls += 1     # long polling бота (не сброс очереди при запуске)
+            while True:
+                if offset < 0:
+                    return self.updates[offset:]
+                self.updates = [u for u in self.updates if u['update_id'] >= offset]
+                left = deadline - time.monotonic()
+                if self.updates or left <= 0:
+                    return list(self.updates[:int(params.get('limit') or 100)])
+                self.cond.wait(left)
+
+    def _record(self, kind, chat_id, message_id, text, markup):
+        with self.cond:
+            event = Event(next(self.seq), kind, chat_id, message_id, text, buttons(markup))
+            self.events[chat_id].append(event)
+            if kind != 'answer':
+                self.messages[(chat_id, message_id)] = event
+            self.cond.notify_all()
+        return event
+
+    def _message(self, chat_id, message_id, text):
+        numeric = chat_id.lstrip('-').isdigit()
+        return {'message_id': message_id, 'date': int(time.time()), 'text': text, 'from': BOT_USER,
+                'chat': {'id': int(chat_id) if numeric else abs(hash(chat_id)) % 10 ** 9,
+                         'type': 'private' if numeric and not chat_id.startswith('-') else 'channel'}}
+
+    def _sendMessage(self, params, chat_id):
+        message_id = next(self.message_ids)
+        text = params.get('text', '')
+        self._record('message', chat_id, message_id, text, params.get('reply_markup'))
+        return self._message(chat_id, message_id, text)
+
+    def _sendPhoto(self, params, chat_id):
+        message_id = next(self.message_ids)
+        text = params.get('caption', '')
+        self._record('message', chat_id, message_id, text, params.get('reply_markup'))
+        return dict(self._message(chat_id, message_id, text), photo=[])
+
+    def _editMessageText(self, params, chat_id):
+        message_id = int(params.get('message_id') or 0)
+        text = params.get('text', '')
+        self._record('edit', chat_id, message_id, text, params.get('reply_markup'))
+        return self._message(chat_id, message_id, text)
+
+    def _editMessageReplyMarkup(self, params, chat_id):
+        message_id = int(params.get('message_id') or 0)
+        with self.cond:
+            old = self.messages.get((chat_id, message_id))
+        text = old.text if old else ''
+        self._record('edit', chat_id, message_id, text, params.get('reply_markup'))
+        return self._message(chat_id, message_id, text)
+
+    def _answerCallbackQuery(self, params, chat_id):
+        # Для ответа на кнопку message_id – id нажатия
+        self._record('answer', chat_id, params.get('callback_query_id'), params.get('text', ''), None)
+        return True
+
+    def _getMe(self, params, chat_id):
+        return BOT_USER
+
+    def _getChatAdministrators(self, params, chat_id):
+        return [{'user': BOT_USER, 'status': 'administrator'}]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # У бота одновременно открыты соединения воркеров, рассылки, outbox и polling;
+    # при очереди по умолчанию (5) лишние SYN отбрасываются и запрос ждёт секунды
+    request_queue_size = 256
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'u{user_id}', 'username': f'u{user_id}'}
+
+
+def _make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'     # keep-alive: requests.Session бота переиспользует соединения
+        disable_nagle_algorithm = True    # иначе заголовки и тело ответа ждут delayed ACK (~40 мс)
+
+        def do_GET(self):
+            self._handle()
+
+        def do_POST(self):
+            self._handle()
+
+        def _handle(self):
+            url = urlsplit(self.path)
+            parts = url.path.strip('/').split('/')
+            if len(parts) != 2 or not parts[0].startswith('bot'):
+                return self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            params = dict(parse_qsl(url.query))
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                body = self.rfile.read(length)
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('application/json'):
+                    params.update(json.loads(body))
+                elif content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode()))
+                # multipart (загрузка файлов) не разбираем – хватает параметров из строки запроса
+            self._reply(200, {'ok': True, 'result': api.call(parts[1], params)})
+
+        def _reply(self, code, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == '__main__':
+    api = FakeTelegram(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8081).start()
+    print(f"Фейковый Bot API: {api.url} (TELEGRAM_API_URL={api.url})")
+    try:
+        api.thread.join()
+    except KeyboardInterrupt:
+        api.shutdown()
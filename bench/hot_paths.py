@@ -0,0 +1,213 @@
+"""Время горячих путей бота на синтетических базах разного размера.
+
+Запуск: python bench/hot_paths.py [--scales 1k-100k,10k-1m] [--repeat 200] [--out результат.json]
+        python bench/hot_paths.py --compare было.json стало.json [--threshold 0.25]
+Базы создаёт bench/synthetic.py (размеры – SCALES там же) и кладёт в --data;
+повторный запуск берёт готовые. Замеряются те же функции и PageView, что
+вызывает бот (queries.py, matching.py, search.py, paginator.py), без токена
+и без запуска polling:
+    notify_masters        подбор получателей новой заявки (MatchIndex.recipients)
+    profile_requests_*    «🔔 Заявки по моему профилю», первая и следующая страница
+    search_serv_* / search_dist_*   каталог по профилю / району
+    search_rating, search_text      лучшие мастера, полнотекстовый поиск
+    find_requests         /findreq – поиск заявок
+    my_requests_*         «📋 Мои заявки» случайного и самого активного клиента
+    get_stats             «📊 Статистика»
+    admin_*               очереди админ-панели
+Результат – JSON с p50 / p95 / средним в мс по каждому замеру; --compare
+печатает разницу двух прогонов и возвращает 1, если что-то замедлилось
+больше чем на threshold.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import SCALES, MASTER_BASE, CLIENT_BASE, WORDS, generate
+from catalog import PROFILES, DISTRICTS
+from matching import MatchIndex
+from paginator import Paginator, NEXT
+from queries import (my_requests_view, profile_requests_view, masters_by_service_view, masters_by_district_view,
+                     top_rated_masters, admin_apps_view, admin_reviews_view, admin_recs_view,
+                     admin_client_recs_view, admin_outbox_view, count_stats)
+from router import CallbackRouter
+from search import search_masters, search_requests
+from storage import Storage
+from timestamps import utc_now
+
+ADMIN_ID = 1
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def measure(call, args, repeat):
+    """Вызывает call(*args[i % len(args)]) repeat раз; времена в мс."""
+    call(*args[0])      # прогрев кеша страниц
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        call(*args[i % len(args)])
+        times.append((time.perf_counter() - started) * 1000)
+    return {'n': repeat, 'p50_ms': round(percentile(times, 50), 3), 'p95_ms': round(percentile(times, 95), 3),
+            'mean_ms': round(sum(times) / len(times), 3)}
+
+
+class HotPaths:
+    """Замеры одной базы. Пути вызываются так же, как их вызывают обработчики в bot.py."""
+
+    def __init__(self, storage, masters, clients, repeat, seed=1):
+        self.storage = storage
+        self.cursor = storage.cursor
+        self.masters = masters
+        self.clients = clients
+        self.repeat = repeat
+        self.rnd = random.Random(seed)
+        self.index = MatchIndex(PROFILES, DISTRICTS)
+        # bot не нужен: fetch только выполняет запрос страницы
+        self.paginator = Paginator(None, CallbackRouter(), self.cursor)
+        self.views = {
+            'profreq': profile_requests_view(self.cursor, self.index),
+            'catserv': masters_by_service_view(),
+            'catdist': masters_by_district_view(),
+            'myreq': my_requests_view(),
+            'adminapps': admin_apps_view(ADMIN_ID),
+            'adminrevs': admin_reviews_view(ADMIN_ID),
+            'adminrecs': admin_recs_view(ADMIN_ID),
+            'admincrecs': admin_client_recs_view(ADMIN_ID),
+            'adminoutbox': admin_outbox_view(ADMIN_ID),
+        }
+
+    def page(self, name, user_id, arg='0', anchor=None):
+        return self.paginator.fetch(self.views[name], user_id, arg, NEXT if anchor else None, anchor)
+
+    def next_pages(self, name, pairs):
+        """Аргументы page() для замера ▶️: после последней строки первой страницы."""
+        found = []
+        for user_id, arg in pairs:
+            rows, more = self.page(name, user_id, arg)
+            if more:
+                found.append((name, user_id, arg, rows[-1][0]))
+        return found or [(name, pairs[0][0], pairs[0][1], None)]
+
+    def run(self):
+        rnd, repeat = self.rnd, self.repeat
+        results = {}
+        started = time.perf_counter()
+        self.index.load(self.cursor)
+        results['match_index_load'] = {'n': 1, 'p50_ms': round((time.perf_counter() - started) * 1000, 3)}
+
+        requests = [(rnd.choice(PROFILES)[1], rnd.choice(DISTRICTS)[1]) for _ in range(50)]
+        results['notify_masters'] = measure(self.index.recipients, requests, repeat)
+
+        masters = [(MASTER_BASE + rnd.randrange(self.masters), '0') for _ in range(50)]
+        services = [(0, rnd.choice(PROFILES)[0]) for _ in range(20)]
+        districts = [(0, rnd.choice(DISTRICTS)[0]) for _ in range(20)]
+        # Куб случайного числа – чаще клиенты с большим числом заявок, как в synthetic.py
+        clients = [(CLIENT_BASE + int(self.clients * rnd.random() ** 3), '0') for _ in range(50)]
+        for name, label, pairs in (('profreq', 'profile_requests', masters),
+                                   ('catserv', 'search_serv', services),
+                                   ('catdist', 'search_dist', districts),
+                                   ('myreq', 'my_requests', clients)):
+            results[f'{label}_first'] = measure(lambda user_id, arg: self.page(name, user_id, arg), pairs, repeat)
+            results[f'{label}_next'] = measure(self.page, self.next_pages(name, pairs), repeat)
+        results['my_requests_heaviest'] = measure(self.page, [('myreq', CLIENT_BASE)], repeat)
+
+        results['search_rating'] = measure(top_rated_masters, [(self.cursor,)], repeat)
+        queries = [(self.cursor, ' '.join(rnd.sample(WORDS, rnd.randint(1, 2)))) for _ in range(50)]
+        results['search_text'] = measure(search_masters, queries, repeat)
+        results['find_requests'] = measure(search_requests, queries, repeat)
+        results['get_stats'] = measure(count_stats, [(self.cursor,)], repeat)
+        for name in ('adminapps', 'adminrevs', 'adminrecs', 'admincrecs', 'adminoutbox'):
+            results[f'admin_{name[5:]}'] = measure(self.page, [(name, ADMIN_ID)], repeat)
+        return results
+
+
+def run_scale(scale, data, repeat, seed):
+    masters, requests = SCALES[scale]
+    path = os.path.join(data, f'{scale}-seed{seed}.db')
+    if not os.path.exists(path):
+        print(f"⏳ {scale}: создаём базу {path} ...")
+        info = generate(path, masters, requests, seed)
+        print(f"✅ {scale}: база создана за {info['seconds']} с")
+    storage = Storage(path)
+    clients = storage.connection().execute("SELECT COUNT(*) FROM users WHERE role = 'client'").fetchone()[0]
+    try:
+        results = HotPaths(storage, masters, clients, repeat, seed).run()
+    finally:
+        storage.close_all()
+    return {'masters': masters, 'requests': requests, 'results': results}
+
+
+def report(scale, entry):
+    print(f"\n{scale}: мастеров {entry['masters']}, заявок {entry['requests']}")
+    print(f"{'замер':28s} {'p50, мс':>9s} {'p95, мс':>9s} {'ср., мс':>9s}")
+    for name, r in entry['results'].items():
+        print(f"{name:28s} {r['p50_ms']:9.3f} {r.get('p95_ms', r['p50_ms']):9.3f} {r.get('mean_ms', r['p50_ms']):9.3f}")
+
+
+def compare(old_path, new_path, threshold):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)['scales']
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['scales']
+    slower = 0
+    for scale in new:
+        if scale not in old:
+            continue
+        print(f"\n{scale}")
+        for name, r in new[scale]['results'].items():
+            before = old[scale]['results'].get(name)
+            if not before or not before['p50_ms']:
+                continue
+            ratio = r['p50_ms'] / before['p50_ms']
+            mark = '❌' if ratio > 1 + threshold else '✅' if ratio < 1 - threshold else '  '
+            slower += mark == '❌'
+            print(f"{mark} {name:28s} {before['p50_ms']:9.3f} → {r['p50_ms']:9.3f} мс  ({ratio - 1:+.0%})")
+    print(f"\nЗамедлилось больше чем на {threshold:.0%}: {slower}")
+    return 1 if slower else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк горячих путей на синтетических базах")
+    parser.add_argument('--scales', default='1k-100k', help=f"через запятую: {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'remont-bench'),
+                        help="каталог для сгенерированных баз")
+    parser.add_argument('--out', default='hot_paths.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    scales = args.scales.split(',')
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"неизвестные размеры: {', '.join(unknown)}")
+    os.makedirs(args.data, exist_ok=True)
+    result = {'created_at': utc_now(), 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+              'repeat': args.repeat, 'seed': args.seed, 'scales': {}}
+    for scale in scales:
+        result['scales'][scale] = run_scale(scale, args.data, args.repeat, args.seed)
+        report(scale, result['scales'][scale])
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 Результат: {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
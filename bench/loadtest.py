@@ -0,0 +1,416 @@
+"""Нагрузочный тест: виртуальные клиенты и мастера против бота на фейковом Bot API.
+
+Запуск: python bench/loadtest.py [--users 20] [--iterations 3]
+                                 [--journeys client_request,master_registration,respond_accept]
+                                 [--think 0.3] [--timeout 15] [--log bot.log] [--workers 0]
+                                 [--max-calls master_registration=35,client_request=18]
+Поднимает bench/fake_api.py, запускает bot.py отдельным процессом (polling,
+временная база, TELEGRAM_API_URL на фейковый сервер) и гоняет сценарии:
+    client_request       /start → Клиент → 🔨 Оставить заявку → ... → Подтвердить
+    master_registration  /start → Мастер → упрощённая анкета → Опубликовать
+    respond_accept       заявка клиента → отклик мастера из канала →
+                         уведомление клиенту → Принять → уведомление мастеру
+Каждый пользователь проходит сценарии по очереди, для каждой итерации –
+новый клиент; мастер для respond_accept у пользователя один (его
+регистрация считается отдельным сценарием master_registration).
+Задержка шага – от отправки обновления до ожидаемого ответа бота.
+Пауза --think – для реализма: шаг анкеты ищется в полосе пользователя
+(dispatcher.py), поэтому мгновенный ответ на вопрос не обгоняет
+register_next_step_handler, и --think 0 – допустимая нагрузка.
+Вызовы API считаются по чатам участников сценария (без постов в канал),
+в отчёте – среднее на сценарий всего и по методам. --max-calls – бюджет
+вызовов на сценарий: при превышении среднего код возврата 1 (для CI).
+В конце – время обработчиков и SQL на стороне бота из его /metrics
+(с --workers – сумма по /metrics воркеров supervisor.py).
+"""
+import argparse
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT = os.path.join(ROOT, 'bot.py')
+ADMIN_ID = 1
+CHANNEL_ID = '-100100'
+USER_BASE = 10000000
+JOURNEYS = ('client_request', 'master_registration', 'respond_accept')
+
+
+class StepFailed(Exception):
+    pass
+
+
+def any_reply(event):
+    return event.kind != 'answer'
+
+
+def says(fragment):
+    return lambda event: event.kind != 'answer' and fragment in event.text
+
+
+def offers(prefix):
+    return lambda event: any(b.startswith(prefix) for b in event.buttons)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Run:
+    """Результат одного прохождения сценария."""
+
+    def __init__(self, name, api):
+        self.name = name
+        self.api = api
+        self.steps = []         # (шаг, секунды)
+        self.chats = set()
+        self.error = None
+        self.calls = 0
+        self.methods = Counter()
+        self.seconds = 0.0
+        self.since = api.position()
+        self.started = time.perf_counter()
+        self.last = (self.since, self.started)    # последнее действие любого участника
+
+    def finish(self, error=None):
+        self.error = error
+        self.seconds = time.perf_counter() - self.started
+        self.methods = self.api.methods_since(self.since, self.chats)
+        self.calls = sum(self.methods.values())
+
+
+class User:
+    def __init__(self, api, user_id, think, timeout):
+        self.api = api
+        self.id = user_id
+        self.think = think
+        self.timeout = timeout
+        self.run = None
+
+    def join(self, run):
+        self.run = run
+        run.chats.add(str(self.id))
+        return self
+
+    def _step(self, step, act, match):
+        since = self.api.position()
+        started = time.perf_counter()
+        self.run.last = (since, started)
+        act()
+        return self._wait(step, since, started, match)
+
+    def _wait(self, step, since, started, match):
+        event = self.api.wait(self.id, since, match, self.timeout)
+        if event is None:
+            raise StepFailed(f"{step}: нет ответа за {self.timeout} с (пользователь {self.id})")
+        self.run.steps.append((step, event.at - started))
+        if self.think:
+            time.sleep(self.think)
+        return event
+
+    def say(self, text, expect=any_reply, step=None):
+        return self._step(step or text, lambda: self.api.push_message(self.id, text), expect)
+
+    def press(self, data, expect=None, chat=None, prefix=False, containing=None):
+        chat = chat or self.id
+        message_id, button = self.api.find_button(chat, data, prefix, containing)
+        if message_id is None:
+            raise StepFailed(f"нет кнопки {data}")
+        data = button
+        pressed = {}
+
+        def act():
+            pressed['id'] = self.api.push_callback(self.id, data, chat, message_id)
+        # Обработчики кнопок отвечают на нажатие последним действием – к этому моменту
+        # следующий шаг анкеты уже зарегистрирован
+        match = expect or (lambda event: event.kind == 'answer' and event.message_id == pressed.get('id'))
+        return self._step(re.sub(r'\d+', 'N', data), act, match)
+
+    def expect(self, match, step):
+        """Ждёт сообщения, вызванного последним действием другого участника сценария."""
+        since, started = self.run.last
+        return self._wait(step, since, started, match)
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index, api, journeys, iterations, think, timeout, results):
+        super().__init__(name=f"vu-{index}", daemon=True)
+        self.index = index
+        self.api = api
+        self.journeys = journeys
+        self.iterations = iterations
+        self.think = think
+        self.timeout = timeout
+        self.results = results
+        self.ids = iter(range(USER_BASE + index * 10000, USER_BASE + (index + 1) * 10000))
+        self.master = None
+
+    def user(self):
+        return User(self.api, next(self.ids), self.think, self.timeout)
+
+    def run(self):
+        for i in range(self.iterations):
+            for k in range(len(self.journeys)):
+                name = self.journeys[(self.index + k) % len(self.journeys)]
+                if name == 'respond_accept' and self.master is None:
+                    self.master = self.user()
+                    self._record('master_registration', lambda run: master_registration(self.master.join(run)))
+                    if self.master.run.error:
+                        self.master = None
+                        continue
+                self._record(name, getattr(self, name))
+
+    def _record(self, name, journey):
+        run = Run(name, self.api)
+        try:
+            journey(run)
+        except StepFailed as e:
+            run.finish(str(e))
+        else:
+            run.finish()
+        self.results.append(run)
+
+    def client_request(self, run):
+        client_request(self.user().join(run))
+
+    def master_registration(self, run):
+        master_registration(self.user().join(run))
+
+    def respond_accept(self, run):
+        master = self.master.join(run)
+        client = self.user().join(run)
+        marker = client_request(client)
+        master.press('channel_respond_', says('Напишите ваше предложение'), chat=CHANNEL_ID, prefix=True,
+                     containing=marker)
+        master.say('Сделаю за 2500₽, приеду завтра', says('Ваш отклик отправлен'), step='отклик')
+        client.expect(offers('accept_response_'), 'уведомление клиенту')
+        client.press('accept_response_', prefix=True)
+        master.expect(says('принят'), 'уведомление мастеру')
+
+
+# ----- сценарии -----
+def client_request(client):
+    """Заявка клиента; возвращает метку из описания, по которой заявку видно в канале."""
+    client.say('/start', offers('role_client'))
+    client.press('role_client')
+    client.say('🔨 Оставить заявку', offers('request_public'))
+    client.press('request_public')
+    client.press('wz_request_serv_plumber')
+    client.press('wz_request_dist_center')
+    marker = f'нагрузка-{client.id}'
+    client.say(f'Течёт смеситель на кухне ({marker})', says('Шаг 4'), step='описание')
+    client.say('На этой неделе', says('Шаг 5'), step='срок')
+    client.say('до 3000₽', offers('confirm_req_'), step='бюджет')
+    client.press(f'confirm_req_{client.id}')
+    return marker
+
+
+def master_registration(master):
+    master.say('/start', offers('role_master'))
+    master.press('role_master')
+    master.press('master_simple')
+    master.press('wz_master_entity_individual')
+    master.say(f'Мастер {master.id}', offers('wz_master_age_'), step='имя')
+    master.press('wz_master_age_skip')
+    master.press('wz_master_prof_plumber')
+    master.press('wz_master_prof_done')
+    master.press('wz_master_exp_3-5')
+    master.press('wz_master_dist_center')
+    master.press('wz_master_dist_done')
+    master.say('1500₽', offers('wz_master_pay_done'), step='цена')
+    master.press('wz_master_pay_cash')
+    master.press('wz_master_pay_done')
+    master.say('Аккуратно, с гарантией', offers('wz_master_contact_done'), step='о себе')
+    master.press('wz_master_contact_telegram')
+    master.press('wz_master_contact_done')
+    master.say('+79990000000', offers('wz_master_portfolio_skip'), step='телефон')
+    master.press('wz_master_portfolio_skip')
+    master.press(f'save_app_{master.id}')
+
+
+# ----- запуск бота и отчёт -----
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_bot(api, tmp, metrics_port, log_path=None, workers=0):
+    env = dict(os.environ, TOKEN='1:loadtest', TELEGRAM_API_URL=api.url, BOT_MODE='polling',
+               DB_PATH=os.path.join(tmp, 'bot.db'), ADMIN_ID=str(ADMIN_ID), CHANNEL_ID=CHANNEL_ID,
+               CHAT_ID='-100200', MASTER_CHAT_ID='-100300',
+               # Начало и конец «ночи» совпадают – заявки публикуются сразу
+               NIGHT_START_HOUR='0', NIGHT_END_HOUR='0',
+               METRICS_HOST='127.0.0.1', METRICS_PORT=str(metrics_port), BOT_WORKERS=str(workers),
+               PYTHONUNBUFFERED='1')
+    log = open(log_path or os.path.join(tmp, 'bot.log'), 'w')
+    proc = subprocess.Popen([sys.executable, BOT], env=env, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while api.polls == 0:
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            log.close()
+            with open(log.name, encoding='utf-8') as f:
+                print(f.read()[-3000:])
+            sys.exit("❌ Бот не запустился")
+        time.sleep(0.1)
+    return proc, log
+
+
+def server_side(metrics_ports, top=10):
+    """Суммарное время обработчиков и SQL из /metrics бота (всех его процессов)."""
+    text = ''
+    for port in metrics_ports:
+        try:
+            text += urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5).read().decode()
+        except OSError as e:
+            print(f"⚠️ /metrics на порту {port} недоступен: {e}")
+    if not text:
+        return
+    sums, counts = defaultdict(float), defaultdict(int)
+    for line in text.splitlines():
+        m = re.match(r'(\w+)_(sum|count)\{\w+="([^"]*)"\} (\S+)$', line)
+        if m:
+            key = (m.group(1), m.group(3))
+            if m.group(2) == 'sum':
+                sums[key] += float(m.group(4))
+            else:
+                counts[key] += int(float(m.group(4)))
+    print("\nНа стороне бота (bot_handler_seconds), по суммарному времени:")
+    handlers = sorted((k for k in sums if k[0] == 'bot_handler_seconds'), key=lambda k: -sums[k])
+    for key in handlers[:top]:
+        print(f"  {key[1]:34s} вызовов {counts[key]:6d}  всего {sums[key] * 1000:9.1f} мс  "
+              f"среднее {sums[key] / max(counts[key], 1) * 1000:7.2f} мс")
+    print("Запросы к Bot API (telegram_api_seconds):")
+    for key in sorted((k for k in sums if k[0] == 'telegram_api_seconds' and k[1] != 'getUpdates'),
+                      key=lambda k: -sums[k]):
+        print(f"  {key[1]:34s} вызовов {counts[key]:6d}  всего {sums[key] * 1000:9.1f} мс  "
+              f"среднее {sums[key] / max(counts[key], 1) * 1000:7.2f} мс")
+    sql = sum(v for k, v in sums.items() if k[0] == 'sqlite_seconds')
+    print(f"SQL всего {sql * 1000:.1f} мс")
+
+
+def report(results, elapsed, api, users):
+    done = [r for r in results if not r.error]
+    print(f"\nПользователей {users}, сценариев {len(results)} (ошибок {len(results) - len(done)}), "
+          f"время {elapsed:.1f} с, {len(done) / elapsed:.2f} сценариев/с")
+    print(f"\n{'Сценарий':22s} {'готово':>6s} {'ошибок':>6s} {'в сек':>6s} "
+          f"{'p50, с':>7s} {'p95, с':>7s} {'вызовов API':>12s}")
+    for name in JOURNEYS:
+        runs = [r for r in results if r.name == name]
+        if not runs:
+            continue
+        ok = [r for r in runs if not r.error]
+        durations = [r.seconds for r in ok]
+        calls = sum(r.calls for r in ok) / len(ok) if ok else 0
+        print(f"{name:22s} {len(ok):6d} {len(runs) - len(ok):6d} {len(ok) / elapsed:6.2f} "
+              f"{percentile(durations, 50):7.2f} {percentile(durations, 95):7.2f} {calls:12.1f}")
+    print("\nВызовы Bot API на сценарий по методам:")
+    for name in JOURNEYS:
+        ok = [r for r in results if r.name == name and not r.error]
+        if ok:
+            methods = sum((r.methods for r in ok), Counter())
+            print(f"  {name:22s} " + ', '.join(f"{m} {n / len(ok):.1f}" for m, n in methods.most_common()))
+    steps = defaultdict(list)
+    for r in results:
+        for step, seconds in r.steps:
+            steps[step].append(seconds)
+    every = [s for values in steps.values() for s in values]
+    print(f"\nШагов {len(every)}, {len(every) / elapsed:.1f} в сек. Задержка ответа бота, мс:")
+    print(f"{'шаг':34s} {'n':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for step, values in sorted(steps.items(), key=lambda item: -percentile(item[1], 95)):
+        print(f"{step[:34]:34s} {len(values):6d} {percentile(values, 50) * 1000:8.1f} "
+              f"{percentile(values, 95) * 1000:8.1f} {percentile(values, 99) * 1000:8.1f}")
+    print(f"{'все шаги':34s} {len(every):6d} {percentile(every, 50) * 1000:8.1f} "
+          f"{percentile(every, 95) * 1000:8.1f} {percentile(every, 99) * 1000:8.1f}")
+    errors = defaultdict(int)
+    for r in results:
+        if r.error:
+            errors[f"{r.name}: {r.error}"] += 1
+    for error, n in sorted(errors.items(), key=lambda item: -item[1])[:10]:
+        print(f"❌ {n} × {error}")
+    print("\nВызовы Bot API: " + ', '.join(f"{m} {n}" for m, n in api.methods.most_common()))
+
+
+def over_budget(results, budget):
+    """Сценарии, у которых среднее число вызовов API больше бюджета: [(сценарий, среднее, бюджет)]."""
+    over = []
+    for name, limit in budget.items():
+        ok = [r for r in results if r.name == name and not r.error]
+        calls = sum(r.calls for r in ok) / len(ok) if ok else 0
+        if calls > limit:
+            over.append((name, calls, limit))
+    return over
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на фейковом Bot API")
+    parser.add_argument('--users', type=int, default=20, help="одновременных виртуальных пользователей")
+    parser.add_argument('--iterations', type=int, default=3, help="повторов набора сценариев на пользователя")
+    parser.add_argument('--journeys', default=','.join(JOURNEYS))
+    parser.add_argument('--think', type=float, default=0.3, help="пауза пользователя между шагами, с")
+    parser.add_argument('--timeout', type=float, default=15, help="ожидание ответа на шаг, с")
+    parser.add_argument('--log', help="куда писать вывод бота (по умолчанию во временный каталог)")
+    parser.add_argument('--workers', type=int, default=0, help="BOT_WORKERS: процессов-воркеров (0 – один процесс)")
+    parser.add_argument('--max-calls', default='', help="бюджет вызовов API: сценарий=N[,сценарий=N]")
+    args = parser.parse_args()
+    journeys = [j for j in args.journeys.split(',') if j]
+    unknown = set(journeys) - set(JOURNEYS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    try:
+        budget = {name: float(limit) for name, limit in
+                  (item.split('=') for item in args.max_calls.split(',') if item)}
+    except ValueError:
+        parser.error("--max-calls: ожидается сценарий=N[,сценарий=N]")
+    if set(budget) - set(JOURNEYS):
+        parser.error(f"неизвестные сценарии в --max-calls: {', '.join(sorted(set(budget) - set(JOURNEYS)))}")
+
+    api = FakeTelegram().start()
+    metrics_port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        proc, log = start_bot(api, tmp, metrics_port, args.log, args.workers)
+        print(f"✅ Бот запущен (pid {proc.pid}), фейковый API {api.url}")
+        results = []
+        users = [VirtualUser(i, api, journeys, args.iterations, args.think, args.timeout, results)
+                 for i in range(args.users)]
+        started = time.perf_counter()
+        for vu in users:
+            vu.start()
+        for vu in users:
+            vu.join()
+        elapsed = time.perf_counter() - started
+        report(results, elapsed, api, args.users)
+        # Воркер N отдаёт метрики на METRICS_PORT + 1 + N
+        server_side([metrics_port] + [metrics_port + 1 + i for i in range(args.workers)])
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+    api.shutdown()
+    over = over_budget(results, budget)
+    for name, calls, limit in over:
+        print(f"❌ {name}: {calls:.1f} вызовов API на сценарий при бюджете {limit:g}")
+    if over:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Число запросов к БД для «📋 Мои заявки»: отдельные COUNT на каждую заявку против одного запроса.
+
+Запуск: python bench/my_requests.py [число заявок клиента]
+Старый вариант повторяет render_my_requests из bot.py до перехода на
+подзапросы: выборка страницы, затем COUNT откликов на каждую заявку и
+поиск принятого мастера на каждую завершённую. Новый – SELECT списка
+'myreq' из bot.py. Запросы считаются через set_trace_callback.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrations
+from paginator import PageView, NEXT
+from storage import Storage
+
+CLIENT = 42
+PAGE_SIZE = 5
+
+OLD = PageView('old', '''SELECT id, service, description, district, date, budget, status, created_at, chat_message_id
+                         FROM requests''', 'requests', None, None, keys=('created_at', 'id'), size=PAGE_SIZE)
+NEW = PageView('new', '''SELECT q.id, q.service, q.description, q.district, q.date, q.budget, q.status, q.created_at,
+                                q.chat_message_id,
+                                (SELECT COUNT(*) FROM responses r WHERE r.request_id = q.id),
+                                (SELECT r.master_id FROM responses r
+                                 WHERE r.request_id = q.id AND r.status = 'accepted' LIMIT 1)
+                         FROM requests q''', 'requests', None, None, keys=('created_at', 'id'), alias='q',
+               size=PAGE_SIZE)
+
+
+def seed(cur, requests, other_clients=2000):
+    rnd = random.Random(1)
+    rows = [(CLIENT if i < requests else rnd.randrange(other_clients),
+             'Сантехник', 'Центр', rnd.choice(['активна', 'завершена']), f'2025-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}')
+            for i in range(requests + other_clients * 3)]
+    cur.executemany('''INSERT INTO requests (user_id, service, district, status, is_public, created_at)
+                       VALUES (?, ?, ?, ?, 1, ?)''', rows)
+    responses = []
+    for request_id in range(1, len(rows) + 1):
+        for n in range(rnd.randrange(6)):
+            responses.append((request_id, rnd.randrange(1, 500), 'accepted' if n == 0 and rnd.random() < 0.5 else 'pending'))
+    cur.executemany('''INSERT INTO responses (request_id, master_id, status, created_at)
+                       VALUES (?, ?, ?, '2025-01-01 00:00:00')''', responses)
+
+
+def walk(conn, view, per_row):
+    """Пролистывает весь список клиента; возвращает (число запросов, секунды)."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    started = time.perf_counter()
+    direction = anchor = None
+    while True:
+        sql, params = view.query(f'{view.alias + "." if view.alias else ""}user_id = ?', (CLIENT,),
+                                 direction, anchor)
+        rows = conn.execute(sql, params).fetchall()
+        page = rows[:view.size]
+        if per_row:
+            for req_id, *_, status, created, chat_msg_id in page:
+                conn.execute('SELECT COUNT(*) FROM responses WHERE request_id = ?', (req_id,)).fetchone()
+                if status == 'завершена':
+                    conn.execute("SELECT master_id FROM responses WHERE request_id = ? AND status = 'accepted'",
+                                 (req_id,)).fetchone()
+        if len(rows) <= view.size:
+            break
+        direction, anchor = NEXT, page[-1][0]
+    elapsed = time.perf_counter() - started
+    conn.set_trace_callback(None)
+    return len(statements), elapsed
+
+
+def main(requests=50):
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, 'bench.db'))
+        migrations.apply(storage)
+        with storage.transaction() as cur:
+            seed(cur, requests)
+        conn = storage.connection()
+        pages = -(-requests // PAGE_SIZE)
+        for title, view, per_row in (("COUNT на каждую заявку", OLD, True), ("один запрос на страницу", NEW, False)):
+            walk(conn, view, per_row)   # прогрев кеша страниц
+            queries, elapsed = walk(conn, view, per_row)
+            print(f"{title:26s} заявок {requests}, страниц {pages}: запросов {queries:4d}, "
+                  f"{elapsed * 1000:7.2f} мс")
+        storage.close_all()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
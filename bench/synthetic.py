@@ -0,0 +1,195 @@
+"""Синтетическая база для бенчмарков: мастера, заявки, отклики, отзывы, очереди модерации.
+
+Запуск: python bench/synthetic.py база.db [--masters 10000] [--requests 100000] [--seed 1]
+Схема – из migrations.py, профили и районы – из catalog.py, статусы – те же
+строки, что пишет bot.py. Распределения похожи на живую базу: у мастера
+1–3 профиля и 1–3 района, популярность профилей и районов неравномерна,
+на заявку 0–4 отклика, у немногих клиентов – десятки заявок.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import PROFILES, DISTRICTS, EXPERIENCE_OPTIONS, PAYMENT_METHODS
+from matching import MatchIndex
+from migrations import migrations
+from storage import Storage
+from timestamps import FORMAT
+
+# Размеры по умолчанию: мастеров / заявок
+SCALES = {
+    '1k-100k': (1_000, 100_000),
+    '10k-100k': (10_000, 100_000),
+    '10k-1m': (10_000, 1_000_000),
+    '100k-1m': (100_000, 1_000_000),
+}
+
+MASTER_BASE = 10_000_000        # user_id мастеров: MASTER_BASE + номер
+CLIENT_BASE = 20_000_000        # user_id клиентов; CLIENT_BASE – клиент с наибольшим числом заявок
+DAYS = 365                      # заявки и отзывы за последний год
+BATCH = 20_000
+
+WORDS = '''заменить смеситель кран протекает унитаз ванная плитка укладка ремонт квартиры под ключ
+           проводка розетки люстра щиток штукатурка шпаклёвка покраска обои ламинат стяжка пола
+           гипсокартон перегородка двери установка окна откосы сварка ворот забор навес крыша
+           душевая кабина бойлер радиатор отопление трубы канализация засор дизайн проект кухня'''.split()
+FIRST_NAMES = 'Алексей Андрей Дмитрий Сергей Иван Михаил Николай Павел Олег Виктор Юрий Артём'.split()
+LAST_NAMES = 'Иванов Петров Смирнов Кузнецов Попов Соколов Лебедев Козлов Новиков Морозов Волков'.split()
+
+
+def weighted(items, rnd):
+    """Веса 1, 1/2, 1/3, ... – первые элементы списка популярнее."""
+    weights = [1 / (i + 1) for i in range(len(items))]
+    return lambda k=1: rnd.choices(items, weights, k=k)
+
+
+def pick_distinct(choose, count):
+    found = []
+    while len(found) < count:
+        item = choose()[0]
+        if item not in found:
+            found.append(item)
+    return found
+
+
+def stamps(rnd, now):
+    """Случайная метка времени за последние DAYS дней."""
+    return lambda: (now - timedelta(seconds=rnd.randrange(DAYS * 86400))).strftime(FORMAT)
+
+
+def text(rnd, words=(4, 14)):
+    return ' '.join(rnd.choices(WORDS, k=rnd.randint(*words)))
+
+
+def batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(path, masters=10_000, requests=100_000, seed=1):
+    """Заполняет новую базу path, возвращает параметры генерации."""
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    stamp = stamps(rnd, now)
+    profiles = weighted([name for _, name in PROFILES], rnd)
+    districts = weighted([name for _, name in DISTRICTS], rnd)
+    index = MatchIndex(PROFILES, DISTRICTS)
+    clients = max(1, requests // 5)
+
+    storage = Storage(path)
+    migrations.apply(storage, match_index=index)
+    started = time.perf_counter()
+    with storage.transaction() as cur:
+        cur.executemany('INSERT INTO users (user_id, role, first_seen, last_active) VALUES (?, ?, ?, ?)',
+                        [(MASTER_BASE + i, 'master', stamp(), stamp()) for i in range(masters)] +
+                        [(CLIENT_BASE + i, 'client', stamp(), stamp()) for i in range(clients)])
+
+        master_rows, services, district_rows = [], [], []
+        for i in range(masters):
+            master_id = i + 1
+            names = pick_distinct(profiles, rnd.choice((1, 1, 2, 3)))
+            areas = pick_distinct(districts, rnd.choice((1, 2, 2, 3)))
+            master_rows.append((
+                master_id, MASTER_BASE + i, f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+                ', '.join(names), f"+7914{rnd.randrange(10 ** 7):07d}", ', '.join(areas),
+                str(rnd.randrange(5, 100) * 100), rnd.choice(EXPERIENCE_OPTIONS[:-1])[1], text(rnd, (5, 30)),
+                'Не указано', 'активен', rnd.choice(('simple', 'simple', 'full')),
+                rnd.choice(PAYMENT_METHODS)[1], stamp()))
+            services += [(master_id, code) for code in index.parse_profiles(', '.join(names))]
+            district_rows += [(master_id, code) for code in index.parse_districts(', '.join(areas))]
+        cur.executemany('''INSERT INTO masters (id, user_id, name, service, phone, districts, price_min, experience,
+                                                bio, portfolio, status, verification_type, payment_methods, created_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', master_rows)
+        cur.executemany('INSERT INTO master_services (master_id, code) VALUES (?, ?)', services)
+        cur.executemany('INSERT INTO master_districts (master_id, code) VALUES (?, ?)', district_rows)
+
+        def request_rows():
+            for request_id in range(1, requests + 1):
+                # rnd.random() ** 3 – большинство заявок у небольшой доли клиентов
+                client = CLIENT_BASE + int(clients * rnd.random() ** 3)
+                status = 'активна' if rnd.random() < 0.3 else 'завершена'
+                yield (request_id, client, f'u{client}', profiles()[0], text(rnd), districts()[0],
+                       rnd.choice(('сегодня', 'на неделе', 'в течение месяца', 'не срочно')),
+                       f"{rnd.randrange(1, 200) * 500} ₽", status, int(rnd.random() < 0.9), stamp())
+        for batch in batches(request_rows()):
+            cur.executemany('''INSERT INTO requests (id, user_id, username, service, description, district, date,
+                                                     budget, status, is_public, created_at)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+
+        def response_rows():
+            for request_id in range(1, requests + 1):
+                count = rnd.choice((0, 0, 1, 1, 2, 3, 4))
+                for n, master_id in enumerate(rnd.sample(range(1, masters + 1), min(count, masters))):
+                    status = 'accepted' if n == 0 and rnd.random() < 0.5 else rnd.choice(('pending', 'rejected'))
+                    yield (request_id, master_id, str(rnd.randrange(5, 300) * 100), status, stamp())
+        for batch in batches(response_rows()):
+            cur.executemany('''INSERT INTO responses (request_id, master_id, price, status, created_at)
+                               VALUES (?, ?, ?, ?, ?)''', batch)
+
+        # Рейтинг и число отзывов мастера пересчитывают триггеры
+        def review_rows():
+            for _ in range(masters * 3):
+                master_id = rnd.randrange(1, masters + 1)
+                status = rnd.choice(('approved', 'approved', 'approved', 'pending', 'rejected'))
+                yield (master_id, master_rows[master_id - 1][2], CLIENT_BASE + rnd.randrange(clients),
+                       f'u{rnd.randrange(clients)}', text(rnd), rnd.choice((3, 4, 5, 5, 5)), status, stamp())
+        for batch in batches(review_rows()):
+            cur.executemany('''INSERT INTO reviews (master_id, master_name, user_id, user_name, review_text, rating,
+                                                    status, created_at)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+
+        # Очереди админ-панели
+        queue = max(10, masters // 20)
+        cur.executemany('''INSERT INTO master_applications (user_id, name, service, phone, districts, status, created_at)
+                           VALUES (?, ?, ?, ?, ?, 'На проверке', ?)''',
+                        [(MASTER_BASE + masters + i, f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+                          profiles()[0], f"+7914{rnd.randrange(10 ** 7):07d}", districts()[0], stamp())
+                         for i in range(queue)])
+        cur.executemany('''INSERT INTO recommendations (user_id, master_name, service, contact, description, status,
+                                                        created_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        [(CLIENT_BASE + rnd.randrange(clients), rnd.choice(LAST_NAMES), profiles()[0], '@master',
+                          text(rnd), rnd.choice(('на модерации', 'approved')), stamp()) for _ in range(queue * 2)])
+        cur.executemany('''INSERT INTO client_recommendations (user_id, username, hashtag, contact, description,
+                                                               status, created_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        [(CLIENT_BASE + rnd.randrange(clients), 'client', 'рекомендую', '@master', text(rnd),
+                          rnd.choice(('new', 'approved')), stamp()) for _ in range(queue * 2)])
+        cur.executemany('''INSERT INTO outbox (chat_id, text, status, attempts, next_attempt, last_error, created_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        [(str(CLIENT_BASE + rnd.randrange(clients)), text(rnd), rnd.choice(('sent', 'sent', 'dead')),
+                          1, 0, 'Forbidden: bot was blocked by the user', stamp()) for _ in range(queue * 4)])
+    storage.close_all()
+    return {'masters': masters, 'requests': requests, 'clients': clients, 'seed': seed,
+            'seconds': round(time.perf_counter() - started, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическая база для бенчмарков")
+    parser.add_argument('path')
+    parser.add_argument('--masters', type=int, default=10_000)
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if os.path.exists(args.path):
+        print(f"❌ {args.path} уже существует")
+        return 1
+    info = generate(args.path, args.masters, args.requests, args.seed)
+    print(f"✅ {args.path}: мастеров {info['masters']}, заявок {info['requests']}, "
+          f"клиентов {info['clients']} за {info['seconds']} с")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,29 +1,42 @@
 import os
 import sys
 import json
-import time
-import sqlite3
 import requests
-import fcntl
 import re
+import argparse
+import signal
 from datetime import datetime, timedelta, timezone
 
 import telebot
-from telebot import types
+from telebot import types, apihelper
+
+from delivery import DeliveryEngine, TokenBucket, retry_after_of
+from matching import MatchIndex
+from storage import Storage
+from sessions import SessionStore, StepHandlerBackend
+from webhook import WebhookServer
+from router import CallbackRouter
+from scheduler import Scheduler, Daily, Every
+from paginator import Paginator, PageView
+from wizard import Wizard, Form, Choice, MultiChoice, TextInput, CANCEL, RESTART
+from migrations import migrations
+from timestamps import utc_now, local
+from search import search_masters, search_requests
+from cards import MasterCardCache
+from outbox import Outbox
+from inbox import Inbox
+from idempotency import CallbackGuard, NOOP
+from metrics import Metrics, MetricsServer
+from dispatcher import LaneDispatcher
+from cluster import Lease, ChangeFeed
+from supervisor import Supervisor, serve_worker
+from catalog import (PROFILES, PROFILES_DICT, DISTRICTS, DISTRICTS_DICT, DOC_TYPES, DOC_TYPES_DICT,
+                     PAYMENT_METHODS, PAYMENT_DICT, CONTACT_METHODS, EXPERIENCE_OPTIONS, EXPERIENCE_DICT)
+from queries import (my_requests_view, profile_requests_view, masters_by_service_view, masters_by_district_view,
+                     top_rated_masters, admin_apps_view, admin_reviews_view, admin_recs_view,
+                     admin_client_recs_view, admin_outbox_view, count_stats)
 print("🚀 Новая версия бота запускается...")
 
-# ================ БЛОКИРОВКА ЗАПУСКА ВТОРОГО ЭКЗЕМПЛЯРА ================
-def single_instance():
-    lock_file = '/tmp/bot.lock'
-    try:
-        f = open(lock_file, 'w')
-        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
-    except:
-        print("❌ Бот уже запущен! Завершаем работу.")
-        sys.exit(1)
-
-single_instance()
-
 # ================ НАСТРОЙКИ ================
 TOKEN = os.environ.get('TOKEN')
 if not TOKEN:
@@ -40,17 +53,68 @@ MASTER_CHAT_ID = os.environ.get('MASTER_CHAT_ID', '@masterVL25_masters')
 MASTER_CHAT_INVITE_LINK = os.environ.get('MASTER_CHAT_INVITE_LINK', '')
 
 DB_PATH = os.environ.get('DB_PATH', '/app/data/remont.db')
+DB_PROFILE = os.environ.get('DB_PROFILE', 'default')
+SESSION_TTL_HOURS = int(os.environ.get('SESSION_TTL_HOURS', 72))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 2000))
 
 NIGHT_START_HOUR = int(os.environ.get('NIGHT_START_HOUR', 23))
 NIGHT_END_HOUR = int(os.environ.get('NIGHT_END_HOUR', 7))
 TIMEZONE_OFFSET = int(os.environ.get('TIMEZONE_OFFSET', 10))
 
+DELIVERY_WORKERS = int(os.environ.get('DELIVERY_WORKERS', 4))
+DELIVERY_RATE = float(os.environ.get('DELIVERY_RATE', 25))
+CHANNEL_POSTS_PER_MINUTE = float(os.environ.get('CHANNEL_POSTS_PER_MINUTE', 20))
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 5))
+MASTER_CARD_CACHE_SIZE = int(os.environ.get('MASTER_CARD_CACHE_SIZE', 500))
+# Полосы обработки обновлений: внутри пользователя – по порядку, между пользователями – параллельно
+BOT_LANES = int(os.environ.get('BOT_LANES', 8))
+
+# Несколько процессов (supervisor.py): BOT_WORKERS воркеров обрабатывают обновления, 0 – всё в одном процессе
+BOT_WORKERS = int(os.environ.get('BOT_WORKERS', 0))
+# Роль и номер процесса задаёт supervisor.py при запуске воркера
+BOT_ROLE = os.environ.get('BOT_ROLE', 'main')
+BOT_SHARD = int(os.environ.get('BOT_SHARD', 0))
+# Второй экземпляр ждёт роль ведущего и забирает её через столько секунд после падения первого
+LEADER_LEASE_TTL = int(os.environ.get('LEADER_LEASE_TTL', 15))
+# Лимиты Telegram – на бота, поэтому делятся между процессами: ведущим и воркерами
+PROCESSES = BOT_WORKERS + 1 if BOT_WORKERS else 1
+
+# Адрес Bot API: свой сервер (telegram-bot-api) или фейковый для нагрузочных тестов (bench/fake_api.py)
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+
+# Режим приёма обновлений: polling или webhook (можно переопределить --mode)
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')          # публичный адрес, например https://example.com
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+# Потоки вебхука только раскладывают обновления по полосам; при одном потоке порядок сохраняется
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 1))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 1000))
+
+# Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 – не запускать)
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
+
 BOT_LINK = f"https://t.me/{BOT_USERNAME}"
 CHANNEL_LINK = f"https://t.me/{CHANNEL_USERNAME}"
 ADMIN_LINK = f"https://t.me/{ADMIN_USERNAME}"
 
+apihelper.API_URL = TELEGRAM_API_URL + '/bot{0}/{1}'
 bot = telebot.TeleBot(TOKEN)
 
+# ================ ДИСПЕТЧЕР ОБНОВЛЕНИЙ ================
+# Вместо пула telebot из двух общих потоков – полосы по пользователю (см. dispatcher.py)
+bot.worker_pool.close()
+bot.worker_pool = LaneDispatcher(bot, lanes=BOT_LANES)
+
+# ================ МЕТРИКИ ================
+# Время обработчиков, запросов к Bot API и SQL – см. metrics.py
+metrics = Metrics()
+metrics.instrument_bot(bot)
+metrics.instrument_api()
+
 # ================ ПОДГОТОВКА ДИРЕКТОРИИ ДЛЯ БАЗЫ ================
 db_dir = os.path.dirname(DB_PATH)
 if db_dir and not os.path.exists(db_dir):
@@ -58,264 +122,142 @@ if db_dir and not os.path.exists(db_dir):
     print(f"✅ Создана директория для БД: {db_dir}")
 
 # ================ БАЗА ДАННЫХ ================
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
-
-# ----- Таблица пользователей (роли) -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS users
-                (user_id INTEGER PRIMARY KEY,
-                 role TEXT DEFAULT 'client',
-                 first_seen TEXT,
-                 last_active TEXT)''')
-
-# ----- Таблица заявок -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS requests
-                (id INTEGER PRIMARY KEY,
-                 user_id INTEGER,
-                 username TEXT,
-                 service TEXT,
-                 description TEXT,
-                 district TEXT,
-                 date TEXT,
-                 budget TEXT,
-                 status TEXT DEFAULT 'активна',
-                 is_public INTEGER DEFAULT 0,
-                 chosen_master_id INTEGER DEFAULT NULL,
-                 delayed INTEGER DEFAULT 0,
-                 chat_message_id INTEGER,
-                 created_at TEXT)''')
-
-# ----- Таблица отзывов -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS reviews
-                (id INTEGER PRIMARY KEY,
-                 master_id INTEGER,
-                 master_name TEXT,
-                 user_id INTEGER,
-                 user_name TEXT,
-                 anonymous INTEGER DEFAULT 0,
-                 review_text TEXT,
-                 rating INTEGER,
-                 media_file_id TEXT,
-                 status TEXT DEFAULT 'pending',
-                 created_at TEXT)''')
-
-# ----- Таблица мастеров (одна запись – один мастер) -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS masters
-                (id INTEGER PRIMARY KEY,
-                 user_id INTEGER UNIQUE,
-                 name TEXT,
-                 service TEXT,
-                 phone TEXT,
-                 districts TEXT,
-                 price_min TEXT,
-                 price_max TEXT,
-                 experience TEXT,
-                 bio TEXT DEFAULT "",
-                 portfolio TEXT,
-                 rating REAL DEFAULT 0,
-                 reviews_count INTEGER DEFAULT 0,
-                 status TEXT DEFAULT 'активен',
-                 entity_type TEXT DEFAULT 'individual',
-                 verification_type TEXT DEFAULT 'simple',
-                 documents_verified INTEGER DEFAULT 0,
-                 photos_verified INTEGER DEFAULT 0,
-                 reviews_verified INTEGER DEFAULT 0,
-                 preferred_contact TEXT DEFAULT 'telegram',
-                 documents_list TEXT DEFAULT '',
-                 payment_methods TEXT DEFAULT '',
-                 age_group TEXT DEFAULT '',
-                 channel_message_id INTEGER,
-                 source TEXT DEFAULT 'bot',
-                 created_at TEXT)''')
-
-# ----- Таблица анкет мастеров (на проверку) -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS master_applications
-                (id INTEGER PRIMARY KEY,
-                 user_id INTEGER UNIQUE,
-                 username TEXT,
-                 name TEXT,
-                 service TEXT,
-                 phone TEXT,
-                 districts TEXT,
-                 price_min TEXT,
-                 price_max TEXT,
-                 experience TEXT,
-                 bio TEXT DEFAULT "",
-                 portfolio TEXT,
-                 documents TEXT,
-                 entity_type TEXT DEFAULT 'individual',
-                 verification_type TEXT DEFAULT 'simple',
-                 documents_list TEXT DEFAULT '',
-                 payment_methods TEXT DEFAULT '',
-                 preferred_contact TEXT DEFAULT 'telegram',
-                 age_group TEXT DEFAULT '',
-                 source TEXT DEFAULT 'bot',
-                 status TEXT,
-                 created_at TEXT)''')
-
-# ----- Таблица рекомендаций (расширенная, через /recommend) -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS recommendations
-                (id INTEGER PRIMARY KEY,
-                 user_id INTEGER,
-                 username TEXT,
-                 master_name TEXT,
-                 service TEXT,
-                 contact TEXT,
-                 description TEXT,
-                 price_level TEXT,
-                 satisfaction TEXT,
-                 recommend TEXT,
-                 media_file_id TEXT,
-                 status TEXT DEFAULT 'на модерации',
-                 created_at TEXT)''')
-
-# ----- Таблица клиентских рекомендаций (из чата через хештеги) -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS client_recommendations
-                (id INTEGER PRIMARY KEY,
-                 user_id INTEGER,
-                 username TEXT,
-                 message_id INTEGER,
-                 hashtag TEXT,
-                 contact TEXT,
-                 description TEXT,
-                 media_file_id TEXT,
-                 status TEXT DEFAULT 'new',
-                 created_at TEXT)''')
-
-# ----- Таблица лайков для клиентских рекомендаций -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS rec_likes
-                (id INTEGER PRIMARY KEY,
-                 rec_id INTEGER,
-                 user_id INTEGER,
-                 created_at TEXT,
-                 UNIQUE(rec_id, user_id))''')
-
-# ----- Таблица комментариев для клиентских рекомендаций -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS rec_comments
-                (id INTEGER PRIMARY KEY,
-                 rec_id INTEGER,
-                 user_id INTEGER,
-                 username TEXT,
-                 comment TEXT,
-                 created_at TEXT)''')
-
-# ----- Таблица откликов мастеров на заявки -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS responses
-                (id INTEGER PRIMARY KEY,
-                 request_id INTEGER,
-                 master_id INTEGER,
-                 price TEXT,
-                 comment TEXT,
-                 status TEXT DEFAULT 'pending',
-                 created_at TEXT,
-                 updated_at TEXT)''')
-
-# ----- Таблица запросов на подробности об отзыве -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS review_questions
-                (id INTEGER PRIMARY KEY,
-                 review_id INTEGER,
-                 from_user_id INTEGER,
-                 from_username TEXT,
-                 question TEXT,
-                 answered INTEGER DEFAULT 0,
-                 created_at TEXT)''')
-
-# ----- Таблица для хранения жалоб на отзывы -----
-cursor.execute('''CREATE TABLE IF NOT EXISTS review_complaints
-                (id INTEGER PRIMARY KEY,
-                 review_id INTEGER,
-                 master_id INTEGER,
-                 complaint_text TEXT,
-                 status TEXT DEFAULT 'new',
-                 created_at TEXT)''')
-
-conn.commit()
-
-# ================ АВТОМАТИЧЕСКОЕ ДОБАВЛЕНИЕ НЕДОСТАЮЩИХ КОЛОНОК ================
-def add_column_if_not_exists(table, column, col_type):
+# У каждого потока своё соединение (WAL), conn / cursor – прокси на соединение текущего потока
+storage = Storage(DB_PATH, profile=DB_PROFILE, factory=metrics.connection_class())
+conn = storage.conn
+cursor = storage.cursor
+print(f"✅ БД открыта: режим {storage.journal_mode}, профиль {DB_PROFILE}")
+
+# Таблицы, индексы и триггеры создаются миграциями (migrations.py) – см. «МИГРАЦИИ БАЗЫ» ниже
+
+# ================ СЕССИИ ДИАЛОГОВ ================
+# Состояние анкет и заявок хранится в БД и переживает перезапуск бота
+sessions = SessionStore(storage, capacity=SESSION_CACHE_SIZE)
+SESSION_TTL = SESSION_TTL_HOURS * 3600
+
+bot.master_data = sessions.namespace('master', SESSION_TTL)
+bot.request_data = sessions.namespace('request', SESSION_TTL)
+bot.recommend_data = sessions.namespace('recommend', SESSION_TTL)
+bot.admin_add_data = sessions.namespace('admin_add', SESSION_TTL)
+bot.master_review_text = sessions.namespace('review_text', SESSION_TTL)
+bot.next_step_backend = StepHandlerBackend(sessions, SESSION_TTL)
+
+
+def process_message(message, update_type='message'):
+    """Сообщение целиком, в полосе пользователя: шаг анкеты или обычные обработчики."""
+    handlers = bot.next_step_backend.get_handlers(message.chat.id)
+    if not handlers:
+        bot._run_middlewares_and_handler(message, bot.message_handlers, None, update_type)
+        return
+    for handler in handlers:
+        metrics.timed(handler["callback"])(message, *handler["args"], **handler["kwargs"])
+
+
+def notify_next_handlers(new_messages):
+    """Замена TeleBot._notify_next_handlers: сообщения уходят в полосы, шаг анкеты ищется там.
+
+    telebot ищет шаг в потоке polling, когда обновление только пришло: ответ,
+    отправленный до того, как обработчик кнопки в полосе дошёл до
+    register_next_step_handler, попал бы в обычные обработчики и потерялся.
+    В полосе все предыдущие обновления пользователя уже обработаны.
+    (Заодно обходим ошибку telebot: сообщение удалялось из new_messages
+    внутри enumerate, и следующее за ним в той же пачке пропускалось.)
+    """
+    for message in new_messages:
+        bot._exec_task(process_message, message, update_type='message')
+    # Остальные шаги process_new_messages получают пустой список
+    new_messages.clear()
+
+
+bot._notify_next_handlers = notify_next_handlers
+
+# ================ ВХОДЯЩИЕ ОБНОВЛЕНИЯ ================
+# Обновления сохраняются в inbox до подтверждения Telegram и повторяются после падения (inbox.py)
+inbox = Inbox(storage)
+
+def process_update(data):
+    """Обновление целиком, в полосе пользователя; обработчики выполняются здесь же (см. LaneDispatcher.put)."""
+    error = None
     try:
-        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
-        print(f"✅ Колонка {column} добавлена в {table}")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print(f"ℹ️ Колонка {column} уже существует в {table}")
-        else:
-            print(f"⚠️ Ошибка при добавлении {column} в {table}: {e}")
-
-# Проверка для master_applications
-add_column_if_not_exists('master_applications', 'verification_type', "TEXT DEFAULT 'simple'")
-add_column_if_not_exists('master_applications', 'documents_list', "TEXT DEFAULT ''")
-add_column_if_not_exists('master_applications', 'payment_methods', "TEXT DEFAULT ''")
-add_column_if_not_exists('master_applications', 'preferred_contact', "TEXT DEFAULT 'telegram'")
-add_column_if_not_exists('master_applications', 'age_group', "TEXT DEFAULT ''")
-
-# Проверка для masters
-add_column_if_not_exists('masters', 'documents', "TEXT DEFAULT ''")
-add_column_if_not_exists('masters', 'documents_list', "TEXT DEFAULT ''")
-add_column_if_not_exists('masters', 'payment_methods', "TEXT DEFAULT ''")
-add_column_if_not_exists('masters', 'preferred_contact', "TEXT DEFAULT 'telegram'")
-add_column_if_not_exists('masters', 'age_group', "TEXT DEFAULT ''")
-add_column_if_not_exists('masters', 'documents_verified', "INTEGER DEFAULT 0")
-add_column_if_not_exists('masters', 'photos_verified', "INTEGER DEFAULT 0")
-add_column_if_not_exists('masters', 'reviews_verified', "INTEGER DEFAULT 0")
-
-# Проверка для responses (добавляем updated_at, если нет)
-add_column_if_not_exists('responses', 'updated_at', "TEXT DEFAULT ''")
-
-conn.commit()
-
-# ================ СПИСКИ ДЛЯ ВЫБОРА ================
-
-PROFILES = [
-    ("plumber", "Сантехник"),
-    ("electrician", "Электрик"),
-    ("finisher", "Отделочник"),
-    ("builder", "Строитель"),
-    ("welder", "Сварщик"),
-    ("handyman", "Разнорабочий"),
-    ("other", "Другое"),
-    ("designer", "Дизайнер интерьера"),
-    ("full", "Полный комплекс")
-]
-PROFILES_DICT = {code: name for code, name in PROFILES}
-
-DISTRICTS = [
-    ("center", "Центр"),
-    ("sneg", "Снеговая Падь"),
-    ("pervorech", "Первореченский (Гоголя, Толстого, ДальПресс)"),
-    ("sovetsky", "Советский район (100-летие, Вторая речка, Заря, Варяг)"),
-    ("pervomay", "Первомайский район (Луговая, Окатовая, Тихая, Патрокл)"),
-    ("frunze", "Фрунзенский район (Эгершельд, Маяк)")
-]
-DISTRICTS_DICT = {code: name for code, name in DISTRICTS}
-
-DOC_TYPES = [
-    ("contract", "Договор"),
-    ("act", "Акт выполненных работ"),
-    ("check", "Чек"),
-    ("invoice", "Счёт"),
-    ("ip", "Свидетельство ИП"),
-    ("selfemployed", "Самозанятость"),
-    ("passport", "Паспорт (для проверки)")
-]
-DOC_TYPES_DICT = {code: name for code, name in DOC_TYPES}
-
-PAYMENT_METHODS = [
-    ("cash", "Наличные"),
-    ("transfer", "Перевод на карту"),
-    ("account", "Расчётный счёт")
-]
-PAYMENT_DICT = {code: name for code, name in PAYMENT_METHODS}
-
-EXPERIENCE_OPTIONS = [
-    ("less1", "Менее 1 года"),
-    ("1-3", "1–3 года"),
-    ("3-5", "3–5 лет"),
-    ("5-10", "5–10 лет"),
-    ("more10", "Более 10 лет"),
-    ("custom", "Свой вариант (ввести текст)")
-]
-EXPERIENCE_DICT = {code: name for code, name in EXPERIENCE_OPTIONS}
+        bot.process_new_updates([types.Update.de_json(data)])
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        inbox.done(data['update_id'], error)
+
+def dispatch_update(data):
+    bot._exec_task(process_update, data)
+
+# ================ ИНДЕКС ПОДБОРА МАСТЕРОВ ================
+match_index = MatchIndex(PROFILES, DISTRICTS)
+# Готовые карточки «👤 Подробнее»; сбрасываются в sync_master и при изменении отзывов
+master_cards = MasterCardCache(MASTER_CARD_CACHE_SIZE)
+
+def write_master_tags(master_id, services, districts):
+    """Перезаписывает коды профилей и районов мастера в master_services / master_districts."""
+    profiles = match_index.parse_profiles(services)
+    district_codes = match_index.parse_districts(districts)
+    cursor.execute("DELETE FROM master_services WHERE master_id = ?", (master_id,))
+    cursor.execute("DELETE FROM master_districts WHERE master_id = ?", (master_id,))
+    cursor.executemany("INSERT INTO master_services (master_id, code) VALUES (?, ?)",
+                       [(master_id, code) for code in profiles])
+    cursor.executemany("INSERT INTO master_districts (master_id, code) VALUES (?, ?)",
+                       [(master_id, code) for code in district_codes])
+    return profiles, district_codes
+
+def sync_master(master_id, services=None):
+    """Синхронизирует коды мастера и индекс подбора после изменения в таблице masters.
+
+    services – полный список профилей, если в masters.service записан только первый.
+    """
+    master_cards.invalidate(master_id)
+    cursor.execute('SELECT user_id, service, districts, verification_type, status FROM masters WHERE id = ?', (master_id,))
+    row = cursor.fetchone()
+    if not row:
+        with storage.transaction():
+            cursor.execute("DELETE FROM master_services WHERE master_id = ?", (master_id,))
+            cursor.execute("DELETE FROM master_districts WHERE master_id = ?", (master_id,))
+            changes.publish('master', master_id)
+        match_index.remove(master_id)
+        return
+    user_id, service, districts, verification_type, status = row
+    with storage.transaction():
+        profiles, district_codes = write_master_tags(master_id, services or service, districts)
+        changes.publish('master', master_id)
+    match_index.update(master_id, user_id, profiles, district_codes, verification_type, status)
+
+def refresh_master(master_id):
+    """Индекс и карточка мастера по базе – после изменения в другом процессе (см. cluster.ChangeFeed)."""
+    master_cards.invalidate(master_id)
+    cursor.execute('SELECT user_id, verification_type, status FROM masters WHERE id = ?', (master_id,))
+    row = cursor.fetchone()
+    if not row:
+        match_index.remove(master_id)
+        return
+    user_id, verification_type, status = row
+    cursor.execute("SELECT code FROM master_services WHERE master_id = ?", (master_id,))
+    profiles = {code for code, in cursor.fetchall()}
+    cursor.execute("SELECT code FROM master_districts WHERE master_id = ?", (master_id,))
+    district_codes = {code for code, in cursor.fetchall()}
+    match_index.update(master_id, user_id, profiles, district_codes, verification_type, status)
+
+def forget_user(user_id):
+    """Пользователь удалил свои данные: убираем его из индекса, карточки строим заново."""
+    match_index.remove_user(user_id)
+    # Удалены и карточка мастера, и отзывы пользователя о других мастерах (их рейтинги изменились)
+    master_cards.clear()
+
+# ================ МИГРАЦИИ БАЗЫ ================
+migrations.apply(storage, match_index=match_index)
+print(f"✅ Схема БД: версия {migrations.current(storage.connection())}")
+
+# Изменения мастеров в других процессах (воркеры, резервный экземпляр) – в кеши этого процесса
+changes = ChangeFeed(storage)
+changes.subscribe('master', refresh_master)
+changes.subscribe('user_removed', forget_user)
+
+print(f"✅ Индекс мастеров построен: {match_index.load(cursor)} активных")
 
 # ================ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ================
 def safe_text(message):
@@ -338,19 +280,13 @@ def only_private(message):
     return True
 
 def reset_webhook():
+    # Без drop_pending_updates: обновления, пришедшие пока бот был выключен, заберёт polling
     try:
-        requests.get(f"https://api.telegram.org/bot{TOKEN}/deleteWebhook?drop_pending_updates=True")
+        requests.get(f"{TELEGRAM_API_URL}/bot{TOKEN}/deleteWebhook")
         print("✅ Webhook сброшен")
     except Exception as e:
         print(f"⚠️ Ошибка сброса вебхука: {e}")
 
-def stop_other_instances():
-    try:
-        requests.get(f"https://api.telegram.org/bot{TOKEN}/getUpdates?offset=-1&timeout=0")
-        print("✅ Другие экземпляры остановлены")
-    except Exception as e:
-        print(f"⚠️ Ошибка остановки других экземпляров: {e}")
-
 def is_night_time():
     now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
     local_time = now_utc + timedelta(hours=TIMEZONE_OFFSET)
@@ -360,11 +296,16 @@ def is_night_time():
     else:
         return NIGHT_START_HOUR <= hour < NIGHT_END_HOUR
 
+# Темп публикации в канал: Telegram ограничивает частоту сообщений в группы и каналы
+channel_bucket = TokenBucket(CHANNEL_POSTS_PER_MINUTE / PROCESSES / 60, capacity=1)
+
 def publish_delayed_requests():
     if is_night_time():
         return
     cursor.execute("SELECT id, service, description, district, date, budget FROM requests WHERE delayed = 1 AND status = 'активна'")
     delayed = cursor.fetchall()
+    if delayed:
+        print(f"🌅 Публикация отложенных заявок: {len(delayed)}")
     for req in delayed:
         req_id, service, desc, district, date, budget = req
         client_alias = f"Клиент #{req_id % 10000}"
@@ -381,12 +322,23 @@ def publish_delayed_requests():
         """
         markup = types.InlineKeyboardMarkup()
         markup.add(types.InlineKeyboardButton("📞 Откликнуться", callback_data=f"channel_respond_{req_id}"))
-        try:
-            sent = bot.send_message(CHANNEL_ID, text, reply_markup=markup)
+        for attempt in range(3):
+            channel_bucket.acquire()
+            try:
+                sent = bot.send_message(CHANNEL_ID, text, reply_markup=markup)
+            except Exception as e:
+                retry_after = retry_after_of(e)
+                if retry_after is not None and attempt < 2:
+                    channel_bucket.pause(retry_after)
+                    continue
+                print(f"Ошибка публикации отложенной заявки {req_id}: {e}")
+                break
             cursor.execute("UPDATE requests SET delayed = 0, chat_message_id = ? WHERE id = ?", (sent.message_id, req_id))
             conn.commit()
-        except Exception as e:
-            print(f"Ошибка публикации отложенной заявки {req_id}: {e}")
+            # Ночью мастерам тоже ничего не отправляли – рассылаем вместе с публикацией
+            notify_masters_about_new_request(req_id, {'service': service, 'description': desc, 'district': district,
+                                                      'date': date, 'budget': budget})
+            break
 
 def get_master_status(user_id):
     cursor.execute("SELECT status FROM masters WHERE user_id = ?", (user_id,))
@@ -413,6 +365,34 @@ def check_bot_admin_in_chat(chat_id):
         print(f"⚠️ Не удалось проверить права в чате {chat_id}: {e}")
         return False
 
+# ================ МАРШРУТИЗАЦИЯ КНОПОК ================
+# Все callback-кнопки проходят через один обработчик: callback_data
+# разбирается один раз, обработчик находится по префиксному дереву.
+router = CallbackRouter()
+metrics.instrument_router(router)
+
+@bot.callback_query_handler(func=lambda call: True)
+def callback_dispatch(call):
+    if not router.dispatch(call):
+        # Кнопка без обработчика – убираем «часики» у пользователя
+        bot.answer_callback_query(call.id)
+
+# Кнопки, которые пишут в базу и рассылают уведомления: повторное нажатие на том же
+# сообщении не выполняется (двойной тап при задержке, см. idempotency.py)
+callback_guard = CallbackGuard(storage, on_repeat=lambda call: bot.answer_callback_query(call.id, "⏳ Уже выполнено"))
+metrics.gauge('callback_guard_total', 'Нажатия охраняемых кнопок: первые и повторные',
+              callback_guard.stats, label='result')
+
+# Списки (каталог, мои заявки, очереди модерации) – по PAGE_SIZE строк в одном сообщении
+paginator = Paginator(bot, router, cursor)
+
+# Анкеты и заявки – шаг за шагом в одном сообщении (анкеты регистрируются в своих разделах)
+wizard = Wizard(bot, router)
+
+def shorten(text, limit=300):
+    text = text or ''
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
 # ================ УДАЛЕНИЕ КОМАНД В ЧАТЕ ================
 @bot.message_handler(func=lambda message: message.chat.type != 'private')
 def delete_group_commands(message):
@@ -517,11 +497,10 @@ def start(message):
         role = row[0]
         show_role_menu(message, role)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('role_'))
-def role_callback(call):
-    role = call.data.split('_')[1]
+@router.route('role_{role}')
+def role_callback(call, role):
     user_id = call.from_user.id
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+    now = utc_now()
     if role == 'client':
         cursor.execute('INSERT OR REPLACE INTO users (user_id, role, first_seen, last_active) VALUES (?, ?, ?, ?)',
                        (user_id, 'client', now, now))
@@ -562,17 +541,18 @@ def role_callback(call):
         show_role_menu(call.message, 'guest')
         bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data in ['master_full', 'master_simple'])
+@router.route('master_full')
+@router.route('master_simple')
 def master_registration_choice(call):
     verif_type = 'full' if call.data == 'master_full' else 'simple'
     user_id = call.from_user.id
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+    now = utc_now()
     cursor.execute('INSERT OR REPLACE INTO users (user_id, role, first_seen, last_active) VALUES (?, ?, ?, ?)',
                    (user_id, 'master', now, now))
     conn.commit()
-    bot.edit_message_text("✅ Роль сохранена: **Мастер**. Теперь заполните анкету.",
-                          call.message.chat.id, call.message.message_id, parse_mode='Markdown')
-    become_master(call.message, verif_type)
+    # call.message отправлено ботом – его from_user это бот, а не мастер;
+    # анкета продолжается в этом же сообщении
+    become_master(call.message, verif_type, user_id, anchor=call.message.message_id)
     bot.answer_callback_query(call.id)
 
 @bot.message_handler(func=lambda message: message.text == '👷 Зарегистрироваться как мастер')
@@ -584,739 +564,274 @@ def guest_register(message):
     if st is not None:
         bot.send_message(message.chat.id, "❌ Вы уже зарегистрированы как мастер. Используйте меню.")
         return
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+    now = utc_now()
     cursor.execute('UPDATE users SET role = ?, last_active = ? WHERE user_id = ?', ('master', now, user_id))
     conn.commit()
     bot.send_message(message.chat.id, "✅ Теперь вы – мастер. Заполните анкету для получения заказов.")
     become_master(message, 'simple')
 
 # ================ АНКЕТА МАСТЕРА (НОВАЯ ВЕРСИЯ) ================
-if not hasattr(bot, 'master_data'):
-    bot.master_data = {}
-
-def become_master(message, verif_type='simple'):
-    """Начало анкеты мастера. verif_type: 'simple' или 'full'."""
+# Шаги описаны один раз и общие для анкеты мастера и ручного добавления мастера
+# админом (см. «РУЧНОЕ ДОБАВЛЕНИЕ МАСТЕРА»); вся анкета – одно сообщение (wizard.py)
+ENTITY_TYPES = [("individual", "👤 Частное лицо / Самозанятый"), ("company", "🏢 Компания / ИП")]
+AGE_GROUPS = [("under25", "до 25 лет"), ("25_35", "25-35 лет"), ("35_50", "35-50 лет"),
+              ("over50", "старше 50"), ("skip", "⏩ Пропустить")]
+AGE_VALUES = {'under25': 'до 25', '25_35': '25-35', '35_50': '35-50', 'over50': 'старше 50', 'skip': ''}
+# Документы, которые мастер может показать при полной регистрации
+PROOF_DOCUMENTS = [("contract", "Договор"), ("act", "Акт"), ("check", "Чек")]
+ADMIN_DOCUMENTS = [("yes", "✅ Да"), ("no", "❌ Нет"), ("skip", "⏩ Пропустить")]
+
+def save_profiles(data, selected):
+    data.update(profiles=", ".join(selected), services=", ".join(selected), service=selected[0])
+
+def save_price(data, price):
+    data.update(price_min=price, price_max='')
+
+def save_proof_documents(data, selected):
+    if selected is None:
+        # Пропуск – анкета становится упрощённой: без проверки, публикуется сразу
+        data.update(documents="Нет", documents_list="", documents_verified='no', verification_type='simple')
+    else:
+        data.update(documents="Есть", documents_list=", ".join(selected), documents_verified='pending')
+
+def portfolio_buttons(data):
+    buttons = []
+    if data.get('verification_type') == 'full' and data.get('documents_verified') == 'pending':
+        buttons.append(("📤 Отправить фото админу", "portfolio_send_to_admin"))
+    buttons.append(("❓ Как загрузить фото?", "help_portfolio"))
+    return buttons
+
+def master_form_steps(admin=False):
+    """Шаги анкеты мастера; admin=True – формулировки для админа, который добавляет мастера сам."""
+    def ask(own, other):
+        return other if admin else own
+
+    def ask_name(data):
+        if data.get('entity_type') == 'individual':
+            return ask("👇 👤 **ВВЕДИТЕ ВАШЕ ПОЛНОЕ ИМЯ (как в документах):**", "👇 👤 **ВВЕДИТЕ ПОЛНОЕ ИМЯ МАСТЕРА:**")
+        return "👇 🏢 **ВВЕДИТЕ НАЗВАНИЕ КОМПАНИИ ИЛИ БРИГАДЫ:**"
+
+    steps = [
+        Choice('entity', "👇 **ВЫБЕРИТЕ ТИП:**", ENTITY_TYPES, key='entity_type', row_width=2,
+               values={code: code for code, _ in ENTITY_TYPES}),
+        TextInput('name', ask_name, error="❌ Пожалуйста, введите имя/название."),
+        Choice('age', ask("🎂 Укажите ваш возраст (необязательно).", "🎂 Укажите возраст мастера (необязательно)."),
+               AGE_GROUPS, key='age_group', values=AGE_VALUES, row_width=3),
+        MultiChoice('prof', ask("👷 Выберите **профили**, по которым вы работаете (можно несколько). "
+                                "Именно по ним будут приходить заявки от клиентов.\n\n"
+                                "⚠️ Вы можете заполнить только одну анкету. "
+                                "Позже её можно будет редактировать или отозвать.",
+                                "👷 Выберите **профили** мастера (можно несколько):"),
+                    PROFILES, selected='selected_profiles', required="❌ Выберите хотя бы один профиль",
+                    save=save_profiles),
+        Choice('exp', ask("⏱️ Выберите ваш опыт работы:", "⏱️ Выберите опыт работы мастера:"),
+               EXPERIENCE_OPTIONS, key='experience', custom='custom',
+               custom_prompt=ask("⏱️ Введите ваш опыт работы текстом:", "⏱️ Введите опыт работы текстом:")),
+        MultiChoice('dist', ask("📍 **Выберите районы работы** (можно несколько):",
+                                "📍 Выберите районы работы мастера (можно несколько):"),
+                    DISTRICTS, key='districts', selected='selected_districts',
+                    required="❌ Выберите хотя бы один район"),
+        TextInput('price', "💰 Введите **минимальную цену заказа** (например: 1000₽, договорная):",
+                  error="❌ Пожалуйста, укажите минимальную цену.", save=save_price),
+        MultiChoice('pay', ask("💳 Какие способы оплаты вы принимаете? (можно несколько)",
+                               "💳 Какие способы оплаты принимает мастер? (можно несколько)"),
+                    PAYMENT_METHODS, key='payment_methods', selected='selected_payments'),
+        TextInput('bio', ask("📝 👇 **КОММЕНТАРИЙ О СЕБЕ (кратко):**\n\n"
+                             "Расскажите о себе пару слов: опыт, подход к работе.\n"
+                             "Это увидят клиенты в вашей карточке.\n\n"
+                             "👉 **Или нажмите «Пропустить»**",
+                             "📝 👇 **КОММЕНТАРИЙ О МАСТЕРЕ (кратко):**\n\n"
+                             "Расскажите о мастере пару слов.\n\n"
+                             "👉 **Или нажмите «Пропустить»**"),
+                  skip="Не указано"),
+        MultiChoice('contact', ask("📞 Выберите предпочтительные способы связи (можно несколько):",
+                                   "📞 Выберите способы связи мастера (можно несколько):"),
+                    CONTACT_METHODS, key='preferred_contact', selected='selected_contacts',
+                    required="❌ Выберите хотя бы один способ связи"),
+        TextInput('phone', ask("📞 Введите ваш телефон (будет виден только администратору):",
+                               "📞 Введите **контактный телефон мастера** (будет виден клиентам):"),
+                  error="❌ Пожалуйста, введите телефон."),
+    ]
+    if admin:
+        steps += [
+            Choice('docs', "📄 Использует ли мастер документы (договор, акт и т.п.)?", ADMIN_DOCUMENTS,
+                   key='documents', values={'yes': "Есть", 'no': "Нет", 'skip': "Пропустить"}, row_width=3),
+            MultiChoice('doctypes', "📄 Какие документы может предоставить мастер? (можно несколько)",
+                        DOC_TYPES, key='documents_list', selected='selected_docs',
+                        when=lambda data: data.get('documents') == "Есть"),
+            TextInput('portfolio', "📸 👇 **ССЫЛКА НА ПОРТФОЛИО МАСТЕРА:**\n\n"
+                                   "Это может быть ссылка на Яндекс.Диск, Google Фото, Telegram-канал с работами.\n\n"
+                                   "👉 **Или нажмите «Пропустить»**",
+                      skip="Не указано"),
+        ]
+    else:
+        steps += [
+            # Только для полной регистрации
+            MultiChoice('docs', "📄 Какие документы вы можете предоставить? (можно выбрать несколько).\n\n"
+                                "⚠️ Если вы выберете хотя бы один вариант, вам нужно будет предоставить "
+                                "фото/скан для проверки. Если вы выберете «Пропустить», анкета будет считаться "
+                                "упрощённой (без проверки) и сразу опубликуется.",
+                        PROOF_DOCUMENTS, selected='selected_docs', required="❌ Вы не выбрали ни одного документа",
+                        skip="⏩ Пропустить", save=save_proof_documents,
+                        when=lambda data: data.get('verification_type') == 'full'),
+            TextInput('portfolio', "📸 👇 **ССЫЛКА НА ПОРТФОЛИО (НЕОБЯЗАТЕЛЬНО):**\n\n"
+                                   "Вы можете отправить ссылку на Яндекс.Диск, Google Фото, Telegram-канал с работами.\n"
+                                   "Если у вас нет ссылки, нажмите «Пропустить».",
+                      skip="Не указано", buttons=portfolio_buttons),
+        ]
+    return steps
+
+def become_master(message, verif_type='simple', user_id=None, anchor=None):
+    """Начало анкеты мастера. verif_type: 'simple' или 'full'; anchor – сообщение, в котором пойдёт анкета."""
     if not only_private(message):
         return
-    user_id = message.from_user.id
+    user_id = user_id or message.from_user.id
     st, _ = get_master_status(user_id)
     if st is not None:
         bot.send_message(message.chat.id, "❌ У вас уже есть анкета. Используйте меню для управления.")
         return
-
-    # Очищаем старые данные
-    if user_id in bot.master_data:
-        del bot.master_data[user_id]
-    # Инициализируем с типом регистрации и портфолио по умолчанию
-    bot.master_data[user_id] = {
+    # Тип регистрации и значения по умолчанию; старые данные анкеты заменяются
+    wizard.start('master', message.chat.id, user_id, {
         'verification_type': verif_type,
         'portfolio': 'Не указано',
         'documents': 'Нет',          # по умолчанию документов нет
         'documents_list': '',
         'documents_verified': 'no'
-    }
-
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    markup.add(
-        types.InlineKeyboardButton("👤 Частное лицо / Самозанятый", callback_data="entity_individual"),
-        types.InlineKeyboardButton("🏢 Компания / ИП", callback_data="entity_company")
-    )
-    bot.send_message(
-        message.chat.id,
-        "👷 **ЗАПОЛНЕНИЕ АНКЕТЫ МАСТЕРА**\n\n"
-        "Шаг 1 из 13\n"
-        "👇 **ВЫБЕРИТЕ ТИП:**",
-        reply_markup=markup
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('entity_'))
-def entity_callback(call):
-    entity_type = call.data.split('_')[1]
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.master_data[user_id] = {}
-    bot.master_data[user_id]['entity_type'] = entity_type
-
-    if bot.master_data[user_id].get('entity_type') == 'individual':
-        question = "👤 **ВВЕДИТЕ ВАШЕ ПОЛНОЕ ИМЯ (как в документах):**"
-    else:
-        question = "🏢 **ВВЕДИТЕ НАЗВАНИЕ КОМПАНИИ ИЛИ БРИГАДЫ:**"
+    }, anchor=anchor)
 
-    bot.edit_message_text(
-        f"👷 **ЗАПОЛНЕНИЕ АНКЕТЫ МАСТЕРА**\n\n"
-        f"Шаг 2 из 13\n"
-        f"👇 {question}",
-        call.message.chat.id,
-        call.message.message_id
-    )
-    bot.register_next_step_handler(call.message, process_master_name)
+@router.route('help_portfolio')
+def help_portfolio_callback(call):
     bot.answer_callback_query(call.id)
-
-def process_master_name(message):
-    if message.chat.type != 'private':
-        return
-    name = safe_text(message)
-    if not name:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, введите имя/название.")
-        return
-    user_id = message.from_user.id
-    if user_id not in bot.master_data:
-        bot.master_data[user_id] = {}
-    bot.master_data[user_id]['name'] = name
-    # Переходим к возрасту
-    ask_age(message.chat.id, user_id)
-
-def ask_age(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=3)
-    markup.add(
-        types.InlineKeyboardButton("до 25 лет", callback_data="age_under25"),
-        types.InlineKeyboardButton("25-35 лет", callback_data="age_25_35"),
-        types.InlineKeyboardButton("35-50 лет", callback_data="age_35_50"),
-        types.InlineKeyboardButton("старше 50", callback_data="age_over50"),
-        types.InlineKeyboardButton("⏩ Пропустить", callback_data="age_skip")
-    )
     bot.send_message(
-        chat_id,
-        "🎂 **Шаг 3 из 13**\n\n"
-        "Укажите ваш возраст (необязательно).",
-        reply_markup=markup
+        call.message.chat.id,
+        "📸 **Как загрузить фото в портфолио:**\n\n"
+        "1. Загрузите фото на Яндекс.Диск, Google Фото или другой файлообменник.\n"
+        "2. Скопируйте ссылку на папку или альбом.\n"
+        "3. Отправьте эту ссылку в ответ на это сообщение.\n\n"
+        "Если вы выбрали проверку документов, вы также можете отправить фото администратору через специальную кнопку."
     )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('age_'))
-def age_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
+@router.route('portfolio_send_to_admin')
+def portfolio_send_to_admin_callback(call):
+    # Портфолио – фото админу после сохранения анкеты; переходим к сводке
+    if not wizard.advance('master', call, send_portfolio_later=True):
         bot.answer_callback_query(call.id, "❌ Начните анкету заново")
         return
-    age_map = {
-        'under25': 'до 25',
-        '25_35': '25-35',
-        '35_50': '35-50',
-        'over50': 'старше 50',
-        'skip': ''
-    }
-    key = call.data[4:]
-    bot.master_data[user_id]['age_group'] = age_map.get(key, '')
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    ask_profiles_multiple(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id)
+    bot.answer_callback_query(call.id, "✅ Вы сможете отправить фото после заполнения анкеты.")
 
-def ask_profiles_multiple(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_profiles' not in bot.master_data[user_id]:
-        bot.master_data[user_id]['selected_profiles'] = []
-    selected = bot.master_data[user_id]['selected_profiles']
-    for code, name in PROFILES:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(
-            f"{prefix}{name}",
-            callback_data=f"prof_{code}"
-        ))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="prof_done"))
-    bot.send_message(
-        chat_id,
-        "👷 **Шаг 4 из 13**\n\n"
-        "Выберите **профили**, по которым вы работаете (можно несколько). "
-        "Именно по ним будут приходить заявки от клиентов.\n\n"
-        "⚠️ Вы можете заполнить только одну анкету. Позже её можно будет редактировать или отозвать.",
-        reply_markup=markup
-    )
+# ---------- СВОДКА И СОХРАНЕНИЕ ----------
+def master_summary(source, user_id, data):
+    summary = f"""
+📋 **Сводка анкеты:**
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('prof_'))
-def profile_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    data = call.data[5:]  # убираем 'prof_'
-    if data == "done":
-        selected = bot.master_data[user_id].get('selected_profiles', [])
-        if not selected:
-            bot.answer_callback_query(call.id, "❌ Выберите хотя бы один профиль")
-            return
-        bot.master_data[user_id]['profiles'] = ", ".join(selected)
-        bot.master_data[user_id]['service'] = selected[0]
-        bot.master_data[user_id]['services'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        ask_experience(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id, "✅ Профили сохранены")
+👤 **Имя/Название:** {data['name']}
+🔧 **Профили:** {data.get('profiles', data.get('services', ''))}
+🎂 **Возраст:** {data.get('age_group', 'Не указан')}
+⏱ **Опыт:** {data['experience']}
+📍 **Районы:** {data['districts']}
+💰 **Минимальная цена:** {data['price_min']}
+💳 **Оплата:** {data.get('payment_methods', 'Не указано')}
+💬 **О себе:** {data.get('bio', 'Не указано')}
+📞 **Предпочтительный контакт:** {data.get('preferred_contact', 'telegram')}
+📞 **Телефон:** {data['phone']}
+📄 **Документы:** {data.get('documents', 'Нет')}
+   **Список:** {data.get('documents_list', '')}
+🛡️ **Проверка документов:** {'✅ Требуется' if data.get('documents_verified')=='pending' else '❌ Не требуется'}
+📸 **Портфолио:** {data.get('portfolio', 'Не указано')}
+    """
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    if data.get('verification_type') == 'simple':
+        # Упрощённая регистрация – только одна кнопка
+        markup.add(types.InlineKeyboardButton("✅ Опубликовать анкету", callback_data=f"save_app_{user_id}"))
     else:
-        profile_name = PROFILES_DICT.get(data)
-        if not profile_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.master_data[user_id].get('selected_profiles', [])
-        if profile_name in selected:
-            selected.remove(profile_name)
-        else:
-            selected.append(profile_name)
-        bot.master_data[user_id]['selected_profiles'] = selected
-        ask_profiles_multiple(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
+        # Полная регистрация – две кнопки
+        markup.add(
+            types.InlineKeyboardButton("📤 Отправить на модерацию", callback_data=f"save_app_{user_id}_moderate"),
+            types.InlineKeyboardButton("💾 Сохранить черновик", callback_data=f"save_app_{user_id}_draft")
+        )
+    markup.add(types.InlineKeyboardButton("✏️ Заполнить заново", callback_data=wizard.callback('master', RESTART)))
+    markup.add(types.InlineKeyboardButton("❌ Отмена", callback_data=wizard.callback('master', CANCEL)))
+    return summary, markup
 
-def ask_experience(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for code, name in EXPERIENCE_OPTIONS:
-        markup.add(types.InlineKeyboardButton(name, callback_data=f"exp_{code}"))
-    bot.send_message(
-        chat_id,
-        "⏱️ **Шаг 5 из 13**\n\nВыберите ваш опыт работы:",
-        reply_markup=markup
-    )
+wizard.register(Form('master', master_form_steps(), bot.master_data, master_summary,
+                     title="👷 **ЗАПОЛНЕНИЕ АНКЕТЫ МАСТЕРА**"))
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('exp_'))
-def experience_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
+@router.route('save_app_{user_id:int}')
+@router.route('save_app_{user_id:int}_{mode}')
+def save_app_callback(call, user_id, mode='simple'):
+    if call.from_user.id != user_id:
+        bot.answer_callback_query(call.id, "❌ Это не ваша анкета")
         return
-    code = call.data[4:]
-    if code == "custom":
-        bot.edit_message_text(
-            "⏱️ Введите ваш опыт работы текстом:",
-            call.message.chat.id,
-            call.message.message_id
-        )
-        bot.register_next_step_handler(call.message, process_custom_experience, user_id)
-        bot.answer_callback_query(call.id)
-    else:
-        exp_map = {k: v for k, v in EXPERIENCE_OPTIONS if k != "custom"}
-        bot.master_data[user_id]['experience'] = exp_map[code]
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        ask_districts_multiple(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def process_custom_experience(message, user_id):
-    exp = safe_text(message)
-    if not exp:
-        bot.send_message(message.chat.id, "❌ Введите опыт.")
+    user_data = bot.master_data.get(user_id)
+    if not user_data:
+        bot.answer_callback_query(call.id, "❌ Данные не найдены")
         return
-    bot.master_data[user_id]['experience'] = exp
-    ask_districts_multiple(message.chat.id, user_id)
-
-def ask_districts_multiple(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_districts' not in bot.master_data[user_id]:
-        bot.master_data[user_id]['selected_districts'] = []
-    selected = bot.master_data[user_id]['selected_districts']
-    for code, name in DISTRICTS:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(
-            f"{prefix}{name}",
-            callback_data=f"dist_{code}"
-        ))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="dist_done"))
-    bot.send_message(
-        chat_id,
-        "📍 **Шаг 6 из 13**\n\n**Выберите районы работы** (можно несколько):",
-        reply_markup=markup
-    )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('dist_'))
-def district_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    data = call.data[5:]  # убираем 'dist_'
-    if data == "done":
-        selected = bot.master_data[user_id].get('selected_districts', [])
-        if not selected:
-            bot.answer_callback_query(call.id, "❌ Выберите хотя бы один район")
-            return
-        bot.master_data[user_id]['districts'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        # Шаг 7 – цена
-        bot.send_message(
-            call.message.chat.id,
-            "💰 **Шаг 7 из 13**\n\n"
-            "Введите **минимальную цену заказа** (например: 1000₽, договорная):"
-        )
-        bot.register_next_step_handler(call.message, process_master_price_min)
-        bot.answer_callback_query(call.id, "✅ Районы сохранены")
-    else:
-        district_name = DISTRICTS_DICT.get(data)
-        if not district_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.master_data[user_id].get('selected_districts', [])
-        if district_name in selected:
-            selected.remove(district_name)
-        else:
-            selected.append(district_name)
-        bot.master_data[user_id]['selected_districts'] = selected
-        ask_districts_multiple(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
+    try:
+        app_id = save_master_application(call.message, user_id, user_data, mode)
+        bot.answer_callback_query(call.id, "✅ Анкета сохранена!")
+        # Сводка в сообщении анкеты сменяется итогом – кнопки сохранения исчезают
+        if mode == 'simple' or mode == 'moderate':
+            bot.edit_message_text("✅ Анкета успешно обработана!", call.message.chat.id, call.message.message_id)
+        elif mode == 'draft':
+            bot.edit_message_text("✅ Анкета сохранена как черновик. Вы можете продолжить позже в разделе «Моя анкета».",
+                                  call.message.chat.id, call.message.message_id)
 
-def process_master_price_min(message):
-    if message.chat.type != 'private':
-        return
-    price_min = safe_text(message)
-    if not price_min:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, укажите минимальную цену.")
-        return
-    user_id = message.from_user.id
-    bot.master_data[user_id]['price_min'] = price_min
-    bot.master_data[user_id]['price_max'] = ''
-    ask_payment_methods(message.chat.id, user_id)
+        # Если есть документы для проверки и режим moderate, предложим отправить документы
+        if mode == 'moderate' and user_data.get('documents_verified') == 'pending':
+            markup = types.InlineKeyboardMarkup()
+            markup.add(types.InlineKeyboardButton("📎 Отправить документы", callback_data=f"send_docs_{app_id}"))
+            bot.send_message(
+                call.message.chat.id,
+                "Вы выбрали вариант с проверкой документов. Теперь вы можете отправить фото/скан документов администратору.",
+                reply_markup=markup
+            )
+        elif mode == 'draft':
+            # Для черновика не предлагаем отправку документов
+            pass
 
-def ask_payment_methods(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_payments' not in bot.master_data[user_id]:
-        bot.master_data[user_id]['selected_payments'] = []
-    selected = bot.master_data[user_id]['selected_payments']
-    for code, name in PAYMENT_METHODS:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(
-            f"{prefix}{name}",
-            callback_data=f"pay_{code}"
-        ))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="pay_done"))
-    bot.send_message(
-        chat_id,
-        "💳 **Шаг 8 из 13**\n\n"
-        "Какие способы оплаты вы принимаете? (можно несколько)",
-        reply_markup=markup
-    )
+        # Возвращаем в главное меню мастера
+        show_role_menu(call.message, 'master')
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('pay_'))
-def payment_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    data = call.data[4:]  # убираем 'pay_'
-    if data == "done":
-        selected = bot.master_data[user_id].get('selected_payments', [])
-        bot.master_data[user_id]['payment_methods'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        ask_bio(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id, "✅ Способы оплаты сохранены")
-    else:
-        pay_name = PAYMENT_DICT.get(data)
-        if not pay_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.master_data[user_id].get('selected_payments', [])
-        if pay_name in selected:
-            selected.remove(pay_name)
-        else:
-            selected.append(pay_name)
-        bot.master_data[user_id]['selected_payments'] = selected
-        ask_payment_methods(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
+        # Очищаем временные данные
+        if user_id in bot.master_data:
+            del bot.master_data[user_id]
 
-def ask_bio(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup()
-    markup.add(types.InlineKeyboardButton("⏩ Пропустить", callback_data="skip_bio"))
-    bot.send_message(
-        chat_id,
-        "📝 **Шаг 9 из 13**\n\n"
-        "👇 **КОММЕНТАРИЙ О СЕБЕ (кратко):**\n\n"
-        "Расскажите о себе пару слов: опыт, подход к работе.\n"
-        "Это увидят клиенты в вашей карточке.\n\n"
-        "👉 **Или нажмите «Пропустить»**",
-        reply_markup=markup
-    )
-    bot.register_next_step_handler_by_chat_id(chat_id, process_master_bio, user_id)
+    except Exception as e:
+        bot.answer_callback_query(call.id, "❌ Ошибка сохранения")
+        bot.send_message(call.message.chat.id, f"❌ Ошибка: {e}")
+        import traceback
+        traceback.print_exc()
 
-@bot.callback_query_handler(func=lambda call: call.data == 'skip_bio')
-def skip_bio_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
+def save_master_application(message, user_id, user_data, mode='simple'):
+    """Сохраняет анкету в зависимости от режима."""
+    # Проверяем наличие обязательных ключей
+    required_keys = ['name', 'phone', 'districts', 'price_min', 'experience']
+    missing = [key for key in required_keys if key not in user_data]
+    if missing:
+        bot.send_message(message.chat.id, f"❌ Отсутствуют данные: {', '.join(missing)}. Пожалуйста, начните анкету заново.")
+        print(f"DEBUG: missing keys for user {user_id}: {missing}")
         return
-    bot.master_data[user_id]['bio'] = "Не указано"
-    ask_contact_methods(call.message.chat.id, user_id)  # следующий шаг – способы связи
-    bot.answer_callback_query(call.id, "⏩ Пропущено")
 
-def process_master_bio(message, user_id):
-    if message.chat.type != 'private':
-        return
-    bio = safe_text(message)
-    if not bio or bio.lower() == "пропустить":
-        bio = "Не указано"
-    bot.master_data[user_id]['bio'] = bio
-    ask_contact_methods(message.chat.id, user_id)
+    name = user_data['name']
+    services_str = user_data.get('services', user_data.get('profiles', ''))
+    service = services_str.split(',')[0].strip()
+    phone = user_data['phone']
+    districts = user_data['districts']
+    price_min = user_data['price_min']
+    price_max = user_data.get('price_max', '')
+    experience = user_data['experience']
+    bio = user_data.get('bio', 'Не указано')
+    portfolio = user_data.get('portfolio', 'Не указано')
+    documents = user_data.get('documents', 'Нет')
+    entity_type = user_data.get('entity_type', 'individual')
+    verification_type = user_data.get('verification_type', 'simple')
+    documents_list = user_data.get('documents_list', '')
+    payment_methods = user_data.get('payment_methods', '')
+    preferred_contact = user_data.get('preferred_contact', 'telegram')
+    age_group = user_data.get('age_group', '')
 
-def ask_contact_methods(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_contacts' not in bot.master_data[user_id]:
-        bot.master_data[user_id]['selected_contacts'] = []
-    selected = bot.master_data[user_id]['selected_contacts']
-    for code, name in [("telegram", "Telegram"), ("whatsapp", "WhatsApp"), ("phone", "Телефонный звонок")]:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(
-            f"{prefix}{name}",
-            callback_data=f"contact_{code}"
-        ))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="contact_done"))
-    bot.send_message(
-        chat_id,
-        "📞 **Шаг 10 из 13**\n\n"
-        "Выберите предпочтительные способы связи (можно несколько):",
-        reply_markup=markup
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('contact_'))
-def contact_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    data = call.data[8:]
-    if data == "done":
-        selected = bot.master_data[user_id].get('selected_contacts', [])
-        if not selected:
-            bot.answer_callback_query(call.id, "❌ Выберите хотя бы один способ связи")
-            return
-        bot.master_data[user_id]['preferred_contact'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        ask_phone(call.message.chat.id, user_id)  # следующий шаг – телефон
-        bot.answer_callback_query(call.id, "✅ Способы связи сохранены")
-    else:
-        contact_names = {"telegram": "Telegram", "whatsapp": "WhatsApp", "phone": "Телефонный звонок"}
-        contact_name = contact_names.get(data)
-        if not contact_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.master_data[user_id].get('selected_contacts', [])
-        if contact_name in selected:
-            selected.remove(contact_name)
-        else:
-            selected.append(contact_name)
-        bot.master_data[user_id]['selected_contacts'] = selected
-        ask_contact_methods(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def ask_phone(chat_id, user_id):
-    bot.send_message(
-        chat_id,
-        "📞 **Шаг 11 из 13**\n\n"
-        "Введите ваш телефон (будет виден только администратору):"
-    )
-    bot.register_next_step_handler_by_chat_id(chat_id, process_master_phone, user_id)
-
-def process_master_phone(message, user_id):
-    if message.chat.type != 'private':
-        return
-    phone = safe_text(message)
-    if not phone:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, введите телефон.")
-        bot.register_next_step_handler(message, process_master_phone, user_id)
-        return
-    bot.master_data[user_id]['phone'] = phone
-    # Если полная регистрация – идём к документам, если упрощённая – сразу к портфолио
-    if bot.master_data[user_id].get('verification_type') == 'full':
-        ask_documents_question(message.chat.id, user_id)
-    else:
-        ask_portfolio(message.chat.id, user_id)
-
-# ---------- БЛОК ДОКУМЕНТОВ (только для полной регистрации) ----------
-def ask_documents_question(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=3)
-    markup.add(
-        types.InlineKeyboardButton("✅ Договор", callback_data="doc_contract"),
-        types.InlineKeyboardButton("✅ Акт", callback_data="doc_act"),
-        types.InlineKeyboardButton("✅ Чек", callback_data="doc_check"),
-        types.InlineKeyboardButton("⏩ Пропустить", callback_data="doc_skip")
-    )
-    bot.send_message(
-        chat_id,
-        "📄 **Шаг 12 из 13**\n\n"
-        "Какие документы вы можете предоставить? (можно выбрать несколько).\n\n"
-        "⚠️ Если вы выберете хотя бы один вариант, вам нужно будет предоставить фото/скан для проверки. "
-        "Если вы выберете «Пропустить», анкета будет считаться упрощённой (без проверки) и сразу опубликуется.",
-        reply_markup=markup
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('doc_'))
-def documents_choice_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    choice = call.data.split('_')[1]
-    if choice == 'skip':
-        # Пропуск – анкета становится упрощённой, документов нет
-        bot.master_data[user_id]['documents'] = "Нет"
-        bot.master_data[user_id]['documents_list'] = ""
-        bot.master_data[user_id]['documents_verified'] = 'no'
-        # Меняем тип регистрации на simple, чтобы при сохранении сразу публиковать
-        bot.master_data[user_id]['verification_type'] = 'simple'
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        bot.send_message(
-            call.message.chat.id,
-            "✅ Вы пропустили документы. Анкета будет опубликована сразу после заполнения (без проверки)."
-        )
-        ask_portfolio(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-    else:
-        # Выбран конкретный документ
-        doc_name = {'contract': 'Договор', 'act': 'Акт', 'check': 'Чек'}.get(choice)
-        if not doc_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        # Инициализируем список, если нет
-        if 'selected_docs' not in bot.master_data[user_id]:
-            bot.master_data[user_id]['selected_docs'] = []
-        selected = bot.master_data[user_id]['selected_docs']
-        if doc_name in selected:
-            selected.remove(doc_name)
-        else:
-            selected.append(doc_name)
-        bot.master_data[user_id]['selected_docs'] = selected
-        # Обновляем клавиатуру
-        ask_documents_question(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-# После выбора документов (когда пользователь нажмёт "Готово" – но у нас нет кнопки Готово, поэтому мы добавим её)
-# Переделаем ask_documents_question, чтобы была кнопка "Готово" после выбора.
-# Заменим предыдущую функцию на:
-
-def ask_documents_question(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    if 'selected_docs' not in bot.master_data[user_id]:
-        bot.master_data[user_id]['selected_docs'] = []
-    selected = bot.master_data[user_id]['selected_docs']
-    doc_map = {'contract': 'Договор', 'act': 'Акт', 'check': 'Чек'}
-    for code, name in doc_map.items():
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(
-            f"{prefix}{name}",
-            callback_data=f"doc_{code}"
-        ))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="doc_done"))
-    markup.add(types.InlineKeyboardButton("⏩ Пропустить", callback_data="doc_skip"))
-    bot.send_message(
-        chat_id,
-        "📄 **Шаг 12 из 13**\n\n"
-        "Какие документы вы можете предоставить? (можно выбрать несколько).\n\n"
-        "⚠️ Если вы выберете хотя бы один вариант, вам нужно будет предоставить фото/скан для проверки. "
-        "Если вы выберете «Пропустить», анкета будет считаться упрощённой (без проверки) и сразу опубликуется.",
-        reply_markup=markup
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data == 'doc_done')
-def doc_done_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    selected = bot.master_data[user_id].get('selected_docs', [])
-    if not selected:
-        bot.answer_callback_query(call.id, "❌ Вы не выбрали ни одного документа")
-        return
-    bot.master_data[user_id]['documents'] = "Есть"
-    bot.master_data[user_id]['documents_list'] = ", ".join(selected)
-    bot.master_data[user_id]['documents_verified'] = 'pending'  # ждём проверки
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    bot.send_message(
-        call.message.chat.id,
-        "✅ Документы выбраны. Далее вы сможете отправить фото/скан для проверки."
-    )
-    ask_portfolio(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id)
-
-@bot.callback_query_handler(func=lambda call: call.data == 'doc_skip')
-def doc_skip_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    bot.master_data[user_id]['documents'] = "Нет"
-    bot.master_data[user_id]['documents_list'] = ""
-    bot.master_data[user_id]['documents_verified'] = 'no'
-    bot.master_data[user_id]['verification_type'] = 'simple'  # меняем на упрощённую
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    bot.send_message(
-        call.message.chat.id,
-        "✅ Вы пропустили документы. Анкета будет опубликована сразу после заполнения (без проверки)."
-    )
-    ask_portfolio(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id)
-
-# ---------- ПОРТФОЛИО ----------
-def ask_portfolio(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup()
-    markup.add(types.InlineKeyboardButton("⏩ Пропустить", callback_data="skip_portfolio"))
-    # Для полной регистрации можно добавить кнопку отправки фото админу
-    if bot.master_data[user_id].get('verification_type') == 'full' and bot.master_data[user_id].get('documents_verified') == 'pending':
-        markup.add(types.InlineKeyboardButton("📤 Отправить фото админу", callback_data="portfolio_send_to_admin"))
-    markup.add(types.InlineKeyboardButton("❓ Как загрузить фото?", callback_data="help_portfolio"))
-    bot.send_message(
-        chat_id,
-        "📸 **Шаг 13 из 13**\n\n"
-        "👇 **ССЫЛКА НА ПОРТФОЛИО (НЕОБЯЗАТЕЛЬНО):**\n\n"
-        "Вы можете отправить ссылку на Яндекс.Диск, Google Фото, Telegram-канал с работами.\n"
-        "Если у вас нет ссылки, нажмите «Пропустить».",
-        reply_markup=markup
-    )
-    bot.register_next_step_handler_by_chat_id(chat_id, process_master_portfolio_text, user_id)
-
-@bot.callback_query_handler(func=lambda call: call.data == 'help_portfolio')
-def help_portfolio_callback(call):
-    bot.answer_callback_query(call.id)
-    bot.send_message(
-        call.message.chat.id,
-        "📸 **Как загрузить фото в портфолио:**\n\n"
-        "1. Загрузите фото на Яндекс.Диск, Google Фото или другой файлообменник.\n"
-        "2. Скопируйте ссылку на папку или альбом.\n"
-        "3. Отправьте эту ссылку в ответ на это сообщение.\n\n"
-        "Если вы выбрали проверку документов, вы также можете отправить фото администратору через специальную кнопку."
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data == 'skip_portfolio')
-def skip_portfolio_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.answer_callback_query(call.id, "❌ Начните анкету заново")
-        return
-    bot.master_data[user_id]['portfolio'] = "Не указано"
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    show_summary(call.message, user_id)
-    bot.answer_callback_query(call.id, "⏩ Пропущено")
-
-@bot.callback_query_handler(func=lambda call: call.data == 'portfolio_send_to_admin')
-def portfolio_send_to_admin_callback(call):
-    user_id = call.from_user.id
-    if user_id not in bot.master_data:
-        bot.master_data[user_id] = {}
-    bot.master_data[user_id]['send_portfolio_later'] = True
-    bot.answer_callback_query(call.id, "✅ Вы сможете отправить фото после заполнения анкеты.")
-    # Переходим к сводке
-    show_summary(call.message, user_id)
-
-def process_master_portfolio_text(message, user_id):
-    if message.chat.type != 'private':
-        return
-    portfolio = safe_text(message)
-    if not portfolio or portfolio.lower() == "пропустить":
-        portfolio = "Не указано"
-    bot.master_data[user_id]['portfolio'] = portfolio
-    show_summary(message, user_id)
-
-# ---------- СВОДКА И СОХРАНЕНИЕ ----------
-def show_summary(message, user_id):
-    data = bot.master_data[user_id]
-    # Отладка
-    print(f"DEBUG show_summary: user={user_id}, portfolio={data.get('portfolio')}, phone={data.get('phone')}")
-    print(f"DEBUG data keys: {list(data.keys())}")
-
-    summary = f"""
-📋 **Сводка анкеты:**
-
-👤 **Имя/Название:** {data['name']}
-🔧 **Профили:** {data.get('profiles', data.get('services', ''))}
-🎂 **Возраст:** {data.get('age_group', 'Не указан')}
-⏱ **Опыт:** {data['experience']}
-📍 **Районы:** {data['districts']}
-💰 **Минимальная цена:** {data['price_min']}
-💳 **Оплата:** {data.get('payment_methods', 'Не указано')}
-💬 **О себе:** {data.get('bio', 'Не указано')}
-📞 **Предпочтительный контакт:** {data.get('preferred_contact', 'telegram')}
-📞 **Телефон:** {data['phone']}
-📄 **Документы:** {data.get('documents', 'Нет')}
-   **Список:** {data.get('documents_list', '')}
-🛡️ **Проверка документов:** {'✅ Требуется' if data.get('documents_verified')=='pending' else '❌ Не требуется'}
-📸 **Портфолио:** {data.get('portfolio', 'Не указано')}
-    """
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    if data.get('verification_type') == 'simple':
-        # Упрощённая регистрация – только одна кнопка
-        markup.add(types.InlineKeyboardButton("✅ Опубликовать анкету", callback_data=f"save_app_{user_id}"))
-    else:
-        # Полная регистрация – две кнопки
-        markup.add(
-            types.InlineKeyboardButton("📤 Отправить на модерацию", callback_data=f"save_app_{user_id}_moderate"),
-            types.InlineKeyboardButton("💾 Сохранить черновик", callback_data=f"save_app_{user_id}_draft")
-        )
-    markup.add(types.InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_summary_{user_id}"))
-    markup.add(types.InlineKeyboardButton("❌ Отмена", callback_data="cancel_app"))
-
-    bot.send_message(message.chat.id, summary, reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('save_app_'))
-def save_app_callback(call):
-    parts = call.data.split('_')
-    user_id = int(parts[2])
-    if call.from_user.id != user_id:
-        bot.answer_callback_query(call.id, "❌ Это не ваша анкета")
-        return
-    # Определяем режим сохранения: moderate, draft или simple
-    if len(parts) >= 4:
-        mode = parts[3]  # 'moderate' или 'draft'
-    else:
-        mode = 'simple'  # для упрощённой регистрации
-
-    user_data = bot.master_data.get(user_id)
-    if not user_data:
-        bot.answer_callback_query(call.id, "❌ Данные не найдены")
-        return
-
-    try:
-        app_id = save_master_application(call.message, user_id, user_data, mode)
-        bot.answer_callback_query(call.id, "✅ Анкета сохранена!")
-        if mode == 'simple' or mode == 'moderate':
-            bot.send_message(call.message.chat.id, "✅ Анкета успешно обработана!")
-        elif mode == 'draft':
-            bot.send_message(call.message.chat.id, "✅ Анкета сохранена как черновик. Вы можете продолжить позже в разделе «Моя анкета».")
-
-        # Если есть документы для проверки и режим moderate, предложим отправить документы
-        if mode == 'moderate' and user_data.get('documents_verified') == 'pending':
-            markup = types.InlineKeyboardMarkup()
-            markup.add(types.InlineKeyboardButton("📎 Отправить документы", callback_data=f"send_docs_{app_id}"))
-            bot.send_message(
-                call.message.chat.id,
-                "Вы выбрали вариант с проверкой документов. Теперь вы можете отправить фото/скан документов администратору.",
-                reply_markup=markup
-            )
-        elif mode == 'draft':
-            # Для черновика не предлагаем отправку документов
-            pass
-
-        # Возвращаем в главное меню мастера
-        show_role_menu(call.message, 'master')
-
-        # Очищаем временные данные
-        if user_id in bot.master_data:
-            del bot.master_data[user_id]
-
-    except Exception as e:
-        bot.answer_callback_query(call.id, "❌ Ошибка сохранения")
-        bot.send_message(call.message.chat.id, f"❌ Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
-
-def save_master_application(message, user_id, user_data, mode='simple'):
-    """Сохраняет анкету в зависимости от режима."""
-    # Проверяем наличие обязательных ключей
-    required_keys = ['name', 'phone', 'districts', 'price_min', 'experience']
-    missing = [key for key in required_keys if key not in user_data]
-    if missing:
-        bot.send_message(message.chat.id, f"❌ Отсутствуют данные: {', '.join(missing)}. Пожалуйста, начните анкету заново.")
-        print(f"DEBUG: missing keys for user {user_id}: {missing}")
-        return
-
-    name = user_data['name']
-    services_str = user_data.get('services', user_data.get('profiles', ''))
-    service = services_str.split(',')[0].strip()
-    phone = user_data['phone']
-    districts = user_data['districts']
-    price_min = user_data['price_min']
-    price_max = user_data.get('price_max', '')
-    experience = user_data['experience']
-    bio = user_data.get('bio', 'Не указано')
-    portfolio = user_data.get('portfolio', 'Не указано')
-    documents = user_data.get('documents', 'Нет')
-    entity_type = user_data.get('entity_type', 'individual')
-    verification_type = user_data.get('verification_type', 'simple')
-    documents_list = user_data.get('documents_list', '')
-    payment_methods = user_data.get('payment_methods', '')
-    preferred_contact = user_data.get('preferred_contact', 'telegram')
-    age_group = user_data.get('age_group', '')
-
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+    now = utc_now()
 
     if mode == 'simple' or mode == 'moderate' and verification_type == 'simple':
         # Упрощённая регистрация или анкета без проверки – сразу в masters
@@ -1332,6 +847,7 @@ def save_master_application(message, user_id, user_data, mode='simple'):
                          'bot', 'активен', now))
         conn.commit()
         master_id = cursor.lastrowid
+        sync_master(master_id, services_str)
         print(f"DEBUG: Упрощённая регистрация, мастер ID={master_id}, user_id={user_id}")
         bot.send_message(
             message.chat.id,
@@ -1342,27 +858,25 @@ def save_master_application(message, user_id, user_data, mode='simple'):
         publish_master_card(master_id, name, services_str, districts, price_min, experience, bio, portfolio)
         return master_id
     elif mode == 'moderate':
-        # Полная регистрация – в master_applications на модерацию
-        cursor.execute('''INSERT INTO master_applications
-                        (user_id, username, name, service, phone, districts, 
-                         price_min, price_max, experience, bio, portfolio, documents,
-                         entity_type, verification_type, source, documents_list, payment_methods, preferred_contact, age_group, status, created_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                        (user_id,
-                         message.from_user.username or "no_username",
-                         name, services_str, phone, districts,
-                         price_min, price_max, experience, bio, portfolio, documents,
-                         entity_type, verification_type, 'bot',
-                         documents_list, payment_methods, preferred_contact, age_group,
-                         'На проверке', now))
-        conn.commit()
-        application_id = cursor.lastrowid
-        print(f"DEBUG: Полная регистрация, заявка ID={application_id}, user_id={user_id}")
-
-        # Уведомление админу с кнопкой связи
+        # Полная регистрация – в master_applications на модерацию; уведомление админу
+        # ставится в outbox в той же транзакции
         markup = types.InlineKeyboardMarkup()
         markup.add(types.InlineKeyboardButton("📩 Связаться с мастером", url=f"tg://user?id={user_id}"))
-        admin_msg = f"""
+        with storage.transaction():
+            cursor.execute('''INSERT INTO master_applications
+                            (user_id, username, name, service, phone, districts, 
+                             price_min, price_max, experience, bio, portfolio, documents,
+                             entity_type, verification_type, source, documents_list, payment_methods, preferred_contact, age_group, status, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                            (user_id,
+                             message.from_user.username or "no_username",
+                             name, services_str, phone, districts,
+                             price_min, price_max, experience, bio, portfolio, documents,
+                             entity_type, verification_type, 'bot',
+                             documents_list, payment_methods, preferred_contact, age_group,
+                             'На проверке', now))
+            application_id = cursor.lastrowid
+            admin_msg = f"""
 🆕 **НОВАЯ АНКЕТА МАСТЕРА!** (ID: {application_id})
 📱 **Источник:** Бот
 👤 **Telegram:** @{message.from_user.username or "нет"} (ID {user_id})
@@ -1385,12 +899,10 @@ def save_master_application(message, user_id, user_data, mode='simple'):
 
 ✅ Одобрить: /approve {application_id}
 ❌ Отклонить: /reject {application_id} [причина]
-        """
-        try:
+            """
             if ADMIN_ID != 0:
-                bot.send_message(ADMIN_ID, admin_msg, reply_markup=markup)
-        except Exception as e:
-            print(f"Ошибка отправки админу: {e}")
+                outbox.send(ADMIN_ID, admin_msg, reply_markup=markup)
+        print(f"DEBUG: Полная регистрация, заявка ID={application_id}, user_id={user_id}")
 
         bot.send_message(
             message.chat.id,
@@ -1417,59 +929,9 @@ def save_master_application(message, user_id, user_data, mode='simple'):
         print(f"DEBUG: Черновик сохранён, ID={draft_id}, user_id={user_id}")
         return draft_id
 
-# ================ ОБРАБОТЧИК СОХРАНЕНИЯ (СВОДКА) ================
-@bot.callback_query_handler(func=lambda call: call.data.startswith('save_app_'))
-def save_app_callback(call):
-    user_id = int(call.data.split('_')[2])
-    if call.from_user.id != user_id:
-        bot.answer_callback_query(call.id, "❌ Это не ваша анкета")
-        return
-    user_data = bot.master_data.get(user_id)
-    if not user_data:
-        bot.answer_callback_query(call.id, "❌ Данные не найдены")
-        return
-    try:
-        app_id = save_master_application(call.message, user_id, user_data)
-        bot.answer_callback_query(call.id, "✅ Анкета отправлена!")
-        bot.send_message(call.message.chat.id, "✅ Ваша анкета успешно отправлена!")
-
-        if user_data.get('verification_type') == 'simple':
-            # Упрощённая регистрация – сразу в меню
-            show_role_menu(call.message, 'master')
-        else:
-            # Полная регистрация – предложения документов и фото
-            if user_data.get('documents_verified') == 'pending':
-                markup = types.InlineKeyboardMarkup()
-                markup.add(types.InlineKeyboardButton("📎 Отправить документы", callback_data=f"send_docs_{app_id}"))
-                bot.send_message(
-                    call.message.chat.id,
-                    "Вы выбрали вариант с проверкой документов. Теперь вы можете отправить фото/скан документов администратору.",
-                    reply_markup=markup
-                )
-            elif user_data.get('send_portfolio_later'):
-                markup = types.InlineKeyboardMarkup()
-                markup.add(types.InlineKeyboardButton("📸 Отправить фото для портфолио", callback_data=f"send_photo_{app_id}"))
-                bot.send_message(
-                    call.message.chat.id,
-                    "Вы хотели отправить фото для портфолио. Сделайте это сейчас.",
-                    reply_markup=markup
-                )
-            else:
-                show_role_menu(call.message, 'master')
-
-        if user_id in bot.master_data:
-            del bot.master_data[user_id]
-
-    except Exception as e:
-        bot.answer_callback_query(call.id, "❌ Ошибка сохранения")
-        bot.send_message(call.message.chat.id, f"❌ Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
-
 # ================ ОТПРАВКА ДОКУМЕНТОВ И ФОТО ================
-@bot.callback_query_handler(func=lambda call: call.data.startswith('send_docs_'))
-def send_docs_callback(call):
-    app_id = int(call.data.split('_')[2])
+@router.route('send_docs_{app_id:int}')
+def send_docs_callback(call, app_id):
     user_id = call.from_user.id
     bot.send_message(
         call.message.chat.id,
@@ -1506,9 +968,8 @@ def process_docs_for_verification(message, app_id, user_id):
         bot.send_message(message.chat.id, "❌ Пожалуйста, отправьте фото.")
         bot.register_next_step_handler(message, process_docs_for_verification, app_id, user_id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('send_photo_'))
-def send_photo_callback(call):
-    app_id = int(call.data.split('_')[2])
+@router.route('send_photo_{app_id:int}')
+def send_photo_callback(call, app_id):
     user_id = call.from_user.id
     bot.send_message(
         call.message.chat.id,
@@ -1545,7 +1006,7 @@ def process_photo_for_portfolio(message, app_id, user_id):
         bot.send_message(message.chat.id, "❌ Пожалуйста, отправьте фото.")
         bot.register_next_step_handler(message, process_photo_for_portfolio, app_id, user_id)
 
-@bot.callback_query_handler(func=lambda call: call.data == 'finish_docs')
+@router.route('finish_docs')
 def finish_docs_callback(call):
     bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
     bot.send_message(call.message.chat.id, "✅ Вы завершили отправку. Спасибо!")
@@ -1553,190 +1014,86 @@ def finish_docs_callback(call):
     bot.answer_callback_query(call.id)
 
 # ================ ФУНКЦИИ УВЕДОМЛЕНИЙ МАСТЕРОВ ================
-def notify_masters_about_new_request(request_id, request_data):
-    service = request_data['service'].lower()
-    district = request_data['district'].lower()
-
-    cursor.execute('''SELECT user_id, name, service, districts, verification_type FROM masters WHERE status = 'активен' ''')
-    masters = cursor.fetchall()
-    notified = 0
-    for master in masters:
-        master_user_id, master_name, master_service, master_districts, master_verif = master
-        if master_user_id == 0 or master_verif == 'simple':
-            continue
-        service_match = any(prof.strip().lower() in master_service.lower() for prof in service.split())
-        district_match = any(d.strip().lower() in district for d in master_districts.split(','))
-        if service_match and district_match:
-            try:
-                bot.send_message(
-                    master_user_id,
-                    f"🔔 **Новая заявка #{request_id}**\n\n"
-                    f"🔧 Профиль: {request_data['service']}\n"
-                    f"📝 Описание: {request_data['description']}\n"
-                    f"📍 Район: {request_data['district']}\n"
-                    f"📅 Срок: {request_data['date']}\n"
-                    f"💰 Бюджет: {request_data['budget']}\n\n"
-                    f"Чтобы откликнуться, используйте команду /respond {request_id} или найдите заявку в разделе «Активные заявки»."
-                )
-                notified += 1
-            except Exception as e:
-                print(f"Не удалось уведомить мастера {master_user_id}: {e}")
-    print(f"Уведомлено {notified} мастеров по заявке #{request_id}")
-
-def notify_masters_about_private_request(request_id, request_data):
-    service = request_data['service'].lower()
-    district = request_data['district'].lower()
-
-    cursor.execute('''SELECT user_id, name, service, districts, verification_type FROM masters WHERE status = 'активен' ''')
-    masters = cursor.fetchall()
-    notified = 0
-    for master in masters:
-        master_user_id, master_name, master_service, master_districts, master_verif = master
-        if master_user_id == 0 or master_verif == 'simple':
-            continue
-        service_match = any(prof.strip().lower() in master_service.lower() for prof in service.split())
-        district_match = any(d.strip().lower() in district for d in master_districts.split(','))
-        if service_match and district_match:
-            try:
-                bot.send_message(
-                    master_user_id,
-                    f"🔔 **Новая приватная заявка #{request_id}**\n\n"
-                    f"🔧 Профиль: {request_data['service']}\n"
-                    f"📝 Описание: {request_data['description']}\n"
-                    f"📍 Район: {request_data['district']}\n"
-                    f"📅 Срок: {request_data['date']}\n"
-                    f"💰 Бюджет: {request_data['budget']}\n\n"
-                    f"Чтобы откликнуться, используйте команду /respond {request_id} или найдите заявку в разделе «Активные заявки»."
-                )
-                notified += 1
-            except Exception as e:
-                print(f"Не удалось уведомить мастера {master_user_id}: {e}")
-    print(f"Уведомлено {notified} мастеров по приватной заявке #{request_id}")
+delivery = DeliveryEngine(bot, workers=DELIVERY_WORKERS, rate=DELIVERY_RATE / PROCESSES).start()
+# Уведомления, которые нельзя терять: пишутся в outbox в транзакции обработчика;
+# отправляет их только ведущий процесс (outbox.start() при запуске). Запись воркера не будит
+# его поток, поэтому с воркерами ведущий проверяет очередь чаще
+outbox = Outbox(storage, bot, bucket=delivery.bucket, poll=0.2 if BOT_WORKERS else 1.0)
+metrics.gauge('delivery_queue_depth', 'Сообщения рассылки в очереди', delivery.queue.qsize)
+metrics.gauge('outbox_messages', 'Сообщения outbox по статусу', outbox.stats, label='status')
+
+def find_masters_for_request(request_data):
+    """user_id активных мастеров (с проверкой), подходящих по профилю и району."""
+    return match_index.recipients(request_data['service'], request_data['district'])
 
-# ================ КЛИЕНТСКАЯ ЧАСТЬ (ЗАЯВКИ) ================
-if not hasattr(bot, 'request_data'):
-    bot.request_data = {}
-
-@bot.message_handler(func=lambda message: message.text == '🔨 Оставить заявку')
-def create_request_start(message):
-    if not only_private(message):
-        return
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    markup.add(
-        types.InlineKeyboardButton("🔧 Публичная заявка", callback_data="request_public"),
-        types.InlineKeyboardButton("🤝 Персональный подбор", callback_data="request_private")
-    )
-    bot.send_message(
-        message.chat.id,
-        "🔨 **Какую заявку хотите оставить?**\n\n"
-        "• **Публичная** – увидят все мастера, кто захочет – откликнется.\n"
-        "• **Персональный подбор** – мы подберём лучших мастеров по вашим критериям.",
-        reply_markup=markup
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('request_'))
-def request_type_callback(call):
-    req_type = call.data.split('_')[1]
-    user_id = call.from_user.id
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    cursor.execute('UPDATE users SET last_active = ? WHERE user_id = ?', (now, user_id))
-    conn.commit()
-    bot.request_data[user_id] = {'type': req_type}
-    ask_client_service(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id)
-
-def ask_client_service(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for code, name in PROFILES:
-        markup.add(types.InlineKeyboardButton(name, callback_data=f"cl_serv_{code}"))
-    bot.send_message(
-        chat_id,
-        "🔧 **Шаг 1 из 5**\n\nВыберите **профиль**, который вам нужен (только один):",
-        reply_markup=markup
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('cl_serv_'))
-def client_service_callback(call):
-    user_id = call.from_user.id
-    code = call.data[8:]
-    service_name = PROFILES_DICT.get(code)
-    if not service_name:
-        bot.answer_callback_query(call.id, "❌ Ошибка")
-        return
-    if user_id not in bot.request_data:
-        bot.request_data[user_id] = {}
-    bot.request_data[user_id]['service'] = service_name
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    ask_client_district(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id)
-
-def ask_client_district(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for code, name in DISTRICTS:
-        markup.add(types.InlineKeyboardButton(name, callback_data=f"cl_dist_{code}"))
-    bot.send_message(
-        chat_id,
-        "📍 **Шаг 2 из 5**\n\nВыберите **район**, где нужно выполнить работу (только один):",
-        reply_markup=markup
-    )
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('cl_dist_'))
-def client_district_callback(call):
-    user_id = call.from_user.id
-    code = call.data[8:]
-    district_name = DISTRICTS_DICT.get(code)
-    if not district_name:
-        bot.answer_callback_query(call.id, "❌ Ошибка")
-        return
-    bot.request_data[user_id]['district'] = district_name
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    bot.send_message(
-        call.message.chat.id,
-        "📝 **Шаг 3 из 5**\n\nОпишите задачу подробнее:"
+def notify_masters_about_new_request(request_id, request_data):
+    recipients = find_masters_for_request(request_data)
+    delivery.submit(
+        request_id, recipients,
+        f"🔔 **Новая заявка #{request_id}**\n\n"
+        f"🔧 Профиль: {request_data['service']}\n"
+        f"📝 Описание: {request_data['description']}\n"
+        f"📍 Район: {request_data['district']}\n"
+        f"📅 Срок: {request_data['date']}\n"
+        f"💰 Бюджет: {request_data['budget']}\n\n"
+        f"Чтобы откликнуться, используйте команду /respond {request_id} или найдите заявку в разделе «Активные заявки».",
+        label="заявка "
     )
-    bot.register_next_step_handler(call.message, process_request_description)
-    bot.answer_callback_query(call.id)
 
-def process_request_description(message):
-    if message.chat.type != 'private':
-        return
-    desc = safe_text(message)
-    if not desc:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, опишите задачу.")
-        return
-    user_id = message.from_user.id
-    bot.request_data[user_id]['description'] = desc
-    msg = bot.send_message(
-        message.chat.id,
-        "📅 **Шаг 4 из 5**\n\nКогда нужно приступить?\nПример: *В ближайшие дни, на следующей неделе, после 15 мая*"
+def notify_masters_about_private_request(request_id, request_data):
+    recipients = find_masters_for_request(request_data)
+    delivery.submit(
+        request_id, recipients,
+        f"🔔 **Новая приватная заявка #{request_id}**\n\n"
+        f"🔧 Профиль: {request_data['service']}\n"
+        f"📝 Описание: {request_data['description']}\n"
+        f"📍 Район: {request_data['district']}\n"
+        f"📅 Срок: {request_data['date']}\n"
+        f"💰 Бюджет: {request_data['budget']}\n\n"
+        f"Чтобы откликнуться, используйте команду /respond {request_id} или найдите заявку в разделе «Активные заявки».",
+        label="приватная заявка "
     )
-    bot.register_next_step_handler(msg, process_request_date)
 
-def process_request_date(message):
-    if message.chat.type != 'private':
-        return
-    date = safe_text(message)
-    if not date:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, укажите желаемые сроки.")
+# ================ ПЛАНИРОВЩИК ================
+# Задачи запускаются в фоновом потоке, время запусков хранится в таблице jobs
+scheduler = Scheduler(storage)
+scheduler.add('publish_delayed', Daily(NIGHT_END_HOUR, 0, TIMEZONE_OFFSET), publish_delayed_requests)
+scheduler.add('evict_sessions', Every(600), sessions.evict_expired)
+scheduler.add('purge_outbox', Daily(4, 0, TIMEZONE_OFFSET), outbox.purge)
+scheduler.add('purge_changes', Every(3600), changes.purge)
+scheduler.add('purge_inbox', Daily(4, 30, TIMEZONE_OFFSET), inbox.purge)
+scheduler.add('purge_callback_keys', Daily(4, 45, TIMEZONE_OFFSET), callback_guard.purge)
+metrics.gauge('inbox_updates', 'Входящие обновления по статусу', inbox.stats, label='status')
+
+# ================ КЛИЕНТСКАЯ ЧАСТЬ (ЗАЯВКИ) ================
+@bot.message_handler(func=lambda message: message.text == '🔨 Оставить заявку')
+def create_request_start(message):
+    if not only_private(message):
         return
-    user_id = message.from_user.id
-    bot.request_data[user_id]['date'] = date
-    msg = bot.send_message(
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        types.InlineKeyboardButton("🔧 Публичная заявка", callback_data="request_public"),
+        types.InlineKeyboardButton("🤝 Персональный подбор", callback_data="request_private")
+    )
+    bot.send_message(
         message.chat.id,
-        "💰 **Шаг 5 из 5**\n\nКакой бюджет?\nПример: *до 5000₽, договорной, 10-15 тыс.*"
+        "🔨 **Какую заявку хотите оставить?**\n\n"
+        "• **Публичная** – увидят все мастера, кто захочет – откликнется.\n"
+        "• **Персональный подбор** – мы подберём лучших мастеров по вашим критериям.",
+        reply_markup=markup
     )
-    bot.register_next_step_handler(msg, process_request_budget)
 
-def process_request_budget(message):
-    if message.chat.type != 'private':
-        return
-    budget = safe_text(message)
-    if not budget:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, укажите бюджет.")
-        return
-    user_id = message.from_user.id
-    bot.request_data[user_id]['budget'] = budget
-    data = bot.request_data[user_id]
+@router.route('request_{req_type}')
+def request_type_callback(call, req_type):
+    user_id = call.from_user.id
+    now = utc_now()
+    cursor.execute('UPDATE users SET last_active = ? WHERE user_id = ?', (now, user_id))
+    conn.commit()
+    # Шаги заявки – в этом же сообщении
+    wizard.start('request', call.message.chat.id, user_id, {'type': req_type}, anchor=call.message.message_id)
+    bot.answer_callback_query(call.id)
+
+def request_summary(source, user_id, data):
     summary = f"""
 📋 **Сводка заявки:**
 
@@ -1750,33 +1107,33 @@ def process_request_budget(message):
     markup = types.InlineKeyboardMarkup()
     markup.add(
         types.InlineKeyboardButton("✅ Подтвердить", callback_data=f"confirm_req_{user_id}"),
-        types.InlineKeyboardButton("✏️ Редактировать", callback_data="edit_req"),
-        types.InlineKeyboardButton("❌ Отмена", callback_data="cancel_req")
-    )
-    bot.send_message(message.chat.id, summary, reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data == 'edit_req')
-def edit_request_callback(call):
-    user_id = call.from_user.id
-    bot.edit_message_text(
-        "Начните создание заявки заново.",
-        call.message.chat.id,
-        call.message.message_id
+        types.InlineKeyboardButton("✏️ Редактировать", callback_data=wizard.callback('request', RESTART)),
+        types.InlineKeyboardButton("❌ Отмена", callback_data=wizard.callback('request', CANCEL))
     )
-    create_request_start(call.message)
-    bot.answer_callback_query(call.id)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('confirm_req_'))
-def confirm_request(call):
-    user_id = int(call.data.split('_')[2])
+    return summary, markup
+
+wizard.register(Form('request', [
+    Choice('serv', "🔧 Выберите **профиль**, который вам нужен (только один):", PROFILES, key='service'),
+    Choice('dist', "📍 Выберите **район**, где нужно выполнить работу (только один):", DISTRICTS, key='district'),
+    TextInput('desc', "📝 Опишите задачу подробнее:", key='description',
+              error="❌ Пожалуйста, опишите задачу."),
+    TextInput('date', "📅 Когда нужно приступить?\nПример: *В ближайшие дни, на следующей неделе, после 15 мая*",
+              error="❌ Пожалуйста, укажите желаемые сроки."),
+    TextInput('budget', "💰 Какой бюджет?\nПример: *до 5000₽, договорной, 10-15 тыс.*",
+              error="❌ Пожалуйста, укажите бюджет."),
+], bot.request_data, request_summary, cancelled="❌ Создание заявки отменено."))
+
+@router.route('confirm_req_{user_id:int}')
+@callback_guard.once('confirm_req')
+def confirm_request(call, user_id):
     if call.from_user.id != user_id:
         bot.answer_callback_query(call.id, "❌ Это не ваша заявка")
-        return
+        return NOOP
     data = bot.request_data.get(user_id)
     if not data:
         bot.answer_callback_query(call.id, "❌ Данные не найдены. Начните заново.")
-        return
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+        return NOOP
+    now = utc_now()
     cursor.execute('''INSERT INTO requests
                     (user_id, username, service, description, district, date, budget, is_public, status, delayed, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
@@ -1851,15 +1208,6 @@ def confirm_request(call):
         del bot.request_data[user_id]
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data == 'cancel_req')
-def cancel_request(call):
-    user_id = call.from_user.id
-    if user_id in bot.request_data:
-        del bot.request_data[user_id]
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    bot.send_message(call.message.chat.id, "❌ Создание заявки отменено.")
-    bot.answer_callback_query(call.id)
-
 # ================ КНОПКА "МОИ ЗАЯВКИ" (КЛИЕНТ) ================
 @bot.message_handler(func=lambda message: message.text == '📋 Мои заявки')
 def my_requests_handler(message):
@@ -1867,94 +1215,62 @@ def my_requests_handler(message):
         return
     my_requests(message)
 
-def my_requests(message):
-    user_id = message.from_user.id
-    cursor.execute('''SELECT id, service, description, district, date, budget, status, created_at, chat_message_id
-                      FROM requests WHERE user_id = ? ORDER BY created_at DESC''', (user_id,))
-    requests = cursor.fetchall()
-    if not requests:
-        bot.send_message(message.chat.id, "У вас пока нет заявок.")
-        return
-    for req in requests:
-        req_id, service, desc, district, date, budget, status, created, chat_msg_id = req
-        text = f"""
-📋 **Заявка #{req_id}**
+def render_my_requests(rows, user_id, arg):
+    blocks, buttons = [], []
+    for req in rows:
+        req_id, service, desc, district, date, budget, status, created, chat_msg_id, resp_count, accepted_master = req
+        blocks.append(f"""📋 **Заявка #{req_id}**
 🔧 Профиль: {service}
-📝 Описание: {desc}
+📝 Описание: {shorten(desc)}
 📍 Район: {district}
 📅 Срок: {date}
 💰 Бюджет: {budget}
 📌 Статус: {status}
-🕒 Создана: {created}
-        """
-        markup = types.InlineKeyboardMarkup()
+🕒 Создана: {local(created, TIMEZONE_OFFSET)}""")
+        row = []
         if chat_msg_id is None and status == 'активна':
-            markup.add(types.InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_request_{req_id}"))
-        cursor.execute('SELECT COUNT(*) FROM responses WHERE request_id = ?', (req_id,))
-        resp_count = cursor.fetchone()[0]
+            row.append(types.InlineKeyboardButton(f"✏️ #{req_id}", callback_data=f"edit_request_{req_id}"))
         if resp_count > 0:
-            markup.add(types.InlineKeyboardButton(f"👥 Отклики ({resp_count})", callback_data=f"view_responses_{req_id}"))
-        if status == 'завершена':
-            # Проверяем, есть ли принятый мастер
-            cursor.execute('SELECT master_id FROM responses WHERE request_id = ? AND status = "accepted"', (req_id,))
-            acc = cursor.fetchone()
-            if acc:
-                master_id = acc[0]
-                markup.add(types.InlineKeyboardButton("⭐ Оставить отзыв", callback_data=f"leave_review_{req_id}_{master_id}"))
+            row.append(types.InlineKeyboardButton(f"👥 #{req_id} ({resp_count})", callback_data=f"view_responses_{req_id}"))
+        if status == 'завершена' and accepted_master:
+            # Есть принятый мастер – можно оставить отзыв
+            row.append(types.InlineKeyboardButton(f"⭐ #{req_id}", callback_data=f"leave_review_{req_id}_{accepted_master}"))
         if status != 'активна':
-            markup.add(types.InlineKeyboardButton("🔄 Опубликовать заново", callback_data=f"republish_request_{req_id}"))
-        if markup.keyboard:
-            bot.send_message(message.chat.id, text, reply_markup=markup)
-        else:
-            bot.send_message(message.chat.id, text)
+            row.append(types.InlineKeyboardButton(f"🔄 #{req_id}", callback_data=f"republish_request_{req_id}"))
+        if row:
+            buttons.append(row)
+    return "\n\n".join(blocks), buttons
+
+paginator.register(my_requests_view(render_my_requests, PAGE_SIZE))
+
+def my_requests(message):
+    paginator.send(message.chat.id, message.from_user.id, 'myreq')
 
 # ================ КНОПКА "ЗАЯВКИ ПО МОЕМУ ПРОФИЛЮ" (ДЛЯ МАСТЕРА) ================
 @bot.message_handler(func=lambda message: message.text == '🔔 Заявки по моему профилю')
 def my_profile_requests_handler(message):
     if not only_private(message):
         return
-    user_id = message.from_user.id
-    cursor.execute("SELECT service, districts FROM masters WHERE user_id = ? AND status = 'активен'", (user_id,))
-    master = cursor.fetchone()
-    if not master:
+    if paginator.send(message.chat.id, message.from_user.id, 'profreq') is None:
         bot.send_message(message.chat.id, "❌ Вы не активный мастер. Заполните анкету и дождитесь одобрения.")
-        return
-    master_service, master_districts = master
-    master_profiles = [p.strip().lower() for p in master_service.split(',')]
-    master_districts_list = [d.strip().lower() for d in master_districts.split(',')]
-
-    cursor.execute('''SELECT id, service, description, district, date, budget, created_at 
-                      FROM requests WHERE status = 'активна' AND is_public = 1 ORDER BY created_at DESC''')
-    all_requests = cursor.fetchall()
-    suitable = []
-    for req in all_requests:
-        req_id, service, desc, district, date, budget, created = req
-        service_match = any(prof in service.lower() for prof in master_profiles)
-        district_match = any(d in district.lower() for d in master_districts_list)
-        if service_match and district_match:
-            suitable.append((req_id, service, desc, district, date, budget, created))
-
-    if not suitable:
-        bot.send_message(message.chat.id, "Нет активных заявок, подходящих под ваш профиль и районы.")
-        return
-    for req in suitable:
-        req_id, service, desc, district, date, budget, created = req
-        text = f"""
-📋 **Заявка #{req_id}**
+
+def render_profile_requests(rows, user_id, arg):
+    blocks, buttons = [], []
+    for req_id, service, desc, district, date, budget in rows:
+        blocks.append(f"""📋 **Заявка #{req_id}**
 🔧 Профиль: {service}
-📝 Описание: {desc}
+📝 Описание: {shorten(desc)}
 📍 Район: {district}
 📅 Срок: {date}
-💰 Бюджет: {budget}
-        """
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("📞 Откликнуться", callback_data=f"respond_{req_id}"))
-        bot.send_message(message.chat.id, text, reply_markup=markup)
+💰 Бюджет: {budget}""")
+        buttons.append([types.InlineKeyboardButton(f"📞 Откликнуться на #{req_id}", callback_data=f"respond_{req_id}")])
+    return "\n\n".join(blocks), buttons
+
+paginator.register(profile_requests_view(cursor, match_index, render_profile_requests, PAGE_SIZE))
 
 # ================ ОТКЛИКИ НА ЗАЯВКИ ================
-@bot.callback_query_handler(func=lambda call: call.data.startswith('respond_'))
-def respond_to_request(call):
-    req_id = int(call.data.split('_')[1])
+@router.route('respond_{req_id:int}')
+def respond_to_request(call, req_id):
     user_id = call.from_user.id
     cursor.execute('SELECT id FROM masters WHERE user_id = ? AND status = "активен"', (user_id,))
     master = cursor.fetchone()
@@ -1978,17 +1294,20 @@ def process_response(message, req_id, master_id):
     if not text:
         bot.send_message(message.chat.id, "❌ Введите текст отклика.")
         return
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    cursor.execute('''INSERT INTO responses (request_id, master_id, price, comment, status, created_at, updated_at)
-                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    (req_id, master_id, '', text, 'pending', now, now))
-    conn.commit()
+    save_response(req_id, master_id, text)
     bot.send_message(message.chat.id, "✅ Ваш отклик отправлен клиенту и администратору.")
 
-    # Уведомление клиенту с карточкой мастера
-    cursor.execute('SELECT user_id FROM requests WHERE id = ?', (req_id,))
-    client = cursor.fetchone()
-    if client:
+def save_response(req_id, master_id, text):
+    """Сохраняет отклик и в той же транзакции ставит в outbox уведомление клиенту с карточкой мастера."""
+    now = utc_now()
+    with storage.transaction():
+        cursor.execute('''INSERT INTO responses (request_id, master_id, price, comment, status, created_at, updated_at)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        (req_id, master_id, '', text, 'pending', now, now))
+        cursor.execute('SELECT user_id FROM requests WHERE id = ?', (req_id,))
+        client = cursor.fetchone()
+        if not client:
+            return
         client_id = client[0]
         cursor.execute('''SELECT name, service, districts, phone, preferred_contact, user_id 
                           FROM masters WHERE id = ?''', (master_id,))
@@ -2014,21 +1333,17 @@ def process_response(message, req_id, master_id):
         if master_info and 'telegram' in master_pref.lower() and master_user_id and master_user_id != 0:
             markup.add(types.InlineKeyboardButton("✉️ Написать мастеру в Telegram", url=f"tg://user?id={master_user_id}"))
 
-        try:
-            bot.send_message(
-                client_id,
-                f"🔔 На вашу заявку #{req_id} поступил отклик от мастера.\n\n"
-                f"**Предложение мастера:** {text}\n\n"
-                f"{master_text}\n\n"
-                f"Вы можете принять или отклонить отклик, а также посмотреть полную карточку мастера.",
-                reply_markup=markup
-            )
-        except Exception as e:
-            print(f"Не удалось уведомить клиента {client_id}: {e}")
+        outbox.send(
+            client_id,
+            f"🔔 На вашу заявку #{req_id} поступил отклик от мастера.\n\n"
+            f"**Предложение мастера:** {text}\n\n"
+            f"{master_text}\n\n"
+            f"Вы можете принять или отклонить отклик, а также посмотреть полную карточку мастера.",
+            reply_markup=markup
+        )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('channel_respond_'))
-def channel_respond_callback(call):
-    request_id = int(call.data.split('_')[2])
+@router.route('channel_respond_{request_id:int}')
+def channel_respond_callback(call, request_id):
     user_id = call.from_user.id
     cursor.execute('SELECT id, service FROM masters WHERE user_id = ? AND status = "активен"', (user_id,))
     master = cursor.fetchone()
@@ -2042,7 +1357,7 @@ def channel_respond_callback(call):
         bot.answer_callback_query(call.id, "❌ Заявка не найдена.")
         return
     request_service = row[0]
-    if not any(prof.strip().lower() in request_service.lower() for prof in master_service.split(',')):
+    if match_index.profile_code(request_service) not in match_index.codes_of(master_id)[0]:
         bot.answer_callback_query(call.id, "❌ Ваш профиль не подходит для этой заявки.", show_alert=True)
         return
     bot.answer_callback_query(call.id, "✅ Перейдите в бота для отклика.")
@@ -2053,149 +1368,77 @@ def channel_respond_callback(call):
     bot.register_next_step_handler_by_chat_id(user_id, process_response_from_channel, request_id, master_id)
 
 def process_response_from_channel(message, request_id, master_id):
-    text = safe_text(message)
-    if not text:
-        bot.send_message(message.chat.id, "❌ Введите текст отклика.")
-        return
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    cursor.execute('''INSERT INTO responses (request_id, master_id, price, comment, status, created_at, updated_at)
-                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    (request_id, master_id, '', text, 'pending', now, now))
-    conn.commit()
-    bot.send_message(message.chat.id, "✅ Ваш отклик отправлен клиенту и администратору.")
-
-    cursor.execute('SELECT user_id FROM requests WHERE id = ?', (request_id,))
-    client_id = cursor.fetchone()[0]
-    # Аналогичное уведомление клиенту (можно вызвать ту же логику, но для простоты повторим)
-    cursor.execute('''SELECT name, service, districts, phone, preferred_contact, user_id 
-                      FROM masters WHERE id = ?''', (master_id,))
-    master_info = cursor.fetchone()
-    if master_info:
-        master_name, master_service, master_districts, master_phone, master_pref, master_user_id = master_info
-        master_text = f"""
-👤 **Мастер:** {master_name}
-🔧 **Профили:** {master_service}
-📍 **Районы:** {master_districts}
-📞 **Контакт:** {master_phone if master_phone else 'не указан'}
-📱 **Предпочтительный способ связи:** {master_pref}
-        """
-    else:
-        master_text = "Информация о мастере временно недоступна."
-
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    markup.add(
-        types.InlineKeyboardButton("✅ Принять", callback_data=f"accept_response_{request_id}_{master_id}"),
-        types.InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_response_{request_id}_{master_id}")
-    )
-    markup.add(types.InlineKeyboardButton("👤 Посмотреть карточку мастера", callback_data=f"view_master_{master_id}"))
-    if master_info and 'telegram' in master_pref.lower() and master_user_id and master_user_id != 0:
-        markup.add(types.InlineKeyboardButton("✉️ Написать мастеру в Telegram", url=f"tg://user?id={master_user_id}"))
-
-    try:
-        bot.send_message(
-            client_id,
-            f"🔔 На вашу заявку #{request_id} поступил отклик от мастера.\n\n"
-            f"**Предложение мастера:** {text}\n\n"
-            f"{master_text}\n\n"
-            f"Вы можете принять или отклонить отклик, а также посмотреть полную карточку мастера.",
-            reply_markup=markup
-        )
-    except Exception as e:
-        print(f"Не удалось уведомить клиента {client_id}: {e}")
+    # Тот же отклик, что из списка заявок по профилю
+    process_response(message, request_id, master_id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('view_master_'))
-def view_master_from_notification(call):
-    master_id = int(call.data.split('_')[2])
-    cursor.execute('''SELECT name, service, phone, districts, price_min, experience, bio, portfolio, rating, reviews_count
-                      FROM masters WHERE id = ?''', (master_id,))
-    master = cursor.fetchone()
-    if not master:
+@router.route('view_master_{master_id:int}')
+def view_master_from_notification(call, master_id):
+    card = master_cards.get(master_id, 'contact', lambda: render_master_card(master_id, with_phone=True))
+    if not card:
         bot.answer_callback_query(call.id, "❌ Мастер не найден")
         return
-    name, service, phone, districts, price_min, experience, bio, portfolio, rating, reviews_count = master
-    rating_display = f"{rating:.1f}" if rating else "Нет"
-    text = f"""
-👤 **{name}**
-🔧 Профили: {service}
-⭐ Рейтинг: {rating_display} ({reviews_count} отзывов)
-📍 Районы: {districts}
-💰 Мин. цена: {price_min}
-⏱ Опыт: {experience}
-💬 О себе: {bio}
-📸 Портфолио: {portfolio}
-📞 Телефон: {phone}
-    """
-    bot.send_message(call.message.chat.id, text)
+    text, markup = card
+    bot.send_message(call.message.chat.id, text, reply_markup=markup)
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('accept_response_'))
-def accept_response_callback(call):
-    parts = call.data.split('_')
-    req_id = int(parts[2])
-    master_id = int(parts[3])
+@router.route('accept_response_{req_id:int}_{master_id:int}')
+@callback_guard.once('accept_response')
+def accept_response_callback(call, req_id, master_id):
     user_id = call.from_user.id
 
     cursor.execute('SELECT user_id FROM requests WHERE id = ?', (req_id,))
     row = cursor.fetchone()
     if not row or row[0] != user_id:
         bot.answer_callback_query(call.id, "❌ Это не ваша заявка")
-        return
+        return NOOP
 
     cursor.execute('SELECT status FROM responses WHERE request_id = ? AND master_id = ?', (req_id, master_id))
     resp = cursor.fetchone()
     if not resp or resp[0] != 'pending':
         bot.answer_callback_query(call.id, "❌ Отклик уже обработан")
-        return
-
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    cursor.execute('UPDATE responses SET status = ?, updated_at = ? WHERE request_id = ? AND master_id = ?',
-                   ('accepted', now, req_id, master_id))
-    cursor.execute('UPDATE responses SET status = ?, updated_at = ? WHERE request_id = ? AND status = "pending"',
-                   ('rejected', now, req_id))
-    cursor.execute('UPDATE requests SET status = ? WHERE id = ?', ('завершена', req_id))
-    conn.commit()
+        return NOOP
 
-    cursor.execute('SELECT name, phone, preferred_contact FROM masters WHERE id = ?', (master_id,))
+    cursor.execute('SELECT name, phone, preferred_contact, user_id FROM masters WHERE id = ?', (master_id,))
     master = cursor.fetchone()
-    master_name, master_phone, master_contact = master if master else ("Неизвестно", "нет", "нет")
-
-    bot.send_message(
-        user_id,
-        f"✅ Вы приняли отклик мастера **{master_name}**.\n\n"
-        f"📞 Контакт мастера: {master_phone}\n"
-        f"📱 Предпочтительный способ связи: {master_contact}\n\n"
-        f"Свяжитесь с мастером для обсуждения деталей."
-    )
-
-    cursor.execute('SELECT user_id FROM masters WHERE id = ?', (master_id,))
-    master_user = cursor.fetchone()
-    if master_user and master_user[0] != 0:
-        try:
+    master_name, master_phone, master_contact, master_user_id = master if master else ("Неизвестно", "нет", "нет", 0)
+
+    now = utc_now()
+    with storage.transaction():
+        cursor.execute('UPDATE responses SET status = ?, updated_at = ? WHERE request_id = ? AND master_id = ?',
+                       ('accepted', now, req_id, master_id))
+        cursor.execute('UPDATE responses SET status = ?, updated_at = ? WHERE request_id = ? AND status = "pending"',
+                       ('rejected', now, req_id))
+        cursor.execute('UPDATE requests SET status = ? WHERE id = ?', ('завершена', req_id))
+        if master_user_id:
             cursor.execute('SELECT username, user_id FROM requests WHERE id = ?', (req_id,))
             client = cursor.fetchone()
             client_username, client_id_db = client if client else ("", "")
             client_contact = f"@{client_username}" if client_username else f"ID: {client_id_db}"
-            bot.send_message(
-                master_user[0],
+            outbox.send(
+                master_user_id,
                 f"✅ Ваш отклик на заявку #{req_id} принят!\n\n"
                 f"👤 Контакт клиента: {client_contact}\n"
                 f"Свяжитесь с клиентом для обсуждения деталей."
             )
-        except Exception as e:
-            print(f"Не удалось уведомить мастера {master_user[0]}: {e}")
 
-    bot.edit_message_text(
-        "✅ Вы приняли отклик. Контакты отправлены.",
-        call.message.chat.id,
-        call.message.message_id
+    bot.send_message(
+        user_id,
+        f"✅ Вы приняли отклик мастера **{master_name}**.\n\n"
+        f"📞 Контакт мастера: {master_phone}\n"
+        f"📱 Предпочтительный способ связи: {master_contact}\n\n"
+        f"Свяжитесь с мастером для обсуждения деталей."
     )
+
+    if not paginator.refresh(call):
+        bot.edit_message_text(
+            "✅ Вы приняли отклик. Контакты отправлены.",
+            call.message.chat.id,
+            call.message.message_id
+        )
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('reject_response_'))
-def reject_response_callback(call):
-    parts = call.data.split('_')
-    req_id = int(parts[2])
-    master_id = int(parts[3])
+@router.route('reject_response_{req_id:int}_{master_id:int}')
+def reject_response_callback(call, req_id, master_id):
     user_id = call.from_user.id
 
     cursor.execute('SELECT user_id FROM requests WHERE id = ?', (req_id,))
@@ -2204,72 +1447,66 @@ def reject_response_callback(call):
         bot.answer_callback_query(call.id, "❌ Это не ваша заявка")
         return
 
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    cursor.execute('UPDATE responses SET status = ?, updated_at = ? WHERE request_id = ? AND master_id = ?',
-                   ('rejected', now, req_id, master_id))
-    conn.commit()
-
     cursor.execute('SELECT user_id FROM masters WHERE id = ?', (master_id,))
     master_user = cursor.fetchone()
-    if master_user and master_user[0] != 0:
-        try:
-            bot.send_message(
-                master_user[0],
-                f"❌ Ваш отклик на заявку #{req_id} был отклонён клиентом."
-            )
-        except:
-            pass
-
-    bot.edit_message_text(
-        "❌ Отклик отклонён.",
-        call.message.chat.id,
-        call.message.message_id
-    )
+    now = utc_now()
+    with storage.transaction():
+        cursor.execute('UPDATE responses SET status = ?, updated_at = ? WHERE request_id = ? AND master_id = ?',
+                       ('rejected', now, req_id, master_id))
+        if master_user and master_user[0] != 0:
+            outbox.send(master_user[0], f"❌ Ваш отклик на заявку #{req_id} был отклонён клиентом.")
+
+    if not paginator.refresh(call):
+        bot.edit_message_text(
+            "❌ Отклик отклонён.",
+            call.message.chat.id,
+            call.message.message_id
+        )
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('view_responses_'))
-def view_responses_callback(call):
-    req_id = int(call.data.split('_')[2])
-    user_id = call.from_user.id
-
+def responses_scope(user_id, arg):
+    try:
+        req_id = int(arg)
+    except ValueError:
+        return None
     cursor.execute('SELECT user_id FROM requests WHERE id = ?', (req_id,))
     row = cursor.fetchone()
     if not row or row[0] != user_id:
+        return None
+    return ('r.request_id = ?', (req_id,))
+
+def render_responses(rows, user_id, arg):
+    blocks, buttons = [], []
+    for resp_id, master_name, price, comment, status, master_id in rows:
+        blocks.append(f"""👤 Мастер: {master_name}
+📝 Комментарий: {shorten(comment)}
+📌 Статус: {status}""")
+        if status == 'pending':
+            buttons.append([
+                types.InlineKeyboardButton(f"✅ {master_name}", callback_data=f"accept_response_{arg}_{master_id}"),
+                types.InlineKeyboardButton(f"❌ {master_name}", callback_data=f"reject_response_{arg}_{master_id}")
+            ])
+    return "\n\n".join(blocks), buttons
+
+paginator.register(PageView(
+    'resp',
+    '''SELECT r.id, m.name, r.price, r.comment, r.status, m.id
+       FROM responses r JOIN masters m ON r.master_id = m.id''',
+    'responses', alias='r',
+    scope=responses_scope,
+    render=render_responses,
+    keys=('created_at', 'id'), size=PAGE_SIZE, empty="Нет откликов."))
+
+@router.route('view_responses_{req_id:int}')
+def view_responses_callback(call, req_id):
+    if paginator.send(call.message.chat.id, call.from_user.id, 'resp', req_id) is None:
         bot.answer_callback_query(call.id, "❌ Это не ваша заявка")
         return
-
-    cursor.execute('''
-        SELECT r.id, m.name, r.price, r.comment, r.status, m.id
-        FROM responses r
-        JOIN masters m ON r.master_id = m.id
-        WHERE r.request_id = ?
-        ORDER BY r.created_at DESC
-    ''', (req_id,))
-    responses = cursor.fetchall()
-    if not responses:
-        bot.answer_callback_query(call.id, "Нет откликов")
-        return
-
-    for resp in responses:
-        resp_id, master_name, price, comment, status, master_id = resp
-        text = f"""
-👤 Мастер: {master_name}
-📝 Комментарий: {comment}
-📌 Статус: {status}
-        """
-        markup = types.InlineKeyboardMarkup()
-        if status == 'pending':
-            markup.add(
-                types.InlineKeyboardButton("✅ Принять", callback_data=f"accept_response_{req_id}_{master_id}"),
-                types.InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_response_{req_id}_{master_id}")
-            )
-        bot.send_message(call.message.chat.id, text, reply_markup=markup if markup.keyboard else None)
     bot.answer_callback_query(call.id)
 
 # ================ ПОВТОРНАЯ ПУБЛИКАЦИЯ ================
-@bot.callback_query_handler(func=lambda call: call.data.startswith('republish_request_'))
-def republish_request_callback(call):
-    req_id = int(call.data.split('_')[2])
+@router.route('republish_request_{req_id:int}')
+def republish_request_callback(call, req_id):
     user_id = call.from_user.id
 
     cursor.execute('SELECT user_id FROM requests WHERE id = ?', (req_id,))
@@ -2291,18 +1528,18 @@ def republish_request_callback(call):
     )
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('confirm_republish_'))
-def confirm_republish_callback(call):
-    req_id = int(call.data.split('_')[2])
+@router.route('confirm_republish_{req_id:int}')
+@callback_guard.once('confirm_republish')
+def confirm_republish_callback(call, req_id):
     user_id = call.from_user.id
 
     cursor.execute('SELECT user_id, service, description, district, date, budget, is_public FROM requests WHERE id = ?', (req_id,))
     req = cursor.fetchone()
     if not req or req[0] != user_id:
         bot.answer_callback_query(call.id, "❌ Ошибка")
-        return
+        return NOOP
     user_id, service, desc, district, date, budget, is_public = req
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+    now = utc_now()
     cursor.execute('''INSERT INTO requests
                     (user_id, username, service, description, district, date, budget, is_public, status, delayed, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
@@ -2326,17 +1563,14 @@ def confirm_republish_callback(call):
         bot.send_message(call.message.chat.id, "Заявка сохранена и будет опубликована утром.")
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data == "cancel_republish")
+@router.route('cancel_republish')
 def cancel_republish_callback(call):
     bot.edit_message_text("❌ Повторная публикация отменена.", call.message.chat.id, call.message.message_id)
     bot.answer_callback_query(call.id)
 
 # ================ ОСТАВЛЕНИЕ ОТЗЫВА ПО ЗАВЕРШЁННОЙ ЗАЯВКЕ ================
-@bot.callback_query_handler(func=lambda call: call.data.startswith('leave_review_'))
-def leave_review_callback(call):
-    parts = call.data.split('_')
-    req_id = int(parts[2])
-    master_id = int(parts[3])
+@router.route('leave_review_{req_id:int}_{master_id:int}')
+def leave_review_callback(call, req_id, master_id):
     user_id = call.from_user.id
 
     cursor.execute('SELECT user_id FROM requests WHERE id = ?', (req_id,))
@@ -2369,8 +1603,6 @@ def process_review_text_from_request(message, req_id, master_id, master_name):
         f"⭐ Оцените мастера от 1 до 5:",
         reply_markup=markup
     )
-    if not hasattr(bot, 'master_review_text'):
-        bot.master_review_text = {}
     bot.master_review_text[message.from_user.id] = (master_id, master_name, text)
 
 # ================ ПОИСК МАСТЕРА (КАТАЛОГ) ================
@@ -2380,6 +1612,7 @@ def find_master_start(message):
         return
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.row('По профилю', 'По району', 'По рейтингу')
+    markup.row('По описанию')
     markup.row('◀️ Назад в меню')
     bot.send_message(
         message.chat.id,
@@ -2405,6 +1638,11 @@ def find_master_menu(message):
     if text == 'По рейтингу':
         search_by_rating(message)
         return
+    if text == 'По описанию':
+        bot.send_message(message.chat.id, "🔍 Опишите, что нужно сделать, или введите имя мастера\n"
+                                          "(например: «заменить смеситель», «плитка в ванной»):")
+        bot.register_next_step_handler(message, search_by_text)
+        return
     else:
         bot.send_message(message.chat.id, "❌ Неверный выбор. Попробуйте снова.")
         find_master_start(message)
@@ -2428,22 +1666,14 @@ def ask_client_service_for_search(chat_id, user_id):
         reply_markup=markup
     )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('search_serv_'))
-def search_service_callback(call):
-    code = call.data[12:]
+@router.route('search_serv_{code}')
+def search_service_callback(call, code):
     service_name = PROFILES_DICT.get(code)
     if not service_name:
         bot.answer_callback_query(call.id, "❌ Ошибка")
         return
     bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    cursor.execute('''SELECT id, name, service, rating, reviews_count, districts
-                      FROM masters WHERE status = 'активен' AND LOWER(service) LIKE ?''',
-                   (f'%{service_name.lower()}%',))
-    masters = cursor.fetchall()
-    if not masters:
-        bot.send_message(call.message.chat.id, "😕 Мастеров с таким профилем пока нет.")
-    else:
-        send_masters_list(call.message.chat.id, masters)
+    paginator.send(call.message.chat.id, call.from_user.id, 'catserv', code)
     bot.answer_callback_query(call.id)
 
 def ask_client_district_for_search(chat_id, user_id):
@@ -2456,58 +1686,66 @@ def ask_client_district_for_search(chat_id, user_id):
         reply_markup=markup
     )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('search_dist_'))
-def search_district_callback(call):
-    code = call.data[12:]
+@router.route('search_dist_{code}')
+def search_district_callback(call, code):
     district_name = DISTRICTS_DICT.get(code)
     if not district_name:
         bot.answer_callback_query(call.id, "❌ Ошибка")
         return
     bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    cursor.execute('''SELECT id, name, service, rating, reviews_count, districts
-                      FROM masters WHERE status = 'активен' AND LOWER(districts) LIKE ?''',
-                   (f'%{district_name.lower()}%',))
-    masters = cursor.fetchall()
-    if not masters:
-        bot.send_message(call.message.chat.id, "😕 Мастеров в этом районе пока нет.")
-    else:
-        send_masters_list(call.message.chat.id, masters)
+    paginator.send(call.message.chat.id, call.from_user.id, 'catdist', code)
     bot.answer_callback_query(call.id)
 
 def search_by_rating(message):
-    cursor.execute('''SELECT id, name, service, rating, reviews_count, districts
-                      FROM masters WHERE status = 'активен' ORDER BY rating DESC, reviews_count DESC LIMIT 10''')
-    masters = cursor.fetchall()
+    masters = top_rated_masters(cursor)
     if not masters:
         bot.send_message(message.chat.id, "😕 Активных мастеров пока нет.")
         return
     send_masters_list(message.chat.id, masters)
 
-def send_masters_list(chat_id, masters):
-    for master in masters:
-        master_id, name, service, rating, reviews_count, districts = master
+def search_by_text(message):
+    query = safe_text(message)
+    if not query:
+        bot.send_message(message.chat.id, "❌ Запрос не может быть пустым.")
+        return
+    masters = search_masters(cursor, query)
+    if not masters:
+        bot.send_message(message.chat.id, "😕 Ничего не найдено. Попробуйте другие слова или поиск по профилю.")
+        return
+    send_masters_list(message.chat.id, masters)
+
+def render_masters(rows, user_id=None, arg=None):
+    blocks, buttons = [], []
+    for master_id, name, service, rating, reviews_count, districts in rows:
         rating_display = f"{rating:.1f}" if rating else "Нет"
-        text = f"""
-👤 **{name}**
+        blocks.append(f"""👤 **{name}**
 🔧 Профили: {service}
 ⭐ Рейтинг: {rating_display} ({reviews_count} отзывов)
-📍 Районы: {districts}
-        """
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("👤 Подробнее", callback_data=f"master_{master_id}"))
-        bot.send_message(chat_id, text, reply_markup=markup)
+📍 Районы: {districts}""")
+        buttons.append([types.InlineKeyboardButton(f"👤 {name} – подробнее", callback_data=f"master_{master_id}")])
+    return "\n\n".join(blocks), buttons
+
+def send_masters_list(chat_id, masters):
+    text, buttons = render_masters(masters)
+    markup = types.InlineKeyboardMarkup()
+    for row in buttons:
+        markup.row(*row)
+    bot.send_message(chat_id, text, reply_markup=markup)
+
+paginator.register(masters_by_service_view(render_masters, PAGE_SIZE))
+
+paginator.register(masters_by_district_view(render_masters, PAGE_SIZE))
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('master_'))
-def master_detail(call):
-    master_id = int(call.data.split('_')[1])
+def render_master_card(master_id, with_phone=False):
+    """(текст, кнопки) карточки мастера или None. with_phone – для клиента, принявшего отклик."""
     cursor.execute('''SELECT name, service, phone, districts, price_min, experience, bio, portfolio, rating, reviews_count
                       FROM masters WHERE id = ?''', (master_id,))
     master = cursor.fetchone()
     if not master:
-        bot.answer_callback_query(call.id, "❌ Мастер не найден")
-        return
+        return None
     name, service, phone, districts, price_min, experience, bio, portfolio, rating, reviews_count = master
     rating_display = f"{rating:.1f}" if rating else "Нет"
+    phone_line = f"📞 Телефон: {phone}\n" if with_phone else ""
     text = f"""
 👤 **{name}**
 🔧 Профили: {service}
@@ -2517,16 +1755,26 @@ def master_detail(call):
 ⏱ Опыт: {experience}
 💬 О себе: {bio}
 📸 Портфолио: {portfolio}
-    """
+{phone_line}    """
+    if with_phone:
+        return text, None
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton("📞 Связаться", callback_data=f"contact_{master_id}"))
     markup.add(types.InlineKeyboardButton("⭐ Отзывы", callback_data=f"reviews_{master_id}"))
+    return text, markup
+
+@router.route('master_{master_id:int}')
+def master_detail(call, master_id):
+    card = master_cards.get(master_id, 'catalog', lambda: render_master_card(master_id))
+    if not card:
+        bot.answer_callback_query(call.id, "❌ Мастер не найден")
+        return
+    text, markup = card
     bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('contact_'))
-def contact_master(call):
-    master_id = int(call.data.split('_')[1])
+@router.route('contact_{master_id:int}')
+def contact_master(call, master_id):
     cursor.execute('SELECT phone FROM masters WHERE id = ?', (master_id,))
     row = cursor.fetchone()
     if not row:
@@ -2535,9 +1783,8 @@ def contact_master(call):
     phone = row[0]
     bot.answer_callback_query(call.id, f"Телефон: {phone}", show_alert=True)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('reviews_'))
-def show_master_reviews(call):
-    master_id = int(call.data.split('_')[1])
+@router.route('reviews_{master_id:int}')
+def show_master_reviews(call, master_id):
     cursor.execute('''SELECT user_name, review_text, rating, created_at
                       FROM reviews WHERE master_id = ? AND status = 'approved'
                       ORDER BY created_at DESC LIMIT 5''', (master_id,))
@@ -2548,7 +1795,7 @@ def show_master_reviews(call):
     text = f"⭐ **Отзывы о мастере**\n\n"
     for r in reviews:
         user_name, rev_text, rating, created = r
-        text += f"👤 {user_name} – {rating}/5\n{rev_text}\n_{created}_\n\n"
+        text += f"👤 {user_name} – {rating}/5\n{rev_text}\n_{local(created, TIMEZONE_OFFSET)}_\n\n"
     bot.send_message(call.message.chat.id, text)
 
 # ================ ОСТАВИТЬ ОТЗЫВ (ОБЩИЙ) ================
@@ -2567,10 +1814,11 @@ def find_master_for_review(message):
     if not query:
         bot.send_message(message.chat.id, "❌ Введите имя или ID.")
         return
-    cursor.execute('''SELECT id, name, service FROM masters
-                      WHERE status = 'активен' AND (name LIKE ? OR id = ?)''',
-                   (f'%{query}%', query if query.isdigit() else -1))
-    masters = cursor.fetchall()
+    if query.isdigit():
+        cursor.execute("SELECT id, name, service FROM masters WHERE status = 'активен' AND id = ?", (int(query),))
+        masters = cursor.fetchall()
+    else:
+        masters = [row[:3] for row in search_masters(cursor, query)]
     if not masters:
         bot.send_message(message.chat.id, "😕 Мастер не найден. Попробуйте другое имя.")
         return
@@ -2615,137 +1863,83 @@ def process_review_text(message, master_id, master_name):
         f"⭐ Оцените мастера {master_name} от 1 до 5:",
         reply_markup=markup
     )
-    bot.master_review_text = {message.from_user.id: (master_id, master_name, text)}
+    bot.master_review_text[message.from_user.id] = (master_id, master_name, text)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('review_rate_'))
-def review_rate_callback(call):
-    parts = call.data.split('_')
-    rating = int(parts[2])
-    master_id = int(parts[3])
+@router.route('review_rate_{rating:int}_{master_id:int}')
+@callback_guard.once('review_rate', by=('master_id',))
+def review_rate_callback(call, rating, master_id):
     user_id = call.from_user.id
     if user_id not in bot.master_review_text:
         bot.answer_callback_query(call.id, "❌ Ошибка, начните заново.")
-        return
+        return NOOP
     master_id, master_name, review_text = bot.master_review_text[user_id]
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    cursor.execute('''INSERT INTO reviews
-                    (master_id, master_name, user_id, user_name, review_text, rating, status, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (master_id, master_name, user_id,
-                     call.from_user.username or "Аноним",
-                     review_text, rating, 'pending', now))
-    conn.commit()
-    bot.edit_message_text(
-        "✅ Спасибо! Отзыв отправлен на модерацию.",
-        call.message.chat.id,
-        call.message.message_id
-    )
-    bot.answer_callback_query(call.id, "Отзыв сохранён")
-    del bot.master_review_text[user_id]
+    now = utc_now()
     admin_text = f"""
 🆕 **НОВЫЙ ОТЗЫВ** (ожидает модерации)
 👤 Мастер: {master_name} (ID {master_id})
 👤 От: @{call.from_user.username or "аноним"}
 ⭐ Оценка: {rating}
 💬 Текст: {review_text}
-    """
-    try:
-        bot.send_message(ADMIN_ID, admin_text)
-    except:
-        pass
-
-# ================ РЕКОМЕНДОВАТЬ МАСТЕРА ================
-@bot.message_handler(func=lambda message: message.text == '👍 Рекомендовать мастера')
-def recommend_start(message):
-    if not only_private(message):
-        return
-    bot.send_message(
-        message.chat.id,
-        "👍 **Рекомендация мастера**\n\n"
-        "Знаете хорошего специалиста, которого пока нет в базе? Расскажите о нём, и мы добавим его.\n\n"
-        "Введите имя мастера:"
-    )
-    bot.register_next_step_handler(message, process_recommend_name)
-
-def process_recommend_name(message):
-    name = safe_text(message)
-    if not name:
-        bot.send_message(message.chat.id, "❌ Введите имя.")
-        return
-    user_id = message.from_user.id
-    if not hasattr(bot, 'recommend_data'):
-        bot.recommend_data = {}
-    bot.recommend_data[user_id] = {'master_name': name}
-    bot.send_message(
-        message.chat.id,
-        "🔧 Какую специализацию вы можете порекомендовать?\nПример: *сантехник, электрик*"
-    )
-    bot.register_next_step_handler(message, process_recommend_service)
-
-def process_recommend_service(message):
-    service = safe_text(message)
-    if not service:
-        bot.send_message(message.chat.id, "❌ Введите специализацию.")
-        return
-    user_id = message.from_user.id
-    bot.recommend_data[user_id]['service'] = service
-    bot.send_message(
-        message.chat.id,
-        "📞 Контакт мастера (телефон, ник в Telegram и т.п.):"
+    """
+    with storage.transaction():
+        cursor.execute('''INSERT INTO reviews
+                        (master_id, master_name, user_id, user_name, review_text, rating, status, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                        (master_id, master_name, user_id,
+                         call.from_user.username or "Аноним",
+                         review_text, rating, 'pending', now))
+        outbox.send(ADMIN_ID, admin_text)
+    bot.edit_message_text(
+        "✅ Спасибо! Отзыв отправлен на модерацию.",
+        call.message.chat.id,
+        call.message.message_id
     )
-    bot.register_next_step_handler(message, process_recommend_contact)
+    bot.answer_callback_query(call.id, "Отзыв сохранён")
+    del bot.master_review_text[user_id]
 
-def process_recommend_contact(message):
-    contact = safe_text(message)
-    if not contact:
-        bot.send_message(message.chat.id, "❌ Введите контакт.")
+# ================ РЕКОМЕНДОВАТЬ МАСТЕРА ================
+@bot.message_handler(func=lambda message: message.text == '👍 Рекомендовать мастера')
+def recommend_start(message):
+    if not only_private(message):
         return
-    user_id = message.from_user.id
-    bot.recommend_data[user_id]['contact'] = contact
-    bot.send_message(
-        message.chat.id,
-        "📝 Краткое описание: почему вы рекомендуете этого мастера?"
-    )
-    bot.register_next_step_handler(message, process_recommend_desc)
+    wizard.start('recommend', message.chat.id, message.from_user.id)
 
-def process_recommend_desc(message):
-    desc = safe_text(message)
-    if not desc:
-        bot.send_message(message.chat.id, "❌ Введите описание.")
-        return
-    user_id = message.from_user.id
-    bot.recommend_data[user_id]['description'] = desc
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    cursor.execute('''INSERT INTO recommendations
-                    (user_id, username, master_name, service, contact, description, status, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (user_id,
-                     message.from_user.username or "no_username",
-                     bot.recommend_data[user_id]['master_name'],
-                     bot.recommend_data[user_id]['service'],
-                     bot.recommend_data[user_id]['contact'],
-                     bot.recommend_data[user_id]['description'],
-                     'на модерации',
-                     now))
-    conn.commit()
-    rec_id = cursor.lastrowid
-    bot.send_message(
-        message.chat.id,
-        "✅ Спасибо за рекомендацию! Администратор проверит её и свяжется с мастером."
-    )
-    del bot.recommend_data[user_id]
-    admin_text = f"""
+def save_recommendation(message, user_id, data):
+    now = utc_now()
+    with storage.transaction():
+        cursor.execute('''INSERT INTO recommendations
+                        (user_id, username, master_name, service, contact, description, status, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                        (user_id,
+                         message.from_user.username or "no_username",
+                         data['master_name'],
+                         data['service'],
+                         data['contact'],
+                         data['description'],
+                         'на модерации',
+                         now))
+        rec_id = cursor.lastrowid
+        admin_text = f"""
 🆕 **НОВАЯ РЕКОМЕНДАЦИЯ МАСТЕРА** (ID: {rec_id})
 👤 Рекомендатель: @{message.from_user.username or "нет"}
-👤 Мастер: {bot.recommend_data[user_id]['master_name']}
-🔧 Специализация: {bot.recommend_data[user_id]['service']}
-📞 Контакт: {bot.recommend_data[user_id]['contact']}
-📝 Описание: {bot.recommend_data[user_id]['description']}
+👤 Мастер: {data['master_name']}
+🔧 Специализация: {data['service']}
+📞 Контакт: {data['contact']}
+📝 Описание: {data['description']}
     """
-    try:
-        bot.send_message(ADMIN_ID, admin_text)
-    except:
-        pass
+        outbox.send(ADMIN_ID, admin_text)
+    del bot.recommend_data[user_id]
+    return "✅ Спасибо за рекомендацию! Администратор проверит её и свяжется с мастером.", None
+
+wizard.register(Form('recommend', [
+    TextInput('name', "Знаете хорошего специалиста, которого пока нет в базе? Расскажите о нём, и мы добавим его.\n\n"
+                      "Введите имя мастера:", key='master_name', error="❌ Введите имя."),
+    TextInput('service', "🔧 Какую специализацию вы можете порекомендовать?\nПример: *сантехник, электрик*",
+              error="❌ Введите специализацию."),
+    TextInput('contact', "📞 Контакт мастера (телефон, ник в Telegram и т.п.):", error="❌ Введите контакт."),
+    TextInput('desc', "📝 Краткое описание: почему вы рекомендуете этого мастера?", key='description',
+              error="❌ Введите описание."),
+], bot.recommend_data, save_recommendation, title="👍 **Рекомендация мастера**"))
 
 # ================ СМЕНА РОЛИ ================
 @bot.message_handler(func=lambda message: message.text == '🔄 Сменить роль')
@@ -2763,22 +1957,26 @@ def change_role_start(message):
         reply_markup=markup
     )
 
-@bot.callback_query_handler(func=lambda call: call.data == "confirm_change_role")
+@router.route('confirm_change_role')
 def confirm_change_role(call):
     user_id = call.from_user.id
-    cursor.execute("DELETE FROM requests WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM master_applications WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM masters WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM responses WHERE master_id IN (SELECT id FROM masters WHERE user_id = ?)", (user_id,))
-    cursor.execute("DELETE FROM reviews WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM recommendations WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM client_recommendations WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-    conn.commit()
+    with storage.transaction():
+        cursor.execute("DELETE FROM requests WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM master_applications WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM responses WHERE master_id IN (SELECT id FROM masters WHERE user_id = ?)", (user_id,))
+        cursor.execute("DELETE FROM master_services WHERE master_id IN (SELECT id FROM masters WHERE user_id = ?)", (user_id,))
+        cursor.execute("DELETE FROM master_districts WHERE master_id IN (SELECT id FROM masters WHERE user_id = ?)", (user_id,))
+        cursor.execute("DELETE FROM masters WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM reviews WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM recommendations WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM client_recommendations WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        changes.publish('user_removed', user_id)
+    forget_user(user_id)
     bot.edit_message_text("✅ Ваши данные удалены. Используйте /start для выбора новой роли.", call.message.chat.id, call.message.message_id)
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data == "cancel_change_role")
+@router.route('cancel_change_role')
 def cancel_change_role(call):
     bot.edit_message_text("❌ Смена роли отменена.", call.message.chat.id, call.message.message_id)
     bot.answer_callback_query(call.id)
@@ -2811,30 +2009,25 @@ def approve_master(message):
          experience, bio, portfolio, documents, entity_type, verification_type,
          documents_list, payment_methods, preferred_contact, age_group, source) = app
 
-        now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-        cursor.execute('''INSERT INTO masters
-                        (user_id, name, service, phone, districts, price_min, price_max,
-                         experience, bio, portfolio, documents, entity_type, verification_type,
-                         documents_list, payment_methods, preferred_contact, age_group,
-                         source, status, created_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                        (user_id, name, service, phone, districts, price_min, '',
-                         experience, bio, portfolio, documents, entity_type, verification_type,
-                         documents_list, payment_methods, preferred_contact, age_group,
-                         source, 'активен', now))
-        conn.commit()
-        master_id = cursor.lastrowid
-
-        cursor.execute("DELETE FROM master_applications WHERE id = ?", (app_id,))
-        conn.commit()
-
-        try:
-            bot.send_message(
+        now = utc_now()
+        with storage.transaction():
+            cursor.execute('''INSERT INTO masters
+                            (user_id, name, service, phone, districts, price_min, price_max,
+                             experience, bio, portfolio, documents, entity_type, verification_type,
+                             documents_list, payment_methods, preferred_contact, age_group,
+                             source, status, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                            (user_id, name, service, phone, districts, price_min, '',
+                             experience, bio, portfolio, documents, entity_type, verification_type,
+                             documents_list, payment_methods, preferred_contact, age_group,
+                             source, 'активен', now))
+            master_id = cursor.lastrowid
+            cursor.execute("DELETE FROM master_applications WHERE id = ?", (app_id,))
+            outbox.send(
                 user_id,
                 f"✅ Поздравляем! Ваша анкета одобрена!\n\nВы добавлены в базу мастеров. Теперь вы будете получать уведомления о новых заявках по вашим профилям и районам.\n\nПриглашаем в закрытый чат мастеров: {MASTER_CHAT_INVITE_LINK}"
             )
-        except:
-            pass
+        sync_master(master_id)
 
         publish_master_card(master_id, name, service, districts, price_min, experience, bio, portfolio)
         bot.reply_to(message, f"✅ Мастер одобрен (ID {master_id}).")
@@ -2856,19 +2049,73 @@ def reject_master(message):
             bot.reply_to(message, f"❌ Анкета с ID {app_id} не найдена.")
             return
         user_id = row[0]
-        cursor.execute("DELETE FROM master_applications WHERE id = ?", (app_id,))
-        conn.commit()
-        try:
-            bot.send_message(
+        with storage.transaction():
+            cursor.execute("DELETE FROM master_applications WHERE id = ?", (app_id,))
+            outbox.send(
                 user_id,
                 f"❌ Ваша анкета отклонена.\nПричина: {reason}\n\nВы можете попробовать снова, исправив ошибки."
             )
-        except:
-            pass
         bot.reply_to(message, f"✅ Анкета {app_id} отклонена.")
     except Exception as e:
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
+@bot.message_handler(commands=['findreq'])
+def find_requests_command(message):
+    if message.from_user.id != ADMIN_ID:
+        bot.reply_to(message, "❌ Нет прав.")
+        return
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        bot.reply_to(message, "Использование: /findreq <слова из заявки>")
+        return
+    found = search_requests(cursor, parts[1])
+    if not found:
+        bot.reply_to(message, "😕 Заявок не найдено.")
+        return
+    lines = [f"#{req_id} | {service} | {district} | {status}\n{shorten(desc, 150)}"
+             for req_id, service, desc, district, status in found]
+    bot.reply_to(message, "🔍 Найденные заявки:\n\n" + "\n\n".join(lines))
+
+@bot.message_handler(commands=['delivery'])
+def delivery_stats_command(message):
+    if message.from_user.id != ADMIN_ID:
+        bot.reply_to(message, "❌ Нет прав.")
+        return
+    try:
+        request_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        bot.reply_to(message, "Использование: /delivery <ID заявки>")
+        return
+    stats = delivery.stats(request_id)
+    if not stats:
+        bot.reply_to(message, f"Нет данных о рассылке по заявке #{request_id}.")
+        return
+    status = "в процессе" if stats['finished'] is None else "завершена"
+    bot.reply_to(message, f"📨 Рассылка по заявке #{request_id} ({status})\n"
+                          f"Получателей: {stats['total']}\n"
+                          f"✅ Доставлено: {stats['delivered']}\n"
+                          f"❌ Ошибок: {stats['failed']}\n"
+                          f"⏳ В очереди: {stats['pending']}")
+
+@bot.message_handler(commands=['jobs'])
+def jobs_command(message):
+    if message.from_user.id != ADMIN_ID:
+        bot.reply_to(message, "❌ Нет прав.")
+        return
+    def fmt(ts):
+        if not ts:
+            return "—"
+        return (datetime.fromtimestamp(ts, timezone.utc) + timedelta(hours=TIMEZONE_OFFSET)).strftime("%d.%m.%Y %H:%M:%S")
+    lines = ["⏰ Фоновые задачи\n"]
+    for job in scheduler.status():
+        duration = f"{job['last_duration']:.1f} с" if job['last_duration'] is not None else "—"
+        lines.append(f"{job['name']} ({job['schedule']})\n"
+                     f"  Последний запуск: {fmt(job['last_run'])}, {duration}, {job['last_status'] or '—'}\n"
+                     f"  Следующий: {fmt(job['next_run'])}, всего запусков: {job['runs']}")
+        if job['last_error']:
+            lines.append(f"  Ошибка: {job['last_error']}")
+    bot.reply_to(message, "\n".join(lines))
+
 def publish_master_card(master_id, name, service, districts, price_min, experience, bio, portfolio):
     if portfolio and portfolio.strip() and portfolio != 'Не указано':
         portfolio_text = portfolio
@@ -2896,9 +2143,8 @@ def publish_master_card(master_id, name, service, districts, price_min, experien
     except Exception as e:
         print(f"Ошибка публикации карточки мастера: {e}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('channel_master_'))
-def channel_master_callback(call):
-    master_id = int(call.data.split('_')[2])
+@router.route('channel_master_{master_id:int}')
+def channel_master_callback(call, master_id):
     user_id = call.from_user.id
     bot.answer_callback_query(call.id, "✅ Перейдите в бота, чтобы оставить заявку.")
     bot.send_message(
@@ -2920,547 +2166,161 @@ def admin_panel(message):
         types.InlineKeyboardButton("📢 Клиентские рекомендации", callback_data="admin_client_recs"),
         types.InlineKeyboardButton("📊 Статистика", callback_data="admin_stats"),
         types.InlineKeyboardButton("🚀 Опубликовать отложенные", callback_data="admin_publish_delayed"),
-        types.InlineKeyboardButton("➕ Добавить мастера вручную", callback_data="admin_manual_add")
+        types.InlineKeyboardButton("➕ Добавить мастера вручную", callback_data="admin_manual_add"),
+        types.InlineKeyboardButton("📭 Недоставленные сообщения", callback_data="admin_outbox")
     )
     bot.send_message(message.chat.id, "🔧 **Панель администратора**", reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_'))
-def admin_callback(call):
+def moderation_buttons(prefix, item_id, approve="✅", reject="❌"):
+    return [types.InlineKeyboardButton(f"{approve} #{item_id}", callback_data=f"{prefix}_approve_{item_id}"),
+            types.InlineKeyboardButton(f"{reject} #{item_id}", callback_data=f"{prefix}_reject_{item_id}")]
+
+def render_admin_apps(rows, user_id, arg):
+    lines = [f"ID: {app_id} | {name} | {service} | {phone} | {local(created, TIMEZONE_OFFSET)}" for app_id, name, service, phone, created in rows]
+    return "\n".join(lines), [moderation_buttons('app', row[0]) for row in rows]
+
+def render_admin_reviews(rows, user_id, arg):
+    blocks = [f"ID {rev_id} | {master} | от {user} | {rating}/5\n{shorten(text)}\n_{local(created, TIMEZONE_OFFSET)}_"
+              for rev_id, master, user, rating, text, created in rows]
+    return "\n\n".join(blocks), [moderation_buttons('rev', row[0]) for row in rows]
+
+def render_admin_recs(rows, user_id, arg):
+    lines = [f"ID {rec_id} | {name} | {service} | Контакт: {contact}" for rec_id, name, service, contact, _ in rows]
+    return "\n".join(lines), [moderation_buttons('rec', row[0]) for row in rows]
+
+def render_admin_client_recs(rows, user_id, arg):
+    blocks = [f"ID {rec_id} | От @{username or 'нет'} | #{hashtag}\nКонтакт: {contact}\nОписание: {shorten(desc)}"
+              for rec_id, _, username, hashtag, contact, desc in rows]
+    return "\n\n".join(blocks), [moderation_buttons('clientrec', row[0]) for row in rows]
+
+paginator.register(admin_apps_view(ADMIN_ID, render_admin_apps, PAGE_SIZE))
+
+paginator.register(admin_reviews_view(ADMIN_ID, render_admin_reviews, PAGE_SIZE))
+
+paginator.register(admin_recs_view(ADMIN_ID, render_admin_recs, PAGE_SIZE))
+
+paginator.register(admin_client_recs_view(ADMIN_ID, render_admin_client_recs, PAGE_SIZE))
+
+def render_admin_outbox(rows, user_id, arg):
+    blocks = [f"#{msg_id} | кому {chat_id} | попыток {attempts}\n{shorten(text, 150)}\n⚠️ {last_error}"
+              for msg_id, chat_id, text, attempts, last_error in rows]
+    buttons = [[types.InlineKeyboardButton(f"🔁 #{row[0]}", callback_data=f"outbox_retry_{row[0]}"),
+                types.InlineKeyboardButton(f"🗑 #{row[0]}", callback_data=f"outbox_drop_{row[0]}")] for row in rows]
+    return "\n\n".join(blocks), buttons
+
+paginator.register(admin_outbox_view(ADMIN_ID, render_admin_outbox, PAGE_SIZE))
+
+@router.route('admin_{cmd:rest}')
+def admin_callback(call, cmd):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id, "❌ Нет прав")
         return
-    cmd = call.data.split('_')[1]
     if cmd == 'apps':
-        cursor.execute('''SELECT id, name, service, phone, created_at FROM master_applications WHERE status = 'На проверке' ORDER BY created_at DESC''')
-        apps = cursor.fetchall()
-        if not apps:
-            bot.send_message(call.message.chat.id, "Нет заявок на проверку.")
-            return
-        for app in apps:
-            app_id, name, service, phone, created = app
-            text = f"ID: {app_id} | {name} | {service} | {phone} | {created}"
-            markup = types.InlineKeyboardMarkup()
-            markup.add(
-                types.InlineKeyboardButton("✅ Одобрить", callback_data=f"app_approve_{app_id}"),
-                types.InlineKeyboardButton("❌ Отклонить", callback_data=f"app_reject_{app_id}")
-            )
-            bot.send_message(call.message.chat.id, text, reply_markup=markup)
+        paginator.send(call.message.chat.id, call.from_user.id, 'adminapps')
         bot.answer_callback_query(call.id)
     elif cmd == 'reviews':
-        cursor.execute('''SELECT id, master_name, user_name, rating, review_text, created_at
-                          FROM reviews WHERE status = 'pending' ORDER BY created_at''')
-        revs = cursor.fetchall()
-        if not revs:
-            bot.send_message(call.message.chat.id, "Нет отзывов на модерации.")
-            return
-        for rev in revs:
-            rev_id, master, user, rating, text, created = rev
-            msg = f"ID {rev_id} | {master} | от {user} | {rating}/5\n{text}\n_{created}_"
-            markup = types.InlineKeyboardMarkup()
-            markup.add(
-                types.InlineKeyboardButton("✅ Одобрить", callback_data=f"rev_approve_{rev_id}"),
-                types.InlineKeyboardButton("❌ Отклонить", callback_data=f"rev_reject_{rev_id}")
-            )
-            bot.send_message(call.message.chat.id, msg, reply_markup=markup)
+        paginator.send(call.message.chat.id, call.from_user.id, 'adminrevs')
         bot.answer_callback_query(call.id)
     elif cmd == 'recs':
-        cursor.execute('''SELECT id, master_name, service, contact, user_id FROM recommendations WHERE status = 'на модерации' ORDER BY created_at''')
-        recs = cursor.fetchall()
-        if not recs:
-            bot.send_message(call.message.chat.id, "Нет рекомендаций на модерации.")
-            return
-        for rec in recs:
-            rec_id, name, service, contact, recommender_id = rec
-            msg = f"ID {rec_id} | {name} | {service} | Контакт: {contact}"
-            markup = types.InlineKeyboardMarkup()
-            markup.add(
-                types.InlineKeyboardButton("✅ Принять", callback_data=f"rec_approve_{rec_id}"),
-                types.InlineKeyboardButton("❌ Отклонить", callback_data=f"rec_reject_{rec_id}")
-            )
-            bot.send_message(call.message.chat.id, msg, reply_markup=markup)
+        paginator.send(call.message.chat.id, call.from_user.id, 'adminrecs')
         bot.answer_callback_query(call.id)
     elif cmd == 'client_recs':
-        cursor.execute('''SELECT id, user_id, username, hashtag, contact, description
-                          FROM client_recommendations WHERE status = 'new' ORDER BY created_at''')
-        recs = cursor.fetchall()
-        if not recs:
-            bot.send_message(call.message.chat.id, "Нет новых клиентских рекомендаций.")
-            return
-        for rec in recs:
-            rec_id, user_id, username, hashtag, contact, desc = rec
-            msg = f"ID {rec_id} | От @{username or 'нет'} | #{hashtag}\nКонтакт: {contact}\nОписание: {desc}"
-            markup = types.InlineKeyboardMarkup()
-            markup.add(
-                types.InlineKeyboardButton("✅ Принять", callback_data=f"clientrec_approve_{rec_id}"),
-                types.InlineKeyboardButton("❌ Отклонить", callback_data=f"clientrec_reject_{rec_id}")
-            )
-            bot.send_message(call.message.chat.id, msg, reply_markup=markup)
+        paginator.send(call.message.chat.id, call.from_user.id, 'admincrecs')
         bot.answer_callback_query(call.id)
     elif cmd == 'stats':
         stats = get_stats()
         bot.send_message(call.message.chat.id, stats, parse_mode='Markdown')
         bot.answer_callback_query(call.id)
     elif cmd == 'publish_delayed':
-        publish_delayed_requests()
-        bot.send_message(call.message.chat.id, "✅ Отложенные заявки опубликованы.")
+        scheduler.run_now('publish_delayed')
+        bot.send_message(call.message.chat.id, "✅ Публикация отложенных заявок запущена.")
         bot.answer_callback_query(call.id)
     elif cmd == 'manual_add':
         start_manual_master_add(call)
-
-def get_stats():
-    cursor.execute("SELECT COUNT(*) FROM users")
-    total_users = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM masters WHERE status = 'активен'")
-    active_masters = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM requests WHERE status = 'активна'")
-    active_requests = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM reviews WHERE status = 'approved'")
-    approved_reviews = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM master_applications WHERE status = 'На проверке'")
-    pending_apps = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM recommendations WHERE status = 'на модерации'")
-    pending_recs = cursor.fetchone()[0]
-    return f"""
-📊 **СТАТИСТИКА**
-
-👥 Всего пользователей: {total_users}
-👷 Активных мастеров: {active_masters}
-📋 Активных заявок: {active_requests}
-⭐ Одобренных отзывов: {approved_reviews}
-⏳ Заявок мастеров на проверке: {pending_apps}
-👍 Рекомендаций на модерации: {pending_recs}
-    """
-
-# ================ РУЧНОЕ ДОБАВЛЕНИЕ МАСТЕРА (АДМИН) ================
-if not hasattr(bot, 'admin_add_data'):
-    bot.admin_add_data = {}
-
-def start_manual_master_add(call):
-    user_id = call.from_user.id
-    if user_id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    bot.admin_add_data[user_id] = {}
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    markup.add(
-        types.InlineKeyboardButton("👤 Частное лицо", callback_data="admin_entity_individual"),
-        types.InlineKeyboardButton("🏢 Компания / ИП", callback_data="admin_entity_company")
-    )
-    bot.edit_message_text(
-        "👷 **РУЧНОЕ ДОБАВЛЕНИЕ МАСТЕРА**\n\n"
-        "Шаг 1 из 14\n"
-        "👇 **ВЫБЕРИТЕ ТИП:**",
-        call.message.chat.id,
-        call.message.message_id,
-        reply_markup=markup
-    )
-    bot.answer_callback_query(call.id)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_entity_'))
-def admin_entity_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    entity_type = call.data.split('_')[2]
-    user_id = call.from_user.id
-    bot.admin_add_data[user_id]['entity_type'] = entity_type
-    question = "👤 **ВВЕДИТЕ ПОЛНОЕ ИМЯ МАСТЕРА:**" if entity_type == 'individual' else "🏢 **ВВЕДИТЕ НАЗВАНИЕ КОМПАНИИ ИЛИ БРИГАДЫ:**"
-    bot.edit_message_text(
-        f"👷 **РУЧНОЕ ДОБАВЛЕНИЕ МАСТЕРА**\n\nШаг 2 из 14\n👇 {question}",
-        call.message.chat.id,
-        call.message.message_id
-    )
-    bot.register_next_step_handler(call.message, admin_process_name)
-    bot.answer_callback_query(call.id)
-
-def admin_process_name(message):
-    if message.from_user.id != ADMIN_ID:
-        return
-    name = safe_text(message)
-    if not name:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, введите имя/название.")
-        bot.register_next_step_handler(message, admin_process_name)
-        return
-    user_id = message.from_user.id
-    bot.admin_add_data[user_id]['name'] = name
-    admin_ask_age(message.chat.id, user_id)
-
-def admin_ask_age(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=3)
-    markup.add(
-        types.InlineKeyboardButton("до 25 лет", callback_data="admin_age_under25"),
-        types.InlineKeyboardButton("25-35 лет", callback_data="admin_age_25_35"),
-        types.InlineKeyboardButton("35-50 лет", callback_data="admin_age_35_50"),
-        types.InlineKeyboardButton("старше 50", callback_data="admin_age_over50"),
-        types.InlineKeyboardButton("⏩ Пропустить", callback_data="admin_age_skip")
-    )
-    bot.send_message(chat_id, "🎂 **Шаг 3 из 14**\n\nУкажите возраст мастера (необязательно).", reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_age_'))
-def admin_age_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    user_id = call.from_user.id
-    age_map = {'under25':'до 25','25_35':'25-35','35_50':'35-50','over50':'старше 50','skip':''}
-    key = call.data[10:]
-    bot.admin_add_data[user_id]['age_group'] = age_map.get(key, '')
-    bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-    admin_ask_profiles(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id)
-
-def admin_ask_profiles(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_profiles' not in bot.admin_add_data[user_id]:
-        bot.admin_add_data[user_id]['selected_profiles'] = []
-    selected = bot.admin_add_data[user_id]['selected_profiles']
-    for code, name in PROFILES:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(f"{prefix}{name}", callback_data=f"admin_prof_{code}"))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="admin_prof_done"))
-    bot.send_message(chat_id, "👷 **Шаг 4 из 14**\n\nВыберите **профили** мастера (можно несколько):", reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_prof_'))
-def admin_profile_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    user_id = call.from_user.id
-    data = call.data[11:]
-    if data == "done":
-        selected = bot.admin_add_data[user_id].get('selected_profiles', [])
-        if not selected:
-            bot.answer_callback_query(call.id, "❌ Выберите хотя бы один профиль")
-            return
-        bot.admin_add_data[user_id]['profiles'] = ", ".join(selected)
-        bot.admin_add_data[user_id]['services'] = ", ".join(selected)
-        bot.admin_add_data[user_id]['service'] = selected[0]
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_experience(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id, "✅ Профили сохранены")
-    else:
-        profile_name = PROFILES_DICT.get(data)
-        if not profile_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.admin_add_data[user_id].get('selected_profiles', [])
-        if profile_name in selected:
-            selected.remove(profile_name)
-        else:
-            selected.append(profile_name)
-        bot.admin_add_data[user_id]['selected_profiles'] = selected
-        admin_ask_profiles(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def admin_ask_experience(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for code, name in EXPERIENCE_OPTIONS:
-        markup.add(types.InlineKeyboardButton(name, callback_data=f"admin_exp_{code}"))
-    bot.send_message(chat_id, "⏱️ **Шаг 5 из 14**\n\nВыберите опыт работы мастера:", reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_exp_'))
-def admin_experience_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    user_id = call.from_user.id
-    code = call.data[10:]
-    if code == "custom":
-        bot.edit_message_text("⏱️ Введите опыт работы текстом:", call.message.chat.id, call.message.message_id)
-        bot.register_next_step_handler(call.message, admin_process_custom_experience, user_id)
+    elif cmd == 'outbox':
+        paginator.send(call.message.chat.id, call.from_user.id, 'adminoutbox')
         bot.answer_callback_query(call.id)
-    else:
-        exp_map = {k:v for k,v in EXPERIENCE_OPTIONS if k!="custom"}
-        bot.admin_add_data[user_id]['experience'] = exp_map[code]
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_districts(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def admin_process_custom_experience(message, user_id):
-    if message.from_user.id != ADMIN_ID:
-        return
-    exp = safe_text(message)
-    if not exp:
-        bot.send_message(message.chat.id, "❌ Введите опыт.")
-        bot.register_next_step_handler(message, admin_process_custom_experience, user_id)
-        return
-    bot.admin_add_data[user_id]['experience'] = exp
-    admin_ask_districts(message.chat.id, user_id)
-
-def admin_ask_districts(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_districts' not in bot.admin_add_data[user_id]:
-        bot.admin_add_data[user_id]['selected_districts'] = []
-    selected = bot.admin_add_data[user_id]['selected_districts']
-    for code, name in DISTRICTS:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(f"{prefix}{name}", callback_data=f"admin_dist_{code}"))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="admin_dist_done"))
-    bot.send_message(chat_id, "📍 **Шаг 6 из 14**\n\nВыберите районы работы мастера (можно несколько):", reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_dist_'))
-def admin_district_callback(call):
+# ----- Недоставленные сообщения (outbox) -----
+@router.route('outbox_retry_{msg_id:int}')
+def outbox_retry_callback(call, msg_id):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id, "❌ Нет прав")
         return
-    user_id = call.from_user.id
-    data = call.data[11:]
-    if data == "done":
-        selected = bot.admin_add_data[user_id].get('selected_districts', [])
-        if not selected:
-            bot.answer_callback_query(call.id, "❌ Выберите хотя бы один район")
-            return
-        bot.admin_add_data[user_id]['districts'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_price_min(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id, "✅ Районы сохранены")
-    else:
-        district_name = DISTRICTS_DICT.get(data)
-        if not district_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.admin_add_data[user_id].get('selected_districts', [])
-        if district_name in selected:
-            selected.remove(district_name)
-        else:
-            selected.append(district_name)
-        bot.admin_add_data[user_id]['selected_districts'] = selected
-        admin_ask_districts(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def admin_ask_price_min(chat_id, user_id):
-    msg = bot.send_message(chat_id, "💰 **Шаг 7 из 14**\n\nВведите **минимальную цену заказа** (например: 1000₽, договорная):")
-    bot.register_next_step_handler(msg, admin_process_price_min, user_id)
-
-def admin_process_price_min(message, user_id):
-    if message.from_user.id != ADMIN_ID:
-        return
-    price_min = safe_text(message)
-    if not price_min:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, укажите минимальную цену.")
-        bot.register_next_step_handler(message, admin_process_price_min, user_id)
+    if not outbox.retry(msg_id):
+        bot.answer_callback_query(call.id, "❌ Сообщение не найдено или уже в очереди")
         return
-    bot.admin_add_data[user_id]['price_min'] = price_min
-    bot.admin_add_data[user_id]['price_max'] = ''
-    admin_ask_payment_methods(message.chat.id, user_id)
+    paginator.refresh(call)
+    bot.answer_callback_query(call.id, "🔁 Сообщение снова в очереди")
 
-def admin_ask_payment_methods(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_payments' not in bot.admin_add_data[user_id]:
-        bot.admin_add_data[user_id]['selected_payments'] = []
-    selected = bot.admin_add_data[user_id]['selected_payments']
-    for code, name in PAYMENT_METHODS:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(f"{prefix}{name}", callback_data=f"admin_pay_{code}"))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="admin_pay_done"))
-    bot.send_message(chat_id, "💳 **Шаг 8 из 14**\n\nКакие способы оплаты принимает мастер? (можно несколько)", reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_pay_'))
-def admin_payment_callback(call):
+@router.route('outbox_drop_{msg_id:int}')
+def outbox_drop_callback(call, msg_id):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id, "❌ Нет прав")
         return
-    user_id = call.from_user.id
-    data = call.data[10:]
-    if data == "done":
-        selected = bot.admin_add_data[user_id].get('selected_payments', [])
-        bot.admin_add_data[user_id]['payment_methods'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_bio(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id, "✅ Способы оплаты сохранены")
-    else:
-        pay_name = PAYMENT_DICT.get(data)
-        if not pay_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.admin_add_data[user_id].get('selected_payments', [])
-        if pay_name in selected:
-            selected.remove(pay_name)
-        else:
-            selected.append(pay_name)
-        bot.admin_add_data[user_id]['selected_payments'] = selected
-        admin_ask_payment_methods(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def admin_ask_bio(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup()
-    markup.add(types.InlineKeyboardButton("⏩ Пропустить", callback_data="admin_skip_bio"))
-    bot.send_message(chat_id, "📝 **Шаг 9 из 14**\n\n👇 **КОММЕНТАРИЙ О МАСТЕРЕ (кратко):**\n\nРасскажите о мастере пару слов.\n\n👉 **Или нажмите «Пропустить»**", reply_markup=markup)
-    bot.register_next_step_handler_by_chat_id(chat_id, admin_process_bio, user_id)
+    with storage.transaction():
+        cursor.execute("DELETE FROM outbox WHERE id = ? AND status = 'dead'", (msg_id,))
+    paginator.refresh(call)
+    bot.answer_callback_query(call.id, "🗑 Удалено")
 
-@bot.callback_query_handler(func=lambda call: call.data == 'admin_skip_bio')
-def admin_skip_bio_callback(call):
+# ----- Модерация отзывов (рейтинг мастера пересчитывают триггеры) -----
+def moderate_review(call, rev_id, status, verdict):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id, "❌ Нет прав")
         return
-    user_id = call.from_user.id
-    bot.admin_add_data[user_id]['bio'] = "Не указано"
-    admin_ask_portfolio(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id, "⏩ Пропущено")
-
-def admin_process_bio(message, user_id):
-    if message.from_user.id != ADMIN_ID:
+    cursor.execute("UPDATE reviews SET status = ? WHERE id = ? AND status = 'pending'", (status, rev_id))
+    updated = cursor.rowcount
+    conn.commit()
+    if not updated:
+        bot.answer_callback_query(call.id, "❌ Отзыв не найден или уже обработан")
         return
-    bio = safe_text(message)
-    if not bio or bio.lower() == "пропустить":
-        bio = "Не указано"
-    bot.admin_add_data[user_id]['bio'] = bio
-    admin_ask_portfolio(message.chat.id, user_id)
-
-def admin_ask_portfolio(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup()
-    markup.add(types.InlineKeyboardButton("⏩ Пропустить", callback_data="admin_skip_portfolio"))
-    bot.send_message(chat_id, "📸 **Шаг 10 из 14**\n\n👇 **ССЫЛКА НА ПОРТФОЛИО МАСТЕРА:**\n\nЭто может быть ссылка на Яндекс.Диск, Google Фото, Telegram-канал с работами.\n\n👉 **Или нажмите «Пропустить»**", reply_markup=markup)
-    bot.register_next_step_handler_by_chat_id(chat_id, admin_process_portfolio, user_id)
+    # Рейтинг мастера пересчитан триггером – карточку нужно перестроить
+    cursor.execute("SELECT master_id FROM reviews WHERE id = ?", (rev_id,))
+    row = cursor.fetchone()
+    if row:
+        master_cards.invalidate(row[0])
+        changes.publish('master', row[0])
+    if not paginator.refresh(call):
+        bot.edit_message_text(f"{call.message.text}\n\n{verdict}", call.message.chat.id, call.message.message_id)
+    bot.answer_callback_query(call.id, verdict)
 
-@bot.callback_query_handler(func=lambda call: call.data == 'admin_skip_portfolio')
-def admin_skip_portfolio_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    user_id = call.from_user.id
-    bot.admin_add_data[user_id]['portfolio'] = "Не указано"
-    admin_ask_documents_question(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id, "⏩ Пропущено")
+@router.route('rev_approve_{rev_id:int}')
+def review_approve_callback(call, rev_id):
+    moderate_review(call, rev_id, 'approved', "✅ Отзыв одобрен")
 
-def admin_process_portfolio(message, user_id):
-    if message.from_user.id != ADMIN_ID:
-        return
-    portfolio = safe_text(message)
-    if not portfolio or portfolio.lower() == "пропустить":
-        portfolio = "Не указано"
-    bot.admin_add_data[user_id]['portfolio'] = portfolio
-    admin_ask_documents_question(message.chat.id, user_id)
+@router.route('rev_reject_{rev_id:int}')
+def review_reject_callback(call, rev_id):
+    moderate_review(call, rev_id, 'rejected', "❌ Отзыв отклонён")
 
-def admin_ask_documents_question(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=3)
-    markup.add(
-        types.InlineKeyboardButton("✅ Да", callback_data="admin_doc_yes"),
-        types.InlineKeyboardButton("❌ Нет", callback_data="admin_doc_no"),
-        types.InlineKeyboardButton("⏩ Пропустить", callback_data="admin_doc_skip")
-    )
-    bot.send_message(chat_id, "📄 **Шаг 11 из 14**\n\nИспользует ли мастер документы (договор, акт и т.п.)?", reply_markup=markup)
+def get_stats():
+    stats = count_stats(cursor)
+    cards = master_cards.stats()
+    messages = outbox.stats()
+    return f"""
+📊 **СТАТИСТИКА**
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_doc_'))
-def admin_documents_question_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    user_id = call.from_user.id
-    choice = call.data.split('_')[2]
-    if choice == 'yes':
-        bot.admin_add_data[user_id]['documents'] = "Есть"
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_doc_types(call.message.chat.id, user_id)
-    elif choice == 'no':
-        bot.admin_add_data[user_id]['documents'] = "Нет"
-        bot.admin_add_data[user_id]['documents_list'] = ""
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_contact_methods(call.message.chat.id, user_id)
-    else:
-        bot.admin_add_data[user_id]['documents'] = "Пропустить"
-        bot.admin_add_data[user_id]['documents_list'] = ""
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_contact_methods(call.message.chat.id, user_id)
-    bot.answer_callback_query(call.id)
+👥 Всего пользователей: {stats['total_users']}
+👷 Активных мастеров: {stats['active_masters']}
+📋 Активных заявок: {stats['active_requests']}
+🆕 Новых публичных заявок за сутки: {stats['new_requests']}
+⭐ Одобренных отзывов: {stats['approved_reviews']}
+⏳ Заявок мастеров на проверке: {stats['pending_apps']}
+👍 Рекомендаций на модерации: {stats['pending_recs']}
+🗂 Кеш карточек мастеров: {cards['hits']} попаданий / {cards['misses']} промахов
+📨 Outbox: в очереди {messages['pending']}, недоставлено {messages['dead']}
+    """
 
-def admin_ask_doc_types(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_docs' not in bot.admin_add_data[user_id]:
-        bot.admin_add_data[user_id]['selected_docs'] = []
-    selected = bot.admin_add_data[user_id]['selected_docs']
-    for code, name in DOC_TYPES:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(f"{prefix}{name}", callback_data=f"admin_doc_type_{code}"))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="admin_doc_type_done"))
-    bot.send_message(chat_id, "📄 **Шаг 12 из 14**\n\nКакие документы может предоставить мастер? (можно несколько)", reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_doc_type_'))
-def admin_doc_type_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
+# ================ РУЧНОЕ ДОБАВЛЕНИЕ МАСТЕРА (АДМИН) ================
+# Те же шаги, что в анкете мастера (master_form_steps), в формулировках для админа
+def start_manual_master_add(call):
     user_id = call.from_user.id
-    data = call.data[15:]
-    if data == "done":
-        selected = bot.admin_add_data[user_id].get('selected_docs', [])
-        bot.admin_add_data[user_id]['documents_list'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_contact_methods(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id, "✅ Список документов сохранён")
-    else:
-        doc_name = DOC_TYPES_DICT.get(data)
-        if not doc_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.admin_add_data[user_id].get('selected_docs', [])
-        if doc_name in selected:
-            selected.remove(doc_name)
-        else:
-            selected.append(doc_name)
-        bot.admin_add_data[user_id]['selected_docs'] = selected
-        admin_ask_doc_types(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def admin_ask_contact_methods(chat_id, user_id):
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    if 'selected_contacts' not in bot.admin_add_data[user_id]:
-        bot.admin_add_data[user_id]['selected_contacts'] = []
-    selected = bot.admin_add_data[user_id]['selected_contacts']
-    for code, name in [("telegram","Telegram"), ("whatsapp","WhatsApp"), ("phone","Телефонный звонок")]:
-        prefix = "✅ " if name in selected else ""
-        markup.add(types.InlineKeyboardButton(f"{prefix}{name}", callback_data=f"admin_contact_{code}"))
-    markup.add(types.InlineKeyboardButton("✅ Готово", callback_data="admin_contact_done"))
-    bot.send_message(chat_id, "📞 **Шаг 13 из 14**\n\nВыберите способы связи мастера (можно несколько):", reply_markup=markup)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_contact_'))
-def admin_contact_callback(call):
-    if call.from_user.id != ADMIN_ID:
+    if user_id != ADMIN_ID:
         bot.answer_callback_query(call.id, "❌ Нет прав")
         return
-    user_id = call.from_user.id
-    data = call.data[14:]
-    if data == "done":
-        selected = bot.admin_add_data[user_id].get('selected_contacts', [])
-        if not selected:
-            bot.answer_callback_query(call.id, "❌ Выберите хотя бы один способ связи")
-            return
-        bot.admin_add_data[user_id]['preferred_contact'] = ", ".join(selected)
-        bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        admin_ask_phone(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id, "✅ Способы связи сохранены")
-    else:
-        contact_names = {"telegram":"Telegram","whatsapp":"WhatsApp","phone":"Телефонный звонок"}
-        contact_name = contact_names.get(data)
-        if not contact_name:
-            bot.answer_callback_query(call.id, "❌ Ошибка")
-            return
-        selected = bot.admin_add_data[user_id].get('selected_contacts', [])
-        if contact_name in selected:
-            selected.remove(contact_name)
-        else:
-            selected.append(contact_name)
-        bot.admin_add_data[user_id]['selected_contacts'] = selected
-        admin_ask_contact_methods(call.message.chat.id, user_id)
-        bot.answer_callback_query(call.id)
-
-def admin_ask_phone(chat_id, user_id):
-    bot.send_message(chat_id, "📞 **Шаг 14 из 14**\n\nВведите **контактный телефон мастера** (будет виден клиентам):")
-    bot.register_next_step_handler_by_chat_id(chat_id, admin_process_phone, user_id)
-
-def admin_process_phone(message, user_id):
-    if message.from_user.id != ADMIN_ID:
-        return
-    phone = safe_text(message)
-    if not phone:
-        bot.send_message(message.chat.id, "❌ Пожалуйста, введите телефон.")
-        bot.register_next_step_handler(message, admin_process_phone, user_id)
-        return
-    bot.admin_add_data[user_id]['phone'] = phone
-    admin_show_summary(message, user_id)
+    wizard.start('admin', call.message.chat.id, user_id, {'documents_list': ''}, anchor=call.message.message_id)
+    bot.answer_callback_query(call.id)
 
-def admin_show_summary(message, user_id):
-    data = bot.admin_add_data[user_id]
+def admin_summary(source, user_id, data):
     summary = f"""
 📋 **Сводка данных мастера:**
 
@@ -3481,21 +2341,24 @@ def admin_show_summary(message, user_id):
     markup = types.InlineKeyboardMarkup()
     markup.add(
         types.InlineKeyboardButton("✅ Сохранить мастера", callback_data=f"admin_save_{user_id}"),
-        types.InlineKeyboardButton("❌ Отмена", callback_data="admin_cancel_add")
+        types.InlineKeyboardButton("❌ Отмена", callback_data=wizard.callback('admin', CANCEL))
     )
-    bot.send_message(message.chat.id, summary, reply_markup=markup)
+    return summary, markup
+
+wizard.register(Form('admin', master_form_steps(admin=True), bot.admin_add_data, admin_summary,
+                     title="👷 **РУЧНОЕ ДОБАВЛЕНИЕ МАСТЕРА**", allowed=lambda user_id: user_id == ADMIN_ID,
+                     cancelled="❌ Добавление мастера отменено."))
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('admin_save_'))
-def admin_save_callback(call):
+@router.route('admin_save_{user_id:int}')
+def admin_save_callback(call, user_id):
     if call.from_user.id != ADMIN_ID:
         bot.answer_callback_query(call.id, "❌ Нет прав")
         return
-    user_id = call.from_user.id
     data = bot.admin_add_data.get(user_id)
     if not data:
         bot.answer_callback_query(call.id, "❌ Данные не найдены")
         return
-    now = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+    now = utc_now()
     cursor.execute('''INSERT INTO masters
                     (user_id, name, service, phone, districts, price_min, price_max,
                      experience, bio, portfolio, documents, entity_type, verification_type,
@@ -3524,6 +2387,7 @@ def admin_save_callback(call):
                      now))
     conn.commit()
     master_id = cursor.lastrowid
+    sync_master(master_id)
     bot.edit_message_text(f"✅ Мастер успешно добавлен в базу с ID {master_id}.", call.message.chat.id, call.message.message_id)
     publish_master_card(master_id, data['name'], data.get('services', data.get('profiles', '')),
                         data['districts'], data['price_min'], data['experience'],
@@ -3531,38 +2395,104 @@ def admin_save_callback(call):
     del bot.admin_add_data[user_id]
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data == "admin_cancel_add")
-def admin_cancel_add_callback(call):
-    if call.from_user.id != ADMIN_ID:
-        bot.answer_callback_query(call.id, "❌ Нет прав")
-        return
-    user_id = call.from_user.id
-    if user_id in bot.admin_add_data:
-        del bot.admin_add_data[user_id]
-    bot.edit_message_text("❌ Добавление мастера отменено.", call.message.chat.id, call.message.message_id)
-    bot.answer_callback_query(call.id)
-
 # ================ ЗАПУСК БОТА ================
+def run_worker():
+    """Воркер supervisor.py: обрабатывает обновления своей доли пользователей, без приёма и фоновых задач."""
+    changes.start()
+    if METRICS_PORT:
+        # У каждого процесса свои метрики: воркер N – на METRICS_PORT + 1 + N
+        port = METRICS_PORT + 1 + BOT_SHARD
+        MetricsServer(metrics, METRICS_HOST, port).start()
+        print(f"✅ Метрики воркера {BOT_SHARD}: http://{METRICS_HOST}:{port}/metrics")
+    print(f"✅ Воркер {BOT_SHARD} готов к работе")
+    serve_worker(os.environ['BOT_IPC_SOCKET'], bytes.fromhex(os.environ['BOT_IPC_KEY']), dispatch_update)
+    # Процесс приёма остановился – дорабатываем то, что уже стоит в полосах
+    bot.worker_pool.close()
+    print(f"✅ Воркер {BOT_SHARD} остановлен")
+
+def on_leadership_lost():
+    # Роль мог забрать другой экземпляр – двое ведущих дважды отправили бы outbox и задачи
+    print("❌ Lease ведущего потерян – завершаем работу.")
+    os._exit(1)
+
 if __name__ == '__main__':
+    if BOT_ROLE == 'worker':
+        run_worker()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default=BOT_MODE)
+    args = parser.parse_args()
+
     print("🚀 Бот запускается...")
     print(f"   Бот: @{BOT_USERNAME}")
     print(f"   Канал: @{CHANNEL_USERNAME}")
     print(f"   Админ: @{ADMIN_USERNAME}")
     print(f"   База данных: {DB_PATH}")
 
+    # Ведущий экземпляр один: принимает обновления, выполняет задачи и отправляет outbox
+    leader = Lease(storage, 'leader', ttl=LEADER_LEASE_TTL)
+    if not leader.try_acquire():
+        holder = leader.current()
+        print(f"⏳ Бот уже запущен ({holder[0] if holder else '?'}). Ждём, пока роль ведущего освободится...")
+        leader.wait()
+    leader.keep(on_lost=on_leadership_lost)
+    print(f"✅ Ведущий экземпляр: {leader.holder}")
+    metrics.gauge('bot_leader', 'Процесс держит роль ведущего', lambda: int(leader.held()))
+    # SIGTERM (остановка сервиса) – через finally ниже: воркеры дорабатывают, lease освобождается
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     try:
         if not check_bot_admin_in_chat(CHANNEL_ID):
             print(f"⚠️ Бот не является администратором канала {CHANNEL_ID}. Публикация заявок может не работать.")
     except:
         print("⚠️ Не удалось проверить права в канале.")
 
+    changes.start()
+    scheduler.start()
+    outbox.start()
+    if METRICS_PORT:
+        MetricsServer(metrics, METRICS_HOST, METRICS_PORT).start()
+        print(f"✅ Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
     if not is_night_time():
-        publish_delayed_requests()
-
-    reset_webhook()
-    stop_other_instances()
-    time.sleep(2)
+        scheduler.run_now('publish_delayed')
+
+    supervisor = None
+    if BOT_WORKERS:
+        supervisor = Supervisor(os.path.abspath(__file__), BOT_WORKERS, replay=inbox.unfinished).start()
+        metrics.gauge('bot_worker_up', 'Воркер запущен', supervisor.alive, label='shard')
+        metrics.gauge('bot_worker_updates', 'Обновления, переданные воркеру', supervisor.routed, label='shard')
+        metrics.gauge('bot_worker_restarts', 'Перезапуски воркера', supervisor.restarts, label='shard')
+        print(f"✅ Обновления обрабатывают воркеры: {BOT_WORKERS}")
+    dispatch = supervisor.route if supervisor else dispatch_update
+
+    # Сохранённые, но не обработанные до остановки обновления – раньше новых
+    replay = inbox.unfinished()
+    if replay:
+        print(f"🔁 Повторная обработка незавершённых обновлений: {len(replay)}")
+    for data in replay:
+        dispatch(data)
 
-    print("✅ Бот готов к работе. Запуск polling...")
-    bot.infinity_polling(skip_pending=True)
-    
+    try:
+        if args.mode == 'webhook':
+            if not WEBHOOK_SECRET:
+                print("❌ Для режима webhook задайте WEBHOOK_SECRET!")
+                sys.exit(1)
+            server = WebhookServer(bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+                                   workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE,
+                                   handle=dispatch, store=inbox.accept_one)
+            metrics.gauge('webhook_queue_depth', 'Обновления вебхука, ждущие обработки', server.depth)
+            if WEBHOOK_URL:
+                # Без WEBHOOK_URL вебхук регистрирует балансировщик / внешний скрипт
+                bot.set_webhook(url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+                print(f"✅ Webhook установлен: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+            print(f"✅ Бот готов к работе. Приём вебхуков на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+            server.serve_forever()
+        else:
+            reset_webhook()
+            print("✅ Бот готов к работе. Запуск polling...")
+            inbox.poll(TOKEN, dispatch)
+    finally:
+        if supervisor:
+            supervisor.close()
+        leader.release()
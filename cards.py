@@ -0,0 +1,57 @@
+"""Кеш готовых карточек мастеров (текст и кнопки) с вытеснением по LRU."""
+import threading
+from collections import OrderedDict
+
+
+class MasterCardCache:
+    """Карточки по master_id; у одного мастера может быть несколько видов
+    (каталог, уведомление клиенту). После любого изменения мастера или его
+    рейтинга запись удаляется через invalidate(master_id).
+    """
+
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self.entries = OrderedDict()    # master_id -> {вид: (текст, разметка)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0     # растёт при каждом сбросе
+
+    def get(self, master_id, kind, build):
+        """Карточка из кеша или build() -> (текст, разметка) | None, если мастера нет."""
+        with self.lock:
+            card = self.entries.get(master_id, {}).get(kind)
+            if card is not None:
+                self.entries.move_to_end(master_id)
+                self.hits += 1
+                return card
+            self.misses += 1
+            generation = self.generation
+        card = build()
+        if card is None:
+            return None
+        with self.lock:
+            if generation != self.generation:
+                # Пока строили, мастера изменили – не кешируем возможно устаревшую карточку
+                return card
+            self.entries.setdefault(master_id, {})[kind] = card
+            self.entries.move_to_end(master_id)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return card
+
+    def invalidate(self, master_id):
+        with self.lock:
+            self.entries.pop(master_id, None)
+            self.generation += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                    'hit_rate': self.hits / total if total else 0.0}
@@ -0,0 +1,64 @@
+"""Списки для выбора: профили, районы, документы, способы оплаты и связи, опыт.
+
+Названия из этих списков хранятся в БД (masters.service, requests.district
+и т. д.), коды – в callback_data и в master_services / master_districts.
+Вынесены из bot.py, чтобы их можно было импортировать без запуска бота
+(queries.py, bench/).
+"""
+
+PROFILES = [
+    ("plumber", "Сантехник"),
+    ("electrician", "Электрик"),
+    ("finisher", "Отделочник"),
+    ("builder", "Строитель"),
+    ("welder", "Сварщик"),
+    ("handyman", "Разнорабочий"),
+    ("other", "Другое"),
+    ("designer", "Дизайнер интерьера"),
+    ("full", "Полный комплекс")
+]
+PROFILES_DICT = {code: name for code, name in PROFILES}
+
+DISTRICTS = [
+    ("center", "Центр"),
+    ("sneg", "Снеговая Падь"),
+    ("pervorech", "Первореченский (Гоголя, Толстого, ДальПресс)"),
+    ("sovetsky", "Советский район (100-летие, Вторая речка, Заря, Варяг)"),
+    ("pervomay", "Первомайский район (Луговая, Окатовая, Тихая, Патрокл)"),
+    ("frunze", "Фрунзенский район (Эгершельд, Маяк)")
+]
+DISTRICTS_DICT = {code: name for code, name in DISTRICTS}
+
+DOC_TYPES = [
+    ("contract", "Договор"),
+    ("act", "Акт выполненных работ"),
+    ("check", "Чек"),
+    ("invoice", "Счёт"),
+    ("ip", "Свидетельство ИП"),
+    ("selfemployed", "Самозанятость"),
+    ("passport", "Паспорт (для проверки)")
+]
+DOC_TYPES_DICT = {code: name for code, name in DOC_TYPES}
+
+PAYMENT_METHODS = [
+    ("cash", "Наличные"),
+    ("transfer", "Перевод на карту"),
+    ("account", "Расчётный счёт")
+]
+PAYMENT_DICT = {code: name for code, name in PAYMENT_METHODS}
+
+CONTACT_METHODS = [
+    ("telegram", "Telegram"),
+    ("whatsapp", "WhatsApp"),
+    ("phone", "Телефонный звонок")
+]
+
+EXPERIENCE_OPTIONS = [
+    ("less1", "Менее 1 года"),
+    ("1-3", "1–3 года"),
+    ("3-5", "3–5 лет"),
+    ("5-10", "5–10 лет"),
+    ("more10", "Более 10 лет"),
+    ("custom", "Свой вариант (ввести текст)")
+]
+EXPERIENCE_DICT = {code: name for code, name in EXPERIENCE_OPTIONS}
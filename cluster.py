@@ -0,0 +1,164 @@
+"""Согласование нескольких процессов бота через общую базу SQLite (WAL).
+
+Lease – аренда роли ведущего строкой в таблице leases вместо файла
+блокировки: ведущий продлевает её каждые ttl/3 секунд, а если процесс
+завис или упал, строка истекает через ttl, и роль забирает другой
+экземпляр. Ведущий – единственный, кто принимает обновления и выполняет
+фоновые задачи (планировщик, outbox).
+
+ChangeFeed – журнал изменений для кешей в памяти процесса (индекс подбора,
+карточки мастеров): процесс, изменивший мастера, пишет запись в changes,
+остальные раз в poll секунд читают новые записи и обновляют свои кеши.
+"""
+import os
+import socket
+import threading
+import time
+
+# Создаются миграцией (migrations.py)
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS leases
+       (name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        acquired_at REAL,
+        renewed_at REAL)''',
+    '''CREATE TABLE IF NOT EXISTS changes
+       (id INTEGER PRIMARY KEY,
+        topic TEXT NOT NULL,
+        key INTEGER,
+        origin TEXT,
+        created_at REAL)''',
+]
+
+
+def process_id():
+    """Имя процесса для leases.holder и changes.origin: хост и pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    def __init__(self, storage, name, holder=None, ttl=15):
+        self.storage = storage
+        self.name = name
+        self.holder = holder or process_id()
+        self.ttl = ttl
+        self.valid_until = 0.0
+        self.thread = None
+
+    def try_acquire(self):
+        """Берёт или продлевает аренду. False, если её держит другой и срок не истёк."""
+        now = time.time()
+        with self.storage.transaction() as cur:
+            # Чужую строку перезаписываем, только если её срок истёк
+            cur.execute('''INSERT INTO leases (name, holder, expires_at, acquired_at, renewed_at)
+                           VALUES (?, ?, ?, ?, ?)
+                           ON CONFLICT (name) DO UPDATE SET
+                               holder = excluded.holder,
+                               expires_at = excluded.expires_at,
+                               renewed_at = excluded.renewed_at,
+                               acquired_at = CASE WHEN leases.holder = excluded.holder
+                                                  THEN leases.acquired_at ELSE excluded.acquired_at END
+                           WHERE leases.holder = excluded.holder OR leases.expires_at < ?''',
+                        (self.name, self.holder, now + self.ttl, now, now, now))
+            acquired = cur.rowcount == 1
+        # Отсчёт от момента до записи: локально считаем аренду истёкшей не позже, чем остальные
+        self.valid_until = now + self.ttl if acquired else 0.0
+        return acquired
+
+    def held(self):
+        return time.time() < self.valid_until
+
+    def current(self):
+        """(holder, expires_at) текущей аренды или None."""
+        return self.storage.connection().execute(
+            'SELECT holder, expires_at FROM leases WHERE name = ?', (self.name,)).fetchone()
+
+    def wait(self):
+        """Ждёт, пока аренду можно будет взять."""
+        while not self.try_acquire():
+            time.sleep(self.ttl / 3)
+
+    def keep(self, on_lost):
+        """Продлевает аренду в фоне; on_lost() – если продлить не удалось до истечения срока."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._renew, args=(on_lost,), name=f"lease-{self.name}",
+                                           daemon=True)
+            self.thread.start()
+        return self
+
+    def release(self):
+        self.valid_until = 0.0
+        with self.storage.transaction() as cur:
+            cur.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (self.name, self.holder))
+
+    def _renew(self, on_lost):
+        while True:
+            time.sleep(self.ttl / 3)
+            try:
+                if self.try_acquire():
+                    continue
+            except Exception as e:
+                # База занята или недоступна – пробуем снова, пока аренда не истекла
+                print(f"⚠️ Не удалось продлить lease {self.name}: {e}")
+                if time.time() < self.valid_until:
+                    continue
+            on_lost()
+            return
+
+
+class ChangeFeed:
+    def __init__(self, storage, poll=1.0, origin=None):
+        self.storage = storage
+        self.poll = poll
+        self.origin = origin or process_id()
+        self.handlers = {}      # topic -> [callback(key)]
+        self.thread = None
+        # Кеши строятся после создания журнала: всё, что раньше, в них уже учтено
+        row = storage.connection().execute('SELECT MAX(id) FROM changes').fetchone()
+        self.last_id = row[0] or 0
+
+    def subscribe(self, topic, callback):
+        self.handlers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, key=None):
+        """Записывает изменение. Внутри storage.transaction() – часть этой транзакции."""
+        conn = self.storage.connection()
+        conn.execute('INSERT INTO changes (topic, key, origin, created_at) VALUES (?, ?, ?, ?)',
+                     (topic, key, self.origin, time.time()))
+        if not self.storage.in_transaction_block():
+            conn.commit()
+
+    def apply(self):
+        """Передаёт подписчикам чужие изменения после last_id. Возвращает их число."""
+        rows = self.storage.connection().execute(
+            'SELECT id, topic, key, origin FROM changes WHERE id > ? ORDER BY id', (self.last_id,)).fetchall()
+        applied = 0
+        for change_id, topic, key, origin in rows:
+            self.last_id = change_id
+            if origin == self.origin:
+                continue
+            for callback in self.handlers.get(topic, ()):
+                callback(key)
+            applied += 1
+        return applied
+
+    def purge(self, hours=24):
+        """Удаляет записи старше hours часов (их давно прочитали все процессы)."""
+        with self.storage.transaction() as cur:
+            cur.execute('DELETE FROM changes WHERE created_at < ?', (time.time() - hours * 3600,))
+            return cur.rowcount
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="changes", daemon=True)
+            self.thread.start()
+        return self
+
+    def _loop(self):
+        while True:
+            try:
+                self.apply()
+            except Exception as e:
+                print(f"⚠️ Ошибка чтения журнала изменений: {e}")
+            time.sleep(self.poll)
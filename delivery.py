@@ -0,0 +1,147 @@
+"""Массовая рассылка сообщений: пул воркеров, token bucket и обработка 429."""
+import threading
+import queue
+import time
+from collections import OrderedDict
+
+
+def retry_after_of(exc):
+    """Возвращает retry_after (сек.) из ошибки Telegram 429 или None."""
+    if getattr(exc, 'error_code', None) != 429:
+        return None
+    result_json = getattr(exc, 'result_json', None) or {}
+    return int((result_json.get('parameters') or {}).get('retry_after', 1))
+
+
+class TokenBucket:
+    """Глобальный ограничитель скорости: не больше rate сообщений в секунду."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов (после 429 от Telegram)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class DeliveryEngine:
+    """Очередь рассылки: submit() возвращается сразу, воркеры отправляют в фоне.
+
+    Результаты считаются по batch_id (обычно это id заявки).
+    """
+
+    def __init__(self, bot, workers=4, rate=25, queue_size=10000, max_retries=3, keep_stats=1000):
+        self.bot = bot
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.max_retries = max_retries
+        self.keep_stats = keep_stats
+        self.batches = OrderedDict()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return self
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"delivery-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        return self
+
+    def submit(self, batch_id, chat_ids, text, label='', **kwargs):
+        """Ставит рассылку в очередь и сразу возвращает количество получателей."""
+        chat_ids = list(chat_ids)
+        with self.lock:
+            self.batches[batch_id] = {'label': label, 'total': len(chat_ids), 'pending': len(chat_ids),
+                                      'delivered': 0, 'failed': 0, 'started': time.time(), 'finished': None}
+            while len(self.batches) > self.keep_stats:
+                self.batches.popitem(last=False)
+        if not chat_ids:
+            self._finish(batch_id)
+            return 0
+        for chat_id in chat_ids:
+            try:
+                self.queue.put_nowait((batch_id, chat_id, text, kwargs, 0))
+            except queue.Full:
+                print(f"⚠️ Очередь рассылки переполнена, сообщение для {chat_id} отброшено")
+                self._account(batch_id, ok=False)
+        return len(chat_ids)
+
+    def stats(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            return dict(batch) if batch else None
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def _worker(self):
+        while True:
+            batch_id, chat_id, text, kwargs, attempt = self.queue.get()
+            try:
+                self._deliver(batch_id, chat_id, text, kwargs, attempt)
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, batch_id, chat_id, text, kwargs, attempt):
+        self.bucket.acquire()
+        try:
+            self.bot.send_message(chat_id, text, **kwargs)
+        except Exception as e:
+            retry_after = retry_after_of(e)
+            if retry_after is not None and attempt < self.max_retries:
+                self.bucket.pause(retry_after)
+                try:
+                    self.queue.put_nowait((batch_id, chat_id, text, kwargs, attempt + 1))
+                    return
+                except queue.Full:
+                    pass
+            print(f"Не удалось доставить сообщение {chat_id}: {e}")
+            self._account(batch_id, ok=False)
+        else:
+            self._account(batch_id, ok=True)
+
+    def _account(self, batch_id, ok):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if not batch:
+                return
+            batch['delivered' if ok else 'failed'] += 1
+            batch['pending'] -= 1
+            done = batch['pending'] <= 0
+        if done:
+            self._finish(batch_id)
+
+    def _finish(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if not batch:
+                return
+            batch['finished'] = time.time()
+            elapsed = batch['finished'] - batch['started']
+        print(f"📨 Рассылка {batch['label']}#{batch_id}: доставлено {batch['delivered']}, "
+              f"ошибок {batch['failed']} из {batch['total']} за {elapsed:.1f} с")
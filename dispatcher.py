@@ -0,0 +1,115 @@
+"""Диспетчер обновлений по полосам: по порядку внутри чата, параллельно между чатами.
+
+Заменяет пул потоков telebot (bot.worker_pool): всё, что бот выполняет
+через _exec_task, попадает в одну из lanes полос по id пользователя или
+чата (lane_key). У полосы один поток, поэтому обновления одного
+пользователя обрабатываются строго по очереди – на это опираются анкеты
+на register_next_step_handler, – а медленный обработчик (например,
+рассылка в confirm_request) задерживает только свою полосу.
+
+Исключение обработчика не останавливает polling (пул telebot передаёт его
+в поток polling, и тот засыпает на несколько секунд для всех): оно уходит
+в bot.exception_handler, а без него печатается, и полоса продолжает работу.
+"""
+import itertools
+import queue
+import threading
+import traceback
+
+
+def lane_key(update):
+    """id, по которому выбирается полоса: чат для сообщений, пользователь для кнопок и inline.
+
+    Кнопки под постами в канале нажимают разные люди – по чату они все
+    попали бы в одну полосу. В личном чате id чата и пользователя совпадают,
+    так что кнопки и сообщения пользователя идут в одну полосу.
+    """
+    if isinstance(update, dict):
+        return update_key(update)
+    chat = getattr(update, 'chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, 'from_user', None)
+    return user.id if user is not None else None
+
+
+def update_key(data):
+    """lane_key для обновления в JSON (dict от Bot API) – так supervisor.py выбирает воркер."""
+    for field, value in data.items():
+        if field == 'update_id' or not isinstance(value, dict):
+            continue
+        chat = value.get('chat')
+        if chat:
+            return chat.get('id')
+        user = value.get('from')
+        return user.get('id') if user else None
+    return None
+
+
+class LaneDispatcher:
+    def __init__(self, bot, lanes=8):
+        if lanes < 1:
+            raise ValueError(f"Число полос должно быть положительным: {lanes}")
+        self.bot = bot
+        self.queues = [queue.Queue() for _ in range(lanes)]
+        self.round_robin = itertools.count()
+        self.running = True
+        # Интерфейс util.ThreadPool: polling ждёт exception_event вместе с событиями своего потока
+        self.exception_event = threading.Event()
+        self.threads = []
+        for i in range(lanes):
+            t = threading.Thread(target=self._run, args=(i,), name=f"lane-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def lane_of(self, key):
+        if key is None:
+            # Обновления без пользователя и чата (опросы и т. п.) – по кругу
+            return next(self.round_robin) % len(self.queues)
+        return hash(key) % len(self.queues)
+
+    def put(self, task, *args, **kwargs):
+        key = lane_key(args[0]) if args else None
+        current = threading.current_thread()
+        if current in self.threads and (key is None or self.threads[self.lane_of(key)] is current):
+            # Задача из задачи той же полосы (обновление целиком → его обработчик) – сразу,
+            # иначе обновление считалось бы обработанным раньше, чем отработал обработчик
+            task(*args, **kwargs)
+            return
+        self.queues[self.lane_of(key)].put((task, args, kwargs))
+
+    def _run(self, index):
+        tasks = self.queues[index]
+        # После close() полоса дорабатывает уже поставленные задачи
+        while self.running or not tasks.empty():
+            try:
+                task, args, kwargs = tasks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                task(*args, **kwargs)
+            except Exception as e:
+                handler = self.bot.exception_handler
+                if handler is None or not handler.handle(e):
+                    print(f"⚠️ Ошибка обработчика (полоса {index}): {e}\n{traceback.format_exc()}")
+
+    # ----- наблюдение -----
+    def depths(self):
+        """Задачи в очереди каждой полосы: {'0': n, ...}."""
+        return {str(i): q.qsize() for i, q in enumerate(self.queues)}
+
+    def qsize(self):
+        return sum(q.qsize() for q in self.queues)
+
+    # ----- остальной интерфейс util.ThreadPool -----
+    def raise_exceptions(self):
+        pass
+
+    def clear_exceptions(self):
+        pass
+
+    def close(self):
+        self.running = False
+        for t in self.threads:
+            if t is not threading.current_thread():
+                t.join()
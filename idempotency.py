@@ -0,0 +1,147 @@
+"""Защита от повторных нажатий кнопок: одно действие на сообщение выполняется один раз.
+
+Ключ – сообщение с кнопкой и действие с аргументами маршрута
+('accept_response:12:7', 'review_rate:7', ...): при двойном нажатии Telegram
+присылает два callback_query с разными id, но с одним сообщением. Первое
+нажатие занимает ключ, повторные отвечают «уже выполнено» и до обработчика
+не доходят – ни записи в базу, ни рассылок. Разные кнопки одного сообщения
+(несколько откликов на странице) – разные ключи. Обработчик, который
+отказал (чужая заявка, отклик уже обработан, данных нет), возвращает NOOP –
+ключ освобождается, и следующее нажатие снова дойдёт до обработчика. Ключи недавних нажатий хранятся в памяти (двойное нажатие
+отсекается без запроса к базе), а в базе – таблица с уникальным ключом:
+она работает между процессами и после перезапуска. Повтор того же
+callback_query из inbox (обработка прервалась) выполняется заново, если
+первая попытка не дошла до конца.
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+# Создаётся миграцией (migrations.py)
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS callback_keys
+       (scope TEXT NOT NULL,
+        action TEXT NOT NULL,
+        callback_id TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'started',
+        created_at REAL NOT NULL,
+        PRIMARY KEY (scope, action))''',
+    '''CREATE INDEX IF NOT EXISTS idx_callback_keys_created ON callback_keys (created_at)''',
+]
+
+STARTED, DONE = 'started', 'done'
+
+# Возвращается обработчиком, если нажатие ничего не сделало: ключ не занимается
+NOOP = object()
+
+
+def scope_of(call):
+    """Сообщение, к которому привязана кнопка."""
+    if call.message is not None:
+        return f"{call.message.chat.id}:{call.message.message_id}"
+    if call.inline_message_id:
+        return f"inline:{call.inline_message_id}"
+    return f"call:{call.id}"
+
+
+class CallbackGuard:
+    def __init__(self, storage, on_repeat=None, ttl=600, capacity=10000):
+        self.storage = storage
+        # on_repeat(call) – ответ на повторное нажатие (иначе у кнопки крутятся «часики»)
+        self.on_repeat = on_repeat
+        self.ttl = ttl
+        self.capacity = capacity
+        self.recent = OrderedDict()     # (scope, action) -> (callback_id, истекает)
+        self.lock = threading.Lock()
+        self.claimed = 0
+        self.repeats = 0
+
+    def once(self, action, by=None):
+        """Декоратор обработчика кнопки: @guard.once('confirm_req') под @router.route(...).
+
+        Обработчик возвращает NOOP, если нажатие ничего не сделало.
+
+        by – имена аргументов маршрута, входящих в ключ (по умолчанию все):
+        by=('master_id',) – одна оценка на сообщение, какую бы кнопку ни нажали.
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            def guarded(call, *args, **kwargs):
+                scope = scope_of(call)
+                key = ':'.join([action] + [str(value) for name, value in kwargs.items()
+                                           if by is None or name in by])
+                if not self.claim(scope, key, call.id):
+                    if self.on_repeat is not None:
+                        self.on_repeat(call)
+                    return None
+                try:
+                    result = handler(call, *args, **kwargs)
+                except Exception:
+                    # Нажатие не сработало – следующее должно пройти
+                    self.release(scope, key)
+                    raise
+                if result is NOOP:
+                    # Отказ или устаревшая кнопка – не блокируем следующее нажатие
+                    self.release(scope, key)
+                    return None
+                self.finish(scope, key)
+                return result
+            return guarded
+        return decorator
+
+    def claim(self, scope, action, callback_id):
+        """True – нажатие первое (или повтор незавершённой обработки того же callback_query)."""
+        key = (scope, action)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.recent.get(key)
+            if entry is not None and entry[1] > now and entry[0] != callback_id:
+                self.repeats += 1
+                return False
+        with self.storage.transaction() as cur:
+            cur.execute('''INSERT OR IGNORE INTO callback_keys (scope, action, callback_id, created_at)
+                           VALUES (?, ?, ?, ?)''', (scope, action, str(callback_id), time.time()))
+            fresh = cur.rowcount == 1
+            if not fresh:
+                cur.execute('SELECT callback_id, status FROM callback_keys WHERE scope = ? AND action = ?',
+                            (scope, action))
+                owner, status = cur.fetchone()
+                fresh = owner == str(callback_id) and status != DONE
+        with self.lock:
+            if fresh:
+                self.claimed += 1
+                self.recent[key] = (callback_id, now + self.ttl)
+                self.recent.move_to_end(key)
+                self._evict(now)
+            else:
+                self.repeats += 1
+        return fresh
+
+    def finish(self, scope, action):
+        with self.storage.transaction() as cur:
+            cur.execute('UPDATE callback_keys SET status = ? WHERE scope = ? AND action = ?', (DONE, scope, action))
+
+    def release(self, scope, action):
+        with self.lock:
+            self.recent.pop((scope, action), None)
+        with self.storage.transaction() as cur:
+            cur.execute('DELETE FROM callback_keys WHERE scope = ? AND action = ?', (scope, action))
+
+    def purge(self, days=7):
+        """Удаляет старые ключи: кнопки таких сообщений давно сняты или устарели."""
+        with self.storage.transaction() as cur:
+            cur.execute('DELETE FROM callback_keys WHERE created_at < ?', (time.time() - days * 86400,))
+            return cur.rowcount
+
+    def stats(self):
+        with self.lock:
+            return {'claimed': self.claimed, 'repeats': self.repeats}
+
+    def _evict(self, now):
+        """Вызывается под self.lock: истёкшие и лишние ключи из начала очереди."""
+        while self.recent:
+            key, (_, expires) = next(iter(self.recent.items()))
+            if expires > now and len(self.recent) <= self.capacity:
+                break
+            self.recent.popitem(last=False)
@@ -0,0 +1,138 @@
+"""Входящие обновления через таблицу inbox: сохранить до подтверждения, отметить после обработки.
+
+Обновление записывается в inbox раньше, чем Telegram узнаёт, что оно
+получено (следующий getUpdates со сдвинутым offset или ответ 200 на
+вебхук), и отмечается после обработки. Поэтому остановка или падение бота
+не теряют обновления: неподтверждённые Telegram присылает снова, а
+сохранённые, но не обработанные выполняются повторно при запуске.
+update_id – ключ идемпотентности: повторная доставка того же обновления
+(таймаут вебхука, повтор getUpdates) в обработку не попадает. Обработка –
+«хотя бы один раз»: обновление, прерванное на середине, выполняется заново.
+
+offset в базе не хранится: после недели без обновлений Telegram начинает
+update_id заново (со случайного, в том числе меньшего значения), и
+сохранённый offset выше всех новых id подтверждал бы их без доставки.
+Поэтому polling при запуске и после пустого ответа спрашивает без offset
+(Telegram отдаёт неподтверждённые), а update_id, пришедший с другим
+содержимым, считается новым обновлением.
+"""
+import json
+import time
+
+from telebot import apihelper
+
+# Создаётся миграцией (migrations.py)
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS inbox
+       (update_id INTEGER PRIMARY KEY,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 1,
+        received_at REAL NOT NULL,
+        done_at REAL,
+        last_error TEXT)''',
+    '''CREATE INDEX IF NOT EXISTS idx_inbox_status ON inbox (status, update_id)''',
+]
+
+PENDING, DONE, FAILED = 'pending', 'done', 'failed'
+
+
+class Inbox:
+    def __init__(self, storage, max_attempts=3):
+        self.storage = storage
+        # Обновление, на котором процесс падает, не должно ронять его при каждом запуске
+        self.max_attempts = max_attempts
+
+    def accept(self, updates):
+        """Сохраняет пачку обновлений (dict от Bot API). Возвращает те, что пришли впервые."""
+        fresh = []
+        now = time.time()
+        with self.storage.transaction() as cur:
+            for data in updates:
+                payload = json.dumps(data, ensure_ascii=False)
+                cur.execute('INSERT OR IGNORE INTO inbox (update_id, payload, received_at) VALUES (?, ?, ?)',
+                            (data['update_id'], payload, now))
+                if cur.rowcount:
+                    fresh.append(data)
+                    continue
+                cur.execute('SELECT payload FROM inbox WHERE update_id = ?', (data['update_id'],))
+                if cur.fetchone()[0] != payload:
+                    # Тот же update_id с другим содержимым – Telegram начал счёт заново
+                    print(f"⚠️ update_id {data['update_id']} пришёл повторно с другим содержимым: счётчик сброшен")
+                    cur.execute('''UPDATE inbox SET payload = ?, status = ?, attempts = 1, received_at = ?,
+                                   done_at = NULL, last_error = NULL WHERE update_id = ?''',
+                                (payload, PENDING, now, data['update_id']))
+                    fresh.append(data)
+        return fresh
+
+    def accept_one(self, data):
+        return bool(self.accept([data]))
+
+    def done(self, update_id, error=None):
+        """Обработка закончена; с error – обработчик упал, повторять такое обновление не нужно."""
+        with self.storage.transaction() as cur:
+            cur.execute('UPDATE inbox SET status = ?, done_at = ?, last_error = ? WHERE update_id = ?',
+                        (FAILED if error else DONE, time.time(), str(error) if error else None, update_id))
+
+    def unfinished(self, select=None):
+        """Сохранённые, но не обработанные обновления по порядку, для повторной обработки.
+
+        select(data) – фильтр (например, воркер после перезапуска). Каждый вызов
+        считается попыткой; после max_attempts обновление отмечается 'failed'.
+        """
+        rows = self.storage.connection().execute(
+            'SELECT update_id, payload, attempts FROM inbox WHERE status = ? ORDER BY update_id',
+            (PENDING,)).fetchall()
+        replay = []
+        with self.storage.transaction() as cur:
+            for update_id, payload, attempts in rows:
+                data = json.loads(payload)
+                if select is not None and not select(data):
+                    continue
+                if attempts >= self.max_attempts:
+                    cur.execute('UPDATE inbox SET status = ?, done_at = ?, last_error = ? WHERE update_id = ?',
+                                (FAILED, time.time(), f'не обработано за {attempts} попыток', update_id))
+                    print(f"⚠️ Обновление {update_id} пропущено: не обработано за {attempts} попыток")
+                    continue
+                cur.execute('UPDATE inbox SET attempts = attempts + 1 WHERE update_id = ?', (update_id,))
+                replay.append(data)
+        return replay
+
+    def poll(self, token, handle, timeout=20):
+        """Long polling: новые обновления сохраняются и передаются в handle(data).
+
+        Telegram считает обновления полученными только при следующем
+        getUpdates с offset больше их update_id – к этому моменту они уже в inbox.
+        Первый запрос и запрос после пустого ответа идут без offset: всё
+        полученное раньше уже подтверждено, а Telegram, сбросивший счётчик
+        update_id, пришлёт новые обновления, даже если их id меньше прежних.
+        """
+        offset = None
+        while True:
+            try:
+                updates = apihelper.get_updates(token, offset=offset, timeout=timeout, long_polling_timeout=timeout)
+            except Exception as e:
+                print(f"⚠️ Ошибка getUpdates: {e}")
+                time.sleep(3)
+                continue
+            if not updates:
+                offset = None
+                continue
+            for data in self.accept(updates):
+                handle(data)
+            offset = updates[-1]['update_id'] + 1
+
+    # ----- просмотр и очистка -----
+    def stats(self):
+        rows = self.storage.connection().execute(
+            'SELECT status, COUNT(*) FROM inbox GROUP BY status').fetchall()
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def purge(self, days=2):
+        """Удаляет обработанные обновления старше days дней."""
+        with self.storage.transaction() as cur:
+            cur.execute('DELETE FROM inbox WHERE status != ? AND received_at < ?',
+                        (PENDING, time.time() - days * 86400))
+            return cur.rowcount
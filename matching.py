@@ -0,0 +1,111 @@
+"""Инвертированный индекс мастеров по кодам профилей и районов."""
+import threading
+
+
+class MatchIndex:
+    """Хранит множества id мастеров для каждого кода PROFILES / DISTRICTS.
+
+    В индекс попадают только активные мастера; подбор получателей заявки –
+    пересечение двух множеств вместо полного перебора таблицы masters.
+    """
+
+    def __init__(self, profiles, districts):
+        self.profile_codes = {name.lower(): code for code, name in profiles}
+        self.district_codes = {name.lower(): code for code, name in districts}
+        self.by_profile = {code: set() for code, _ in profiles}
+        self.by_district = {code: set() for code, _ in districts}
+        self.notifiable = set()
+        self.masters = {}   # master_id -> (user_id, профили, районы)
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _parse(text, codes):
+        # Названия районов сами содержат запятые, поэтому ищем названия целиком
+        text = (text or '').lower()
+        return {code for name, code in codes.items() if name in text}
+
+    def parse_profiles(self, text):
+        return self._parse(text, self.profile_codes)
+
+    def parse_districts(self, text):
+        return self._parse(text, self.district_codes)
+
+    def profile_code(self, name):
+        return self.profile_codes.get((name or '').strip().lower())
+
+    def district_code(self, name):
+        return self.district_codes.get((name or '').strip().lower())
+
+    def load(self, cursor):
+        """Строит индекс по таблицам master_services / master_districts."""
+        cursor.execute("SELECT id, user_id, verification_type FROM masters WHERE status = 'активен'")
+        masters = cursor.fetchall()
+        cursor.execute('''SELECT s.master_id, s.code FROM master_services s
+                          JOIN masters m ON m.id = s.master_id WHERE m.status = 'активен' ''')
+        profiles = cursor.fetchall()
+        cursor.execute('''SELECT d.master_id, d.code FROM master_districts d
+                          JOIN masters m ON m.id = d.master_id WHERE m.status = 'активен' ''')
+        districts = cursor.fetchall()
+        codes = {master_id: (set(), set()) for master_id, _, _ in masters}
+        for master_id, code in profiles:
+            codes[master_id][0].add(code)
+        for master_id, code in districts:
+            codes[master_id][1].add(code)
+        with self.lock:
+            for master_id in list(self.masters):
+                self.remove(master_id)
+            for master_id, user_id, verification_type in masters:
+                self.update(master_id, user_id, *codes[master_id], verification_type, 'активен')
+        return len(self.masters)
+
+    def update(self, master_id, user_id, profiles, districts, verification_type, status):
+        """profiles / districts – множества кодов."""
+        with self.lock:
+            self.remove(master_id)
+            if status != 'активен':
+                return
+            profiles = {c for c in profiles if c in self.by_profile}
+            districts = {c for c in districts if c in self.by_district}
+            self.masters[master_id] = (user_id, profiles, districts)
+            for code in profiles:
+                self.by_profile[code].add(master_id)
+            for code in districts:
+                self.by_district[code].add(master_id)
+            if user_id and verification_type != 'simple':
+                self.notifiable.add(master_id)
+
+    def remove(self, master_id):
+        with self.lock:
+            entry = self.masters.pop(master_id, None)
+            self.notifiable.discard(master_id)
+            if not entry:
+                return
+            _, profiles, districts = entry
+            for code in profiles:
+                self.by_profile[code].discard(master_id)
+            for code in districts:
+                self.by_district[code].discard(master_id)
+
+    def remove_user(self, user_id):
+        with self.lock:
+            for master_id in [m for m, entry in self.masters.items() if entry[0] == user_id]:
+                self.remove(master_id)
+
+    def match(self, profile_code, district_code, notifiable_only=True):
+        """id мастеров, у которых есть и профиль, и район."""
+        with self.lock:
+            found = self.by_profile.get(profile_code, set()) & self.by_district.get(district_code, set())
+            if notifiable_only:
+                found &= self.notifiable
+            return found
+
+    def recipients(self, service_name, district_name):
+        """user_id мастеров для рассылки по заявке (названия профиля и района)."""
+        with self.lock:
+            found = self.match(self.profile_code(service_name), self.district_code(district_name))
+            return [self.masters[m][0] for m in found]
+
+    def codes_of(self, master_id):
+        with self.lock:
+            entry = self.masters.get(master_id)
+            return (set(entry[1]), set(entry[2])) if entry else (set(), set())
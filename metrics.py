@@ -0,0 +1,412 @@
+"""Метрики в формате Prometheus: время обработчиков, вызовы Telegram API, время SQL.
+
+Metrics – реестр счётчиков и гистограмм плюс точки подключения:
+    instrument_bot(bot)       – время каждого обработчика (сообщения, кнопки,
+                                шаги анкет) и ожидание обновления в очереди
+                                пула потоков;
+    instrument_router(router) – время по конкретному маршруту кнопки;
+    instrument_api()          – все запросы к Bot API идут через
+                                apihelper._make_request: время по методу,
+                                ошибки по коду, отдельно 429;
+    connection_class()        – класс соединения для Storage: время
+                                execute/fetch/commit и счётчик операторов
+                                через set_trace_callback (включая операторы
+                                триггеров и FTS5);
+    gauge(name, help, fn)     – глубина очередей и прочее, что читается в
+                                момент запроса /metrics.
+MetricsServer отдаёт текст на GET /metrics (по умолчанию только localhost).
+"""
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import apihelper
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+SQL_KINDS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH', 'BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA',
+             'CREATE', 'ALTER', 'DROP')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def statement_kind(sql):
+    """Тип оператора для метки: первое слово SQL.
+
+    Операторы, которые SQLite выполняет сам внутри другого (триггеры,
+    обновление индекса FTS5), trace callback передаёт с префиксом '-- ' –
+    они считаются как 'NESTED'.
+    """
+    sql = sql.lstrip()
+    if sql.startswith('--'):
+        return 'NESTED'
+    word = sql[:8].split(None, 1)[0].upper() if sql else ''
+    return word if word in SQL_KINDS else 'OTHER'
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}     # метки -> [счётчики по корзинам..., сумма, количество]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, *labels):
+        with self.lock:
+            row = self.values.get(labels)
+            return row[-1] if row else 0
+
+    def samples(self):
+        with self.lock:
+            items = sorted((labels, list(row)) for labels, row in self.values.items())
+        for labels, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), row[:-2] + [row[-1] - sum(row[:-2])]):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else _number(float(bound))
+                yield (self.name + '_bucket', _labels(self.labelnames + ('le',), labels + (le,)), cumulative)
+            yield self.name + '_sum', _labels(self.labelnames, labels), row[-2]
+            yield self.name + '_count', _labels(self.labelnames, labels), row[-1]
+
+
+class Gauge:
+    """Значение читается вызовом fn() в момент выдачи метрик.
+
+    fn возвращает число или словарь {значение метки: число}.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn, label=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+
+    def samples(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                yield self.name, _labels((self.label,), (key,)), v
+        else:
+            yield self.name, '', value
+
+
+class Metrics:
+    def __init__(self):
+        self.metrics = []
+        self.handler_seconds = self.histogram(
+            'bot_handler_seconds', 'Время работы обработчика обновления', ('handler',))
+        self.handler_wait_seconds = self.histogram(
+            'bot_handler_wait_seconds', 'Ожидание обновления в очереди пула потоков', ('update_type',))
+        self.handler_errors = self.counter(
+            'bot_handler_errors_total', 'Обработчики, завершившиеся исключением', ('handler',))
+        self.callback_seconds = self.histogram(
+            'bot_callback_seconds', 'Время обработчика кнопки по маршруту', ('handler',))
+        self.api_seconds = self.histogram(
+            'telegram_api_seconds', 'Время запроса к Telegram Bot API', ('method',))
+        self.api_errors = self.counter(
+            'telegram_api_errors_total', 'Ошибки Telegram Bot API по коду', ('method', 'code'))
+        self.api_throttled = self.counter(
+            'telegram_api_429_total', 'Ответы 429 Too Many Requests', ('method',))
+        self.sql_seconds = self.histogram(
+            'sqlite_seconds', 'Время SQL: execute, чтение строк, commit', ('kind',), SQL_BUCKETS)
+        self.sql_statements = self.counter(
+            'sqlite_statements_total', 'Выполненные операторы SQL (trace callback)', ('kind',))
+        self.started = time.time()
+        self.gauge('process_uptime_seconds', 'Время работы процесса', lambda: time.time() - self.started)
+
+    # ----- реестр -----
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, fn, label=None):
+        metric = Gauge(name, help, fn, label)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # Например, база занята – пропускаем метрику, остальные отдаём
+                lines.append(f'# {metric.name}: {e}')
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in samples:
+                lines.append(f'{name}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    # ----- обработчики -----
+    def _timed(self, handler, histogram):
+        name = getattr(handler, '__name__', type(handler).__name__)
+
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                self.handler_errors.inc(name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, name)
+        run.__name__ = name
+        return run
+
+    def _waited(self, task, update_type):
+        queued = time.perf_counter()
+
+        def run(*args, **kwargs):
+            self.handler_wait_seconds.observe(time.perf_counter() - queued, update_type)
+            return task(*args, **kwargs)
+        return run
+
+    def instrument_bot(self, bot):
+        """Вызывать сразу после создания бота, до регистрации обработчиков.
+
+        Декораторы и register_* строят описание обработчика через
+        _build_handler_dict – функция в нём заменяется на замеряющую.
+        Затем всё выполняется через _exec_task: для обновлений меряем
+        ожидание в очереди пула, шаги анкет (register_next_step_handler)
+        замеряем целиком.
+        """
+        build_handler_dict = bot._build_handler_dict
+
+        def timed_build_handler_dict(handler, *args, **kwargs):
+            return build_handler_dict(self._timed(handler, self.handler_seconds), *args, **kwargs)
+        bot._build_handler_dict = timed_build_handler_dict
+
+        exec_task = bot._exec_task
+
+        def timed_exec_task(task, *args, **kwargs):
+            update_type = kwargs.get('update_type')
+            if update_type is None:
+                task = self._timed(task, self.handler_seconds)
+            exec_task(self._waited(task, update_type or 'next_step'), *args, **kwargs)
+        bot._exec_task = timed_exec_task
+        pool = getattr(bot, 'worker_pool', None)
+        if pool is not None:
+            self.gauge('bot_handler_queue_depth', 'Обновления, ждущие свободного потока',
+                       pool.qsize if hasattr(pool, 'qsize') else pool.tasks.qsize)
+        if hasattr(pool, 'depths'):
+            # LaneDispatcher (dispatcher.py): глубина каждой полосы – видно перекос по пользователям
+            self.gauge('bot_lane_depth', 'Задачи в очереди полосы диспетчера', pool.depths, label='lane')
+        return bot
+
+    def timed(self, handler):
+        """handler, замеряемый как обработчик обновления (для вызовов мимо _exec_task)."""
+        return self._timed(handler, self.handler_seconds)
+
+    def instrument_router(self, router):
+        resolve = router.resolve
+
+        def timed_resolve(data):
+            handler, kwargs = resolve(data)
+            if handler is not None:
+                handler = self._timed(handler, self.callback_seconds)
+            return handler, kwargs
+        router.resolve = timed_resolve
+        return router
+
+    # ----- Telegram API -----
+    def instrument_api(self):
+        """Подменяет apihelper._make_request – через него идут все методы Bot API."""
+        make_request = apihelper._make_request
+        if getattr(make_request, 'metrics', None) is not None:
+            return
+        metrics = self
+
+        def timed_make_request(token, method_name, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return make_request(token, method_name, *args, **kwargs)
+            except apihelper.ApiTelegramException as e:
+                metrics.api_errors.inc(method_name, str(e.error_code))
+                if e.error_code == 429:
+                    metrics.api_throttled.inc(method_name)
+                raise
+            except Exception:
+                metrics.api_errors.inc(method_name, 'network')
+                raise
+            finally:
+                metrics.api_seconds.observe(time.perf_counter() - started, method_name)
+        timed_make_request.metrics = self
+        apihelper._make_request = timed_make_request
+
+    # ----- SQLite -----
+    def connection_class(self):
+        """Класс соединения для Storage(factory=...), который меряет время SQL."""
+        observe = self.sql_seconds.observe
+        count = self.sql_statements.inc
+
+        def trace(sql):
+            count(statement_kind(sql))
+
+        class TimedCursor(sqlite3.Cursor):
+            def execute(self, sql, parameters=()):
+                started = time.perf_counter()
+                try:
+                    return super().execute(sql, parameters)
+                finally:
+                    observe(time.perf_counter() - started, statement_kind(sql))
+
+            def executemany(self, sql, seq_of_parameters):
+                started = time.perf_counter()
+                try:
+                    return super().executemany(sql, seq_of_parameters)
+                finally:
+                    observe(time.perf_counter() - started, statement_kind(sql))
+
+            # Строки SELECT читаются уже после execute – это тоже время базы
+            def fetchone(self):
+                started = time.perf_counter()
+                try:
+                    return super().fetchone()
+                finally:
+                    observe(time.perf_counter() - started, 'FETCH')
+
+            def fetchmany(self, size=None):
+                started = time.perf_counter()
+                try:
+                    return super().fetchmany(self.arraysize if size is None else size)
+                finally:
+                    observe(time.perf_counter() - started, 'FETCH')
+
+            def fetchall(self):
+                started = time.perf_counter()
+                try:
+                    return super().fetchall()
+                finally:
+                    observe(time.perf_counter() - started, 'FETCH')
+
+        class TimedConnection(sqlite3.Connection):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.set_trace_callback(trace)
+
+            def cursor(self, factory=TimedCursor):
+                return super().cursor(factory)
+
+            # Connection.execute создаёт обычный курсор в обход cursor() – перенаправляем
+            def execute(self, sql, parameters=()):
+                return self.cursor().execute(sql, parameters)
+
+            def executemany(self, sql, seq_of_parameters):
+                return self.cursor().executemany(sql, seq_of_parameters)
+
+            def commit(self):
+                started = time.perf_counter()
+                try:
+                    return super().commit()
+                finally:
+                    observe(time.perf_counter() - started, 'COMMIT')
+
+        return TimedConnection
+
+
+class MetricsServer:
+    """HTTP-сервер метрик: GET /metrics. Работает в фоновом потоке."""
+
+    def __init__(self, metrics, host='127.0.0.1', port=9100):
+        self.metrics = metrics
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(metrics))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+            self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _make_handler(metrics):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                return self._reply(404, b'', 'text/plain')
+            self._reply(200, metrics.render().encode('utf-8'), CONTENT_TYPE)
+
+        def _reply(self, code, body, content_type):
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
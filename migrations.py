@@ -0,0 +1,439 @@
+"""Версионные миграции схемы БД.
+
+Номер применённой миграции хранится в PRAGMA user_version. При старте
+выполняются только шаги с номером больше текущего – каждый в своей
+транзакции вместе с увеличением user_version, поэтому прерванная
+миграция не оставляет схему в промежуточном состоянии. Если база
+актуальна, запуск стоит одного чтения PRAGMA.
+
+Новый шаг – функция с декоратором @migrations.step(N, 'описание') в конце
+файла; уже выпущенные шаги не меняются.
+"""
+from types import SimpleNamespace
+
+import cluster
+import idempotency
+import inbox
+import outbox
+import scheduler
+import search
+import sessions
+
+
+class Migrations:
+    def __init__(self):
+        self.steps = []     # (версия, описание, функция)
+
+    def step(self, version, description):
+        """Декоратор: func(cur, ctx) выполняется внутри транзакции."""
+        def decorator(func):
+            if self.steps and version <= self.steps[-1][0]:
+                raise ValueError(f"Версия миграции {version} должна быть больше {self.steps[-1][0]}")
+            self.steps.append((version, description, func))
+            return func
+        return decorator
+
+    @property
+    def latest(self):
+        return self.steps[-1][0] if self.steps else 0
+
+    @staticmethod
+    def current(conn):
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def pending(self, conn):
+        version = self.current(conn)
+        return [step for step in self.steps if step[0] > version]
+
+    def apply(self, storage, **context):
+        """Применяет недостающие шаги. Возвращает список применённых версий."""
+        conn = storage.connection()
+        if self.current(conn) >= self.latest:
+            return []
+        ctx = SimpleNamespace(**context)
+        applied = []
+        for version, description, func in self.steps:
+            with storage.transaction() as cur:
+                # Повторная проверка под блокировкой записи: другой процесс мог успеть раньше
+                if self.current(conn) >= version:
+                    continue
+                func(cur, ctx)
+                cur.execute(f'PRAGMA user_version = {int(version)}')
+            applied.append(version)
+            print(f"✅ Миграция {version}: {description}")
+        return applied
+
+
+def column_exists(cur, table, column):
+    cur.execute("SELECT 1 FROM pragma_table_info(?) WHERE name = ?", (table, column))
+    return cur.fetchone() is not None
+
+
+def table_exists(cur, table):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cur.fetchone() is not None
+
+
+def add_column(cur, table, column, col_type):
+    """ALTER TABLE ADD COLUMN, если колонки ещё нет. True – колонка добавлена."""
+    if column_exists(cur, table, column):
+        return False
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+    return True
+
+
+migrations = Migrations()
+
+
+# ================ 1. ИСХОДНАЯ СХЕМА ================
+@migrations.step(1, 'исходные таблицы')
+def base_schema(cur, ctx):
+    # ----- Таблица пользователей (роли) -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS users
+                    (user_id INTEGER PRIMARY KEY,
+                     role TEXT DEFAULT 'client',
+                     first_seen TEXT,
+                     last_active TEXT)''')
+
+    # ----- Таблица заявок -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS requests
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER,
+                     username TEXT,
+                     service TEXT,
+                     description TEXT,
+                     district TEXT,
+                     date TEXT,
+                     budget TEXT,
+                     status TEXT DEFAULT 'активна',
+                     is_public INTEGER DEFAULT 0,
+                     chosen_master_id INTEGER DEFAULT NULL,
+                     delayed INTEGER DEFAULT 0,
+                     chat_message_id INTEGER,
+                     created_at TEXT)''')
+
+    # ----- Таблица отзывов -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS reviews
+                    (id INTEGER PRIMARY KEY,
+                     master_id INTEGER,
+                     master_name TEXT,
+                     user_id INTEGER,
+                     user_name TEXT,
+                     anonymous INTEGER DEFAULT 0,
+                     review_text TEXT,
+                     rating INTEGER,
+                     media_file_id TEXT,
+                     status TEXT DEFAULT 'pending',
+                     created_at TEXT)''')
+
+    # ----- Таблица мастеров (одна запись – один мастер) -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS masters
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER UNIQUE,
+                     name TEXT,
+                     service TEXT,
+                     phone TEXT,
+                     districts TEXT,
+                     price_min TEXT,
+                     price_max TEXT,
+                     experience TEXT,
+                     bio TEXT DEFAULT "",
+                     portfolio TEXT,
+                     rating REAL DEFAULT 0,
+                     reviews_count INTEGER DEFAULT 0,
+                     status TEXT DEFAULT 'активен',
+                     entity_type TEXT DEFAULT 'individual',
+                     verification_type TEXT DEFAULT 'simple',
+                     documents_verified INTEGER DEFAULT 0,
+                     photos_verified INTEGER DEFAULT 0,
+                     reviews_verified INTEGER DEFAULT 0,
+                     preferred_contact TEXT DEFAULT 'telegram',
+                     documents_list TEXT DEFAULT '',
+                     payment_methods TEXT DEFAULT '',
+                     age_group TEXT DEFAULT '',
+                     channel_message_id INTEGER,
+                     source TEXT DEFAULT 'bot',
+                     created_at TEXT)''')
+
+    # ----- Таблица анкет мастеров (на проверку) -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS master_applications
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER UNIQUE,
+                     username TEXT,
+                     name TEXT,
+                     service TEXT,
+                     phone TEXT,
+                     districts TEXT,
+                     price_min TEXT,
+                     price_max TEXT,
+                     experience TEXT,
+                     bio TEXT DEFAULT "",
+                     portfolio TEXT,
+                     documents TEXT,
+                     entity_type TEXT DEFAULT 'individual',
+                     verification_type TEXT DEFAULT 'simple',
+                     documents_list TEXT DEFAULT '',
+                     payment_methods TEXT DEFAULT '',
+                     preferred_contact TEXT DEFAULT 'telegram',
+                     age_group TEXT DEFAULT '',
+                     source TEXT DEFAULT 'bot',
+                     status TEXT,
+                     created_at TEXT)''')
+
+    # ----- Таблица рекомендаций (расширенная, через /recommend) -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS recommendations
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER,
+                     username TEXT,
+                     master_name TEXT,
+                     service TEXT,
+                     contact TEXT,
+                     description TEXT,
+                     price_level TEXT,
+                     satisfaction TEXT,
+                     recommend TEXT,
+                     media_file_id TEXT,
+                     status TEXT DEFAULT 'на модерации',
+                     created_at TEXT)''')
+
+    # ----- Таблица клиентских рекомендаций (из чата через хештеги) -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS client_recommendations
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER,
+                     username TEXT,
+                     message_id INTEGER,
+                     hashtag TEXT,
+                     contact TEXT,
+                     description TEXT,
+                     media_file_id TEXT,
+                     status TEXT DEFAULT 'new',
+                     created_at TEXT)''')
+
+    # ----- Таблица лайков для клиентских рекомендаций -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS rec_likes
+                    (id INTEGER PRIMARY KEY,
+                     rec_id INTEGER,
+                     user_id INTEGER,
+                     created_at TEXT,
+                     UNIQUE(rec_id, user_id))''')
+
+    # ----- Таблица комментариев для клиентских рекомендаций -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS rec_comments
+                    (id INTEGER PRIMARY KEY,
+                     rec_id INTEGER,
+                     user_id INTEGER,
+                     username TEXT,
+                     comment TEXT,
+                     created_at TEXT)''')
+
+    # ----- Таблица откликов мастеров на заявки -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS responses
+                    (id INTEGER PRIMARY KEY,
+                     request_id INTEGER,
+                     master_id INTEGER,
+                     price TEXT,
+                     comment TEXT,
+                     status TEXT DEFAULT 'pending',
+                     created_at TEXT,
+                     updated_at TEXT)''')
+
+    # ----- Таблица запросов на подробности об отзыве -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS review_questions
+                    (id INTEGER PRIMARY KEY,
+                     review_id INTEGER,
+                     from_user_id INTEGER,
+                     from_username TEXT,
+                     question TEXT,
+                     answered INTEGER DEFAULT 0,
+                     created_at TEXT)''')
+
+    # ----- Таблица для хранения жалоб на отзывы -----
+    cur.execute('''CREATE TABLE IF NOT EXISTS review_complaints
+                    (id INTEGER PRIMARY KEY,
+                     review_id INTEGER,
+                     master_id INTEGER,
+                     complaint_text TEXT,
+                     status TEXT DEFAULT 'new',
+                     created_at TEXT)''')
+
+    # Колонки, появившиеся в старых версиях бота (базы, созданные до них)
+    for table, column, col_type in [
+        ('master_applications', 'verification_type', "TEXT DEFAULT 'simple'"),
+        ('master_applications', 'documents_list', "TEXT DEFAULT ''"),
+        ('master_applications', 'payment_methods', "TEXT DEFAULT ''"),
+        ('master_applications', 'preferred_contact', "TEXT DEFAULT 'telegram'"),
+        ('master_applications', 'age_group', "TEXT DEFAULT ''"),
+        ('masters', 'documents', "TEXT DEFAULT ''"),
+        ('masters', 'documents_list', "TEXT DEFAULT ''"),
+        ('masters', 'payment_methods', "TEXT DEFAULT ''"),
+        ('masters', 'preferred_contact', "TEXT DEFAULT 'telegram'"),
+        ('masters', 'age_group', "TEXT DEFAULT ''"),
+        ('masters', 'documents_verified', "INTEGER DEFAULT 0"),
+        ('masters', 'photos_verified', "INTEGER DEFAULT 0"),
+        ('masters', 'reviews_verified', "INTEGER DEFAULT 0"),
+        ('responses', 'updated_at', "TEXT DEFAULT ''"),
+    ]:
+        if add_column(cur, table, column, col_type):
+            print(f"✅ Колонка {column} добавлена в {table}")
+
+
+# ================ 2. ПРОФИЛИ И РАЙОНЫ МАСТЕРОВ ================
+@migrations.step(2, 'таблицы кодов master_services / master_districts')
+def master_tags(cur, ctx):
+    existed = table_exists(cur, 'master_services')
+    cur.execute('''CREATE TABLE IF NOT EXISTS master_services
+                    (master_id INTEGER NOT NULL,
+                     code TEXT NOT NULL,
+                     PRIMARY KEY (code, master_id)) WITHOUT ROWID''')
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_master_services_master ON master_services (master_id, code)''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS master_districts
+                    (master_id INTEGER NOT NULL,
+                     code TEXT NOT NULL,
+                     PRIMARY KEY (code, master_id)) WITHOUT ROWID''')
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_master_districts_master ON master_districts (master_id, code)''')
+    if existed:
+        return
+    # Перенос строк masters.service / masters.districts в таблицы кодов
+    cur.execute('SELECT id, service, districts FROM masters')
+    services, districts = [], []
+    for master_id, service, district in cur.fetchall():
+        services += [(master_id, code) for code in ctx.match_index.parse_profiles(service)]
+        districts += [(master_id, code) for code in ctx.match_index.parse_districts(district)]
+    cur.executemany("INSERT OR IGNORE INTO master_services (master_id, code) VALUES (?, ?)", services)
+    cur.executemany("INSERT OR IGNORE INTO master_districts (master_id, code) VALUES (?, ?)", districts)
+
+
+# ================ 3. СЕССИИ И ЗАДАЧИ ================
+@migrations.step(3, 'сессии диалогов')
+def sessions_table(cur, ctx):
+    for sql in sessions.SCHEMA:
+        cur.execute(sql)
+
+
+@migrations.step(4, 'расписание фоновых задач')
+def jobs_table(cur, ctx):
+    for sql in scheduler.SCHEMA:
+        cur.execute(sql)
+
+
+# ================ 5. РЕЙТИНГ МАСТЕРОВ ================
+# rating_sum / reviews_count / rating обновляются триггерами при добавлении,
+# одобрении, отклонении и удалении отзывов – учитываются только 'approved'.
+RATING_ADD = '''UPDATE masters SET rating_sum = rating_sum + NEW.rating,
+                                   reviews_count = reviews_count + 1,
+                                   rating = (rating_sum + NEW.rating) * 1.0 / (reviews_count + 1)
+                WHERE id = NEW.master_id;'''
+RATING_REMOVE = '''UPDATE masters SET rating_sum = rating_sum - OLD.rating,
+                                      reviews_count = reviews_count - 1,
+                                      rating = CASE WHEN reviews_count > 1
+                                                    THEN (rating_sum - OLD.rating) * 1.0 / (reviews_count - 1)
+                                                    ELSE 0 END
+                   WHERE id = OLD.master_id;'''
+
+
+@migrations.step(5, 'рейтинг мастеров на триггерах')
+def rating_triggers(cur, ctx):
+    need_backfill = add_column(cur, 'masters', 'rating_sum', "INTEGER DEFAULT 0")
+    cur.execute(f'''CREATE TRIGGER IF NOT EXISTS reviews_rating_insert AFTER INSERT ON reviews
+                    WHEN NEW.status = 'approved' BEGIN {RATING_ADD} END''')
+    cur.execute(f'''CREATE TRIGGER IF NOT EXISTS reviews_rating_update_old AFTER UPDATE OF status, rating, master_id ON reviews
+                    WHEN OLD.status = 'approved' BEGIN {RATING_REMOVE} END''')
+    cur.execute(f'''CREATE TRIGGER IF NOT EXISTS reviews_rating_update_new AFTER UPDATE OF status, rating, master_id ON reviews
+                    WHEN NEW.status = 'approved' BEGIN {RATING_ADD} END''')
+    cur.execute(f'''CREATE TRIGGER IF NOT EXISTS reviews_rating_delete AFTER DELETE ON reviews
+                    WHEN OLD.status = 'approved' BEGIN {RATING_REMOVE} END''')
+    # Лучшие мастера: WHERE status = ? ORDER BY rating DESC, reviews_count DESC – обход индекса
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_masters_status_rating ON masters (status, rating, reviews_count)''')
+    if need_backfill:
+        # Один раз пересчитываем агрегаты по уже существующим отзывам
+        cur.execute('''UPDATE masters SET
+                         rating_sum = (SELECT COALESCE(SUM(r.rating), 0) FROM reviews r
+                                       WHERE r.master_id = masters.id AND r.status = 'approved'),
+                         reviews_count = (SELECT COUNT(*) FROM reviews r
+                                          WHERE r.master_id = masters.id AND r.status = 'approved')''')
+        cur.execute('''UPDATE masters SET rating = CASE WHEN reviews_count > 0
+                                                        THEN rating_sum * 1.0 / reviews_count ELSE 0 END''')
+
+
+# ================ 6. МЕТКИ ВРЕМЕНИ В UTC ================
+TIMESTAMP_COLUMNS = [
+    ('users', 'first_seen'), ('users', 'last_active'),
+    ('requests', 'created_at'), ('reviews', 'created_at'), ('masters', 'created_at'),
+    ('master_applications', 'created_at'), ('recommendations', 'created_at'),
+    ('client_recommendations', 'created_at'), ('rec_likes', 'created_at'), ('rec_comments', 'created_at'),
+    ('responses', 'created_at'), ('responses', 'updated_at'),
+    ('review_questions', 'created_at'), ('review_complaints', 'created_at'),
+]
+LEGACY_GLOB = '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]'
+
+
+@migrations.step(6, "created_at / updated_at в формате 'YYYY-MM-DD HH:MM:SS' UTC")
+def utc_timestamps(cur, ctx):
+    # Раньше писалось datetime.now() – местное время сервера в виде 'ДД.ММ.ГГГГ ЧЧ:ММ:СС'.
+    # Модификатор 'utc' в SQLite переводит из местного времени этой же машины.
+    for table, column in TIMESTAMP_COLUMNS:
+        cur.execute(f'''UPDATE {table} SET {column} = datetime(substr({column}, 7, 4) || '-' || substr({column}, 4, 2)
+                                                                || '-' || substr({column}, 1, 2) || ' '
+                                                                || substr({column}, 12, 8), 'utc')
+                        WHERE {column} GLOB ?''', (LEGACY_GLOB,))
+    # Списки «сначала новые» и выборки за период – диапазон по индексу
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_requests_user_created ON requests (user_id, created_at)''')
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_requests_status_public_created
+                   ON requests (status, is_public, created_at)''')
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_responses_request_created ON responses (request_id, created_at)''')
+
+
+# ================ 7. ИНДЕКСЫ ЧАСТЫХ ЗАПРОСОВ ================
+# Состав проверяется тестом tests/test_query_plans.py: запросы из bot.py не должны проходить таблицы целиком
+@migrations.step(7, 'индексы для выборок по статусу, мастеру и пользователю')
+def lookup_indexes(cur, ctx):
+    for sql in [
+        # Отзывы мастера на карточке и очередь модерации
+        'CREATE INDEX IF NOT EXISTS idx_reviews_master_status ON reviews (master_id, status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_status_created ON reviews (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_user ON reviews (user_id)',
+        # Отклики мастера (удаление профиля, проверки «уже откликался»)
+        'CREATE INDEX IF NOT EXISTS idx_responses_master ON responses (master_id, request_id)',
+        # Очереди модерации в админ-панели
+        'CREATE INDEX IF NOT EXISTS idx_master_applications_status ON master_applications (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_recommendations_status ON recommendations (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_recommendations_user ON recommendations (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_client_recommendations_status ON client_recommendations (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_client_recommendations_user ON client_recommendations (user_id)',
+    ]:
+        cur.execute(sql)
+
+
+# ================ 8. ПОЛНОТЕКСТОВЫЙ ПОИСК ================
+@migrations.step(8, 'полнотекстовый поиск мастеров и заявок (FTS5)')
+def full_text_search(cur, ctx):
+    for sql in search.SCHEMA:
+        cur.execute(sql)
+
+
+# ================ 9. ИСХОДЯЩИЕ СООБЩЕНИЯ ================
+@migrations.step(9, 'очередь исходящих сообщений outbox')
+def outbox_table(cur, ctx):
+    for sql in outbox.SCHEMA:
+        cur.execute(sql)
+
+
+# ================ 10. НЕСКОЛЬКО ПРОЦЕССОВ ================
+@migrations.step(10, 'аренда роли ведущего и журнал изменений для кешей процессов')
+def cluster_tables(cur, ctx):
+    for sql in cluster.SCHEMA:
+        cur.execute(sql)
+
+
+# ================ 11. ВХОДЯЩИЕ ОБНОВЛЕНИЯ ================
+@migrations.step(11, 'журнал входящих обновлений inbox')
+def inbox_table(cur, ctx):
+    for sql in inbox.SCHEMA:
+        cur.execute(sql)
+
+
+# ================ 12. ПОВТОРНЫЕ НАЖАТИЯ ================
+@migrations.step(12, 'ключи нажатий кнопок для защиты от повторов')
+def callback_keys_table(cur, ctx):
+    for sql in idempotency.SCHEMA:
+        cur.execute(sql)
@@ -0,0 +1,147 @@
+"""Исходящие сообщения через таблицу outbox: запись в той же транзакции, доставка в фоне.
+
+Обработчик вызывает outbox.send(...) рядом со своими изменениями в БД –
+сообщение сохраняется вместе с ними (или не сохраняется вовсе, если
+транзакция откатилась). Фоновый поток отправляет сообщения, повторяя
+попытки с экспоненциальной задержкой и учётом retry_after от Telegram.
+Сообщения, которые доставить не удалось, остаются в outbox со статусом
+'dead' – их видно администратору и можно отправить повторно.
+"""
+import json
+import threading
+import time
+
+from delivery import TokenBucket, retry_after_of
+from timestamps import utc_now, utc_ago
+
+# Создаётся миграцией (migrations.py)
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS outbox
+       (id INTEGER PRIMARY KEY,
+        chat_id TEXT NOT NULL,
+        text TEXT NOT NULL,
+        options TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt REAL NOT NULL,
+        last_error TEXT,
+        created_at TEXT,
+        sent_at TEXT)''',
+    '''CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON outbox (status, next_attempt)''',
+]
+
+PENDING, SENT, DEAD = 'pending', 'sent', 'dead'
+
+
+def is_permanent(exc):
+    """Ошибки, после которых повтор бессмысленен: бот заблокирован, чата нет, неверный запрос."""
+    return getattr(exc, 'error_code', None) in (400, 403)
+
+
+class Outbox:
+    def __init__(self, storage, bot, bucket=None, rate=25, max_attempts=8, base_delay=2, max_delay=900,
+                 batch=20, poll=1.0):
+        self.storage = storage
+        self.bot = bot
+        # Общий с рассылкой bucket – лимит Telegram один на бота
+        self.bucket = bucket or TokenBucket(rate)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch = batch
+        self.poll = poll
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def send(self, chat_id, text, **options):
+        """Ставит сообщение в очередь. Внутри storage.transaction() – часть этой транзакции.
+
+        options – параметры send_message (reply_markup, parse_mode, ...).
+        """
+        markup = options.get('reply_markup')
+        if markup is not None and hasattr(markup, 'to_json'):
+            options['reply_markup'] = markup.to_json()
+        conn = self.storage.connection()
+        cur = conn.execute('''INSERT INTO outbox (chat_id, text, options, next_attempt, created_at)
+                              VALUES (?, ?, ?, ?, ?)''',
+                           (str(chat_id), text, json.dumps(options, ensure_ascii=False), time.time(), utc_now()))
+        if not self.storage.in_transaction_block():
+            conn.commit()
+        self.wakeup.set()
+        return cur.lastrowid
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="outbox", daemon=True)
+            self.thread.start()
+        return self
+
+    # ----- просмотр и повтор -----
+    def stats(self):
+        rows = self.storage.connection().execute(
+            'SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+        counts = {PENDING: 0, SENT: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def retry(self, message_id):
+        """Возвращает сообщение из 'dead' в очередь. False, если такого нет."""
+        with self.storage.transaction() as cur:
+            cur.execute('''UPDATE outbox SET status = ?, attempts = 0, next_attempt = ?, last_error = NULL
+                           WHERE id = ? AND status = ?''', (PENDING, time.time(), message_id, DEAD))
+            updated = cur.rowcount
+        self.wakeup.set()
+        return bool(updated)
+
+    def purge(self, days=7):
+        """Удаляет доставленные сообщения старше days дней."""
+        with self.storage.transaction() as cur:
+            cur.execute('DELETE FROM outbox WHERE status = ? AND sent_at < ?', (SENT, utc_ago(days=days)))
+            return cur.rowcount
+
+    # ----- доставка -----
+    def _loop(self):
+        while True:
+            try:
+                sent = self._deliver_due()
+            except Exception as e:
+                print(f"⚠️ Ошибка отправки из outbox: {e}")
+                sent = 0
+            if not sent:
+                self.wakeup.wait(self.poll)
+                self.wakeup.clear()
+
+    def _deliver_due(self):
+        """Отправляет пачку сообщений, время которых пришло. Возвращает их число."""
+        rows = self.storage.connection().execute(
+            '''SELECT id, chat_id, text, options, attempts FROM outbox
+               WHERE status = ? AND next_attempt <= ? ORDER BY next_attempt LIMIT ?''',
+            (PENDING, time.time(), self.batch)).fetchall()
+        for row in rows:
+            self._deliver(*row)
+        return len(rows)
+
+    def _deliver(self, message_id, chat_id, text, options, attempts):
+        self.bucket.acquire()
+        try:
+            self.bot.send_message(chat_id, text, **json.loads(options))
+        except Exception as e:
+            retry_after = retry_after_of(e)
+            if retry_after is not None:
+                # 429 – не ошибка сообщения: ждём сколько сказал Telegram, попытку не считаем
+                self.bucket.pause(retry_after)
+                delay = retry_after
+            else:
+                attempts += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            dead = is_permanent(e) or attempts >= self.max_attempts
+            with self.storage.transaction() as cur:
+                cur.execute('''UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ?
+                               WHERE id = ?''',
+                            (DEAD if dead else PENDING, attempts, time.time() + delay, str(e)[:500], message_id))
+            if dead:
+                print(f"⚠️ Сообщение {message_id} для {chat_id} не доставлено: {e}")
+            return
+        with self.storage.transaction() as cur:
+            cur.execute('UPDATE outbox SET status = ?, attempts = ?, sent_at = ? WHERE id = ?',
+                        (SENT, attempts + 1, utc_now(), message_id))
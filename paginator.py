@@ -0,0 +1,170 @@
+"""Постраничный вывод списков в одном сообщении с кнопками ◀️ / ▶️.
+
+Страницы выбираются по ключу (keyset), а не через OFFSET: в callback_data
+кнопки лежит id крайней строки страницы, запрос продолжает с неё по индексу.
+Листание редактирует то же сообщение – один экран, один запрос, один вызов API.
+"""
+from telebot import types
+
+NEXT, PREV, CURRENT = 'n', 'p', 'c'
+
+
+class PageView:
+    """Описание списка.
+
+    select – 'SELECT x.id, ... FROM table x [JOIN ...]', первая колонка – id строки table;
+    scope(user_id, arg) -> (условие WHERE, параметры) или None, если доступа нет;
+    render(rows, user_id, arg) -> (текст, ряды кнопок);
+    keys – колонки table, по которым упорядочен список (последняя – id).
+    """
+
+    def __init__(self, name, select, table, scope, render, keys=('id',), alias='', descending=True,
+                 size=5, empty="Ничего не найдено."):
+        self.name = name
+        self.select = select
+        self.table = table
+        self.scope = scope
+        self.render = render
+        self.keys = keys
+        self.alias = alias
+        self.descending = descending
+        self.size = size
+        self.empty = empty
+
+    def query(self, where, params, direction=None, anchor=None):
+        """SQL и параметры для страницы после / перед строкой anchor (id)."""
+        prefix = f"{self.alias}." if self.alias else ''
+        columns = ', '.join(prefix + k for k in self.keys)
+        forward = direction != PREV
+        # Порядок выборки: в направлении списка для ▶️, в обратном для ◀️
+        descending = self.descending == forward
+        sql = f"{self.select} WHERE ({where})"
+        params = list(params)
+        if anchor is not None:
+            if direction == CURRENT:
+                op = '<=' if descending else '>='
+            else:
+                op = '<' if descending else '>'
+            if self.keys == ('id',):
+                sql += f" AND {prefix}id {op} ?"
+            else:
+                # Строки-якоря может уже не быть (заявку одобрили и удалили) – тогда берётся
+                # соседняя по id с той стороны, что отсекает сравнение (id растёт вместе с
+                # created_at); если якорь есть, подзапрос возвращает его самого
+                near = "id >= ? ORDER BY id ASC" if op in ('<', '>=') else "id <= ? ORDER BY id DESC"
+                sql += (f" AND ({columns}) {op} "
+                        f"(SELECT {', '.join(self.keys)} FROM {self.table} WHERE {near} LIMIT 1)")
+            params.append(anchor)
+        order = 'DESC' if descending else 'ASC'
+        sql += " ORDER BY " + ', '.join(f"{prefix}{k} {order}" for k in self.keys)
+        sql += f" LIMIT {self.size + 1}"
+        return sql, params
+
+
+class Paginator:
+    def __init__(self, bot, router, cursor, prefix='pg'):
+        self.bot = bot
+        self.cursor = cursor
+        self.prefix = prefix
+        self.views = {}
+        router.add(f"{prefix}_{{view}}_{{arg}}_{{direction}}_{{anchor:int}}", self._on_page)
+
+    def register(self, view):
+        if '_' in view.name or view.name in self.views:
+            raise ValueError(f"Недопустимое имя списка: {view.name}")
+        self.views[view.name] = view
+        return view
+
+    def fetch(self, view, user_id, arg, direction=None, anchor=None):
+        """(строки страницы в порядке списка, есть ли ещё строки дальше) или None без доступа."""
+        scope = view.scope(user_id, arg)
+        if scope is None:
+            return None
+        sql, params = view.query(*scope, direction=direction, anchor=anchor)
+        self.cursor.execute(sql, params)
+        rows = self.cursor.fetchall()
+        more = len(rows) > view.size
+        rows = rows[:view.size]
+        if direction == PREV:
+            rows.reverse()
+        return rows, more
+
+    def build(self, view, rows, user_id, arg, has_prev, has_next):
+        text, buttons = view.render(rows, user_id, arg)
+        markup = types.InlineKeyboardMarkup()
+        for row in buttons:
+            markup.row(*row)
+        nav = []
+        if has_prev:
+            nav.append(types.InlineKeyboardButton("◀️", callback_data=self._data(view, arg, PREV, rows[0][0])))
+        # Средняя кнопка перерисовывает текущую страницу (и хранит её положение)
+        nav.append(types.InlineKeyboardButton("🔄", callback_data=self._data(view, arg, CURRENT, rows[0][0])))
+        if has_next:
+            nav.append(types.InlineKeyboardButton("▶️", callback_data=self._data(view, arg, NEXT, rows[-1][0])))
+        markup.row(*nav)
+        return text, markup
+
+    def _data(self, view, arg, direction, anchor):
+        return f"{self.prefix}_{view.name}_{arg}_{direction}_{anchor}"
+
+    def send(self, chat_id, user_id, name, arg='0'):
+        """Первая страница новым сообщением."""
+        view = self.views[name]
+        page = self.fetch(view, user_id, arg)
+        if page is None:
+            return None
+        rows, more = page
+        if not rows:
+            return self.bot.send_message(chat_id, view.empty)
+        text, markup = self.build(view, rows, user_id, arg, False, more)
+        return self.bot.send_message(chat_id, text, reply_markup=markup)
+
+    def show(self, call, name, arg, direction, anchor):
+        """Редактирует сообщение call.message: страница после / перед anchor."""
+        view = self.views.get(name)
+        user_id = call.from_user.id
+        page = self.fetch(view, user_id, arg, direction, anchor) if view else None
+        if page is None:
+            return False
+        rows, more = page
+        if not rows and direction is not None:
+            # Страница опустела (всё обработано) – показываем начало списка
+            direction = None
+            rows, more = self.fetch(view, user_id, arg)
+        if not rows:
+            self.bot.edit_message_text(view.empty, call.message.chat.id, call.message.message_id)
+            return True
+        if direction == PREV:
+            has_prev, has_next = more, True
+        elif direction == NEXT:
+            has_prev, has_next = True, more
+        elif direction == CURRENT:
+            before = self.fetch(view, user_id, arg, PREV, rows[0][0])
+            has_prev, has_next = bool(before and before[0]), more
+        else:
+            has_prev, has_next = False, more
+        text, markup = self.build(view, rows, user_id, arg, has_prev, has_next)
+        try:
+            self.bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+        except Exception as e:
+            # «message is not modified» при повторном нажатии 🔄 – не ошибка
+            if 'not modified' not in str(e):
+                raise
+        return True
+
+    def refresh(self, call):
+        """Перерисовывает страницу, на кнопку которой нажали (после одобрения, отклонения и т.п.)."""
+        markup = call.message.reply_markup
+        for row in (markup.keyboard if markup else []):
+            for button in row:
+                data = button.callback_data or ''
+                parts = data.split('_')
+                if len(parts) == 5 and parts[0] == self.prefix and parts[3] == CURRENT:
+                    return self.show(call, parts[1], parts[2], CURRENT, int(parts[4]))
+        return False
+
+    def _on_page(self, call, view, arg, direction, anchor):
+        if direction not in (NEXT, PREV, CURRENT) or not self.show(call, view, arg, direction, anchor):
+            self.bot.answer_callback_query(call.id, "❌ Список недоступен")
+            return
+        self.bot.answer_callback_query(call.id)
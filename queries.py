@@ -0,0 +1,161 @@
+"""Запросы горячих путей: списки заявок и мастеров, очереди админ-панели, статистика.
+
+Списки описаны фабриками PageView: bot.py передаёт в них рендер и размер
+страницы, а bench/hot_paths.py вызывает их без рендера на синтетической
+базе – без токена и без запуска бота. Подбор получателей заявки – в
+matching.py, полнотекстовый поиск – в search.py.
+"""
+from catalog import PROFILES_DICT, DISTRICTS_DICT
+from paginator import PageView
+from timestamps import utc_ago
+
+
+# ----- клиент: «📋 Мои заявки» -----
+def my_requests_view(render=None, size=5):
+    return PageView(
+        'myreq',
+        # Число откликов и принятый мастер – подзапросами по индексу responses (request_id, ...):
+        # вся страница одним запросом
+        '''SELECT q.id, q.service, q.description, q.district, q.date, q.budget, q.status, q.created_at,
+                  q.chat_message_id,
+                  (SELECT COUNT(*) FROM responses r WHERE r.request_id = q.id),
+                  (SELECT r.master_id FROM responses r WHERE r.request_id = q.id AND r.status = 'accepted' LIMIT 1)
+           FROM requests q''',
+        'requests', alias='q',
+        scope=lambda user_id, arg: ('q.user_id = ?', (user_id,)),
+        render=render,
+        keys=('created_at', 'id'), size=size, empty="У вас пока нет заявок.")
+
+
+# ----- мастер: «🔔 Заявки по моему профилю» -----
+def profile_requests_view(cursor, match_index, render=None, size=5):
+    def profile_requests_scope(user_id, arg):
+        cursor.execute("SELECT id FROM masters WHERE user_id = ? AND status = 'активен'", (user_id,))
+        master = cursor.fetchone()
+        if not master:
+            return None
+        profile_codes, district_codes = match_index.codes_of(master[0])
+        services = [PROFILES_DICT[c] for c in profile_codes]
+        districts = [DISTRICTS_DICT[c] for c in district_codes]
+        if not services or not districts:
+            return ('0', ())
+        return (f'''status = 'активна' AND is_public = 1
+                   AND service IN ({",".join("?" * len(services))})
+                   AND district IN ({",".join("?" * len(districts))})''', services + districts)
+
+    return PageView(
+        'profreq',
+        '''SELECT id, service, description, district, date, budget FROM requests''',
+        'requests',
+        scope=profile_requests_scope,
+        render=render,
+        keys=('created_at', 'id'), size=size, empty="Нет активных заявок, подходящих под ваш профиль и районы.")
+
+
+# ----- каталог мастеров -----
+def masters_by_service_view(render=None, size=5):
+    return PageView(
+        'catserv',
+        '''SELECT m.id, m.name, m.service, m.rating, m.reviews_count, m.districts
+           FROM master_services s JOIN masters m ON m.id = s.master_id''',
+        'masters', alias='m',
+        scope=lambda user_id, code: ("s.code = ? AND m.status = 'активен'", (code,)),
+        render=render,
+        size=size, empty="😕 Мастеров с таким профилем пока нет.")
+
+
+def masters_by_district_view(render=None, size=5):
+    return PageView(
+        'catdist',
+        '''SELECT m.id, m.name, m.service, m.rating, m.reviews_count, m.districts
+           FROM master_districts d JOIN masters m ON m.id = d.master_id''',
+        'masters', alias='m',
+        scope=lambda user_id, code: ("d.code = ? AND m.status = 'активен'", (code,)),
+        render=render,
+        size=size, empty="😕 Мастеров в этом районе пока нет.")
+
+
+def top_rated_masters(cursor, limit=10):
+    """Лучшие активные мастера – обход индекса (status, rating, reviews_count)."""
+    cursor.execute('''SELECT id, name, service, rating, reviews_count, districts
+                      FROM masters WHERE status = 'активен' ORDER BY rating DESC, reviews_count DESC LIMIT ?''',
+                   (limit,))
+    return cursor.fetchall()
+
+
+# ----- админ-панель -----
+def admin_scope(admin_id, where):
+    return lambda user_id, arg: (where, ()) if user_id == admin_id else None
+
+
+def admin_apps_view(admin_id, render=None, size=5):
+    return PageView(
+        'adminapps',
+        '''SELECT id, name, service, phone, created_at FROM master_applications''',
+        'master_applications',
+        scope=admin_scope(admin_id, "status = 'На проверке'"),
+        render=render,
+        keys=('created_at', 'id'), size=size, empty="Нет заявок на проверку.")
+
+
+def admin_reviews_view(admin_id, render=None, size=5):
+    return PageView(
+        'adminrevs',
+        '''SELECT id, master_name, user_name, rating, review_text, created_at FROM reviews''',
+        'reviews', descending=False,
+        scope=admin_scope(admin_id, "status = 'pending'"),
+        render=render,
+        keys=('created_at', 'id'), size=size, empty="Нет отзывов на модерации.")
+
+
+def admin_recs_view(admin_id, render=None, size=5):
+    return PageView(
+        'adminrecs',
+        '''SELECT id, master_name, service, contact, user_id FROM recommendations''',
+        'recommendations', descending=False,
+        scope=admin_scope(admin_id, "status = 'на модерации'"),
+        render=render,
+        keys=('created_at', 'id'), size=size, empty="Нет рекомендаций на модерации.")
+
+
+def admin_client_recs_view(admin_id, render=None, size=5):
+    return PageView(
+        'admincrecs',
+        '''SELECT id, user_id, username, hashtag, contact, description FROM client_recommendations''',
+        'client_recommendations', descending=False,
+        scope=admin_scope(admin_id, "status = 'new'"),
+        render=render,
+        keys=('created_at', 'id'), size=size, empty="Нет новых клиентских рекомендаций.")
+
+
+def admin_outbox_view(admin_id, render=None, size=5):
+    return PageView(
+        'adminoutbox',
+        '''SELECT id, chat_id, text, attempts, last_error FROM outbox''',
+        'outbox',
+        scope=admin_scope(admin_id, "status = 'dead'"),
+        render=render,
+        size=size, empty="Недоставленных сообщений нет.")
+
+
+# ----- статистика -----
+def count_stats(cursor):
+    """Счётчики для «📊 Статистика»."""
+    stats = {}
+    cursor.execute("SELECT COUNT(*) FROM users")
+    stats['total_users'] = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM masters WHERE status = 'активен'")
+    stats['active_masters'] = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM requests WHERE status = 'активна'")
+    stats['active_requests'] = cursor.fetchone()[0]
+    # За сутки: диапазон по индексу (status, is_public, created_at)
+    cursor.execute("SELECT COUNT(*) FROM requests WHERE status = 'активна' AND is_public = 1 AND created_at >= ?",
+                   (utc_ago(days=1),))
+    stats['new_requests'] = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM reviews WHERE status = 'approved'")
+    stats['approved_reviews'] = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM master_applications WHERE status = 'На проверке'")
+    stats['pending_apps'] = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM recommendations WHERE status = 'на модерации'")
+    stats['pending_recs'] = cursor.fetchone()[0]
+    return stats
@@ -0,0 +1,117 @@
+"""Маршрутизация callback-кнопок по префиксному дереву.
+
+callback_data вида action_arg1_arg2 разбирается один раз: литеральные
+части шаблона ищутся в дереве по токенам, аргументы приводятся к типам
+и передаются обработчику именованными параметрами. Выигрывает самый
+длинный совпавший префикс, поэтому 'doc_done' не перехватывается
+маршрутом 'doc_{choice}', а порядок объявления обработчиков не важен.
+
+Шаблоны:
+    'doc_done'                        – точное совпадение
+    'master_{master_id:int}'          – целое число
+    'role_{role}'                     – строка (один токен)
+    'age_{key:rest}'                  – остаток строки вместе с '_'
+"""
+import re
+
+_PARAM = re.compile(r'^\{(\w+)(?::(int|str|rest))?\}$')
+_SEPARATOR = re.compile(r'_(?![^{]*\})')   # '_' вне фигурных скобок
+_CONVERTERS = {'int': int, 'str': str, 'rest': str}
+
+
+class Route:
+    def __init__(self, pattern, handler):
+        self.pattern = pattern
+        self.handler = handler
+        self.literal = []
+        self.params = []    # (имя, тип)
+        for token in _SEPARATOR.split(pattern):
+            m = _PARAM.match(token)
+            if m:
+                self.params.append((m.group(1), m.group(2) or 'str'))
+            elif self.params:
+                raise ValueError(f"Литерал после аргумента в шаблоне: {pattern}")
+            else:
+                self.literal.append(token)
+        kinds = [kind for _, kind in self.params]
+        if 'rest' in kinds[:-1]:
+            raise ValueError(f"{{...:rest}} может быть только последним: {pattern}")
+        self.rest = bool(kinds) and kinds[-1] == 'rest'
+        self.typed = sum(1 for kind in kinds if kind == 'int')
+
+    @property
+    def order(self):
+        # Сначала маршруты с фиксированным числом аргументов и с типизированными аргументами
+        return (self.rest, -self.typed)
+
+    def bind(self, tokens):
+        """Именованные аргументы для оставшихся токенов или None."""
+        if len(tokens) < len(self.params) or (not self.rest and len(tokens) != len(self.params)):
+            return None
+        kwargs = {}
+        for i, (name, kind) in enumerate(self.params):
+            value = '_'.join(tokens[i:]) if kind == 'rest' else tokens[i]
+            try:
+                kwargs[name] = _CONVERTERS[kind](value)
+            except ValueError:
+                return None
+        return kwargs
+
+
+class _Node:
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []
+
+
+class CallbackRouter:
+    def __init__(self):
+        self.root = _Node()
+        self.patterns = {}
+
+    def add(self, pattern, handler):
+        if pattern in self.patterns:
+            raise ValueError(f"Маршрут уже зарегистрирован: {pattern}")
+        route = Route(pattern, handler)
+        node = self.root
+        for token in route.literal:
+            node = node.children.setdefault(token, _Node())
+        node.routes.append(route)
+        node.routes.sort(key=lambda r: r.order)
+        self.patterns[pattern] = route
+        return route
+
+    def route(self, pattern):
+        """Декоратор: @router.route('accept_response_{req_id:int}_{master_id:int}')."""
+        def decorator(handler):
+            self.add(pattern, handler)
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        """(обработчик, аргументы) для callback_data или (None, None)."""
+        tokens = (data or '').split('_')
+        node = self.root
+        path = [(node, 0)]
+        for i, token in enumerate(tokens):
+            node = node.children.get(token)
+            if node is None:
+                break
+            path.append((node, i + 1))
+        for node, depth in reversed(path):
+            rest = tokens[depth:]
+            for route in node.routes:
+                kwargs = route.bind(rest)
+                if kwargs is not None:
+                    return route.handler, kwargs
+        return None, None
+
+    def dispatch(self, call):
+        """Вызывает обработчик кнопки. False – маршрут не найден."""
+        handler, kwargs = self.resolve(call.data)
+        if handler is None:
+            return False
+        handler(call, **kwargs)
+        return True
@@ -0,0 +1,141 @@
+"""Планировщик фоновых задач: поток внутри процесса, расписание хранится в таблице jobs."""
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+# Таблицы создаются миграцией (migrations.py)
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS jobs
+       (name TEXT PRIMARY KEY,
+        schedule TEXT,
+        next_run REAL,
+        last_run REAL,
+        last_duration REAL,
+        last_status TEXT,
+        last_error TEXT,
+        runs INTEGER DEFAULT 0)''',
+]
+
+
+class Daily:
+    """Каждый день в hour:minute по местному времени (UTC + tz_offset часов)."""
+
+    def __init__(self, hour, minute=0, tz_offset=0):
+        self.hour = hour
+        self.minute = minute
+        self.tz_offset = tz_offset
+
+    def next_after(self, ts):
+        shift = timedelta(hours=self.tz_offset)
+        local = datetime.fromtimestamp(ts, timezone.utc) + shift
+        run = local.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if run <= local:
+            run += timedelta(days=1)
+        return (run - shift).timestamp()
+
+    def __str__(self):
+        return f"ежедневно {self.hour:02d}:{self.minute:02d} (UTC{self.tz_offset:+d})"
+
+
+class Every:
+    """Каждые seconds секунд."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_after(self, ts):
+        return ts + self.seconds
+
+    def __str__(self):
+        return f"каждые {self.seconds} с"
+
+
+class Scheduler:
+    """Выполняет задачи по расписанию в одном фоновом потоке.
+
+    Время следующего запуска сохраняется в таблице jobs, поэтому запуск,
+    пропущенный пока бот был выключен, выполняется сразу после старта.
+    """
+
+    def __init__(self, storage, tick=30):
+        self.storage = storage
+        self.tick = tick
+        self.jobs = {}      # name -> (schedule, func)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, name, schedule, func):
+        with self.lock:
+            self.jobs[name] = (schedule, func)
+        with self.storage.transaction() as cur:
+            cur.execute('SELECT next_run FROM jobs WHERE name = ?', (name,))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute('INSERT INTO jobs (name, schedule, next_run) VALUES (?, ?, ?)',
+                            (name, str(schedule), schedule.next_after(time.time())))
+            else:
+                cur.execute('UPDATE jobs SET schedule = ? WHERE name = ?', (str(schedule), name))
+        return func
+
+    def run_now(self, name):
+        """Ставит задачу на ближайший проход планировщика (не блокирует вызывающего)."""
+        with self.storage.transaction() as cur:
+            cur.execute('UPDATE jobs SET next_run = ? WHERE name = ?', (time.time(), name))
+        self.wakeup.set()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self.thread.start()
+        return self
+
+    def status(self):
+        """Список задач с временем последнего запуска, длительностью и следующим запуском."""
+        with self.lock:
+            names = list(self.jobs)
+        if not names:
+            return []
+        cur = self.storage.connection().execute(
+            f'''SELECT name, schedule, next_run, last_run, last_duration, last_status, last_error, runs
+                FROM jobs WHERE name IN ({','.join('?' * len(names))}) ORDER BY name''', names)
+        columns = [d[0] for d in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def _loop(self):
+        while True:
+            try:
+                delay = self._run_due()
+            except Exception as e:
+                print(f"⚠️ Ошибка планировщика: {e}")
+                delay = self.tick
+            self.wakeup.wait(max(0.0, min(delay, self.tick)))
+            self.wakeup.clear()
+
+    def _run_due(self):
+        """Выполняет задачи, время которых пришло. Возвращает секунды до следующей."""
+        now = time.time()
+        cur = self.storage.connection().execute('SELECT name, next_run FROM jobs')
+        due = [name for name, next_run in cur.fetchall() if name in self.jobs and (next_run or 0) <= now]
+        for name in due:
+            self._run(name)
+        rows = self.storage.connection().execute('SELECT name, next_run FROM jobs').fetchall()
+        upcoming = [next_run for name, next_run in rows if name in self.jobs and next_run]
+        return (min(upcoming) - time.time()) if upcoming else self.tick
+
+    def _run(self, name):
+        schedule, func = self.jobs[name]
+        started = time.time()
+        status, error = 'ok', None
+        try:
+            func()
+        except Exception as e:
+            status, error = 'error', str(e)
+            print(f"⚠️ Задача {name} завершилась с ошибкой: {e}")
+            traceback.print_exc()
+        finished = time.time()
+        with self.storage.transaction() as cur:
+            cur.execute('''UPDATE jobs SET next_run = ?, last_run = ?, last_duration = ?, last_status = ?,
+                           last_error = ?, runs = runs + 1 WHERE name = ?''',
+                        (schedule.next_after(finished), started, finished - started, status, error, name))
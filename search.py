@@ -0,0 +1,115 @@
+"""Полнотекстовый поиск мастеров и заявок (SQLite FTS5).
+
+masters_fts и requests_fts – индексы с внешним содержимым: текст хранится
+только в masters / requests, триггеры обновляют индекс при изменениях.
+Токенизатор unicode61 приводит кириллицу к нижнему регистру, ё в запросе
+заменяется на е. Стеммера для русского в SQLite нет, поэтому от слов
+запроса отрезаются окончания и ищется префикс: «сантехника» находит
+«сантехник», «плиточные работы» – «плиточник, работаю». Если точный поиск
+ничего не дал, повторяем по коротким префиксам через OR – это прощает
+опечатки в окончаниях.
+"""
+import re
+
+TOKENIZER = "unicode61 remove_diacritics 2"
+
+MASTER_COLUMNS = ('name', 'service', 'bio')
+REQUEST_COLUMNS = ('service', 'description', 'district')
+
+# Вес совпадения по колонкам для bm25: имя важнее профиля, профиль важнее описания
+MASTER_WEIGHTS = (10.0, 5.0, 1.0)
+REQUEST_WEIGHTS = (5.0, 2.0, 1.0)
+
+
+def _fts_schema(fts, table, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f'''CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5
+            ({cols}, content='{table}', content_rowid='id', tokenize='{TOKENIZER}', prefix='2 3')''',
+        f'''CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+            END''',
+        # Заполнение индекса по уже существующим строкам
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+# Создаётся миграцией (migrations.py)
+SCHEMA = _fts_schema('masters_fts', 'masters', MASTER_COLUMNS) + \
+         _fts_schema('requests_fts', 'requests', REQUEST_COLUMNS)
+
+# Окончания русских слов, от длинных к коротким
+_ENDINGS = sorted('''иями ями ами ого его ому ему ыми ими ых их ая яя ое ее ые ие ый ий ой ей ом ем
+                     ам ям ах ях ов ев ию ья ье ьи ия ии ик ка а я о е ы и у ю ь й'''.split(),
+                  key=len, reverse=True)
+_WORD = re.compile(r'\w+')
+MIN_STEM = 3
+FUZZY_PREFIX = 4
+
+
+def words(text):
+    return [w.replace('ё', 'е') for w in _WORD.findall((text or '').lower())]
+
+
+def stem(word):
+    """Отрезает одно окончание, оставляя не меньше MIN_STEM букв."""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def match_query(text, fuzzy=False):
+    """Выражение для MATCH: все слова по основам (AND) или короткие префиксы (OR)."""
+    terms = []
+    for word in words(text):
+        term = word[:FUZZY_PREFIX] if fuzzy else stem(word)
+        if len(term) >= 2 and term not in terms:
+            terms.append(term)
+    if not terms:
+        return None
+    # Кавычки – чтобы слова из запроса не разбирались как синтаксис FTS5
+    return (' OR ' if fuzzy else ' ').join(f'"{t}"*' for t in terms)
+
+
+def _ranked(cursor, sql, text, params, limit):
+    # CROSS JOIN в запросах фиксирует порядок: сначала совпадения FTS, затем строки по id
+    for fuzzy in (False, True):
+        query = match_query(text, fuzzy)
+        if query is None:
+            return []
+        cursor.execute(sql, (query, *params, limit))
+        rows = cursor.fetchall()
+        if rows:
+            return rows
+    return []
+
+
+def search_masters(cursor, text, limit=10, status='активен'):
+    """Мастера по имени, профилю и описанию, лучшие совпадения первыми.
+
+    Строки: (id, name, service, rating, reviews_count, districts).
+    """
+    sql = f'''SELECT m.id, m.name, m.service, m.rating, m.reviews_count, m.districts
+              FROM masters_fts CROSS JOIN masters m ON m.id = masters_fts.rowid
+              WHERE masters_fts MATCH ? AND m.status = ?
+              ORDER BY bm25(masters_fts, {', '.join(map(str, MASTER_WEIGHTS))}) LIMIT ?'''
+    return _ranked(cursor, sql, text, (status,), limit)
+
+
+def search_requests(cursor, text, limit=10):
+    """Заявки по профилю, описанию и району. Строки: (id, service, description, district, status)."""
+    sql = f'''SELECT q.id, q.service, q.description, q.district, q.status
+              FROM requests_fts CROSS JOIN requests q ON q.id = requests_fts.rowid
+              WHERE requests_fts MATCH ?
+              ORDER BY bm25(requests_fts, {', '.join(map(str, REQUEST_WEIGHTS))}) LIMIT ?'''
+    return _ranked(cursor, sql, text, (), limit)
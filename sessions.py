@@ -0,0 +1,218 @@
+"""Хранилище состояний диалогов (анкеты, заявки) в SQLite с LRU-кешем и TTL."""
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Таблицы создаются миграцией (migrations.py)
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sessions
+       (kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        data BLOB NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (kind, key))''',
+    '''CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)''',
+]
+
+_MISSING = object()
+
+
+class SessionStore:
+    """Сессии лежат в таблице sessions, последние используемые – ещё и в памяти.
+
+    Каждая запись живёт ttl секунд с последнего изменения; просроченные
+    удаляет evict_expired() (задача планировщика в bot.py).
+    """
+
+    def __init__(self, storage, capacity=2000):
+        self.storage = storage
+        self.capacity = capacity
+        self.cache = OrderedDict()   # (kind, key) -> (value, expires_at)
+        self.lock = threading.RLock()
+
+    def namespace(self, kind, ttl, codec='json'):
+        return SessionNamespace(self, kind, ttl, codec)
+
+    # ----- низкоуровневые операции -----
+    def load(self, kind, key, codec):
+        now = time.time()
+        with self.lock:
+            cached = self.cache.get((kind, key))
+            if cached is not None:
+                if cached[1] > now:
+                    self.cache.move_to_end((kind, key))
+                    return cached[0]
+                del self.cache[(kind, key)]
+        row = self.storage.connection().execute(
+            'SELECT data, expires_at FROM sessions WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        if not row or row[1] <= now:
+            return _MISSING
+        value = _decode(row[0], codec)
+        self._remember(kind, key, value, row[1])
+        return value
+
+    def save(self, kind, key, value, ttl, codec):
+        expires_at = time.time() + ttl
+        conn = self.storage.connection()
+        conn.execute('INSERT OR REPLACE INTO sessions (kind, key, data, expires_at) VALUES (?, ?, ?, ?)',
+                     (kind, key, _encode(value, codec), expires_at))
+        if not self.storage.in_transaction_block():
+            conn.commit()
+        self._remember(kind, key, value, expires_at)
+
+    def delete(self, kind, key):
+        conn = self.storage.connection()
+        conn.execute('DELETE FROM sessions WHERE kind = ? AND key = ?', (kind, key))
+        if not self.storage.in_transaction_block():
+            conn.commit()
+        with self.lock:
+            self.cache.pop((kind, key), None)
+
+    def _remember(self, kind, key, value, expires_at):
+        with self.lock:
+            self.cache[(kind, key)] = (value, expires_at)
+            self.cache.move_to_end((kind, key))
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+
+    # ----- очистка -----
+    def evict_expired(self):
+        now = time.time()
+        with self.lock:
+            for cache_key in [k for k, (_, exp) in self.cache.items() if exp <= now]:
+                del self.cache[cache_key]
+        with self.storage.transaction() as cur:
+            cur.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+            return cur.rowcount
+
+
+class SessionNamespace:
+    """Замена словарям вида bot.master_data: ns[user_id] -> Session."""
+
+    def __init__(self, store, kind, ttl, codec='json'):
+        self.store = store
+        self.kind = kind
+        self.ttl = ttl
+        self.codec = codec
+
+    def _get(self, key):
+        value = self.store.load(self.kind, str(key), self.codec)
+        if isinstance(value, dict) and not isinstance(value, Session):
+            value = Session(self, key, value)
+            self.store._remember(self.kind, str(key), value, time.time() + self.ttl)
+        return value
+
+    def __contains__(self, key):
+        return self._get(key) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self._get(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        return default if value is _MISSING else value
+
+    def __setitem__(self, key, value):
+        if isinstance(value, dict):
+            value = Session(self, key, value)
+        self.store.save(self.kind, str(key), value, self.ttl, self.codec)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.store.delete(self.kind, str(key))
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self.store.delete(self.kind, str(key))
+        return value
+
+    def touch(self, key, value):
+        self.store.save(self.kind, str(key), value, self.ttl, self.codec)
+
+
+class Session(dict):
+    """Словарь, который сохраняет себя в хранилище при каждом изменении."""
+
+    def __init__(self, namespace, key, data=()):
+        super().__init__(data)
+        self._namespace = namespace
+        self._key = key
+
+    def _save(self):
+        self._namespace.touch(self._key, self)
+
+    def __setitem__(self, name, value):
+        super().__setitem__(name, value)
+        self._save()
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self._save()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._save()
+
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self[name] = default
+        return self[name]
+
+    def pop(self, name, *default):
+        value = super().pop(name, *default)
+        self._save()
+        return value
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class StepHandlerBackend:
+    """Хранилище next-step обработчиков telebot в таблице sessions.
+
+    Совместим с интерфейсом telebot.handler_backends.HandlerBackend; после
+    перезапуска пользователь продолжает анкету с того же шага.
+    """
+
+    def __init__(self, store, ttl):
+        self.handlers = store.namespace('next_step', ttl, codec='pickle')
+
+    def register_handler(self, handler_group_id, handler):
+        current = self._load(handler_group_id) or []
+        self.handlers[handler_group_id] = current + [handler]
+
+    def clear_handlers(self, handler_group_id):
+        self.handlers.store.delete(self.handlers.kind, str(handler_group_id))
+
+    def get_handlers(self, handler_group_id):
+        handlers = self._load(handler_group_id)
+        if handlers is not None:
+            self.handlers.pop(handler_group_id)
+        return handlers
+
+    def _load(self, handler_group_id):
+        try:
+            return self.handlers.get(handler_group_id)
+        except (AttributeError, ImportError, pickle.UnpicklingError) as e:
+            # Шаг из прошлой версии бота: функцию обработчика переименовали или удалили
+            print(f"⚠️ Сохранённый шаг диалога {handler_group_id} отброшен: {e}")
+            self.handlers.store.delete(self.handlers.kind, str(handler_group_id))
+            return None
+
+
+def _encode(value, codec):
+    if codec == 'pickle':
+        return pickle.dumps(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _decode(data, codec):
+    if codec == 'pickle':
+        return pickle.loads(data)
+    return json.loads(data)
@@ -0,0 +1,156 @@
+"""Слой хранения SQLite: WAL, отдельное соединение на поток, профили PRAGMA."""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Профили настроек. WAL позволяет читателям не блокировать писателя,
+# synchronous=NORMAL в WAL не делает fsync на каждый commit.
+PRAGMA_PROFILES = {
+    'default': {
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,        # ~16 МБ
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    # Максимальная надёжность: fsync на каждый commit
+    'durable': {
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 0,
+        'temp_store': 'MEMORY',
+    },
+    # Большой кеш и mmap для сервера с запасом памяти
+    'fast': {
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    # Минимум памяти (маленький VPS)
+    'small': {
+        'synchronous': 'NORMAL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'FILE',
+    },
+}
+
+
+class Storage:
+    """Раздаёт каждому потоку своё соединение с одной базой.
+
+    conn / cursor – прокси, которые в каждом потоке указывают на его
+    собственные соединение и курсор, поэтому старый код вида
+    cursor.execute(...); conn.commit() работает без изменений.
+    Для ':memory:' у каждого потока была бы своя база – используйте файл.
+    """
+
+    def __init__(self, path, profile='default', busy_timeout=5000, factory=sqlite3.Connection, **overrides):
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"Неизвестный профиль БД: {profile}")
+        self.path = path
+        self.profile = profile
+        self.pragmas = dict(PRAGMA_PROFILES[profile], **overrides)
+        self.busy_timeout = busy_timeout
+        self.factory = factory      # класс соединения, например с замером времени (metrics.py)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.conn = _ConnectionProxy(self)
+        self.cursor = _CursorProxy(self)
+        with self.lock:
+            first = self._open()
+            mode = first.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        self.journal_mode = mode
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, factory=self.factory)
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        self.local.conn = conn
+        self.local.cursor = conn.cursor()
+        self.local.depth = 0
+        self.connections.append(conn)
+        return conn
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            with self.lock:
+                conn = self._open()
+        return conn
+
+    def get_cursor(self):
+        self.connection()
+        return self.local.cursor
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Транзакция текущего потока. Вложенные блоки входят во внешнюю.
+
+        BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому два потока
+        не упираются в SQLITE_BUSY посреди транзакции.
+        """
+        conn = self.connection()
+        outer = self.local.depth == 0
+        if outer and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        self.local.depth += 1
+        try:
+            yield self.local.cursor
+        except BaseException:
+            self.local.depth -= 1
+            if outer:
+                conn.rollback()
+            raise
+        else:
+            self.local.depth -= 1
+            if outer:
+                conn.commit()
+
+    def in_transaction_block(self):
+        return getattr(self.local, 'depth', 0) > 0
+
+    def close(self):
+        """Закрывает соединение текущего потока."""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            with self.lock:
+                self.connections.remove(conn)
+            conn.close()
+            self.local.conn = None
+
+    def close_all(self):
+        with self.lock:
+            for conn in self.connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self.connections = []
+        self.local = threading.local()
+
+
+class _ConnectionProxy:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def commit(self):
+        # Внутри storage.transaction() фиксирует внешний блок, а не каждый оператор
+        if not self._storage.in_transaction_block():
+            self._storage.connection().commit()
+
+    def __getattr__(self, name):
+        return getattr(self._storage.connection(), name)
+
+
+class _CursorProxy:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getattr__(self, name):
+        return getattr(self._storage.get_cursor(), name)
+
+    def __iter__(self):
+        return iter(self._storage.get_cursor())
@@ -0,0 +1,186 @@
+"""Режим нескольких процессов: один принимает обновления, K воркеров их обрабатывают.
+
+Процесс приёма (polling или вебхук) не выполняет обработчики, а пересылает
+каждое обновление в JSON воркеру по id пользователя или чата (update_key),
+поэтому все обновления одного пользователя обрабатывает один процесс – по
+порядку, в одной полосе (dispatcher.py). Воркер – тот же bot.py,
+запущенный с BOT_ROLE=worker; связь – Unix-сокет multiprocessing.connection
+с ключом, который знают только процессы одного запуска. Упавший воркер
+перезапускается, и ему повторно передаются его незавершённые обновления
+(replay, см. inbox.py); общее состояние – в базе SQLite (WAL), кеши
+процессов согласуются через cluster.ChangeFeed.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from multiprocessing.connection import Client, Listener
+
+from dispatcher import update_key
+
+
+def shard_of(key, shards):
+    """Номер воркера для id. Не key % shards: внутри воркера тот же id ещё раскладывается
+    по полосам (hash(key) % lanes), и при общем делителе часть полос пустовала бы.
+    """
+    if key is None:
+        return 0
+    return zlib.crc32(str(key).encode()) % shards
+
+
+class WorkerProcess:
+    def __init__(self, index, command, path, authkey, env):
+        self.index = index
+        self.command = command
+        self.path = path
+        self.authkey = authkey
+        self.env = env
+        self.process = None
+        self.conn = None
+        self.restarts = 0
+        self.routed = 0
+        self.lock = threading.Lock()
+
+    def start(self, timeout=60):
+        """Запускает процесс и ждёт, пока он начнёт слушать сокет."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.process = subprocess.Popen(self.command, env=self.env)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.conn = Client(self.path, family='AF_UNIX', authkey=self.authkey)
+                return self
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"воркер {self.index} завершился при запуске (код {self.process.returncode})")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"воркер {self.index} не ответил за {timeout} с")
+                time.sleep(0.2)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, data):
+        self.conn.send(data)
+        self.routed += 1
+
+    def stop(self, timeout=10):
+        if self.conn is not None:
+            # Воркер видит конец соединения, дорабатывает очередь и выходит
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class Supervisor:
+    def __init__(self, script, workers, env=None, ipc_dir=None, replay=None):
+        if workers < 1:
+            raise ValueError(f"Число воркеров должно быть положительным: {workers}")
+        self.ipc_dir = ipc_dir or tempfile.mkdtemp(prefix='remont-bot-')
+        authkey = os.urandom(16)
+        self.workers = []
+        for i in range(workers):
+            path = os.path.join(self.ipc_dir, f'worker-{i}.sock')
+            worker_env = dict(env or os.environ, BOT_ROLE='worker', BOT_SHARD=str(i), BOT_WORKERS=str(workers),
+                              BOT_IPC_SOCKET=path, BOT_IPC_KEY=authkey.hex())
+            self.workers.append(WorkerProcess(i, [sys.executable, script], path, authkey, worker_env))
+        # replay(select) – незавершённые обновления для перезапущенного воркера
+        self.replay = replay
+        self.running = True
+        self.monitor = None
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+            print(f"✅ Воркер {worker.index} запущен (pid {worker.process.pid})")
+        self.monitor = threading.Thread(target=self._watch, name="supervisor", daemon=True)
+        self.monitor.start()
+        return self
+
+    def route(self, data):
+        """Пересылает обновление (dict от Bot API) воркеру его пользователя."""
+        worker = self.workers[self.shard(data)]
+        with worker.lock:
+            for attempt in range(2):
+                try:
+                    worker.send(data)
+                    return
+                except (OSError, EOFError, AttributeError) as e:
+                    if attempt or not self.running:
+                        print(f"⚠️ Обновление {data.get('update_id')} не передано воркеру {worker.index}: {e}")
+                        return
+                    self._restart(worker, e)
+                    if self.replay is not None:
+                        # data уже в inbox и ушло воркеру вместе с остальными незавершёнными
+                        return
+
+    def shard(self, data):
+        return shard_of(update_key(data), len(self.workers))
+
+    # ----- наблюдение -----
+    def alive(self):
+        return {str(w.index): int(w.alive()) for w in self.workers}
+
+    def routed(self):
+        return {str(w.index): w.routed for w in self.workers}
+
+    def restarts(self):
+        return {str(w.index): w.restarts for w in self.workers}
+
+    def close(self):
+        self.running = False
+        for worker in self.workers:
+            with worker.lock:
+                worker.stop()
+        shutil.rmtree(self.ipc_dir, ignore_errors=True)
+
+    def _restart(self, worker, reason):
+        """Вызывается под worker.lock."""
+        print(f"⚠️ Воркер {worker.index} недоступен ({reason}), перезапуск...")
+        worker.stop(timeout=5)
+        worker.restarts += 1
+        worker.start()
+        print(f"✅ Воркер {worker.index} перезапущен (pid {worker.process.pid})")
+        if self.replay is not None:
+            # Обновления, которые упавший процесс получил, но не обработал
+            for data in self.replay(lambda data: self.shard(data) == worker.index):
+                worker.send(data)
+
+    def _watch(self):
+        while self.running:
+            time.sleep(1)
+            for worker in self.workers:
+                if self.running and not worker.alive():
+                    with worker.lock:
+                        if self.running and not worker.alive():
+                            try:
+                                self._restart(worker, f"код выхода {worker.process.returncode}")
+                            except Exception as e:
+                                print(f"❌ Не удалось перезапустить воркер {worker.index}: {e}")
+
+
+def serve_worker(path, authkey, handle):
+    """Сторона воркера: принимает обновления от процесса приёма и передаёт их в handle(data).
+
+    Возвращается, когда процесс приёма закрыл соединение (остановился или упал).
+    """
+    with Listener(path, family='AF_UNIX', authkey=authkey) as listener:
+        with listener.accept() as conn:
+            while True:
+                try:
+                    data = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    handle(data)
+                except Exception as e:
+                    print(f"⚠️ Ошибка обработки обновления {data.get('update_id')}: {e}")
@@ -0,0 +1,91 @@
+"""Общие фикстуры тестов: модули из корня репозитория и bot.py на фейковом Bot API.
+
+bot.py импортируется один раз на временной базе; запросы к Telegram
+перехватываются через apihelper.CUSTOM_REQUEST_SENDER и сохраняются в
+bot_calls – по ним тесты проверяют, что и кому отправлено.
+"""
+import itertools
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self._payload = payload
+        self.status_code = 200
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture(scope='session')
+def bot_calls():
+    return []
+
+
+@pytest.fixture(scope='session')
+def bot(bot_calls, tmp_path_factory):
+    """Модуль bot.py: временная база, ADMIN_ID=1, ответы Bot API из памяти."""
+    from telebot import apihelper
+
+    message_ids = itertools.count(1000)
+
+    def sender(method, url, params=None, files=None, **kwargs):
+        name = url.rsplit('/', 1)[-1]
+        params = dict(params or {})
+        bot_calls.append((name, params))
+        if name in ('sendMessage', 'editMessageText'):
+            chat_id = str(params.get('chat_id', 0))
+            result = {'message_id': next(message_ids), 'date': 0, 'text': params.get('text', ''),
+                      'chat': {'id': int(chat_id) if chat_id.lstrip('-').isdigit() else 0, 'type': 'private'}}
+        elif name == 'getMe':
+            result = {'id': 999, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}
+        elif name == 'getUpdates':
+            result = []
+        else:
+            result = True
+        return FakeResponse({'ok': True, 'result': result})
+
+    os.environ.update(TOKEN='123:TEST', ADMIN_ID='1',
+                      DB_PATH=str(tmp_path_factory.mktemp('db') / 'remont.db'))
+    apihelper.CUSTOM_REQUEST_SENDER = sender
+    import bot as module
+    return module
+
+
+_ids = itertools.count(1)
+
+
+def make_user(uid):
+    return {'id': uid, 'is_bot': False, 'first_name': 'u', 'username': f'u{uid}'}
+
+
+@pytest.fixture
+def message():
+    """Фабрика входящих сообщений: message(uid, text)."""
+    from telebot import types
+
+    def make(uid, text):
+        return types.Message.de_json({'message_id': next(_ids), 'date': 0, 'text': text,
+                                      'chat': {'id': uid, 'type': 'private'}, 'from': make_user(uid)})
+    return make
+
+
+@pytest.fixture
+def callback():
+    """Фабрика нажатий кнопок: callback(uid, data, message_id)."""
+    from telebot import types
+
+    def make(uid, data, message_id):
+        return types.CallbackQuery.de_json({
+            'id': str(next(_ids)), 'chat_instance': 'x', 'data': data, 'from': make_user(uid),
+            'message': {'message_id': message_id, 'date': 0, 'text': 'x', 'chat': {'id': uid, 'type': 'private'},
+                        'from': {'id': 999, 'is_bot': True, 'first_name': 'bot'}}})
+    return make
@@ -0,0 +1,34 @@
+"""Число вызовов Bot API на анкету мастера (бот отдельным процессом на bench/fake_api.py)."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+import loadtest
+from fake_api import FakeTelegram
+
+# До анкеты в одном сообщении (по шагу на сообщение): 43 вызова, из них sendMessage 19
+BEFORE_CALLS, BEFORE_SENT = 43, 19
+
+
+@pytest.fixture
+def api(tmp_path):
+    api = FakeTelegram().start()
+    proc, log = loadtest.start_bot(api, str(tmp_path), loadtest.free_port())
+    yield api
+    proc.terminate()
+    proc.wait(10)
+    log.close()
+    api.shutdown()
+
+
+def test_master_registration_calls(api):
+    run = loadtest.Run('master_registration', api)
+    loadtest.master_registration(loadtest.User(api, loadtest.USER_BASE, 0, 15).join(run))
+    run.finish()
+    # Каждое нажатие – answerCallbackQuery, каждый шаг – правка сообщения анкеты
+    assert run.methods['answerCallbackQuery'] == 15
+    assert run.methods['sendMessage'] <= 3 < BEFORE_SENT
+    assert run.calls <= 35 < BEFORE_CALLS
@@ -0,0 +1,121 @@
+"""Аренда ведущего и журнал изменений между процессами (общая база SQLite)."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from cluster import ChangeFeed, Lease, SCHEMA
+from storage import Storage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'cluster.db')
+    storage = Storage(path)
+    with storage.transaction() as cur:
+        for sql in SCHEMA:
+            cur.execute(sql)
+    storage.close_all()
+    return path
+
+
+def test_lease_held_by_one(path):
+    first = Lease(Storage(path), 'leader', holder='a', ttl=5)
+    second = Lease(Storage(path), 'leader', holder='b', ttl=5)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.held() and not second.held()
+    # Продление своей аренды
+    assert first.try_acquire()
+    assert second.current()[0] == 'a'
+
+
+def test_lease_taken_over_after_expiry(path):
+    first = Lease(Storage(path), 'leader', holder='a', ttl=0.2)
+    second = Lease(Storage(path), 'leader', holder='b', ttl=5)
+    assert first.try_acquire()
+    time.sleep(0.3)
+    assert not first.held()
+    assert second.try_acquire()
+    assert second.current()[0] == 'b'
+    assert not first.try_acquire()
+
+
+def test_lease_release_hands_over(path):
+    first = Lease(Storage(path), 'leader', holder='a', ttl=5)
+    second = Lease(Storage(path), 'leader', holder='b', ttl=5)
+    first.try_acquire()
+    first.release()
+    assert not first.held()
+    assert second.try_acquire()
+
+
+def test_keep_reports_lost_lease(path):
+    lease = Lease(Storage(path), 'leader', holder='a', ttl=0.3)
+    assert lease.try_acquire()
+    lost = threading.Event()
+    lease.keep(lost.set)
+    time.sleep(0.2)
+    assert not lost.is_set()
+    # Другой процесс забрал аренду (например, эта считалась зависшей)
+    other = Storage(path)
+    with other.transaction() as cur:
+        cur.execute("UPDATE leases SET holder = 'b', expires_at = ? WHERE name = 'leader'", (time.time() + 60,))
+    assert lost.wait(2)
+
+
+def test_change_feed_skips_own_changes(path):
+    storage = Storage(path)
+    feed = ChangeFeed(storage, origin='a')
+    seen = []
+    feed.subscribe('master', seen.append)
+    feed.publish('master', 1)
+    assert feed.apply() == 0
+    assert seen == []
+
+
+def test_change_feed_ignores_rolled_back_change(path):
+    publisher = ChangeFeed(Storage(path), origin='a')
+    reader = ChangeFeed(Storage(path), origin='b')
+    seen = []
+    reader.subscribe('master', seen.append)
+    with pytest.raises(RuntimeError):
+        with publisher.storage.transaction():
+            publisher.publish('master', 1)
+            raise RuntimeError()
+    publisher.publish('master', 2)
+    assert reader.apply() == 1
+    assert seen == [2]
+
+
+def test_change_in_other_process_refreshes_bot_caches(bot):
+    """Мастера меняет другой процесс: после apply() у бота новый индекс подбора и нет старой карточки."""
+    with bot.storage.transaction():
+        bot.cursor.execute('''INSERT INTO masters (user_id, name, service, districts, status, verification_type)
+                              VALUES (77001, 'Мастер', 'Сантехник', 'Центр', 'активен', 'full')''')
+        master_id = bot.cursor.lastrowid
+    bot.sync_master(master_id)
+    bot.master_cards.get(master_id, 'full', lambda: ("старая карточка", None))
+    assert bot.match_index.codes_of(master_id) == ({'plumber'}, {'center'})
+
+    script = f'''
+import sys
+sys.path.insert(0, {ROOT!r})
+from cluster import ChangeFeed
+from storage import Storage
+storage = Storage({bot.DB_PATH!r})
+feed = ChangeFeed(storage)
+with storage.transaction() as cur:
+    cur.execute("UPDATE master_districts SET code = 'sneg' WHERE master_id = ?", ({master_id},))
+    feed.publish('master', {master_id})
+'''
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=30)
+
+    assert bot.changes.apply() >= 1
+    assert bot.match_index.codes_of(master_id) == ({'plumber'}, {'sneg'})
+    assert bot.master_cards.get(master_id, 'full', lambda: ("новая карточка", None))[0] == "новая карточка"
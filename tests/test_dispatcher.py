@@ -0,0 +1,121 @@
+"""Полосы обновлений: порядок внутри пользователя, параллельность между пользователями."""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from dispatcher import LaneDispatcher, lane_key, update_key
+
+
+def message(chat_id):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), from_user=SimpleNamespace(id=chat_id))
+
+
+def other_lane_key(dispatcher, key):
+    return next(k for k in range(key + 1, key + 100) if dispatcher.lane_of(k) != dispatcher.lane_of(key))
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = LaneDispatcher(SimpleNamespace(exception_handler=None), lanes=4)
+    yield dispatcher
+    dispatcher.close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("не дождались")
+        time.sleep(0.01)
+
+
+def test_lane_key():
+    assert lane_key(message(5)) == 5
+    assert lane_key(SimpleNamespace(chat=None, from_user=SimpleNamespace(id=6))) == 6
+    assert update_key({'update_id': 1, 'message': {'chat': {'id': 7}, 'from': {'id': 8}}}) == 7
+    assert update_key({'update_id': 1, 'callback_query': {'from': {'id': 9}}}) == 9
+
+
+def test_same_user_in_order(dispatcher):
+    done = []
+
+    def task(update, n):
+        # Первые задачи медленнее последующих: порядок держит полоса, а не время
+        time.sleep(0.02 * (5 - n))
+        done.append(n)
+    for n in range(5):
+        dispatcher.put(task, message(10), n)
+    wait_for(lambda: len(done) == 5)
+    assert done == [0, 1, 2, 3, 4]
+
+
+def test_slow_user_does_not_block_others(dispatcher):
+    release = threading.Event()
+    done = []
+
+    def slow(update):
+        release.wait(5)
+        done.append('slow')
+
+    def fast(update):
+        done.append('fast')
+    dispatcher.put(slow, message(10))
+    dispatcher.put(fast, message(other_lane_key(dispatcher, 10)))
+    wait_for(lambda: done == ['fast'])
+    release.set()
+    wait_for(lambda: done == ['fast', 'slow'])
+
+
+def test_same_lane_task_runs_inline(dispatcher):
+    """Обработчик, поставленный из обновления той же полосы, выполняется сразу, внутри него."""
+    done = []
+
+    def handler(update):
+        done.append('handler')
+
+    def process_update(update):
+        done.append('update')
+        dispatcher.put(handler, update)
+        done.append('update done')
+    dispatcher.put(process_update, message(10))
+    wait_for(lambda: len(done) == 3)
+    assert done == ['update', 'handler', 'update done']
+
+
+def test_other_lane_task_is_queued(dispatcher):
+    done = []
+    other = other_lane_key(dispatcher, 10)
+
+    def handler(update):
+        done.append(('handler', threading.current_thread().name))
+
+    def process_update(update):
+        dispatcher.put(handler, message(other))
+        done.append(('update', threading.current_thread().name))
+    dispatcher.put(process_update, message(10))
+    wait_for(lambda: len(done) == 2)
+    names = dict(done)
+    assert names['handler'] == f"lane-{dispatcher.lane_of(other)}"
+    assert names['update'] == f"lane-{dispatcher.lane_of(10)}"
+
+
+def test_exception_keeps_lane_running(dispatcher, capsys):
+    done = []
+
+    def broken(update):
+        raise RuntimeError("сбой")
+    dispatcher.put(broken, message(10))
+    dispatcher.put(lambda update: done.append('next'), message(10))
+    wait_for(lambda: done == ['next'])
+    assert "сбой" in capsys.readouterr().out
+
+
+def test_close_drains_queued_tasks():
+    dispatcher = LaneDispatcher(SimpleNamespace(exception_handler=None), lanes=2)
+    done = []
+    for n in range(20):
+        dispatcher.put(lambda update, n=n: done.append(n), message(10))
+    dispatcher.close()
+    assert done == list(range(20))
@@ -0,0 +1,133 @@
+"""Защита от повторных нажатий: ключ по кнопке, освобождение ключа после NOOP."""
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from idempotency import CallbackGuard, NOOP, SCHEMA
+from storage import Storage
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = Storage(str(tmp_path / 'guard.db'))
+    with storage.transaction() as cur:
+        cur.execute('CREATE TABLE writes (req_id INTEGER, master_id INTEGER)')
+        for sql in SCHEMA:
+            cur.execute(sql)
+    return storage
+
+
+@pytest.fixture
+def guard(storage):
+    guard = CallbackGuard(storage)
+    guard.repeated = []
+    guard.on_repeat = guard.repeated.append
+    return guard
+
+
+def tap(message_id=500, chat_id=7):
+    return SimpleNamespace(id=str(next(_ids)), inline_message_id=None,
+                           message=SimpleNamespace(message_id=message_id, chat=SimpleNamespace(id=chat_id)))
+
+
+def accept_handler(guard, storage, calls, write=lambda req_id, master_id: True):
+    @guard.once('accept_response')
+    def accept(call, req_id, master_id):
+        calls.append((req_id, master_id))
+        if not write(req_id, master_id):
+            return NOOP
+        with storage.transaction() as cur:
+            cur.execute('INSERT INTO writes VALUES (?, ?)', (req_id, master_id))
+    return accept
+
+
+def test_repeat_tap_is_blocked(guard, storage):
+    calls = []
+    accept = accept_handler(guard, storage, calls)
+    accept(tap(), req_id=1, master_id=10)
+    accept(tap(), req_id=1, master_id=10)
+    assert calls == [(1, 10)]
+    assert len(guard.repeated) == 1
+
+
+def test_different_buttons_on_one_message(guard, storage):
+    calls = []
+    accept = accept_handler(guard, storage, calls)
+    accept(tap(), req_id=1, master_id=10)
+    accept(tap(), req_id=2, master_id=20)
+    assert calls == [(1, 10), (2, 20)]
+    assert guard.repeated == []
+
+
+def test_noop_tap_releases_key(guard, storage):
+    calls = []
+    ready = []
+    accept = accept_handler(guard, storage, calls, write=lambda req_id, master_id: bool(ready))
+    accept(tap(), req_id=1, master_id=10)
+    ready.append(True)
+    accept(tap(), req_id=1, master_id=10)
+    accept(tap(), req_id=1, master_id=10)
+    assert calls == [(1, 10), (1, 10)]
+    assert storage.get_cursor().execute('SELECT COUNT(*) FROM writes').fetchone()[0] == 1
+    assert len(guard.repeated) == 1
+
+
+def test_noop_with_incidental_write_releases_key(guard, storage):
+    """Служебная запись (сессия, last_active) не делает отказ выполненным."""
+    calls = []
+
+    @guard.once('confirm_req')
+    def confirm(call, user_id):
+        calls.append(user_id)
+        with storage.transaction() as cur:
+            cur.execute('INSERT INTO writes VALUES (0, 0)')
+        if len(calls) == 1:
+            return NOOP
+
+    confirm(tap(), user_id=1)
+    confirm(tap(), user_id=1)
+    confirm(tap(), user_id=1)
+    assert calls == [1, 1]
+    assert len(guard.repeated) == 1
+
+
+def test_effect_without_db_write_is_done(guard):
+    """Обработчик, чей результат – только вызов API, второй раз не выполняется."""
+    sent = []
+
+    @guard.once('send_contacts')
+    def send_contacts(call, master_id):
+        sent.append(master_id)
+
+    send_contacts(tap(), master_id=10)
+    send_contacts(tap(), master_id=10)
+    assert sent == [10]
+    assert len(guard.repeated) == 1
+
+
+def test_by_limits_key_to_named_args(guard, storage):
+    calls = []
+
+    @guard.once('review_rate', by=('master_id',))
+    def rate(call, rating, master_id):
+        calls.append(rating)
+        with storage.transaction() as cur:
+            cur.execute('INSERT INTO writes VALUES (?, ?)', (rating, master_id))
+
+    rate(tap(), rating=5, master_id=10)
+    rate(tap(), rating=3, master_id=10)
+    assert calls == [5]
+
+
+def test_confirm_after_missing_data(bot, callback):
+    """«Данные не найдены» не занимает кнопку: после повторного заполнения подтверждение проходит."""
+    user_id, anchor = 9001, 9002
+    bot.confirm_request(callback(user_id, f'confirm_req_{user_id}', anchor), user_id=user_id)
+    bot.bot.request_data[user_id] = {'service': 'plumber', 'description': 'кран', 'district': 'center',
+                                 'date': 'завтра', 'budget': '1000', 'type': 'private'}
+    bot.confirm_request(callback(user_id, f'confirm_req_{user_id}', anchor), user_id=user_id)
+    bot.cursor.execute('SELECT COUNT(*) FROM requests WHERE user_id = ?', (user_id,))
+    assert bot.cursor.fetchone()[0] == 1
@@ -0,0 +1,71 @@
+"""Inbox: повторная доставка, сброс счётчика update_id в Telegram."""
+import pytest
+from telebot import apihelper
+
+from inbox import Inbox, SCHEMA, DONE
+from storage import Storage
+
+
+class StopPolling(BaseException):
+    pass
+
+
+@pytest.fixture
+def inbox(tmp_path):
+    storage = Storage(str(tmp_path / 'inbox.db'))
+    with storage.transaction() as cur:
+        for sql in SCHEMA:
+            cur.execute(sql)
+    return Inbox(storage)
+
+
+def update(update_id, text='привет'):
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                                'chat': {'id': 7, 'type': 'private'}}}
+
+
+def poll(inbox, monkeypatch, responses):
+    """Прогоняет poll по заготовленным ответам getUpdates; возвращает (offset запросов, обработанные id)."""
+    offsets, handled = [], []
+    responses = iter(responses)
+
+    def get_updates(token, offset=None, **kwargs):
+        offsets.append(offset)
+        try:
+            return next(responses)
+        except StopIteration:
+            raise StopPolling()
+    monkeypatch.setattr(apihelper, 'get_updates', get_updates)
+    with pytest.raises(StopPolling):
+        inbox.poll('token', lambda data: handled.append(data['update_id']))
+    return offsets, handled
+
+
+def test_redelivery_is_ignored(inbox):
+    assert inbox.accept([update(1), update(2)]) == [update(1), update(2)]
+    assert inbox.accept([update(2), update(3)]) == [update(3)]
+
+
+def test_poll_after_update_id_reset(inbox, monkeypatch):
+    for data in inbox.accept([update(1000), update(1001)]):
+        inbox.done(data['update_id'])
+    # Неделя без обновлений: Telegram начинает счёт с меньшего id
+    offsets, handled = poll(inbox, monkeypatch, [[], [update(5)], [update(6)], []])
+    assert handled == [5, 6]
+    assert offsets == [None, None, 6, 7, None]
+
+
+def test_reused_update_id_with_new_content(inbox):
+    inbox.accept([update(5, 'старое')])
+    inbox.done(5)
+    assert inbox.accept([update(5, 'новое')]) == [update(5, 'новое')]
+    assert inbox.unfinished() == [update(5, 'новое')]
+
+
+def test_purge_removes_old_done_updates(inbox):
+    inbox.accept([update(1), update(2)])
+    inbox.done(1)
+    inbox.done(2)
+    inbox.storage.connection().execute('UPDATE inbox SET received_at = 0')
+    assert inbox.purge() == 2
+    assert inbox.stats()[DONE] == 0
@@ -0,0 +1,106 @@
+"""Уведомления из outbox ставятся в одной транзакции с изменениями обработчика."""
+import itertools
+
+import pytest
+
+from outbox import Outbox, SCHEMA
+from storage import Storage
+
+_ids = itertools.count(100)
+
+
+class SendFailed(Exception):
+    pass
+
+
+@pytest.fixture
+def failing_send(bot, monkeypatch):
+    """outbox.send, который успевает записать строку в outbox и падает."""
+    real = bot.outbox.send
+
+    def send(chat_id, text, **options):
+        real(chat_id, text, **options)
+        raise SendFailed()
+    monkeypatch.setattr(bot.outbox, 'send', send)
+
+
+def count(bot, sql, *params):
+    bot.cursor.execute(sql, params)
+    return bot.cursor.fetchone()[0]
+
+
+def outbox_rows(bot, chat_id):
+    return count(bot, 'SELECT COUNT(*) FROM outbox WHERE chat_id = ?', str(chat_id))
+
+
+def add_request_and_master(bot, with_response=False):
+    """Заявка клиента и мастер; with_response – с откликом мастера в статусе pending."""
+    client_id, master_user_id = next(_ids), next(_ids)
+    with bot.storage.transaction():
+        bot.cursor.execute('''INSERT INTO requests (user_id, username, service, description, district, status, created_at)
+                              VALUES (?, 'client', 'plumber', 'кран', 'center', 'активна', ?)''',
+                           (client_id, bot.utc_now()))
+        req_id = bot.cursor.lastrowid
+        bot.cursor.execute('''INSERT INTO masters (user_id, name, service, phone, districts, status, preferred_contact)
+                              VALUES (?, 'Мастер', 'plumber', '+7', 'center', 'активен', 'telegram')''',
+                           (master_user_id,))
+        master_id = bot.cursor.lastrowid
+        if with_response:
+            bot.cursor.execute('''INSERT INTO responses (request_id, master_id, comment, status, created_at)
+                                  VALUES (?, ?, 'готов', 'pending', ?)''', (req_id, master_id, bot.utc_now()))
+    return client_id, master_user_id, req_id, master_id
+
+
+def test_send_rolls_back_with_transaction(tmp_path):
+    storage = Storage(str(tmp_path / 'outbox.db'))
+    with storage.transaction() as cur:
+        cur.execute('CREATE TABLE items (id INTEGER PRIMARY KEY)')
+        for sql in SCHEMA:
+            cur.execute(sql)
+    outbox = Outbox(storage, bot=None)
+    with pytest.raises(SendFailed):
+        with storage.transaction() as cur:
+            cur.execute('INSERT INTO items (id) VALUES (1)')
+            outbox.send(42, 'первое')
+            raise SendFailed()
+    cur = storage.get_cursor()
+    assert cur.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+    assert cur.execute('SELECT COUNT(*) FROM outbox').fetchone()[0] == 0
+
+
+def test_response_rolled_back_with_notification(bot, failing_send, message):
+    client_id, master_user_id, req_id, master_id = add_request_and_master(bot)
+    with pytest.raises(SendFailed):
+        bot.process_response(message(master_user_id, 'Сделаю завтра'), req_id, master_id)
+    assert count(bot, 'SELECT COUNT(*) FROM responses WHERE request_id = ?', req_id) == 0
+    assert outbox_rows(bot, client_id) == 0
+
+
+def test_accept_rolled_back_with_notification(bot, failing_send, callback):
+    client_id, master_user_id, req_id, master_id = add_request_and_master(bot, with_response=True)
+    call = callback(client_id, f'accept_response_{req_id}_{master_id}', next(_ids))
+    with pytest.raises(SendFailed):
+        bot.accept_response_callback(call, req_id=req_id, master_id=master_id)
+    assert count(bot, 'SELECT COUNT(*) FROM responses WHERE request_id = ? AND status = ?', req_id, 'pending') == 1
+    assert count(bot, 'SELECT COUNT(*) FROM requests WHERE id = ? AND status = ?', req_id, 'активна') == 1
+    assert outbox_rows(bot, master_user_id) == 0
+
+
+def test_reject_rolled_back_with_notification(bot, failing_send, callback):
+    client_id, master_user_id, req_id, master_id = add_request_and_master(bot, with_response=True)
+    call = callback(client_id, f'reject_response_{req_id}_{master_id}', next(_ids))
+    with pytest.raises(SendFailed):
+        bot.reject_response_callback(call, req_id=req_id, master_id=master_id)
+    assert count(bot, 'SELECT COUNT(*) FROM responses WHERE request_id = ? AND status = ?', req_id, 'pending') == 1
+    assert outbox_rows(bot, master_user_id) == 0
+
+
+def test_application_rolled_back_with_admin_notification(bot, failing_send, message):
+    user_id = next(_ids)
+    data = {'name': 'Иван', 'phone': '+7', 'districts': 'center', 'price_min': '1000', 'experience': '5 лет',
+            'services': 'plumber', 'verification_type': 'full', 'documents_verified': 'pending'}
+    before = outbox_rows(bot, bot.ADMIN_ID)
+    with pytest.raises(SendFailed):
+        bot.save_master_application(message(user_id, 'x'), user_id, data, mode='moderate')
+    assert count(bot, 'SELECT COUNT(*) FROM master_applications WHERE user_id = ?', user_id) == 0
+    assert outbox_rows(bot, bot.ADMIN_ID) == before
@@ -0,0 +1,163 @@
+"""Списки по ключу (keyset) в одном сообщении: листание вперёд и назад, обновление страницы."""
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from paginator import Paginator, PageView
+from router import CallbackRouter
+from storage import Storage
+
+_ids = itertools.count(1)
+
+
+class RecordingBot:
+    def __init__(self):
+        self.screen = None      # (текст, разметка) последнего показа
+        self.answers = []
+
+    def send_message(self, chat_id, text, reply_markup=None):
+        self.screen = (text, reply_markup)
+        return SimpleNamespace(message_id=next(_ids))
+
+    def edit_message_text(self, text, chat_id, message_id, reply_markup=None):
+        self.screen = (text, reply_markup)
+
+    def answer_callback_query(self, callback_id, text=None):
+        self.answers.append(text)
+
+    def buttons(self):
+        markup = self.screen[1]
+        return {b.text: b.callback_data for row in (markup.keyboard if markup else []) for b in row}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = Storage(str(tmp_path / 'pages.db'))
+    with storage.transaction() as cur:
+        cur.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, owner INTEGER, created_at TEXT)')
+        # Одинаковые created_at у соседних строк: порядок и граница страницы – по (created_at, id)
+        cur.executemany('INSERT INTO items (id, owner, created_at) VALUES (?, ?, ?)',
+                        [(i, 7, f'2025-01-{i // 3 + 1:02d}') for i in range(1, 13)])
+    return storage
+
+
+@pytest.fixture
+def bot():
+    return RecordingBot()
+
+
+@pytest.fixture
+def router():
+    return CallbackRouter()
+
+
+@pytest.fixture
+def paginator(bot, router, storage):
+    paginator = Paginator(bot, router, storage.get_cursor())
+    paginator.register(PageView(
+        'items', 'SELECT x.id, x.created_at FROM items x', 'items', alias='x',
+        scope=lambda user_id, arg: ('x.owner = ?', (user_id,)) if user_id == 7 else None,
+        render=lambda rows, user_id, arg: (' '.join(str(r[0]) for r in rows), []),
+        keys=('created_at', 'id'), size=5, empty="Пусто"))
+    return paginator
+
+
+def tap(bot, router, label, user_id=7):
+    call = SimpleNamespace(id=str(next(_ids)), data=bot.buttons()[label], from_user=SimpleNamespace(id=user_id),
+                           message=SimpleNamespace(chat=SimpleNamespace(id=user_id), message_id=1,
+                                                   reply_markup=bot.screen[1]))
+    assert router.dispatch(call)
+    return call
+
+
+def page(bot):
+    return [int(i) for i in bot.screen[0].split()]
+
+
+def test_pages_forward_and_back(bot, router, paginator):
+    paginator.send(7, 7, 'items')
+    assert page(bot) == [12, 11, 10, 9, 8]
+    assert set(bot.buttons()) == {"🔄", "▶️"}
+    tap(bot, router, "▶️")
+    assert page(bot) == [7, 6, 5, 4, 3]
+    tap(bot, router, "▶️")
+    assert page(bot) == [2, 1]
+    assert set(bot.buttons()) == {"◀️", "🔄"}
+    tap(bot, router, "◀️")
+    assert page(bot) == [7, 6, 5, 4, 3]
+    tap(bot, router, "◀️")
+    assert page(bot) == [12, 11, 10, 9, 8]
+    assert "◀️" not in bot.buttons()
+
+
+def test_refresh_keeps_page(bot, router, storage, paginator):
+    """Первую строку страницы обработали и удалили: 🔄 остаётся на той же странице."""
+    paginator.send(7, 7, 'items')
+    tap(bot, router, "▶️")
+    with storage.transaction() as cur:
+        cur.execute('DELETE FROM items WHERE id = 7')
+    call = tap(bot, router, "🔄")
+    assert page(bot) == [6, 5, 4, 3, 2]
+    assert paginator.refresh(call)
+    assert page(bot) == [6, 5, 4, 3, 2]
+
+
+def test_next_after_anchor_deleted(bot, router, storage, paginator):
+    paginator.send(7, 7, 'items')
+    with storage.transaction() as cur:
+        cur.execute('DELETE FROM items WHERE id = 8')
+    tap(bot, router, "▶️")
+    assert page(bot) == [7, 6, 5, 4, 3]
+
+
+def test_prev_after_anchor_deleted(bot, router, storage, paginator):
+    paginator.send(7, 7, 'items')
+    tap(bot, router, "▶️")
+    with storage.transaction() as cur:
+        cur.execute('DELETE FROM items WHERE id = 7')
+    tap(bot, router, "◀️")
+    assert page(bot) == [12, 11, 10, 9, 8]
+
+
+def test_ascending_list(bot, router, storage, paginator):
+    paginator.register(PageView(
+        'old', 'SELECT id, created_at FROM items', 'items',
+        scope=lambda user_id, arg: ('owner = ?', (user_id,)),
+        render=lambda rows, user_id, arg: (' '.join(str(r[0]) for r in rows), []),
+        keys=('created_at', 'id'), descending=False, size=5))
+    paginator.send(7, 7, 'old')
+    assert page(bot) == [1, 2, 3, 4, 5]
+    with storage.transaction() as cur:
+        cur.execute('DELETE FROM items WHERE id = 5')
+    tap(bot, router, "▶️")
+    assert page(bot) == [6, 7, 8, 9, 10]
+    with storage.transaction() as cur:
+        cur.execute('DELETE FROM items WHERE id = 6')
+    tap(bot, router, "🔄")
+    assert page(bot) == [7, 8, 9, 10, 11]
+    tap(bot, router, "◀️")
+    assert page(bot) == [1, 2, 3, 4]
+
+
+def test_emptied_page_shows_start(bot, router, storage, paginator):
+    paginator.send(7, 7, 'items')
+    tap(bot, router, "▶️")
+    tap(bot, router, "▶️")
+    with storage.transaction() as cur:
+        cur.execute('DELETE FROM items WHERE id <= 2')
+    tap(bot, router, "🔄")
+    assert page(bot) == [12, 11, 10, 9, 8]
+
+
+def test_no_access(bot, router, paginator):
+    paginator.send(7, 7, 'items')
+    tap(bot, router, "▶️", user_id=8)
+    assert bot.answers[-1] == "❌ Список недоступен"
+
+
+def test_empty_list(bot, storage, paginator):
+    with storage.transaction() as cur:
+        cur.execute('DELETE FROM items')
+    paginator.send(7, 7, 'items')
+    assert bot.screen == ("Пусто", None)
@@ -0,0 +1,158 @@
+"""Планы запросов: каждый SQL из bot.py и queries.py с условием WHERE идёт по индексу.
+
+Строки SQL берутся из исходников (ast): аргументы cursor.execute / executemany
+и списки PageView. На временной базе со схемой из migrations.py и тестовыми
+данными выполняется EXPLAIN QUERY PLAN; полный проход таблицы (SCAN) в
+запросе с условием WHERE – ошибка, если запрос не внесён в ALLOWED_SCANS.
+Подробно: python -m pytest tests/test_query_plans.py -v
+"""
+import ast
+import os
+import re
+import sqlite3
+
+import pytest
+
+from migrations import migrations
+from paginator import PageView, NEXT
+from storage import Storage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = ('bot.py', 'queries.py')
+
+# Фрагмент SQL -> почему полный проход допустим (редкие служебные запросы)
+ALLOWED_SCANS = {}
+
+_PARAMS = re.compile(r'uses (\d+), and there are')
+
+
+def sql_literal(node):
+    """Текст SQL из строки или f-строки (подстановки заменяются на '?'), иначе None."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            else:
+                parts.append('?')
+        return ''.join(parts)
+    return None
+
+
+def scope_where(node, functions):
+    """Условие WHERE из scope=... в PageView (admin_scope(..., '...'), lambda или функция)."""
+    if isinstance(node, ast.Call) and node.args:
+        return sql_literal(node.args[-1])
+    if isinstance(node, ast.Lambda) and isinstance(node.body, ast.Tuple):
+        return sql_literal(node.body.elts[0])
+    if isinstance(node, ast.Name) and node.id in functions:
+        returns = [n for n in ast.walk(functions[node.id])
+                   if isinstance(n, ast.Return) and isinstance(n.value, ast.Tuple)]
+        if returns:
+            # Основная ветка – последний return в функции
+            return sql_literal(max(returns, key=lambda n: n.lineno).value.elts[0])
+    return None
+
+
+def page_view_queries(call, functions):
+    """SQL первой и следующей страницы списка PageView(...)."""
+    args = [sql_literal(a) if isinstance(a, (ast.Constant, ast.JoinedStr)) else None for a in call.args[:3]]
+    kwargs = {k.arg: k.value for k in call.keywords}
+    where = scope_where(kwargs.get('scope'), functions)
+    if None in args or where is None:
+        return []
+    options = {}
+    for name in ('keys', 'alias', 'descending'):
+        if name in kwargs:
+            options[name] = ast.literal_eval(kwargs[name])
+    view = PageView(args[0], args[1], args[2], None, None, **options)
+    return [view.query(where, ())[0], view.query(where, (), NEXT, 0)[0]]
+
+
+def extract(path):
+    """[(строка, SQL)] для всех запросов файла."""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    functions = {n.name: n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef)}
+    found = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr in ('execute', 'executemany'):
+            sql = sql_literal(node.args[0])
+            if sql and sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH'):
+                found.append((node.lineno, sql))
+        elif isinstance(func, ast.Name) and func.id == 'PageView':
+            found += [(node.lineno, sql) for sql in page_view_queries(node, functions)]
+    return sorted(found)
+
+
+def seed(cur, rows=200):
+    """Немного данных во всех основных таблицах."""
+    cur.executemany('INSERT INTO users (user_id, role, first_seen, last_active) VALUES (?, ?, ?, ?)',
+                    [(i, 'client', '2025-01-01 00:00:00', '2025-01-01 00:00:00') for i in range(rows)])
+    cur.executemany('''INSERT INTO masters (user_id, name, service, districts, status, created_at)
+                       VALUES (?, ?, 'Сантехник', 'Центр', 'активен', '2025-01-01 00:00:00')''',
+                    [(i, f'm{i}') for i in range(rows)])
+    cur.executemany('''INSERT INTO requests (user_id, service, district, status, is_public, created_at)
+                       VALUES (?, 'Сантехник', 'Центр', 'активна', 1, '2025-01-01 00:00:00')''',
+                    [(i % 50,) for i in range(rows)])
+    cur.executemany('''INSERT INTO responses (request_id, master_id, status, created_at)
+                       VALUES (?, ?, 'pending', '2025-01-01 00:00:00')''',
+                    [(i % 100, i) for i in range(rows)])
+    cur.executemany('''INSERT INTO reviews (master_id, user_id, rating, status, created_at)
+                       VALUES (?, ?, 5, 'approved', '2025-01-01 00:00:00')''',
+                    [(i % 100, i) for i in range(rows)])
+    cur.executemany('''INSERT INTO master_applications (user_id, name, status, created_at)
+                       VALUES (?, ?, 'На проверке', '2025-01-01 00:00:00')''',
+                    [(i, f'a{i}') for i in range(rows)])
+
+
+def explain(conn, sql):
+    """Строки плана; параметры подставляются как NULL."""
+    count = 0
+    while True:
+        try:
+            return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, [None] * count)]
+        except sqlite3.ProgrammingError as e:
+            m = _PARAMS.search(str(e))
+            if not m or count:
+                raise
+            count = int(m.group(1))
+
+
+def full_scans(plan):
+    # 'SCAN t USING COVERING INDEX' – тоже проход по всей таблице; CONSTANT ROW – не таблица
+    return [step for step in plan if step.startswith('SCAN ') and 'CONSTANT ROW' not in step]
+
+
+QUERIES = [(f"{name}:{lineno}", sql) for name in SOURCES for lineno, sql in extract(os.path.join(ROOT, name))]
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    storage = Storage(str(tmp_path_factory.mktemp('plans') / 'plans.db'))
+    migrations.apply(storage)
+    with storage.transaction() as cur:
+        seed(cur)
+    yield storage.connection()
+    storage.close_all()
+
+
+def test_queries_found():
+    assert len(QUERIES) > 50
+
+
+@pytest.mark.parametrize('sql', [sql for _, sql in QUERIES], ids=[where for where, _ in QUERIES])
+def test_query_uses_index(conn, sql):
+    flat = ' '.join(sql.split())
+    try:
+        plan = explain(conn, sql)
+    except sqlite3.Error as e:
+        pytest.skip(f"не разобран ({e})")
+    if ' WHERE ' not in f" {flat.upper()} " or any(fragment in flat for fragment in ALLOWED_SCANS):
+        return
+    assert not full_scans(plan), f"{flat}\n    {' | '.join(plan)}"
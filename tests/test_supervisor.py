@@ -0,0 +1,99 @@
+"""Supervisor: раскладка обновлений по воркерам и повтор незавершённых после падения воркера."""
+import os
+import time
+
+import pytest
+
+from supervisor import Supervisor, shard_of
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Воркер вместо bot.py: записывает «pid update_id» каждого полученного обновления
+WORKER = f'''
+import os
+import sys
+sys.path.insert(0, {ROOT!r})
+from supervisor import serve_worker
+
+log = os.path.join(os.environ['WORKER_LOG'], 'worker-' + os.environ['BOT_SHARD'])
+
+def handle(data):
+    with open(log, 'a') as f:
+        f.write(f"{{os.getpid()}} {{data['update_id']}}\\n")
+
+serve_worker(os.environ['BOT_IPC_SOCKET'], bytes.fromhex(os.environ['BOT_IPC_KEY']), handle)
+'''
+
+
+def update(update_id, user_id):
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': 'x',
+                                                'chat': {'id': user_id, 'type': 'private'}}}
+
+
+def user_of_shard(shard, shards, start=1000):
+    return next(user for user in range(start, start + 1000) if shard_of(user, shards) == shard)
+
+
+def received(tmp_path, shard):
+    """[(pid, update_id)] воркера shard."""
+    path = tmp_path / f'worker-{shard}'
+    if not path.exists():
+        return []
+    return [tuple(map(int, line.split())) for line in path.read_text().splitlines()]
+
+
+def wait_for(condition, timeout=15):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("не дождались")
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def pending():
+    """Незавершённые обновления (вместо inbox.unfinished)."""
+    return []
+
+
+@pytest.fixture
+def supervisor(tmp_path, pending):
+    script = tmp_path / 'worker.py'
+    script.write_text(WORKER)
+    supervisor = Supervisor(str(script), 2, env=dict(os.environ, WORKER_LOG=str(tmp_path)),
+                            replay=lambda select: [data for data in pending if select(data)])
+    yield supervisor.start()
+    supervisor.close()
+
+
+def test_shard_of():
+    assert shard_of(None, 4) == 0
+    assert all(shard_of(user, 4) == shard_of(user, 4) for user in range(100))
+    assert {shard_of(user, 4) for user in range(100)} == {0, 1, 2, 3}
+
+
+def test_updates_of_one_user_go_to_one_worker(tmp_path, supervisor):
+    first, second = user_of_shard(0, 2), user_of_shard(1, 2)
+    for n in range(1, 7):
+        supervisor.route(update(n, first if n % 2 else second))
+    wait_for(lambda: len(received(tmp_path, 0)) + len(received(tmp_path, 1)) == 6)
+    assert [u for _, u in received(tmp_path, 0)] == [1, 3, 5]
+    assert [u for _, u in received(tmp_path, 1)] == [2, 4, 6]
+    assert supervisor.routed() == {'0': 3, '1': 3}
+
+
+def test_restarted_worker_gets_unfinished_updates(tmp_path, supervisor, pending):
+    first, second = user_of_shard(0, 2), user_of_shard(1, 2)
+    supervisor.route(update(1, first))
+    wait_for(lambda: received(tmp_path, 0))
+    old_pid = supervisor.workers[0].process.pid
+    # Воркер получил обновления 2 и 3, но упал, не обработав их; 4 – чужого воркера
+    pending.extend([update(2, first), update(3, first), update(4, second)])
+    supervisor.workers[0].process.kill()
+    wait_for(lambda: supervisor.restarts()['0'] == 1)
+    wait_for(lambda: len(received(tmp_path, 0)) == 3)
+    new_pid = supervisor.workers[0].process.pid
+    assert new_pid != old_pid
+    assert received(tmp_path, 0) == [(old_pid, 1), (new_pid, 2), (new_pid, 3)]
+    assert received(tmp_path, 1) == []
+    assert supervisor.alive() == {'0': 1, '1': 1}
@@ -0,0 +1,118 @@
+"""Анкета в одном сообщении: ответы текстом и выходы без перехода к шагу."""
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from router import CallbackRouter
+from sessions import SessionStore, SCHEMA
+from storage import Storage
+from wizard import Wizard, Form, Choice, TextInput, on_text
+
+_ids = itertools.count(1)
+
+
+class RecordingBot:
+    """Методы telebot, которые вызывает движок анкет; next-step обработчики – по чату."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.sent = []
+        self.edited = []
+
+    def register_next_step_handler_by_chat_id(self, chat_id, callback, *args):
+        self.handlers[chat_id] = (callback, args)
+
+    def clear_step_handler_by_chat_id(self, chat_id):
+        self.handlers.pop(chat_id, None)
+
+    def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=next(_ids))
+
+    def edit_message_text(self, text, chat_id, message_id, reply_markup=None):
+        self.edited.append((chat_id, text))
+
+    def answer_callback_query(self, callback_id, text=None):
+        pass
+
+    def reply(self, chat_id, text, user_id=None, chat_type='private'):
+        """Ответ текстом так, как его доставляет telebot: обработчик снимается и вызывается."""
+        callback, args = self.handlers.pop(chat_id)
+        message = SimpleNamespace(chat=SimpleNamespace(id=chat_id, type=chat_type), text=text,
+                                  from_user=SimpleNamespace(id=user_id or chat_id))
+        callback(message, *args)
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    storage = Storage(str(tmp_path / 'wizard.db'))
+    with storage.transaction() as cur:
+        for sql in SCHEMA:
+            cur.execute(sql)
+    return SessionStore(storage).namespace('wizard_test', ttl=3600)
+
+
+@pytest.fixture
+def bot():
+    return RecordingBot()
+
+
+@pytest.fixture
+def wizard(bot, sessions):
+    allowed = {7}
+    wizard = Wizard(bot, CallbackRouter(), prefix='wztest')
+    wizard.register(Form('form', [
+        TextInput('name', "Имя?"),
+        Choice('size', "Размер?", [('s', 'S'), ('m', 'M')]),
+    ], sessions, lambda source, user_id, data: ("Готово", None), allowed=lambda user_id: user_id in allowed))
+    wizard.allowed = allowed
+    return wizard
+
+
+def test_text_answer_advances(bot, sessions, wizard):
+    wizard.start('form', 7, 7)
+    bot.reply(7, 'Иван')
+    assert sessions[7]['name'] == 'Иван'
+    assert sessions[7]['_step'] == 'size'
+    assert 7 not in bot.handlers
+
+
+def test_message_from_other_user_keeps_waiting(bot, sessions, wizard):
+    wizard.start('form', 7, 7)
+    bot.reply(7, 'чужое', user_id=8)
+    assert 7 in bot.handlers
+    bot.reply(7, 'Иван')
+    assert sessions[7]['name'] == 'Иван'
+
+
+def test_group_message_keeps_waiting(bot, sessions, wizard):
+    wizard.start('form', 7, 7)
+    bot.reply(7, 'из группы', chat_type='group')
+    assert 7 in bot.handlers
+    assert sessions[7]['_step'] == 'name'
+
+
+def test_revoked_rights_end_form(bot, sessions, wizard):
+    wizard.start('form', 7, 7)
+    wizard.allowed.discard(7)
+    bot.reply(7, 'Иван')
+    assert sessions.get(7) is None
+    assert bot.sent[-1] == (7, "❌ Нет прав. Заполнение анкеты прекращено.")
+
+
+def test_text_on_button_step_shows_hint(bot, sessions, wizard):
+    wizard.start('form', 7, 7)
+    bot.reply(7, 'Иван')
+    # Устаревший обработчик текста на шаге с кнопками
+    bot.register_next_step_handler_by_chat_id(7, on_text, 'wztest', 'form', 7)
+    bot.reply(7, 'M')
+    assert sessions[7]['_step'] == 'size'
+    assert "👆 Выберите вариант кнопкой." in bot.edited[-1][1]
+
+
+def test_text_after_session_lost(bot, sessions, wizard):
+    wizard.start('form', 7, 7)
+    del sessions[7]
+    bot.reply(7, 'Иван')
+    assert bot.sent[-1] == (7, "❌ Анкета не найдена. Начните заново.")
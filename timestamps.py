@@ -0,0 +1,32 @@
+"""Метки времени в БД: текст ISO-8601 в UTC, 'YYYY-MM-DD HH:MM:SS'.
+
+Такие строки сравниваются и сортируются как время, поэтому ORDER BY
+created_at и условия «за последние N часов» идут по индексу. Формат
+совпадает с datetime('now') в SQLite. Пользователю время показывается
+по местному часовому поясу через local().
+"""
+from datetime import datetime, timedelta, timezone
+
+FORMAT = '%Y-%m-%d %H:%M:%S'
+DISPLAY_FORMAT = '%d.%m.%Y %H:%M'
+
+
+def utc_now():
+    """Текущее время для записи в created_at / updated_at."""
+    return datetime.now(timezone.utc).strftime(FORMAT)
+
+
+def utc_ago(**delta):
+    """Граница окна: utc_ago(days=7) – метка времени неделю назад."""
+    return (datetime.now(timezone.utc) - timedelta(**delta)).strftime(FORMAT)
+
+
+def local(value, tz_offset=0, fmt=DISPLAY_FORMAT):
+    """Метка из БД в местном времени (UTC + tz_offset часов) для показа."""
+    if not value:
+        return "—"
+    try:
+        moment = datetime.strptime(value, FORMAT)
+    except (TypeError, ValueError):
+        return str(value)
+    return (moment + timedelta(hours=tz_offset)).strftime(fmt)
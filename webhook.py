@@ -0,0 +1,221 @@
+"""Приём обновлений Telegram через вебхук: HTTP-сервер, секретный токен, дедупликация.
+
+Запросы принимаются в ограниченную очередь и сразу получают ответ 200;
+обработку выполняют воркеры через bot.process_new_updates (или handle,
+например Supervisor.route в режиме нескольких процессов). С store
+(Inbox.accept_one) обновление сохраняется в базу до ответа 200.
+Для локальной проверки: python webhook.py URL SECRET '{"update_id": 1, ...}'
+"""
+import hmac
+import json
+import queue
+import sys
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY = 1024 * 1024
+
+
+class RecentIds:
+    """Последние capacity принятых update_id (Telegram повторяет доставку при таймаутах)."""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, update_id):
+        with self.lock:
+            return update_id in self.ids
+
+    def add(self, update_id):
+        """False, если такой update_id уже был."""
+        with self.lock:
+            if update_id in self.ids:
+                return False
+            self.ids[update_id] = None
+            while len(self.ids) > self.capacity:
+                self.ids.popitem(last=False)
+            return True
+
+    def discard(self, update_id):
+        with self.lock:
+            self.ids.pop(update_id, None)
+
+
+class WebhookServer:
+    """HTTP-сервер вебхука.
+
+    Ответы: 200 – принято (или дубликат), 401 – неверный секретный токен,
+    400 – не JSON / нет update_id, 404 – чужой путь, 503 – очередь заполнена
+    (Telegram повторит доставку позже).
+    """
+
+    def __init__(self, bot, host='0.0.0.0', port=8443, path='/webhook', secret_token='',
+                 workers=4, queue_size=1000, dedup_size=10000, handle=None, store=None):
+        self.bot = bot
+        # handle(data) получает обновление в JSON; по умолчанию – обработчики этого процесса
+        self.handle = handle or self.process
+        # store(data) -> False для уже известного update_id; вызывается до ответа Telegram
+        self.store = store
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.seen = RecentIds(dedup_size)
+        self.counters = {'accepted': 0, 'duplicates': 0, 'rejected': 0, 'overflow': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.threads = []
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        """Запускает воркеры обработки (сам сервер – serve_forever())."""
+        if self.threads:
+            return self
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"webhook-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, queued=self.depth())
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def check_secret(self, header):
+        if not self.secret_token:
+            return True
+        return hmac.compare_digest((header or '').encode(), self.secret_token.encode())
+
+    def accept(self, data):
+        """Кладёт обновление в очередь. Возвращает HTTP-код ответа."""
+        update_id = data.get('update_id') if isinstance(data, dict) else None
+        if not isinstance(update_id, int):
+            self._count('rejected')
+            return 400
+        if not self.seen.add(update_id):
+            self._count('duplicates')
+            return 200
+        if self.queue.full():
+            # Не помечаем как принятое – повторная доставка должна пройти
+            self.seen.discard(update_id)
+            self._count('overflow')
+            return 503
+        if self.store is not None:
+            try:
+                fresh = self.store(data)
+            except Exception as e:
+                self.seen.discard(update_id)
+                self._count('errors')
+                print(f"⚠️ Не удалось сохранить обновление {update_id}: {e}")
+                return 503
+            if not fresh:
+                self._count('duplicates')
+                return 200
+        # Место проверено выше; если очередь успели занять другие запросы – ждём, а не теряем
+        self.queue.put(data)
+        self._count('accepted')
+        return 200
+
+    def process(self, data):
+        self.bot.process_new_updates([types.Update.de_json(data)])
+
+    def _worker(self):
+        while True:
+            data = self.queue.get()
+            try:
+                self.handle(data)
+            except Exception as e:
+                self._count('errors')
+                print(f"⚠️ Ошибка обработки обновления {data.get('update_id')}: {e}")
+            finally:
+                self.queue.task_done()
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.split('?', 1)[0] != server.path:
+                return self._reply(404)
+            if not server.check_secret(self.headers.get(SECRET_HEADER)):
+                server._count('rejected')
+                return self._reply(401)
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                if length <= 0 or length > MAX_BODY:
+                    raise ValueError(length)
+                data = json.loads(self.rfile.read(length))
+            except ValueError:
+                server._count('rejected')
+                return self._reply(400)
+            self._reply(server.accept(data))
+
+        def do_GET(self):
+            if self.path != '/health':
+                return self._reply(404)
+            self._reply(200, json.dumps(server.stats()).encode(), 'application/json')
+
+        def _reply(self, code, body=b'', content_type='text/plain'):
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def send_update(url, update, secret_token=None, timeout=10):
+    """Отправляет обновление на вебхук так же, как это делает Telegram. Возвращает HTTP-код."""
+    body = json.dumps(update).encode()
+    request = urllib.request.Request(url, data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    if secret_token:
+        request.add_header(SECRET_HEADER, secret_token)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print("Использование: python webhook.py URL SECRET UPDATE_JSON|@файл")
+        sys.exit(1)
+    url, secret, payload = sys.argv[1:4]
+    if payload.startswith('@'):
+        with open(payload[1:], encoding='utf-8') as f:
+            payload = f.read()
+    print(send_update(url, json.loads(payload), secret))
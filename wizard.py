@@ -0,0 +1,460 @@
+"""Пошаговые анкеты в одном сообщении: шаги описываются данными, движок редактирует якорь.
+
+У анкеты одно сообщение-якорь. Переход к следующему шагу – editMessageText
+этого сообщения, отметка варианта в списке (профили, районы) –
+editMessageReplyMarkup, ответ текстом ловится next-step обработчиком и тоже
+перерисовывает якорь. Шаги описываются один раз (Choice / MultiChoice /
+TextInput) и собираются в анкеты (Form): одни и те же шаги служат анкете
+мастера и ручному добавлению мастера админом.
+
+Состояние – в сессии анкеты (sessions.py): ответы под своими ключами и
+служебные '_step' (текущий шаг), '_anchor' (id якоря), '_seed' (данные
+начала – для «Заполнить заново»). Кнопки шагов – 'wz_{анкета}_{шаг}_{значение}',
+действия анкеты – 'wz_{анкета}_cancel' / 'wz_{анкета}_restart'. Нажатие на
+кнопку пройденного шага или старого сообщения ничего не меняет.
+"""
+from telebot import types
+
+NEXT, TOGGLE, CUSTOM = 'next', 'toggle', 'custom'
+SKIP, DONE = 'skip', 'done'
+CANCEL, RESTART = 'cancel', 'restart'
+
+# next-step обработчики сохраняются в БД через pickle (sessions.StepHandlerBackend),
+# поэтому обработчик текста – функция модуля, а движок находится по префиксу
+_engines = {}
+
+
+class Invalid(Exception):
+    """Ответ не принят; текст исключения показывается пользователю."""
+
+
+class Step:
+    """Шаг анкеты.
+
+    name – часть callback_data (без '_'); key – ключ ответа в сессии;
+    prompt – текст или prompt(data) -> текст; when(data) – нужен ли шаг;
+    save(data, value) – вместо data[key] = value (несколько ключей, смена режима).
+    """
+
+    def __init__(self, name, prompt, key=None, when=None, save=None):
+        if '_' in name:
+            raise ValueError(f"Недопустимое имя шага: {name}")
+        self.name = name
+        self.prompt = prompt
+        self.key = key or name
+        self.when = when
+        self.save = save
+
+    def active(self, data):
+        return self.when is None or self.when(data)
+
+    def text(self, data):
+        return self.prompt(data) if callable(self.prompt) else self.prompt
+
+    def keyboard(self, data, callback):
+        """InlineKeyboardMarkup шага или None; callback(value) – callback_data кнопки."""
+        return None
+
+    def wants_text(self, data):
+        return False
+
+    def press(self, data, value):
+        raise Invalid("❌ Ошибка")
+
+    def receive(self, data, text):
+        raise Invalid("❌ Ответьте кнопкой")
+
+    def apply(self, data, value):
+        if self.save is not None:
+            self.save(data, value)
+        else:
+            data[self.key] = value
+
+
+class Choice(Step):
+    """Один вариант из options [(код, надпись)]. Сохраняется values[код] или надпись.
+
+    custom – код варианта «ввести своё»: после него ответ ждётся текстом (custom_prompt).
+    """
+
+    def __init__(self, name, prompt, options, values=None, custom=None, custom_prompt=None, row_width=1,
+                 **kwargs):
+        super().__init__(name, prompt, **kwargs)
+        self.options = list(options)
+        self.labels = dict(self.options)
+        self.values = values or {}
+        self.custom = custom
+        self.custom_prompt = custom_prompt
+        self.row_width = row_width
+
+    def text(self, data):
+        if data.get('_custom'):
+            return self.custom_prompt
+        return super().text(data)
+
+    def keyboard(self, data, callback):
+        if data.get('_custom'):
+            return None
+        markup = types.InlineKeyboardMarkup(row_width=self.row_width)
+        markup.add(*[types.InlineKeyboardButton(label, callback_data=callback(code)) for code, label in self.options])
+        return markup
+
+    def wants_text(self, data):
+        return bool(data.get('_custom'))
+
+    def press(self, data, value):
+        if value not in self.labels:
+            raise Invalid("❌ Ошибка")
+        if value == self.custom:
+            return CUSTOM
+        self.apply(data, self.values.get(value, self.labels[value]))
+        return NEXT
+
+    def receive(self, data, text):
+        if not text:
+            raise Invalid("❌ Введите ответ текстом.")
+        self.apply(data, text)
+        return NEXT
+
+
+class MultiChoice(Step):
+    """Несколько вариантов: нажатие отмечает вариант, «Готово» сохраняет надписи через ', '.
+
+    Отмеченные надписи лежат в data[selected] (по умолчанию 'selected_{name}').
+    required – ошибка, если ничего не отмечено (None – можно пустой список);
+    skip – надпись кнопки «Пропустить», при пропуске apply получает None.
+    """
+
+    def __init__(self, name, prompt, options, selected=None, required=None, skip=None, row_width=1, **kwargs):
+        super().__init__(name, prompt, **kwargs)
+        self.options = list(options)
+        self.labels = dict(self.options)
+        self.selected = selected or f"selected_{name}"
+        self.required = required
+        self.skip = skip
+        self.row_width = row_width
+
+    def keyboard(self, data, callback):
+        chosen = data.get(self.selected) or []
+        markup = types.InlineKeyboardMarkup(row_width=self.row_width)
+        markup.add(*[types.InlineKeyboardButton(f"✅ {label}" if label in chosen else label,
+                                                callback_data=callback(code))
+                     for code, label in self.options])
+        markup.add(types.InlineKeyboardButton("✅ Готово", callback_data=callback(DONE)))
+        if self.skip:
+            markup.add(types.InlineKeyboardButton(self.skip, callback_data=callback(SKIP)))
+        return markup
+
+    def press(self, data, value):
+        chosen = list(data.get(self.selected) or [])
+        if value == DONE:
+            if not chosen and self.required:
+                raise Invalid(self.required)
+            self.apply(data, chosen)
+            return NEXT
+        if value == SKIP and self.skip:
+            self.apply(data, None)
+            return NEXT
+        label = self.labels.get(value)
+        if label is None:
+            raise Invalid("❌ Ошибка")
+        if label in chosen:
+            chosen.remove(label)
+        else:
+            chosen.append(label)
+        data[self.selected] = chosen
+        return TOGGLE
+
+    def apply(self, data, value):
+        if self.save is not None:
+            self.save(data, value)
+        else:
+            data[self.key] = ", ".join(value or [])
+
+
+class TextInput(Step):
+    """Ответ текстом.
+
+    skip – значение при кнопке «Пропустить», пустом ответе и слове «пропустить»;
+    без skip пустой ответ не принимается (error). buttons(data) – дополнительные
+    кнопки шага [(надпись, callback_data)], их обработчики – обычные маршруты.
+    """
+
+    def __init__(self, name, prompt, skip=None, error="❌ Введите ответ текстом.", buttons=None, **kwargs):
+        super().__init__(name, prompt, **kwargs)
+        self.skip = skip
+        self.error = error
+        self.buttons = buttons
+
+    def keyboard(self, data, callback):
+        rows = []
+        if self.skip is not None:
+            rows.append(types.InlineKeyboardButton("⏩ Пропустить", callback_data=callback(SKIP)))
+        for label, callback_data in (self.buttons(data) if self.buttons else ()):
+            rows.append(types.InlineKeyboardButton(label, callback_data=callback_data))
+        if not rows:
+            return None
+        markup = types.InlineKeyboardMarkup(row_width=1)
+        markup.add(*rows)
+        return markup
+
+    def wants_text(self, data):
+        return True
+
+    def press(self, data, value):
+        if value != SKIP or self.skip is None:
+            raise Invalid("❌ Ошибка")
+        self.apply(data, self.skip)
+        return NEXT
+
+    def receive(self, data, text):
+        if self.skip is not None and (not text or text.lower() == "пропустить"):
+            text = self.skip
+        if not text:
+            raise Invalid(self.error)
+        self.apply(data, text)
+        return NEXT
+
+
+class Form:
+    """Анкета.
+
+    name – часть callback_data (без '_'); sessions – SessionNamespace ответов;
+    finish(source, user_id, data) -> (текст, клавиатура) – итог после последнего
+    шага (сводка с кнопками или «спасибо»), source – сообщение или нажатие;
+    allowed(user_id) – кто может заполнять; private – ответы только из лички.
+    """
+
+    def __init__(self, name, steps, sessions, finish, title=None, allowed=None, private=True,
+                 cancelled="❌ Заполнение анкеты отменено."):
+        if '_' in name:
+            raise ValueError(f"Недопустимое имя анкеты: {name}")
+        self.name = name
+        self.steps = list(steps)
+        self.by_name = {step.name: step for step in self.steps}
+        if len(self.by_name) != len(self.steps) or {CANCEL, RESTART} & set(self.by_name):
+            raise ValueError(f"Повторяющиеся или зарезервированные имена шагов в анкете {name}")
+        self.sessions = sessions
+        self.finish = finish
+        self.title = title
+        self.allowed = allowed
+        self.private = private
+        self.cancelled = cancelled
+
+    def permits(self, user_id):
+        return self.allowed is None or self.allowed(user_id)
+
+    def following(self, data, after=None):
+        """Первый нужный шаг после after (None – с начала) или None, если шаги кончились."""
+        index = 0 if after is None else self.steps.index(after) + 1
+        for step in self.steps[index:]:
+            if step.active(data):
+                return step
+        return None
+
+    def position(self, data, step):
+        """(номер шага, всего шагов) среди нужных при текущих ответах."""
+        active = [s for s in self.steps if s.active(data) or s is step]
+        return active.index(step) + 1, len(active)
+
+
+class Wizard:
+    def __init__(self, bot, router, prefix='wz'):
+        self.bot = bot
+        self.prefix = prefix
+        self.forms = {}
+        router.add(f"{prefix}_{{form}}_{{action}}", self._on_action)
+        router.add(f"{prefix}_{{form}}_{{step}}_{{value:rest}}", self._on_button)
+        _engines[prefix] = self
+
+    def register(self, form):
+        if form.name in self.forms:
+            raise ValueError(f"Анкета уже зарегистрирована: {form.name}")
+        self.forms[form.name] = form
+        return form
+
+    def callback(self, name, action, value=None):
+        """callback_data кнопки анкеты: действие (CANCEL / RESTART) или значение шага."""
+        return f"{self.prefix}_{name}_{action}" + (f"_{value}" if value is not None else "")
+
+    # ----- начало и переходы -----
+    def start(self, name, chat_id, user_id, data=None, anchor=None):
+        """Начинает анкету: первый шаг в сообщении anchor (редактируется) или в новом сообщении."""
+        form = self.forms[name]
+        seed = dict(data or {})
+        self.bot.clear_step_handler_by_chat_id(chat_id)
+        state = dict(seed, _seed=seed, _anchor=anchor)
+        form.sessions[user_id] = state
+        self._goto(form, chat_id, user_id, state)
+
+    def advance(self, name, call, **answers):
+        """Завершает текущий шаг внешней кнопкой (обычный маршрут): сохраняет answers и идёт дальше.
+
+        False – анкета не начата или кнопка не из её сообщения.
+        """
+        form = self.forms[name]
+        user_id = call.from_user.id
+        data = form.sessions.get(user_id)
+        step = form.by_name.get(data.get('_step')) if data else None
+        if step is None or data.get('_anchor') != call.message.message_id:
+            return False
+        data = dict(data, **answers)
+        self.bot.clear_step_handler_by_chat_id(call.message.chat.id)
+        self._goto(form, call.message.chat.id, user_id, data, after=step, source=call)
+        return True
+
+    def _goto(self, form, chat_id, user_id, data, after=None, source=None, error=None):
+        step = form.following(data, after)
+        data.pop('_custom', None)
+        if step is None:
+            data['_step'] = ''
+            form.sessions[user_id] = data
+            text, markup = form.finish(source, user_id, data)
+            self._show(form, chat_id, user_id, data.get('_anchor'), text, markup)
+            return
+        data['_step'] = step.name
+        form.sessions[user_id] = data
+        self._render(form, step, chat_id, user_id, data, error)
+
+    def _render(self, form, step, chat_id, user_id, data, error=None):
+        number, total = form.position(data, step)
+        parts = [form.title] if form.title else []
+        parts.append(f"Шаг {number} из {total}")
+        parts.append(step.text(data))
+        if error:
+            parts.append(error)
+        markup = step.keyboard(data, lambda value: self.callback(form.name, step.name, value))
+        if step.wants_text(data):
+            # До отрисовки: ответ может прийти сразу после неё
+            self._wait_text(form, chat_id, user_id)
+        self._show(form, chat_id, user_id, data.get('_anchor'), "\n\n".join(parts), markup)
+
+    def _wait_text(self, form, chat_id, user_id):
+        self.bot.register_next_step_handler_by_chat_id(chat_id, on_text, self.prefix, form.name, user_id)
+
+    def _show(self, form, chat_id, user_id, anchor, text, markup):
+        """Рисует text в якоре; если якорь не отредактировать (удалён, не найден) – новым сообщением."""
+        if anchor is not None:
+            try:
+                self.bot.edit_message_text(text, chat_id, anchor, reply_markup=markup)
+                return anchor
+            except Exception as e:
+                # «message is not modified» – тот же текст (повтор той же ошибки ввода)
+                if 'not modified' in str(e):
+                    return anchor
+                print(f"⚠️ Не удалось обновить сообщение анкеты {form.name}: {e}")
+        sent = self.bot.send_message(chat_id, text, reply_markup=markup)
+        data = form.sessions.get(user_id)
+        if data is not None and data.get('_anchor') == anchor:
+            data['_anchor'] = sent.message_id
+        return sent.message_id
+
+    # ----- ответы -----
+    def _session(self, call, name):
+        """(анкета, сессия) для нажатия на кнопку якоря или None (уже ответили на нажатие)."""
+        form = self.forms.get(name)
+        if form is None:
+            self.bot.answer_callback_query(call.id, "❌ Ошибка")
+            return None
+        if not form.permits(call.from_user.id):
+            self.bot.answer_callback_query(call.id, "❌ Нет прав")
+            return None
+        data = form.sessions.get(call.from_user.id)
+        if data is None:
+            self.bot.answer_callback_query(call.id, "❌ Начните анкету заново")
+            return None
+        if data.get('_anchor') != call.message.message_id:
+            self.bot.answer_callback_query(call.id, "⏳ Эта анкета уже неактуальна")
+            return None
+        return form, dict(data)
+
+    def _on_button(self, call, form, step, value):
+        found = self._session(call, form)
+        if found is None:
+            return
+        form, data = found
+        current = form.by_name.get(step)
+        if current is None or data.get('_step') != step:
+            self.bot.answer_callback_query(call.id, "⏳ Этот шаг уже пройден")
+            return
+        user_id, chat_id = call.from_user.id, call.message.chat.id
+        try:
+            outcome = current.press(data, value)
+        except Invalid as e:
+            self.bot.answer_callback_query(call.id, str(e))
+            return
+        if outcome == TOGGLE:
+            form.sessions[user_id] = data
+            markup = current.keyboard(data, lambda v: self.callback(form.name, current.name, v))
+            try:
+                self.bot.edit_message_reply_markup(chat_id, data['_anchor'], reply_markup=markup)
+            except Exception as e:
+                if 'not modified' not in str(e):
+                    raise
+        elif outcome == CUSTOM:
+            data['_custom'] = True
+            form.sessions[user_id] = data
+            self._render(form, current, chat_id, user_id, data)
+        else:
+            # Шаг с текстом пропущен кнопкой – ответ текстом больше не ждём
+            self.bot.clear_step_handler_by_chat_id(chat_id)
+            self._goto(form, chat_id, user_id, data, after=current, source=call)
+        self.bot.answer_callback_query(call.id)
+
+    def _on_text(self, message, name, user_id):
+        # telebot уже снял обработчик: каждый выход без перехода к шагу либо ждёт
+        # ответ дальше, либо сообщает пользователю, что анкета не продолжится
+        form = self.forms.get(name)
+        if form is None:
+            return
+        chat_id = message.chat.id
+        data = form.sessions.get(user_id)
+        current = form.by_name.get(data.get('_step')) if data else None
+        if (form.private and message.chat.type != 'private') or message.from_user.id != user_id:
+            # Сообщение не от того, кто заполняет анкету
+            if current is not None and current.wants_text(data):
+                self._wait_text(form, chat_id, user_id)
+            return
+        if data is None:
+            self.bot.send_message(chat_id, "❌ Анкета не найдена. Начните заново.")
+            return
+        if not form.permits(user_id):
+            del form.sessions[user_id]
+            self.bot.send_message(chat_id, "❌ Нет прав. Заполнение анкеты прекращено.")
+            return
+        if current is None:
+            self.bot.send_message(chat_id, "👆 Анкета заполнена – выберите действие кнопкой под сводкой.")
+            return
+        data = dict(data)
+        if not current.wants_text(data):
+            self._render(form, current, chat_id, user_id, data, error="👆 Выберите вариант кнопкой.")
+            return
+        text = message.text.strip() if message.text else ""
+        try:
+            current.receive(data, text)
+        except Invalid as e:
+            self._render(form, current, message.chat.id, user_id, data, error=str(e))
+            return
+        self._goto(form, message.chat.id, user_id, data, after=current, source=message)
+
+    def _on_action(self, call, form, action):
+        found = self._session(call, form)
+        if found is None:
+            return
+        form, data = found
+        chat_id = call.message.chat.id
+        self.bot.clear_step_handler_by_chat_id(chat_id)
+        if action == RESTART:
+            self.start(form.name, chat_id, call.from_user.id, data.get('_seed'), anchor=data['_anchor'])
+        elif action == CANCEL:
+            del form.sessions[call.from_user.id]
+            self._show(form, chat_id, call.from_user.id, data['_anchor'], form.cancelled, None)
+        else:
+            self.bot.answer_callback_query(call.id, "❌ Ошибка")
+            return
+        self.bot.answer_callback_query(call.id)
+
+
+def on_text(message, prefix, name, user_id):
+    """next-step обработчик ответа текстом (см. _engines)."""
+    _engines[prefix]._on_text(message, name, user_id)